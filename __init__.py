@@ -2,18 +2,30 @@
 
 from .nodes import (
     ArduinoTargetNode, 
-    ArduinoCompileUploadNode
+    ArduinoCompileUploadNode,
+    ArduinoFleetCompileUploadNode,
+    ArduinoMetricsNode
 )
 from .arduino_native_nodes import (
     ArduinoCreateVariableNode, # <-- NOUVEAU pour la flexibilité
     ArduinoDigitalWriteNode, 
     ArduinoAnalogWriteNode, 
+    ArduinoFrameBufferNode,
+    ArduinoSequenceNode,
     ArduinoDelayNode,
     ArduinoVariableInfoNode # <-- NOUVEAU pour l'info
 )
 from .arduino_comms_nodes import (
     ArduinoSenderNode, 
-    ArduinoReceiverNode
+    ArduinoReceiverNode,
+    ArduinoSendManyNode,
+    ArduinoReceiveManyNode,
+    ArduinoTelemetrySubscribeNode,
+    ArduinoSendArrayNode,
+    ArduinoReceiveArrayNode,
+    ArduinoSendFrameNode,
+    ArduinoSequenceControlNode,
+    ArduinoStreamSequenceNode
 )
 
 
@@ -24,13 +36,27 @@ NODE_CLASS_MAPPINGS = {
     "ArduinoCreateVariable": ArduinoCreateVariableNode,
     "ArduinoDigitalWrite": ArduinoDigitalWriteNode,
     "ArduinoAnalogWrite": ArduinoAnalogWriteNode,
+    "ArduinoFrameBuffer": ArduinoFrameBufferNode,
+    "ArduinoSequence": ArduinoSequenceNode,
     "ArduinoDelay": ArduinoDelayNode,
     "ArduinoVariableInfo": ArduinoVariableInfoNode,
     "ArduinoCompileUpload": ArduinoCompileUploadNode,
+    "ArduinoFleetCompileUpload": ArduinoFleetCompileUploadNode,
     
     # Workflow 2: Communication
     "ArduinoSender": ArduinoSenderNode,
     "ArduinoReceiver": ArduinoReceiverNode,
+    "ArduinoSendMany": ArduinoSendManyNode,
+    "ArduinoReceiveMany": ArduinoReceiveManyNode,
+    "ArduinoTelemetrySubscribe": ArduinoTelemetrySubscribeNode,
+    "ArduinoSendArray": ArduinoSendArrayNode,
+    "ArduinoReceiveArray": ArduinoReceiveArrayNode,
+    "ArduinoSendFrame": ArduinoSendFrameNode,
+    "ArduinoSequenceControl": ArduinoSequenceControlNode,
+    "ArduinoStreamSequence": ArduinoStreamSequenceNode,
+
+    # Diagnostics
+    "ArduinoMetrics": ArduinoMetricsNode,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
@@ -39,13 +65,27 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "ArduinoCreateVariable": "Native: Create Variable",
     "ArduinoDigitalWrite": "Native: DigitalWrite",
     "ArduinoAnalogWrite": "Native: AnalogWrite (PWM)",
+    "ArduinoFrameBuffer": "Native: Frame Buffer (LEDs / PWM bank)",
+    "ArduinoSequence": "Native: Keyframe Sequence",
     "ArduinoDelay": "Native: Delay (Non-Blocking)",
     "ArduinoVariableInfo": "Show Variable Info",
     "ArduinoCompileUpload": "2. Compile & Upload",
+    "ArduinoFleetCompileUpload": "2. Compile & Upload (Fleet)",
 
     # Workflow 2
     "ArduinoSender": "Send to Arduino (by Port)",
     "ArduinoReceiver": "Receive from Arduino (by Port)",
+    "ArduinoSendMany": "Send Many to Arduino (Batch)",
+    "ArduinoReceiveMany": "Receive Many from Arduino (Batch)",
+    "ArduinoTelemetrySubscribe": "Stream from Arduino (Telemetry)",
+    "ArduinoSendArray": "Send Array to Arduino (Range)",
+    "ArduinoReceiveArray": "Receive Array from Arduino (Range)",
+    "ArduinoSendFrame": "Send Frame to Arduino (Image / LEDs)",
+    "ArduinoSequenceControl": "Sequence Playback (Play / Pause / Seek)",
+    "ArduinoStreamSequence": "Stream Sequence to Arduino",
+
+    # Diagnostics
+    "ArduinoMetrics": "Arduino Metrics",
 }
 
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS"]
@@ -1,8 +1,91 @@
 # arduino_comms_nodes.py
 
-from .src.serial_communicator import send_and_receive
+import json
+from .src.device_client import set_values, get_values, get_range, set_range, get_streamed_values, subscribe, write_frame, control_sequence
+from .src.code_generator import resolve_variable_index
+from .src.frame_buffer import image_to_values, list_to_values, quantize_and_pack
+from .src.protocol_codec import SEQUENCE_ACTIONS, SEQUENCE_STATES
+from .src.sequence import parse_keyframes, stream_sequence, get_streamer
+from .src.write_coalescer import get_coalescer, record_sent, mark_sequence_driven, DEFAULT_FLUSH_INTERVAL_MS
 from .nodes import ARDUINO_PROFILES
 
+def _parse_value(value) -> int:
+    """Converts a user value (integer, float, HIGH or LOW) to the integer sent to the board."""
+    value_str = str(value).strip().upper()
+    if value_str == "HIGH": return 1
+    if value_str == "LOW": return 0
+    return int(float(value_str))
+
+def _parse_name_values(values: str) -> list[tuple[str, str]]:
+    """
+    Accepts a JSON object ({"name": value}), a JSON list of [name, value] pairs,
+    or plain text with one 'name=value' per line (commas also separate entries).
+    """
+    text = values.strip()
+    if text.startswith('{') or text.startswith('['):
+        data = json.loads(text)
+        items = data.items() if isinstance(data, dict) else data
+        return [(str(name), value) for name, value in items]
+    pairs = []
+    for entry in text.replace(',', '\n').splitlines():
+        if not entry.strip(): continue
+        name, sep, value = entry.partition('=')
+        if not sep: raise ValueError(f"Entry '{entry.strip()}' is not of the form name=value.")
+        pairs.append((name.strip(), value.strip()))
+    return pairs
+
+def _parse_names(names: str) -> list[str]:
+    """Accepts a JSON list of names or names separated by commas or newlines."""
+    text = names.strip()
+    if text.startswith('['):
+        return [str(name) for name in json.loads(text)]
+    return [name.strip() for name in text.replace(',', '\n').splitlines() if name.strip()]
+
+def _parse_array_values(values: str) -> list[int]:
+    """Accepts a JSON list or values separated by commas, whitespace or newlines."""
+    text = values.strip()
+    items = json.loads(text) if text.startswith('[') else text.replace(',', ' ').split()
+    return [_parse_value(item) for item in items]
+
+def _variable_index(comm_map: dict, name: str, port: str) -> int:
+    """Protocol index of a variable or 'name[i]' array element. Raises ValueError with the node's error message."""
+    try:
+        return resolve_variable_index(comm_map, name)
+    except KeyError:
+        raise ValueError(f"Variable '{name}' not found in profile for {port}.")
+
+def _array_details(comm_map: dict, name: str, port: str) -> dict:
+    """comm_map entry of the array variable `name`. Raises ValueError with the node's error message."""
+    details = comm_map.get(name)
+    if details is None:
+        raise ValueError(f"Variable '{name}' not found in profile for {port}.")
+    if details["type"] != "array":
+        raise ValueError(f"Variable '{name}' is not an array variable.")
+    return details
+
+_COALESCE_INPUTS = {
+    "coalesce": ("BOOLEAN", {"default": False, "tooltip": "Queue the write and return at once. A background flusher sends only the latest value per variable, skips values the board already has, and batches them into one frame."}),
+    "flush_interval_ms": ("INT", {"default": DEFAULT_FLUSH_INTERVAL_MS, "min": 1, "max": 10000, "tooltip": "With coalesce on: at most one flush to the port per interval."}),
+}
+
+def _send(port, profile, items, description, coalesce, flush_interval_ms) -> str:
+    """Writes items directly, or queues them for the port's flusher when coalescing. Returns the node's status."""
+    if not coalesce:
+        success, response = set_values(port, profile, items)
+        if not success: return response
+        record_sent(port, items)
+        return f"✅ Sent {description}."
+    coalescer = get_coalescer(port, profile, flush_interval_ms)
+    try:
+        all_acked = coalescer.queue(items)
+    except ValueError as e:
+        return f"❌ ERROR: {e}"
+    if coalescer.last_error:
+        return f"⚠️ Queued {description}, but the last flush failed: {coalescer.last_error}"
+    if all_acked:
+        return f"✅ Acked: {description} already applied."
+    return f"✅ Queued {description}."
+
 class ArduinoSenderNode:
     @classmethod
     def INPUT_TYPES(s):
@@ -12,38 +95,27 @@ class ArduinoSenderNode:
                 "variable_name": ("STRING", {"default": "state_pin_13"}),
                 "value": ("STRING", {"default": "HIGH", "multiline": False}),
             },
+            "optional": dict(_COALESCE_INPUTS),
         }
     RETURN_TYPES = ("STRING",); RETURN_NAMES = ("status",); FUNCTION = "send_data"; CATEGORY = "Arduino/Communication"
 
-    def send_data(self, port, variable_name, value):
-        if port not in ARDUINO_PROFILES:
+    def send_data(self, port, variable_name, value, coalesce=False, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
             return (f"❌ ERROR: No profile for {port}. Upload code first.",)
         
-        comm_map = ARDUINO_PROFILES[port].get("comm_map", {})
-        if variable_name not in comm_map:
-            return (f"❌ ERROR: Variable '{variable_name}' not found in profile for {port}.",)
-
-        details = comm_map[variable_name]
-        variable_index = details["index"]
+        comm_map = profile.get("comm_map", {})
+        try:
+            variable_index = _variable_index(comm_map, variable_name, port)
+        except ValueError as e:
+            return (f"❌ ERROR: {e}",)
         
         try:
-            value_str = str(value).strip().upper()
-            if value_str == "HIGH": int_value = 1
-            elif value_str == "LOW": int_value = 0
-            else: int_value = int(float(value_str))
+            int_value = _parse_value(value)
         except (ValueError, TypeError):
             return (f"❌ ERROR: Invalid value '{value}'. Must be an integer, HIGH, or LOW.",)
 
-        command = f"S:{variable_index}:{int_value}\n"
-        success, response = send_and_receive(port, command)
-        
-        if not success: return (f"❌ ERROR: {response}",)
-        
-        expected_ack = f"OK:S:{variable_index}"
-        if response.startswith(expected_ack):
-            return (f"✅ Sent {value} to '{variable_name}'.",)
-        else:
-            return (f"⚠️ UNEXPECTED RESPONSE: {response}",)
+        return (_send(port, profile, [(variable_index, int_value)], f"{value} to '{variable_name}'", coalesce, flush_interval_ms),)
 
 class ArduinoReceiverNode:
     @classmethod
@@ -53,35 +125,369 @@ class ArduinoReceiverNode:
                 "port": ("STRING", {"default": "COM3"}),
                 "variable_name": ("STRING", {"default": "my_variable"}),
             },
-            "optional": { "trigger": ("*",), }
+            "optional": {
+                "trigger": ("*",),
+                "max_staleness_ms": ("INT", {"default": 0, "min": 0, "tooltip": "When the port streams telemetry, accept streamed values up to this age (0 = any age). Older values are polled."}),
+            }
         }
     RETURN_TYPES = ("INT", "STRING",); RETURN_NAMES = ("value", "status",); FUNCTION = "receive_data"; CATEGORY = "Arduino/Communication"
 
-    def receive_data(self, port, variable_name, trigger=None):
-        if port not in ARDUINO_PROFILES:
+    def receive_data(self, port, variable_name, trigger=None, max_staleness_ms=0):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
             return (-1, f"❌ ERROR: No profile for {port}. Upload code first.",)
 
-        comm_map = ARDUINO_PROFILES[port].get("comm_map", {})
-        if variable_name not in comm_map:
-            return (-1, f"❌ ERROR: Variable '{variable_name}' not found in profile for {port}.",)
+        comm_map = profile.get("comm_map", {})
+        try:
+            variable_index = _variable_index(comm_map, variable_name, port)
+        except ValueError as e:
+            return (-1, f"❌ ERROR: {e}",)
         
         # THE FIX: This entire 'if' block is removed to allow reading any variable type.
         # if details['type'] != 'shared':
         #      return (-1, f"❌ ERROR: Can only receive from general-purpose variables...")
 
-        details = comm_map[variable_name]
-        variable_index = details["index"]
-        command = f"G:{variable_index}\n"
-        success, response = send_and_receive(port, command)
+        streamed = get_streamed_values(port, [variable_index], max_staleness_ms)
+        if streamed is not None:
+            value, age = streamed[0]
+            return (value, f"✅ Received {value} from '{variable_name}' (telemetry, {age * 1000:.0f} ms old).")
 
-        if not success: return (-1, f"❌ ERROR: {response}",)
+        success, result = get_values(port, profile, [variable_index])
+        if not success: return (-1, result)
 
-        parts = response.split(':')
-        if len(parts) == 3 and parts[0] == 'R' and parts[1] == str(variable_index):
+        value = result[0]
+        return (value, f"✅ Received {value} from '{variable_name}'.")
+
+class ArduinoSendManyNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "values": ("STRING", {"default": "state_pin_13=HIGH\nstate_pin_9=128", "multiline": True}),
+            },
+            "optional": dict(_COALESCE_INPUTS),
+        }
+    RETURN_TYPES = ("STRING",); RETURN_NAMES = ("status",); FUNCTION = "send_many"; CATEGORY = "Arduino/Communication"
+
+    def send_many(self, port, values, coalesce=False, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return (f"❌ ERROR: No profile for {port}. Upload code first.",)
+
+        comm_map = profile.get("comm_map", {})
+        try:
+            pairs = _parse_name_values(values)
+        except (ValueError, TypeError) as e:
+            return (f"❌ ERROR: Could not parse values: {e}",)
+        if not pairs:
+            return ("❌ ERROR: No values to send.",)
+
+        items = []
+        for name, value in pairs:
             try:
-                value = int(parts[2])
-                return (value, f"✅ Received {value} from '{variable_name}'.")
-            except ValueError:
-                return (-1, f"⚠️ INVALID VALUE in response: {response}")
+                if isinstance(value, list):
+                    # A whole array from JSON: {"name": [v, v, ...]} writes its first elements.
+                    details = _array_details(comm_map, name, port)
+                    if len(value) > details["length"]:
+                        return (f"❌ ERROR: '{name}' holds {details['length']} elements, got {len(value)} values.",)
+                    indices = range(details["index"], details["index"] + len(value))
+                else:
+                    indices, value = [_variable_index(comm_map, name, port)], [value]
+            except ValueError as e:
+                return (f"❌ ERROR: {e}",)
+            for index, element in zip(indices, value):
+                try:
+                    items.append((index, _parse_value(element)))
+                except (ValueError, TypeError):
+                    return (f"❌ ERROR: Invalid value '{element}' for '{name}'. Must be an integer, HIGH, or LOW.",)
+
+        # All values normally fit in one frame; very large maps are split to respect the board's buffer.
+        return (_send(port, profile, items, f"{len(items)} values to {port}", coalesce, flush_interval_ms),)
+
+def _group_values(names: list[str], spans: list, values: list[int]) -> dict:
+    """Maps each name to its value, or to the list of its values for an array (see receive_many)."""
+    grouped, pos = {}, 0
+    for name, span in zip(names, spans):
+        if isinstance(span, list):
+            grouped[name] = values[pos:pos + len(span)]
+            pos += len(span)
         else:
-            return (-1, f"⚠️ UNEXPECTED RESPONSE: {response}")
\ No newline at end of file
+            grouped[name] = values[pos]
+            pos += 1
+    return grouped
+
+class ArduinoReceiveManyNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "variable_names": ("STRING", {"default": "my_variable", "multiline": True}),
+            },
+            "optional": {
+                "trigger": ("*",),
+                "max_staleness_ms": ("INT", {"default": 0, "min": 0, "tooltip": "When the port streams telemetry, accept streamed values up to this age (0 = any age). Older values are polled."}),
+            }
+        }
+    RETURN_TYPES = ("STRING", "STRING",); RETURN_NAMES = ("values_json", "status",); FUNCTION = "receive_many"; CATEGORY = "Arduino/Communication"
+
+    def receive_many(self, port, variable_names, trigger=None, max_staleness_ms=0):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return ("{}", f"❌ ERROR: No profile for {port}. Upload code first.",)
+
+        comm_map = profile.get("comm_map", {})
+        try:
+            names = _parse_names(variable_names)
+        except (ValueError, TypeError) as e:
+            return ("{}", f"❌ ERROR: Could not parse variable names: {e}",)
+        if not names:
+            return ("{}", "❌ ERROR: No variables to read.",)
+        # Array variables are read whole, in the same batch as the other names, and returned as lists.
+        spans = []
+        for name in names:
+            details = comm_map.get(name)
+            try:
+                if details is not None and details["type"] == "array":
+                    spans.append(list(range(details["index"], details["index"] + details["length"])))
+                else:
+                    spans.append(_variable_index(comm_map, name, port))
+            except ValueError as e:
+                return ("{}", f"❌ ERROR: {e}",)
+        indices = [i for span in spans for i in (span if isinstance(span, list) else [span])]
+
+        streamed = get_streamed_values(port, indices, max_staleness_ms)
+        if streamed is not None:
+            values = _group_values(names, spans, [value for value, _ in streamed])
+            return (json.dumps(values), f"✅ Received {len(values)} values from {port} (telemetry).")
+
+        success, result = get_values(port, profile, indices)
+        if not success: return ("{}", result)
+
+        values = _group_values(names, spans, result)
+        return (json.dumps(values), f"✅ Received {len(values)} values from {port}.")
+
+
+class ArduinoTelemetrySubscribeNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "variable_names": ("STRING", {"default": "my_variable", "multiline": True}),
+                "interval_ms": ("INT", {"default": 100, "min": 0, "max": 65535, "tooltip": "Streaming period. 0 stops streaming."}),
+            },
+        }
+    RETURN_TYPES = ("STRING",); RETURN_NAMES = ("status",); FUNCTION = "subscribe"; CATEGORY = "Arduino/Communication"
+
+    def subscribe(self, port, variable_names, interval_ms):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return (f"❌ ERROR: No profile for {port}. Upload code first.",)
+
+        comm_map = profile.get("comm_map", {})
+        try:
+            names = _parse_names(variable_names)
+        except (ValueError, TypeError) as e:
+            return (f"❌ ERROR: Could not parse variable names: {e}",)
+        try:
+            indices = [_variable_index(comm_map, name, port) for name in names]
+        except ValueError as e:
+            return (f"❌ ERROR: {e}",)
+
+        success, result = subscribe(port, profile, indices, interval_ms)
+        if not success: return (result,)
+        if interval_ms == 0 or not names:
+            return (f"✅ Telemetry stopped on {port}.",)
+        return (f"✅ Streaming {len(names)} values from {port} every {interval_ms} ms.",)
+
+class ArduinoSendArrayNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "array_name": ("STRING", {"default": "my_array"}),
+                "values": ("STRING", {"default": "0, 0, 0, 0", "multiline": True, "tooltip": "JSON list or values separated by commas or whitespace."}),
+            },
+            "optional": {
+                "start": ("INT", {"default": 0, "min": 0, "tooltip": "First element written."}),
+            }
+        }
+    RETURN_TYPES = ("STRING",); RETURN_NAMES = ("status",); FUNCTION = "send_array"; CATEGORY = "Arduino/Communication"
+
+    def send_array(self, port, array_name, values, start=0):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return (f"❌ ERROR: No profile for {port}. Upload code first.",)
+
+        try:
+            details = _array_details(profile.get("comm_map", {}), array_name, port)
+            int_values = _parse_array_values(values)
+        except (ValueError, TypeError) as e:
+            return (f"❌ ERROR: {e}",)
+        if not int_values:
+            return ("❌ ERROR: No values to send.",)
+        if start + len(int_values) > details["length"]:
+            return (f"❌ ERROR: '{array_name}' holds {details['length']} elements; {len(int_values)} values from element {start} do not fit.",)
+
+        first = details["index"] + start
+        success, response = set_range(port, profile, first, int_values)
+        if not success: return (response,)
+        record_sent(port, list(zip(range(first, first + len(int_values)), int_values)))
+        return (f"✅ Sent {len(int_values)} values to '{array_name}'.",)
+
+class ArduinoReceiveArrayNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "array_name": ("STRING", {"default": "my_array"}),
+            },
+            "optional": {
+                "trigger": ("*",),
+                "start": ("INT", {"default": 0, "min": 0, "tooltip": "First element read."}),
+                "count": ("INT", {"default": 0, "min": 0, "tooltip": "Elements to read; 0 reads to the end of the array."}),
+            }
+        }
+    RETURN_TYPES = ("STRING", "STRING",); RETURN_NAMES = ("values_json", "status",); FUNCTION = "receive_array"; CATEGORY = "Arduino/Communication"
+
+    def receive_array(self, port, array_name, trigger=None, start=0, count=0):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return ("[]", f"❌ ERROR: No profile for {port}. Upload code first.",)
+
+        try:
+            details = _array_details(profile.get("comm_map", {}), array_name, port)
+        except ValueError as e:
+            return ("[]", f"❌ ERROR: {e}",)
+        if count == 0:
+            count = details["length"] - start
+        if start + count > details["length"] or count <= 0:
+            return ("[]", f"❌ ERROR: '{array_name}' holds {details['length']} elements; cannot read {count} from element {start}.",)
+
+        success, result = get_range(port, profile, details["index"] + start, count)
+        if not success: return ("[]", result)
+        return (json.dumps(result), f"✅ Received {len(result)} values from '{array_name}'.")
+
+class ArduinoSendFrameNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "frame_name": ("STRING", {"default": "led_frame"}),
+            },
+            "optional": {
+                "image": ("IMAGE",),
+                "values": ("STRING", {"default": "", "multiline": True, "tooltip": "Used when no image is connected: floats in 0-1, one per channel (RGB order) or one gray value per pixel."}),
+                "bit_depth": ("INT", {"default": 8, "min": 1, "max": 8, "tooltip": "Levels per channel. 4, 2 and 1 bits are also packed tighter on the wire, for higher frame rates."}),
+                "gamma": ("FLOAT", {"default": 2.2, "min": 0.1, "max": 5.0, "step": 0.1, "tooltip": "LED gamma correction; 1.0 sends values linearly."}),
+                "brightness": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "batch_index": ("INT", {"default": 0, "min": 0, "tooltip": "Image of the batch to show."}),
+            }
+        }
+    RETURN_TYPES = ("STRING",); RETURN_NAMES = ("status",); FUNCTION = "send_frame"; CATEGORY = "Arduino/Communication"
+
+    def send_frame(self, port, frame_name, image=None, values="", bit_depth=8, gamma=2.2, brightness=1.0, batch_index=0):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return (f"❌ ERROR: No profile for {port}. Upload code first.",)
+
+        frame_map = profile.get("frame_map", {})
+        if frame_name not in frame_map:
+            return (f"❌ ERROR: Frame buffer '{frame_name}' not found in profile for {port}.",)
+        frame = frame_map[frame_name]
+
+        try:
+            if image is not None:
+                frame_values = image_to_values(image, frame, batch_index)
+            elif values.strip():
+                frame_values = list_to_values(values, frame)
+            else:
+                return ("❌ ERROR: Connect an image or enter values.",)
+        except (ValueError, TypeError) as e:
+            return (f"❌ ERROR: Could not convert the input to a frame: {e}",)
+
+        data, bits = quantize_and_pack(frame_values, bit_depth, gamma, brightness)
+        success, response = write_frame(port, profile, frame["id"], frame["length"], data, bits)
+        if not success: return (response,)
+        return (f"✅ Sent frame '{frame_name}' ({frame['width']}x{frame['height']}, {bit_depth}-bit, {len(data)} bytes) to {port}.",)
+
+def _sequence_details(profile: dict, name: str, port: str) -> dict:
+    """sequence_map entry of `name` in the port's profile. Raises ValueError with the node's error message."""
+    sequence_map = profile.get("sequence_map", {})
+    if name not in sequence_map:
+        raise ValueError(f"Sequence '{name}' not found in profile for {port}.")
+    return sequence_map[name]
+
+class ArduinoSequenceControlNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "sequence_name": ("STRING", {"default": "my_sequence"}),
+                "action": (list(SEQUENCE_ACTIONS), {"default": "play", "tooltip": "stop rewinds (and empties a streamed sequence), seek jumps to position_ms, status only reports."}),
+            },
+            "optional": {
+                "position_ms": ("INT", {"default": 0, "min": 0, "max": 0xFFFFFFFF}),
+                "trigger": ("*",),
+            }
+        }
+    RETURN_TYPES = ("INT", "STRING",); RETURN_NAMES = ("position_ms", "status",); FUNCTION = "control"; CATEGORY = "Arduino/Communication"
+
+    def control(self, port, sequence_name, action, position_ms=0, trigger=None):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return (-1, f"❌ ERROR: No profile for {port}. Upload code first.",)
+        try:
+            sequence = _sequence_details(profile, sequence_name, port)
+        except ValueError as e:
+            return (-1, f"❌ ERROR: {e}",)
+
+        streamer = get_streamer(port, sequence["id"])
+        if action in ("play", "seek"):
+            # Coalesced writes must not take the board's values of these variables for the last acknowledged ones.
+            mark_sequence_driven(port, sequence.get("indices", []) + ([entry[2] for entry in streamer.entries] if streamer is not None else []))
+        success, result = control_sequence(port, profile, sequence["id"], SEQUENCE_ACTIONS[action], position_ms)
+        if not success: return (-1, result)
+        state, position = result
+        status = f"✅ Sequence '{sequence_name}' {SEQUENCE_STATES.get(state, state)} at {position} ms."
+        if streamer is not None and streamer.last_error:
+            status += f"\n⚠️ Streaming failed: {streamer.last_error}"
+        elif streamer is not None and not streamer.done:
+            status += f"\n   Streaming: {streamer.sent}/{len(streamer.entries)} entries sent."
+        return (position, status)
+
+class ArduinoStreamSequenceNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "port": ("STRING", {"default": "COM3"}),
+                "sequence_name": ("STRING", {"default": "my_sequence"}),
+                "keyframes": ("STRING", {"multiline": True, "default": "0, my_variable, 0, linear\n1000, my_variable, 255",
+                                         "tooltip": "One 'time_ms, variable, value[, step|linear]' per line, or a JSON list."}),
+            },
+            "optional": {
+                "play": ("BOOLEAN", {"default": True, "tooltip": "Start playing as soon as the first entries are buffered."}),
+            }
+        }
+    RETURN_TYPES = ("STRING",); RETURN_NAMES = ("status",); FUNCTION = "stream"; CATEGORY = "Arduino/Communication"
+
+    def stream(self, port, sequence_name, keyframes, play=True):
+        profile = ARDUINO_PROFILES.lookup(port)
+        if profile is None:
+            return (f"❌ ERROR: No profile for {port}. Upload code first.",)
+        try:
+            sequence = _sequence_details(profile, sequence_name, port)
+            if sequence["storage"] != "stream":
+                return (f"❌ ERROR: Sequence '{sequence_name}' is baked into the sketch; only streamed sequences take keyframes at run time.",)
+            # Rewinds the sequence and feeds it from a background thread, so the graph never waits on playback.
+            streamer = stream_sequence(port, profile, sequence, parse_keyframes(keyframes), play)
+        except (ValueError, TypeError) as e:
+            return (f"❌ ERROR: Could not compile the keyframes: {e}",)
+        return (f"✅ Streaming {len(streamer.entries)} entries into '{sequence_name}' on {port}.",)
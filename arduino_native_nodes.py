@@ -1,37 +1,35 @@
 # arduino_native_nodes.py
 
-import copy
-from .src.code_generator import create_communication_map
+from .src.code_block import CodeBlock
+from .src.code_generator import (create_communication_map, create_frame_map, create_sequence_map, check_frame_buffer, check_array_variable,
+                                 check_sequence, FRAME_OUTPUTS, COLOR_ORDERS, SHARED_VARIABLE_TYPES, DEFAULT_SHARED_VARIABLE_TYPE,
+                                 MAX_ARRAY_LENGTH, SEQUENCE_STORAGES, DEFAULT_SEQUENCE_CAPACITY, MAX_SEQUENCE_CAPACITY)
+from .src.sequence import parse_keyframes
 
 ARDUINO_CODE_BLOCK = "ARDUINO_CODE_BLOCK"
 
 def create_empty_code_block():
-    """Creates the base data structure for our Arduino code."""
-    return {
-        "setup_pins": set(),
-        "setup_code": [],
-        "loop_steps": [], # Kept for potential future use, but ignored by current generator
-        "global_vars": [],
-        "shared_variable_names": [],
-        "pin_states": {},
-    }
-
-def _append_code_to_last_step(steps, code_line):
-    if not steps or not isinstance(steps[-1], list):
-        steps.append([])
-    steps[-1].append(code_line)
+    """Creates the base data structure for our Arduino code (an immutable CodeBlock)."""
+    return CodeBlock.empty()
 
 class ArduinoCreateVariableNode:
     @classmethod
     def INPUT_TYPES(s):
-        return { "required": { "variable_name": ("STRING", {"multiline": False, "default": "my_variable"}) }, "optional": { "code_in": (ARDUINO_CODE_BLOCK,), } }
+        return {
+            "required": { "variable_name": ("STRING", {"multiline": False, "default": "my_variable"}) },
+            "optional": {
+                "code_in": (ARDUINO_CODE_BLOCK,),
+                "array_length": ("INT", {"default": 0, "min": 0, "max": MAX_ARRAY_LENGTH, "tooltip": "0 declares a single value. Otherwise an array of that many elements, read and written in bulk with the array nodes or one element at a time as name[i]."}),
+                "element_type": (list(SHARED_VARIABLE_TYPES), {"default": DEFAULT_SHARED_VARIABLE_TYPE, "tooltip": "Storage type of the array's elements; values are clamped to its range."}),
+            }
+        }
     RETURN_TYPES = (ARDUINO_CODE_BLOCK,); RETURN_NAMES = ("code_out",); FUNCTION = "create_var"; CATEGORY = "Arduino/Native"
-    def create_var(self, variable_name, code_in=None):
+    def create_var(self, variable_name, code_in=None, array_length=0, element_type=DEFAULT_SHARED_VARIABLE_TYPE):
         if code_in is None: code_in = create_empty_code_block()
-        new_code_block = copy.deepcopy(code_in)
-        if variable_name not in new_code_block["shared_variable_names"]:
-            new_code_block["shared_variable_names"].append(variable_name)
-        return (new_code_block,)
+        if array_length > 0:
+            check_array_variable(array_length, element_type)
+            return (code_in.with_array_variable(variable_name, array_length, element_type),)
+        return (code_in.with_variable(variable_name),)
         
 class ArduinoVariableInfoNode:
     @classmethod
@@ -45,7 +43,23 @@ class ArduinoVariableInfoNode:
             info += "None detected. Use DigitalWrite or Create Variable nodes."
         else:
             for name, details in comm_map.items():
-                info += f"- {name} (type: {details['type']})\n"
+                if details['type'] == 'array':
+                    info += f"- {name} (type: array of {details['length']} {details['element_type']}, indices {details['index']}-{details['index'] + details['length'] - 1})\n"
+                else:
+                    info += f"- {name} (type: {details['type']})\n"
+        frame_map = create_frame_map(code_block)
+        if frame_map:
+            info += "--- Frame Buffers ---\n"
+            for name, frame in frame_map.items():
+                info += f"- {name} ({frame['output']}, {frame['width']}x{frame['height']} {frame['color_order']}, {frame['length']} values)\n"
+        sequence_map = create_sequence_map(code_block, comm_map)
+        if sequence_map:
+            info += "--- Sequences ---\n"
+            for name, sequence in sequence_map.items():
+                if sequence['storage'] == 'progmem':
+                    info += f"- {name} (baked, {len(sequence['entries'])} entries, {sequence['length_ms']} ms{', loop' if sequence['loop'] else ''})\n"
+                else:
+                    info += f"- {name} (streamed, {sequence['capacity']}-entry buffer)\n"
         return (info,)
 
 class ArduinoDigitalWriteNode:
@@ -55,12 +69,9 @@ class ArduinoDigitalWriteNode:
     RETURN_TYPES = (ARDUINO_CODE_BLOCK,); RETURN_NAMES = ("code_out",); FUNCTION = "generate_code"; CATEGORY = "Arduino/Native"
     def generate_code(self, pin, value, code_in=None):
         if code_in is None: code_in = create_empty_code_block()
-        new_code_block = copy.deepcopy(code_in)
-        new_code_block["setup_pins"].add(pin) 
-        # RENAMING: Use state_pin_X as the variable name
-        new_code_block["pin_states"][f"state_pin_{pin}"] = {"type": "digital", "value": value}
+        # Registers pin as an OUTPUT with a state_pin_X variable holding its initial state.
         # The node no longer adds code to the loop, it just defines the initial state.
-        return (new_code_block,)
+        return (code_in.with_pin_state(pin, "digital", value),)
 
 class ArduinoAnalogWriteNode:
     @classmethod
@@ -69,11 +80,58 @@ class ArduinoAnalogWriteNode:
     RETURN_TYPES = (ARDUINO_CODE_BLOCK,); RETURN_NAMES = ("code_out",); FUNCTION = "generate_code"; CATEGORY = "Arduino/Native"
     def generate_code(self, pin, value, code_in=None):
         if code_in is None: code_in = create_empty_code_block()
-        new_code_block = copy.deepcopy(code_in)
-        new_code_block["setup_pins"].add(pin)
-        # RENAMING: Use state_pin_X as the variable name
-        new_code_block["pin_states"][f"state_pin_{pin}"] = {"type": "analog", "value": value}
-        return (new_code_block,)
+        # Registers pin as an OUTPUT with a state_pin_X variable holding its initial state.
+        return (code_in.with_pin_state(pin, "analog", value),)
+
+class ArduinoFrameBufferNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "name": ("STRING", {"multiline": False, "default": "led_frame"}),
+                "output": (FRAME_OUTPUTS, {"default": "neopixel"}),
+                "width": ("INT", {"default": 16, "min": 1, "max": 1024}),
+                "height": ("INT", {"default": 16, "min": 1, "max": 1024}),
+                "color_order": (list(COLOR_ORDERS), {"default": "GRB", "tooltip": "Channel order the LEDs expect. 'mono' is one channel per pixel (PWM only)."}),
+                "pins": ("STRING", {"default": "6", "tooltip": "NeoPixel: the data pin. PWM: one pin per channel value, comma-separated, in frame order."}),
+            },
+            "optional": {
+                "serpentine": ("BOOLEAN", {"default": False, "tooltip": "Matrix wired in a zigzag: every other row runs backwards."}),
+                "code_in": (ARDUINO_CODE_BLOCK,),
+            }
+        }
+    RETURN_TYPES = (ARDUINO_CODE_BLOCK,); RETURN_NAMES = ("code_out",); FUNCTION = "generate_code"; CATEGORY = "Arduino/Native"
+    def generate_code(self, name, output, width, height, color_order, pins, serpentine=False, code_in=None):
+        if code_in is None: code_in = create_empty_code_block()
+        # Declares a frame buffer the host fills in one bulk transfer (see the Send Frame node).
+        pin_list = [int(p) for p in pins.replace(',', ' ').split()]
+        check_frame_buffer(output, width, height, color_order, pin_list)
+        return (code_in.with_frame_buffer(name, output, width, height, color_order, pin_list, serpentine),)
+
+class ArduinoSequenceNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "name": ("STRING", {"multiline": False, "default": "my_sequence"}),
+                "keyframes": ("STRING", {"multiline": True, "default": "0, state_pin_9, 0, linear\n1000, state_pin_9, 255, linear\n2000, state_pin_9, 0",
+                                         "tooltip": "One 'time_ms, variable, value[, step|linear]' per line, or a JSON list. 'linear' ramps to the variable's next keyframe. Ignored for streamed sequences."}),
+                "storage": (SEQUENCE_STORAGES, {"default": "progmem", "tooltip": "progmem: baked into the sketch's flash. stream: the host streams keyframes into a RAM ring at run time (Stream Sequence node)."}),
+            },
+            "optional": {
+                "loop": ("BOOLEAN", {"default": True, "tooltip": "Baked sequences restart at their last keyframe."}),
+                "autoplay": ("BOOLEAN", {"default": True, "tooltip": "Start playing when the board boots."}),
+                "buffer_entries": ("INT", {"default": DEFAULT_SEQUENCE_CAPACITY, "min": 1, "max": MAX_SEQUENCE_CAPACITY, "tooltip": "Ring size of a streamed sequence (12 bytes of RAM each)."}),
+                "code_in": (ARDUINO_CODE_BLOCK,),
+            }
+        }
+    RETURN_TYPES = (ARDUINO_CODE_BLOCK,); RETURN_NAMES = ("code_out",); FUNCTION = "generate_code"; CATEGORY = "Arduino/Native"
+    def generate_code(self, name, keyframes, storage, loop=True, autoplay=True, buffer_entries=DEFAULT_SEQUENCE_CAPACITY, code_in=None):
+        if code_in is None: code_in = create_empty_code_block()
+        # The board plays the sequence on its own clock; variables are resolved when the sketch is generated.
+        check_sequence(storage, buffer_entries)
+        frames = parse_keyframes(keyframes) if storage == "progmem" else []
+        return (code_in.with_sequence(name, frames, storage, loop, autoplay, buffer_entries),)
 
 class ArduinoDelayNode:
     @classmethod
@@ -82,5 +140,6 @@ class ArduinoDelayNode:
     RETURN_TYPES = (ARDUINO_CODE_BLOCK,); RETURN_NAMES = ("code_out",); FUNCTION = "generate_delay"; CATEGORY = "Arduino/Native"
     def generate_delay(self, delay_ms, code_in=None):
         # This node is now informational and doesn't affect the generated loop code.
+        # Code blocks are immutable, so the input can be passed through as is.
         if code_in is None: code_in = create_empty_code_block()
-        return (copy.deepcopy(code_in),)
\ No newline at end of file
+        return (code_in,)
\ No newline at end of file
@@ -0,0 +1,112 @@
+# benchmarks/bench_code_block.py
+
+"""
+Cost of building a chain of native nodes, old deepcopy dicts vs. CodeBlock.
+
+Each "node" alternates between Create Variable, Digital Write and Analog Write,
+like a long hand-built graph. All intermediate blocks are kept alive, as in
+ComfyUI's output cache. Reported per chain length:
+
+  build: time to run every node of the chain
+  gen:   time to generate the sketch from the last block
+  mem:   memory held by all intermediate blocks
+
+No arduino-cli or board needed.
+
+    python benchmarks/bench_code_block.py --lengths 10 100 1000
+"""
+
+import argparse
+import copy
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.code_block import CodeBlock
+from src.code_generator import create_communication_map, generate_arduino_code
+
+
+# The pre-CodeBlock node implementations, for comparison.
+def legacy_empty():
+    return {"setup_pins": set(), "setup_code": [], "loop_steps": [], "global_vars": [],
+            "shared_variable_names": [], "pin_states": {}}
+
+def legacy_variable(code_in, name):
+    block = copy.deepcopy(code_in)
+    if name not in block["shared_variable_names"]:
+        block["shared_variable_names"].append(name)
+    return block
+
+def legacy_pin(code_in, pin, pin_type, value):
+    block = copy.deepcopy(code_in)
+    block["setup_pins"].add(pin)
+    block["pin_states"][f"state_pin_{pin}"] = {"type": pin_type, "value": value}
+    return block
+
+IMPLEMENTATIONS = {
+    "deepcopy": (legacy_empty, legacy_variable, legacy_pin),
+    "codeblock": (CodeBlock.empty,
+                  lambda block, name: block.with_variable(name),
+                  lambda block, pin, pin_type, value: block.with_pin_state(pin, pin_type, value)),
+}
+
+
+def build_chain(implementation: str, length: int) -> list:
+    empty, add_variable, add_pin = IMPLEMENTATIONS[implementation]
+    blocks = [empty()]
+    for i in range(length):
+        block = blocks[-1]
+        if i % 3 == 0:
+            block = add_variable(block, f"var_{i}")
+        elif i % 3 == 1:
+            block = add_pin(block, i, "digital", "HIGH")
+        else:
+            block = add_pin(block, i, "analog", i % 256)
+        blocks.append(block)
+    return blocks
+
+
+def measure(implementation: str, length: int) -> tuple[float, float, int]:
+    gc.collect()
+    start = time.perf_counter()
+    blocks = build_chain(implementation, length)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    last = blocks[-1]
+    generate_arduino_code(last, 10, create_communication_map(last))
+    gen_time = time.perf_counter() - start
+    del blocks, last
+
+    gc.collect()
+    tracemalloc.start()
+    blocks = build_chain(implementation, length)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del blocks
+    return build_time, gen_time, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    print(f"{'nodes':>6} {'impl':>10} {'build':>10} {'gen':>10} {'mem':>10}")
+    for length in args.lengths:
+        results = {}
+        for implementation in IMPLEMENTATIONS:
+            results[implementation] = measure(implementation, length)
+            build_time, gen_time, memory = results[implementation]
+            print(f"{length:6} {implementation:>10} {build_time * 1000:8.2f}ms {gen_time * 1000:8.2f}ms {memory / 1024:8.0f}KB")
+        old, new = results["deepcopy"], results["codeblock"]
+        print(f"{'':6} {'speedup':>10} {old[0] / new[0]:9.1f}x {'':10} {old[2] / new[2]:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
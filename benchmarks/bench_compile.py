@@ -0,0 +1,84 @@
+# benchmarks/bench_compile.py
+
+"""
+Cold vs. warm compile times for generated sketches.
+
+  cold: the persistent build workspace is wiped before compiling, so the Arduino
+        core and the runtime library are rebuilt from scratch (the old behaviour).
+  warm: the workspace is kept and only the sketch changes between runs (a
+        different initial value), so only the small variable table is recompiled.
+
+Needs arduino-cli (installed by the node on first run) but no board.
+
+    python benchmarks/bench_compile.py --fqbn arduino:avr:uno --runs 3
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.arduino_installer import setup_arduino_cli
+from src.arduino_actions import compile_sketch, get_workspace_root
+from src.code_generator import create_communication_map, generate_arduino_code
+from src.firmware_runtime import RUNTIME_LIBRARY_NAME, get_runtime_library_files
+
+
+def make_code(variant: int, protocol: str) -> str:
+    code_block = {
+        "setup_pins": {9, 13},
+        "shared_variable_names": ["speed", "mode"],
+        "pin_states": {
+            "state_pin_13": {"type": "digital", "value": "HIGH"},
+            "state_pin_9": {"type": "analog", "value": variant % 256},
+        },
+    }
+    return generate_arduino_code(code_block, 10, create_communication_map(code_block), protocol=protocol)
+
+
+def timed_compile(cli_path: str, config_path: str, fqbn: str, code: str) -> float:
+    output_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        success, result = compile_sketch(cli_path, config_path, fqbn, code, output_dir,
+                                         {RUNTIME_LIBRARY_NAME: get_runtime_library_files()})
+        elapsed = time.perf_counter() - start
+        if not success:
+            raise SystemExit(f"Compilation failed: {result}")
+        return elapsed
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fqbn", default="arduino:avr:uno")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--protocol", choices=["ascii", "binary"], default="ascii")
+    args = parser.parse_args()
+
+    cli_path, config_path, error = setup_arduino_cli(ROOT)
+    if error:
+        raise SystemExit(error)
+    workspace_root = get_workspace_root(config_path)
+
+    cold, warm = [], []
+    for run in range(args.runs):
+        shutil.rmtree(workspace_root, ignore_errors=True)
+        cold.append(timed_compile(cli_path, config_path, args.fqbn, make_code(2 * run, args.protocol)))
+        warm.append(timed_compile(cli_path, config_path, args.fqbn, make_code(2 * run + 1, args.protocol)))
+
+    print(f"\n{'':6} {'median':>9} {'min':>9} {'max':>9}   ({args.runs} runs, {args.fqbn})")
+    for label, samples in (("cold", cold), ("warm", warm)):
+        print(f"{label:6} {statistics.median(samples):8.2f}s {min(samples):8.2f}s {max(samples):8.2f}s")
+    print(f"speedup: {statistics.median(cold) / statistics.median(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
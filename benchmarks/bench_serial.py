@@ -0,0 +1,166 @@
+# benchmarks/bench_serial.py
+
+"""
+Serial path and code generation benchmarks, against a simulated board.
+
+Runs on a headless Linux box: the board is a SimulatedDevice on a pty, so no
+hardware, arduino-cli or ComfyUI is needed. Reported:
+
+  send_and_receive:  raw request/reply round trips ("G:<i>")
+  pipelined xN:      N raw requests in flight at once; latency is per batch,
+                     ops/sec counts single requests
+  sender node:       ArduinoSenderNode.send_data, including profile lookup
+  receiver node:     ArduinoReceiverNode.receive_data
+  frame 16x16 RGB:   device_client.write_frame of a 768-value LED frame (8-bit);
+                     ops/sec is frames per second
+  codegen:           create_communication_map + generate_arduino_code for large maps
+
+Latencies are per operation (p50/p90/p99), throughput is sequential ops/sec.
+
+    python benchmarks/bench_serial.py --ops 500 --baud 115200 --protocol binary
+"""
+
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.code_block import CodeBlock
+from src.code_generator import create_communication_map, create_frame_map, generate_arduino_code
+from src.device_simulator import SimulatedDevice
+from src import protocol_codec as codec
+
+PIPELINE_DEPTH = 4  # Requests per batch in the pipelined run (the transport's default window).
+
+
+def load_comms_nodes():
+    """
+    Imports arduino_comms_nodes without running the package __init__ or nodes.py,
+    which would start the arduino-cli installer. The comms nodes only need the
+    ARDUINO_PROFILES table from nodes.py.
+
+    Returns the comms nodes module, the profile table and the serial_communicator
+    the nodes use. Requests must go through that same module: each copy has its
+    own port reader, and two readers on one port would steal each other's replies.
+    """
+    package = types.ModuleType("comfyui_arduino_bench")
+    package.__path__ = [ROOT]
+    sys.modules[package.__name__] = package
+    nodes = types.ModuleType(f"{package.__name__}.nodes")
+    nodes.ARDUINO_PROFILES = {}
+    sys.modules[nodes.__name__] = nodes
+    comms_nodes = importlib.import_module(f"{package.__name__}.arduino_comms_nodes")
+    serial_communicator = importlib.import_module(f"{package.__name__}.src.serial_communicator")
+    return comms_nodes, nodes.ARDUINO_PROFILES, serial_communicator
+
+
+FRAME_SIZE = 16  # Side of the square RGB LED matrix in the frame run.
+
+
+def make_code_block(variables: int) -> CodeBlock:
+    block = CodeBlock.empty()
+    for i in range(variables):
+        if i % 3 == 0:
+            block = block.with_variable(f"var_{i}")
+        elif i % 3 == 1:
+            block = block.with_pin_state(i, "digital", "HIGH")
+        else:
+            block = block.with_pin_state(i, "analog", i % 256)
+    return block
+
+
+def measure(func, ops: int) -> tuple[list[float], float, int]:
+    """Runs func() `ops` times. Returns (latencies, total_seconds, failures)."""
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    for i in range(ops):
+        t = time.perf_counter()
+        if not func(i):
+            failures += 1
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - start, failures
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def report(label: str, latencies: list[float], total: float, failures: int):
+    ms = [s * 1000 for s in latencies]
+    print(f"{label:18} {percentile(ms, 50):8.2f} {percentile(ms, 90):8.2f} {percentile(ms, 99):8.2f} "
+          f"{len(ms) / total:10.0f} {failures:6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=300)
+    parser.add_argument("--protocol", choices=["ascii", "binary"], default="ascii")
+    parser.add_argument("--baud", type=int, default=None, help="Emulated baud rate (default: unlimited).")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Simulated processing time per command.")
+    parser.add_argument("--noise", type=float, default=0.0, help="Probability of a bit flip per byte sent by the board.")
+    parser.add_argument("--variables", type=int, default=12, help="Variables in the simulated sketch.")
+    parser.add_argument("--codegen-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    comms_nodes, profiles, serial_communicator = load_comms_nodes()
+    write_frame = comms_nodes.write_frame
+    block = make_code_block(args.variables)
+    comm_map = create_communication_map(block)
+    names = list(comm_map)
+    frame_map = create_frame_map(CodeBlock.empty().with_frame_buffer("leds", "neopixel", FRAME_SIZE, FRAME_SIZE, "GRB", [6]))
+    frame = frame_map["leds"]
+
+    device = SimulatedDevice(comm_map, protocol=args.protocol, baudrate=args.baud,
+                             processing_delay=args.delay_ms / 1000.0, noise=args.noise, seed=1, frame_map=frame_map)
+    with device:
+        port = device.port
+        profiles[port] = {"port": port, "fqbn": "simulated", "comm_map": comm_map, "frame_map": frame_map, "protocol": args.protocol}
+        sender, receiver = comms_nodes.ArduinoSenderNode(), comms_nodes.ArduinoReceiverNode()
+
+        if args.protocol == "binary":
+            raw = lambda i: serial_communicator.send_and_receive_frame(port, codec.encode_get(i % len(names)), timeout=0.5)[0]
+        else:
+            raw = lambda i: serial_communicator.send_and_receive(port, f"G:{i % len(names)}\n", timeout=0.5)[0]
+        if args.protocol == "binary":
+            many = lambda i: all(ok for ok, _ in serial_communicator.send_and_receive_frames(
+                port, [codec.encode_get(j % len(names)) for j in range(i, i + PIPELINE_DEPTH)], timeout=0.5))
+        else:
+            many = lambda i: all(ok for ok, _ in serial_communicator.send_and_receive_many(
+                port, [f"G:{j % len(names)}\n" for j in range(i, i + PIPELINE_DEPTH)], timeout=0.5))
+        send = lambda i: sender.send_data(port, names[i % len(names)], str(i % 2))[0].startswith("✅")
+        receive = lambda i: receiver.receive_data(port, names[i % len(names)])[1].startswith("✅")
+        frame_data = bytes(i % 256 for i in range(frame["length"]))
+        send_frame = lambda i: write_frame(port, profiles[port], frame["id"], frame["length"], frame_data)[0]
+
+        raw(0)  # Opens the port outside the measurement.
+        print(f"\n{args.ops} ops, protocol={args.protocol}, baud={args.baud or 'unlimited'}, "
+              f"delay={args.delay_ms}ms, noise={args.noise}")
+        print(f"{'':18} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'ops/sec':>10} {'fails':>6}")
+        report("send_and_receive", *measure(raw, args.ops))
+        latencies, total, failures = measure(many, max(1, args.ops // PIPELINE_DEPTH))
+        report(f"pipelined x{PIPELINE_DEPTH}", latencies, total / PIPELINE_DEPTH, failures)
+        report("sender node", *measure(send, args.ops))
+        report("receiver node", *measure(receive, args.ops))
+        report(f"frame {FRAME_SIZE}x{FRAME_SIZE} RGB", *measure(send_frame, max(1, args.ops // 10)))
+        serial_communicator.release_port(port)
+
+    print(f"\n{'variables':>10} {'codegen ms':>11}")
+    for size in args.codegen_sizes:
+        block = make_code_block(size)
+        runs = []
+        for _ in range(5):
+            start = time.perf_counter()
+            generate_arduino_code(block, 10, create_communication_map(block))
+            runs.append(time.perf_counter() - start)
+        print(f"{size:10} {statistics.median(runs) * 1000:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,84 @@
 # nodes.py
 
+import json
 import os
-from .src.arduino_installer import setup_arduino_cli
-from .src.arduino_board_finder import get_available_boards, get_fqbn_by_name
-from .src.arduino_actions import compile_and_upload_sketch
-from .src.code_generator import generate_arduino_code, create_communication_map
-import serial.tools.list_ports
+import time
+from .src.arduino_environment import ArduinoEnvironment
+from .src.arduino_board_finder import get_fqbn_by_name, get_board_clock
+from concurrent.futures import ThreadPoolExecutor
+from .src.arduino_actions import compile_and_upload_sketch, compile_and_upload_to_many, DEFAULT_MAX_PARALLEL_UPLOADS
+from .src.code_generator import (generate_arduino_code, create_communication_map, create_frame_map, create_sequence_map, get_firmware_fingerprint,
+                                 get_required_libraries, check_baud_rate, get_negotiable_baud_rates,
+                                 SHARED_VARIABLE_TYPES, DEFAULT_SHARED_VARIABLE_TYPE, BAUD_RATES, DEFAULT_BAUD_RATE)
+from .src.device_client import PROTOCOLS, PROTOCOL_ASCII, identify, negotiate_baud_rate
+from .src.firmware_runtime import RUNTIME_LIBRARY_NAME, get_runtime_library_files
+from .src.metrics import metrics
+from .src.profile_store import ProfileStore, PROFILES_FILE_NAME
 
 from .arduino_native_nodes import ARDUINO_CODE_BLOCK
 
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # --- GLOBAL PROFILE STORAGE ---
-ARDUINO_PROFILES = {}
+# Saved to disk, so boards flashed before a restart are usable without a new upload.
+ARDUINO_PROFILES = ProfileStore(os.path.join(NODE_DIR, PROFILES_FILE_NAME))
 
-# --- Global Initialization (unchanged) ---
-def list_physical_ports():
-    ports = serial.tools.list_ports.comports()
-    return [f"{p.device} - {p.description}" for p in ports] if ports else ["No COM ports found"]
-NODE_DIR = os.path.dirname(os.path.abspath(__file__))
-print("--- Initializing ComfyUI-Arduino: Setting up arduino-cli ---")
-ARDUINO_CLI_PATH, ARDUINO_CONFIG_PATH, SETUP_ERROR = setup_arduino_cli(NODE_DIR)
-AVAILABLE_BOARDS = ["Error: CLI setup failed"]
-AVAILABLE_PORTS = ["Error: pyserial missing or failed"]
-if SETUP_ERROR is None:
-    print("--- Fetching board lists and COM ports ---")
-    AVAILABLE_BOARDS = get_available_boards(ARDUINO_CLI_PATH, ARDUINO_CONFIG_PATH)
-    AVAILABLE_PORTS = list_physical_ports()
-else:
-    print(f"FATAL: ComfyUI-Arduino setup failed: {SETUP_ERROR}")
+# --- Global Initialization (background) ---
+# arduino-cli setup, `board listall` and port enumeration run on background threads
+# so that loading ComfyUI never waits on them. Nodes wait for it when they execute.
+SETUP_WAIT_TIMEOUT = 300.0
+AUTO_DETECT_BOARD = "Auto-detect (from USB VID/PID)"
+ARDUINO_ENV = ArduinoEnvironment(NODE_DIR)
+ARDUINO_ENV.start()
+
+def _runs_firmware(port, protocol, fingerprint):
+    """True if the board on `port` already runs the firmware with this fingerprint."""
+    if not fingerprint: return False
+    ARDUINO_PROFILES.lookup(port)  # Verifying a saved profile sets the rate the port opens at.
+    found, running = identify(port, protocol)
+    return found and running == fingerprint
+
+def _store_profile(port, fqbn, comm_map, protocol, fingerprint, frame_map=None, sequence_map=None, baud_rate=DEFAULT_BAUD_RATE):
+    # Baked sequence entries live in the sketch; the host only needs their ids and settings.
+    sequences = {name: {k: v for k, v in s.items() if k != "entries"} for name, s in (sequence_map or {}).items()}
+    profile = { "port": port, "fqbn": fqbn, "comm_map": comm_map, "frame_map": frame_map or {}, "sequence_map": sequences, "protocol": protocol,
+                "baud_rate": baud_rate, "fingerprint": fingerprint, "created_at": time.time() }
+    ARDUINO_PROFILES[port] = profile
+    print(f"--- Arduino: Profile for port {port} created and stored. ---")
+    return profile
+
+def _check_baud_rate(fqbn, baud_rate):
+    """Returns an error message if the board's clock cannot produce `baud_rate`, else None."""
+    try:
+        check_baud_rate(baud_rate, fqbn, get_board_clock(ARDUINO_ENV.cli_path, ARDUINO_ENV.config_path, fqbn))
+    except ValueError as e:
+        return str(e)
+    return None
 
 # --- Node Definitions ---
 
 class ArduinoTargetNode:
     @classmethod
     def INPUT_TYPES(s):
-        return { "required": { "board_name": (AVAILABLE_BOARDS, ), "port_str": (AVAILABLE_PORTS, ), } }
+        return { "required": { "board_name": ([AUTO_DETECT_BOARD] + ARDUINO_ENV.boards, ), "port_str": (ARDUINO_ENV.ports, ), } }
     RETURN_TYPES = ("STRING", "STRING", "STRING"); RETURN_NAMES = ("port", "fqbn", "status"); FUNCTION = "define_target"; CATEGORY = "Arduino/Build"
     def define_target(self, board_name, port_str):
-        if SETUP_ERROR is not None: return ("ERROR", "ERROR", f"Setup failed: {SETUP_ERROR}")
+        setup_error = ARDUINO_ENV.check(SETUP_WAIT_TIMEOUT)
+        if setup_error is not None: return ("ERROR", "ERROR", setup_error)
         port = port_str.split(' ')[0]
-        fqbn, error = get_fqbn_by_name(ARDUINO_CLI_PATH, ARDUINO_CONFIG_PATH, board_name)
+        ARDUINO_ENV.port_registry.refresh()
+        detected_fqbn = ARDUINO_ENV.port_registry.detect_fqbn(port)
+
+        if board_name == AUTO_DETECT_BOARD:
+            if detected_fqbn is None:
+                return ("ERROR", "ERROR", f"❌ ERROR: Could not identify the board on {port}. Please select it by name.")
+            return (port, detected_fqbn, f"✅ Target defined: auto-detected {detected_fqbn} on {port}")
+
+        fqbn, error = get_fqbn_by_name(ARDUINO_ENV.cli_path, ARDUINO_ENV.config_path, board_name)
         if error: return ("ERROR", "ERROR", error)
         status_message = f"✅ Target defined: {board_name} ({fqbn}) on {port}"
+        if detected_fqbn is not None and detected_fqbn != fqbn:
+            status_message += f"\n💡 The board on {port} looks like {detected_fqbn}."
         return (port, fqbn, status_message)
 
 class ArduinoCompileUploadNode:
@@ -51,30 +89,165 @@ class ArduinoCompileUploadNode:
                 "port": ("STRING", {"forceInput": True}),
                 "fqbn": ("STRING", {"forceInput": True}),
                 "code_block": (ARDUINO_CODE_BLOCK, {}),
-                "cadence_ms": ("INT", {"default": 10, "min": 1}),
+                "cadence_ms": ("INT", {"default": 10, "min": 1, "tooltip": "How often the board applies changed outputs. Serial input is handled on every loop."}),
+            },
+            "optional": {
+                "protocol": (PROTOCOLS, {"default": PROTOCOL_ASCII}),
+                "use_build_cache": ("BOOLEAN", {"default": True}),
+                "skip_if_unchanged": ("BOOLEAN", {"default": True}),
+                "shared_variable_type": (list(SHARED_VARIABLE_TYPES), {"default": DEFAULT_SHARED_VARIABLE_TYPE, "tooltip": "Storage width of shared variables. Smaller types save RAM; values are clamped to the type's range."}),
+                "baud_rate": (BAUD_RATES, {"default": DEFAULT_BAUD_RATE, "tooltip": "Serial speed the sketch starts at. Checked against the board's clock; senders and receivers use it automatically."}),
+                "negotiate_baud": ("BOOLEAN", {"default": False, "tooltip": "After connecting, step the link up to the fastest rate (115200 to 2000000) that the board answers reliably at."}),
             }
         }
-    RETURN_TYPES = ("STRING",); RETURN_NAMES = ("status",); FUNCTION = "compile_and_upload"; CATEGORY = "Arduino/Build"
+    RETURN_TYPES = ("STRING", "STRING"); RETURN_NAMES = ("status", "memory_usage"); FUNCTION = "compile_and_upload"; CATEGORY = "Arduino/Build"
     
-    def compile_and_upload(self, port, fqbn, code_block, cadence_ms):
-        if SETUP_ERROR is not None: return (f"❌ ERROR: Setup failed: {SETUP_ERROR}",)
-        if port == "ERROR" or fqbn == "ERROR": return ("❌ ERROR: Invalid target.",)
+    def compile_and_upload(self, port, fqbn, code_block, cadence_ms, protocol=PROTOCOL_ASCII, use_build_cache=True, skip_if_unchanged=True, shared_variable_type=DEFAULT_SHARED_VARIABLE_TYPE,
+                           baud_rate=DEFAULT_BAUD_RATE, negotiate_baud=False):
+        setup_error = ARDUINO_ENV.check(SETUP_WAIT_TIMEOUT)
+        if setup_error is not None: return (f"❌ ERROR: {setup_error}", "{}")
+        if port == "ERROR" or fqbn == "ERROR": return ("❌ ERROR: Invalid target.", "{}")
+        baud_error = _check_baud_rate(fqbn, baud_rate)
+        if baud_error is not None: return (f"❌ ERROR: {baud_error}", "{}")
 
         comm_map = create_communication_map(code_block)
-        final_code = generate_arduino_code(code_block, cadence_ms, comm_map)
-        
-        print(f"--- Arduino: Starting compile & upload for {fqbn} on {port} ---")
-        
-        success, message = compile_and_upload_sketch(
-            cli_path=ARDUINO_CLI_PATH, config_path=ARDUINO_CONFIG_PATH,
-            port=port, fqbn=fqbn, code=final_code
-        )
+        frame_map = create_frame_map(code_block)
+        sequence_map = create_sequence_map(code_block, comm_map)
+        final_code = generate_arduino_code(code_block, cadence_ms, comm_map, protocol=protocol, shared_type=shared_variable_type,
+                                           frame_map=frame_map, sequence_map=sequence_map, baud_rate=baud_rate)
+        fingerprint = get_firmware_fingerprint(final_code)
+
+        # If the board already runs this exact firmware, flashing again would only cost time and a reset.
+        if skip_if_unchanged and _runs_firmware(port, protocol, fingerprint):
+            print(f"--- Arduino: {port} already runs firmware {fingerprint}, skipping upload ---")
+            success, message = True, f"⏭️ Board on {port} already runs this firmware ({fingerprint}). Upload skipped."
+            memory_usage = {}
+        else:
+            print(f"--- Arduino: Starting compile & upload for {fqbn} on {port} ---")
+
+            success, message, memory_usage = compile_and_upload_sketch(
+                cli_path=ARDUINO_ENV.cli_path, config_path=ARDUINO_ENV.config_path,
+                port=port, fqbn=fqbn, code=final_code, use_cache=use_build_cache,
+                libraries={RUNTIME_LIBRARY_NAME: get_runtime_library_files()}, required_libraries=get_required_libraries(frame_map)
+            )
         
         if success:
-            profile = { "port": port, "fqbn": fqbn, "comm_map": comm_map }
-            global ARDUINO_PROFILES
-            ARDUINO_PROFILES[port] = profile
-            print(f"--- Arduino: Profile for port {port} created and stored. ---")
+            profile = _store_profile(port, fqbn, comm_map, protocol, fingerprint, frame_map, sequence_map, baud_rate)
             message += f"\n✅ Profile ready for port {port}."
+            if negotiate_baud:
+                message += "\n" + self._negotiate(port, fqbn, profile)
         
-        return (message,)
\ No newline at end of file
+        return (message, json.dumps(memory_usage))
+
+    def _negotiate(self, port, fqbn, profile):
+        print(f"--- Arduino: Negotiating a faster link on {port} ---")
+        rates = get_negotiable_baud_rates(profile["baud_rate"], fqbn, get_board_clock(ARDUINO_ENV.cli_path, ARDUINO_ENV.config_path, fqbn))
+        success, result = negotiate_baud_rate(port, profile, rates)
+        if not success: return f"⚠️ Could not step the link up. {result}"
+        if result == profile["baud_rate"]: return f"⚠️ Link stays at {result} baud: no faster rate was reliable."
+        # Saved with the profile, so the port reopens at this rate after a restart of ComfyUI.
+        ARDUINO_PROFILES[port] = {**profile, "link_baud_rate": result}
+        return f"✅ Link stepped up to {result} baud."
+
+class ArduinoFleetCompileUploadNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "ports": ("STRING", {"default": "COM3\nCOM4", "multiline": True, "tooltip": "One port per line (or comma-separated). All boards must match the FQBN."}),
+                "fqbn": ("STRING", {"forceInput": True}),
+                "code_block": (ARDUINO_CODE_BLOCK, {}),
+                "cadence_ms": ("INT", {"default": 10, "min": 1, "tooltip": "How often the board applies changed outputs. Serial input is handled on every loop."}),
+            },
+            "optional": {
+                "protocol": (PROTOCOLS, {"default": PROTOCOL_ASCII}),
+                "use_build_cache": ("BOOLEAN", {"default": True}),
+                "skip_if_unchanged": ("BOOLEAN", {"default": True}),
+                "shared_variable_type": (list(SHARED_VARIABLE_TYPES), {"default": DEFAULT_SHARED_VARIABLE_TYPE}),
+                "max_parallel_uploads": ("INT", {"default": DEFAULT_MAX_PARALLEL_UPLOADS, "min": 1, "max": 32}),
+                "baud_rate": (BAUD_RATES, {"default": DEFAULT_BAUD_RATE}),
+            }
+        }
+    RETURN_TYPES = ("STRING", "STRING", "STRING"); RETURN_NAMES = ("status", "port_results", "memory_usage"); FUNCTION = "compile_and_upload_fleet"; CATEGORY = "Arduino/Build"
+
+    def compile_and_upload_fleet(self, ports, fqbn, code_block, cadence_ms, protocol=PROTOCOL_ASCII, use_build_cache=True, skip_if_unchanged=True,
+                                 shared_variable_type=DEFAULT_SHARED_VARIABLE_TYPE, max_parallel_uploads=DEFAULT_MAX_PARALLEL_UPLOADS, baud_rate=DEFAULT_BAUD_RATE):
+        setup_error = ARDUINO_ENV.check(SETUP_WAIT_TIMEOUT)
+        if setup_error is not None: return (f"❌ ERROR: {setup_error}", "{}", "{}")
+        if fqbn == "ERROR": return ("❌ ERROR: Invalid target.", "{}", "{}")
+        baud_error = _check_baud_rate(fqbn, baud_rate)
+        if baud_error is not None: return (f"❌ ERROR: {baud_error}", "{}", "{}")
+        port_list = list(dict.fromkeys(p.strip().split(' ')[0] for p in ports.replace(',', '\n').splitlines() if p.strip()))
+        if not port_list: return ("❌ ERROR: No ports given.", "{}", "{}")
+
+        comm_map = create_communication_map(code_block)
+        frame_map = create_frame_map(code_block)
+        sequence_map = create_sequence_map(code_block, comm_map)
+        final_code = generate_arduino_code(code_block, cadence_ms, comm_map, protocol=protocol, shared_type=shared_variable_type,
+                                           frame_map=frame_map, sequence_map=sequence_map, baud_rate=baud_rate)
+        fingerprint = get_firmware_fingerprint(final_code)
+
+        port_results = {}
+        to_upload = port_list
+        if skip_if_unchanged and fingerprint:
+            with ThreadPoolExecutor(max_workers=max(1, max_parallel_uploads)) as executor:
+                up_to_date = dict(zip(port_list, executor.map(lambda p: _runs_firmware(p, protocol, fingerprint), port_list)))
+            for port in port_list:
+                if up_to_date[port]:
+                    port_results[port] = {"success": True, "message": "⏭️ Already runs this firmware. Upload skipped.", "seconds": 0.0}
+            to_upload = [p for p in port_list if not up_to_date[p]]
+
+        message, memory_usage = f"⏭️ All {len(port_list)} board(s) already run this firmware ({fingerprint}).", {}
+        if to_upload:
+            print(f"--- Arduino: Fleet compile & upload for {fqbn} on {', '.join(to_upload)} ---")
+            _, message, upload_results, memory_usage = compile_and_upload_to_many(
+                cli_path=ARDUINO_ENV.cli_path, config_path=ARDUINO_ENV.config_path,
+                ports=to_upload, fqbn=fqbn, code=final_code, use_cache=use_build_cache,
+                libraries={RUNTIME_LIBRARY_NAME: get_runtime_library_files()}, max_workers=max_parallel_uploads,
+                required_libraries=get_required_libraries(frame_map)
+            )
+            port_results.update(upload_results)
+            skipped = len(port_list) - len(to_upload)
+            if skipped: message += f"\n⏭️ {skipped} board(s) already ran this firmware."
+
+        ready = [port for port in port_list if port_results.get(port, {}).get("success")]
+        for port in ready:
+            _store_profile(port, fqbn, comm_map, protocol, fingerprint, frame_map, sequence_map, baud_rate)
+        if ready: message += f"\n✅ Profiles ready for {', '.join(ready)}."
+
+        return (message, json.dumps({port: port_results[port] for port in port_list if port in port_results}), json.dumps(memory_usage))
+
+class ArduinoMetricsNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "enabled": ("BOOLEAN", {"default": True, "tooltip": "Turns timing collection on or off for serial transactions, arduino-cli calls and build phases."}),
+                "format": (["text", "json", "prometheus"], {"default": "text"}),
+            },
+            "optional": {
+                "dump_path": ("STRING", {"default": "", "tooltip": "If set, also writes the metrics to this file (JSON for 'json', Prometheus text otherwise)."}),
+                "reset_after_read": ("BOOLEAN", {"default": False}),
+                "trigger": ("*",),
+            }
+        }
+    RETURN_TYPES = ("STRING",); RETURN_NAMES = ("metrics",); FUNCTION = "report"; CATEGORY = "Arduino/Diagnostics"
+
+    @classmethod
+    def IS_CHANGED(s, **kwargs):
+        # Metrics change between runs even when the inputs do not.
+        return float("nan")
+
+    def report(self, enabled, format, dump_path="", reset_after_read=False, trigger=None):
+        metrics.enabled = enabled
+        if format == "json": report = metrics.to_json()
+        elif format == "prometheus": report = metrics.to_prometheus()
+        else: report = metrics.to_text()
+
+        if dump_path.strip():
+            try:
+                metrics.dump(dump_path.strip(), "json" if format == "json" else "prometheus")
+            except OSError as e:
+                report += f"\n❌ ERROR: Could not write {dump_path}: {e}"
+        if reset_after_read: metrics.reset()
+        return (report,)
@@ -1,62 +1,278 @@
 # src/arduino_actions.py
 
+import json
 import os
+import re
 import shutil
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from .cli_utils import run_cli_command
+from .serial_communicator import release_port
+from .build_cache import get_build_cache, get_core_version, get_library_versions, BuildCache
+from .metrics import metrics
 
-def compile_and_upload_sketch(cli_path: str, config_path: str, port: str, fqbn: str, code: str) -> tuple[bool, str]:
+# Fixed sketch name, so build artifacts are always named "<SKETCH_NAME>.ino.hex" etc.
+SKETCH_NAME = "comfyui_sketch"
+WORKSPACE_DIR_NAME = "build_workspace"
+DEFAULT_MAX_PARALLEL_UPLOADS = 4
+
+# Size summary printed by `arduino-cli compile`, e.g.
+# "Sketch uses 924 bytes (2%) of program storage space. Maximum is 32256 bytes."
+# "Global variables use 9 bytes (0%) of dynamic memory, leaving 2039 bytes for local variables. Maximum is 2048 bytes."
+_PROGRAM_SIZE_RE = re.compile(r"Sketch uses (\d+) bytes.*?of program storage space\.(?: Maximum is (\d+) bytes)?")
+_DATA_SIZE_RE = re.compile(r"Global variables use (\d+) bytes.*?of dynamic memory.*?(?:Maximum is (\d+) bytes)?\.?$", re.MULTILINE)
+
+_installed_libraries: set[str] = set()
+_install_lock = threading.Lock()
+
+_workspace_locks: dict[str, threading.Lock] = {}
+_workspace_locks_guard = threading.Lock()
+
+def _workspace_lock(board_dir: str) -> threading.Lock:
+    with _workspace_locks_guard:
+        return _workspace_locks.setdefault(board_dir, threading.Lock())
+
+def _write_if_changed(path: str, content: str):
+    """Leaves unchanged files untouched so their timestamps keep incremental builds valid."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content: return
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+def parse_memory_usage(compile_output: str) -> dict:
+    """
+    Extracts flash ("program") and RAM ("data") usage from the compiler's size summary:
+    {"program": {"used": 924, "max": 32256, "percent": 2.9}, "data": {...}}.
+    Sections the board's toolchain does not report are left out.
+    """
+    usage = {}
+    for section, pattern in (("program", _PROGRAM_SIZE_RE), ("data", _DATA_SIZE_RE)):
+        match = pattern.search(compile_output or "")
+        if not match: continue
+        used, maximum = int(match.group(1)), int(match.group(2)) if match.group(2) else None
+        usage[section] = {"used": used, "max": maximum,
+                          "percent": round(100.0 * used / maximum, 1) if maximum else None}
+    return usage
+
+def format_memory_usage(usage: dict) -> str:
+    parts = []
+    for section, label in (("program", "Flash"), ("data", "RAM")):
+        if section not in usage: continue
+        details = usage[section]
+        if details["max"]:
+            parts.append(f"{label}: {details['used']}/{details['max']} bytes ({details['percent']}%)")
+        else:
+            parts.append(f"{label}: {details['used']} bytes")
+    return "📊 " + ", ".join(parts) if parts else "📊 Memory usage not reported by the compiler."
+
+def install_libraries(cli_path: str, config_path: str, names: list[str]) -> tuple[bool, str]:
+    """Installs third-party libraries from the Arduino library index, once per session."""
+    with _install_lock:
+        for name in names:
+            if name in _installed_libraries: continue
+            print(f"   - Installing library '{name}'...")
+            success, result = run_cli_command(cli_path, config_path, ["lib", "install", name])
+            if not success:
+                return False, f"Could not install library '{name}': {result}"
+            _installed_libraries.add(name)
+    return True, "OK"
+
+def get_workspace_root(config_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), WORKSPACE_DIR_NAME)
+
+def compile_sketch(cli_path: str, config_path: str, fqbn: str, code: str, output_dir: str, libraries: dict | None = None,
+                   required_libraries: list[str] | None = None) -> tuple[bool, str]:
+    """
+    Compiles `code` for `fqbn` and writes the build artifacts to `output_dir`.
+
+    Builds happen in a persistent workspace next to arduino-cli.yaml: one sketch
+    and build directory per FQBN, plus a core cache shared by all boards. The
+    compiled core and unchanged objects (including `libraries`, given as
+    {library_name: {relative_path: content}}) are therefore reused across runs.
+    `required_libraries` are installed from the library index first.
+    """
+    success, result = install_libraries(cli_path, config_path, required_libraries or [])
+    if not success:
+        return False, result
+
+    workspace_root = get_workspace_root(config_path)
+    board_dir = os.path.join(workspace_root, fqbn.replace(':', '_'))
+    # Arduino CLI requires the .ino file to be in a folder with the same name.
+    sketch_dir = os.path.join(board_dir, SKETCH_NAME)
+    build_path = os.path.join(board_dir, "build")
+    core_cache_path = os.path.join(workspace_root, "core_cache")
+
+    with _workspace_lock(board_dir):
+        library_args = []
+        for name, files in (libraries or {}).items():
+            library_dir = os.path.join(workspace_root, "libraries", name)
+            for relative_path, content in files.items():
+                _write_if_changed(os.path.join(library_dir, relative_path), content)
+            library_args += ["--library", library_dir]
+
+        _write_if_changed(os.path.join(sketch_dir, f"{SKETCH_NAME}.ino"), code)
+        print(f"   - Sketch written to {sketch_dir}")
+
+        print(f"   - Compiling for board {fqbn} (build path: {build_path})...")
+        compile_args = ["compile", "--fqbn", fqbn,
+                        "--build-path", build_path, "--build-cache-path", core_cache_path,
+                        "--output-dir", output_dir] + library_args + [sketch_dir]
+        return run_cli_command(cli_path, config_path, compile_args)
+
+def compile_and_upload_sketch(cli_path: str, config_path: str, port: str, fqbn: str, code: str, use_cache: bool = True, libraries: dict | None = None,
+                              required_libraries: list[str] | None = None) -> tuple[bool, str, dict]:
     """
     Handles the entire process of compiling and uploading an Arduino sketch.
 
+    Compiled artifacts are kept in a persistent build cache keyed on the code,
+    the bundled libraries, the FQBN and the installed core and library versions.
+    On a cache hit, compilation is skipped and the cached artifacts are uploaded directly.
+
     Args:
         cli_path: Path to the arduino-cli executable.
         config_path: Path to the arduino-cli.yaml config file.
         port: The COM port to upload to (e.g., "COM3").
         fqbn: The Fully Qualified Board Name (e.g., "arduino:avr:uno").
         code: A string containing the Arduino C++ code.
+        libraries: Extra libraries to compile with the sketch, {name: {relative_path: content}}.
+        required_libraries: Names of index libraries the sketch includes (installed if missing).
+        use_cache: Set to False to always compile from scratch.
 
     Returns:
         A tuple containing:
         - bool: True if successful, False otherwise.
         - str: A status message detailing the outcome.
+        - dict: Flash and RAM usage of the sketch (see parse_memory_usage), {} if unknown.
     """
-    # Arduino CLI requires the .ino file to be in a folder with the same name.
-    # We create a temporary directory for this.
-    temp_dir = tempfile.mkdtemp()
-    sketch_name = os.path.basename(temp_dir)
-    sketch_path = os.path.join(temp_dir, f"{sketch_name}.ino")
-
+    output_dir = tempfile.mkdtemp()
     try:
-        # 1. Write the code to the temporary .ino file
-        with open(sketch_path, 'w', encoding='utf-8') as f:
-            f.write(code)
-        print(f"   - Temporary sketch created at {sketch_path}")
-
-        # 2. Compile the sketch
-        print(f"   - Compiling for board {fqbn}...")
-        compile_args = ["compile", "--fqbn", fqbn, temp_dir]
-        success, result = run_cli_command(cli_path, config_path, compile_args)
+        # 1. Compile the sketch, or reuse an identical previous build
+        success, result, memory_usage, cache_status = _build_artifacts(cli_path, config_path, fqbn, code, output_dir, use_cache, libraries, required_libraries)
         if not success:
-            error_msg = f"❌ Compilation failed: {result}"
-            print(f"   - {error_msg}")
-            return False, error_msg
-        print("   - ✅ Compilation successful.")
+            return False, result, {}
 
-        # 3. Upload the sketch
-        print(f"   - Uploading to port {port}...")
-        upload_args = ["upload", "-p", port, "--fqbn", fqbn, temp_dir]
-        success, result = run_cli_command(cli_path, config_path, upload_args)
+        # 2. Upload the build artifacts
+        success, upload_result = upload_artifacts(cli_path, config_path, port, fqbn, result)
         if not success:
-            error_msg = f"❌ Upload failed: {result}"
-            print(f"   - {error_msg}")
-            return False, error_msg
-        
-        status_message = f"✅✅✅ Upload to {fqbn} on {port} successful!"
+            return False, upload_result, memory_usage
+
+        status_message = f"✅✅✅ Upload to {fqbn} on {port} successful!\n{format_memory_usage(memory_usage)}\n{cache_status}"
+        print(f"   - {status_message}")
+        return True, status_message, memory_usage
+
+    finally:
+        # 3. Clean up the temporary output directory, regardless of outcome
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+def compile_and_upload_to_many(cli_path: str, config_path: str, ports: list[str], fqbn: str, code: str, use_cache: bool = True,
+                               libraries: dict | None = None, max_workers: int = DEFAULT_MAX_PARALLEL_UPLOADS,
+                               required_libraries: list[str] | None = None) -> tuple[bool, str, dict, dict]:
+    """
+    Fleet deployment: compiles `code` once for `fqbn`, then uploads it to every
+    port in `ports` concurrently, at most `max_workers` at a time.
+
+    Returns:
+        A tuple containing:
+        - bool: True if every upload succeeded.
+        - str: A summary status message.
+        - dict: Per-port results, {port: {"success": bool, "message": str, "seconds": float}}.
+        - dict: Flash and RAM usage of the sketch (see parse_memory_usage), {} if unknown.
+    """
+    ports = list(dict.fromkeys(ports))
+    if not ports:
+        return False, "❌ ERROR: No ports given.", {}, {}
+
+    started = time.perf_counter()
+    output_dir = tempfile.mkdtemp()
+    try:
+        success, result, memory_usage, cache_status = _build_artifacts(cli_path, config_path, fqbn, code, output_dir, use_cache, libraries, required_libraries)
+        if not success:
+            return False, result, {port: {"success": False, "message": result, "seconds": 0.0} for port in ports}, {}
+        build_seconds = time.perf_counter() - started
+
+        def upload(port):
+            upload_started = time.perf_counter()
+            ok, message = upload_artifacts(cli_path, config_path, port, fqbn, result)
+            return {"success": ok, "message": message if not ok else "✅ Uploaded.", "seconds": round(time.perf_counter() - upload_started, 2)}
+
+        print(f"   - Uploading to {len(ports)} port(s), up to {max_workers} at a time...")
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="arduino-upload") as executor:
+            port_results = dict(zip(ports, executor.map(upload, ports)))
+
+        succeeded = sum(1 for r in port_results.values() if r["success"])
+        total_seconds = time.perf_counter() - started
+        lines = [f"{'✅' if succeeded == len(ports) else '⚠️'} Fleet upload to {fqbn}: {succeeded}/{len(ports)} board(s) updated "
+                 f"in {total_seconds:.1f}s (build {build_seconds:.1f}s)."]
+        for port, r in port_results.items():
+            lines.append(f"  ✅ {port} ({r['seconds']:.1f}s)" if r["success"] else f"  ❌ {port} ({r['seconds']:.1f}s): {r['message'].removeprefix('❌ ')}")
+        lines += [format_memory_usage(memory_usage), cache_status]
+        status_message = "\n".join(lines)
         print(f"   - {status_message}")
-        return True, status_message
+        return succeeded == len(ports), status_message, port_results, memory_usage
 
     finally:
-        # 4. Clean up the temporary directory, regardless of outcome
-        print(f"   - Cleaning up temporary sketch directory: {temp_dir}")
-        shutil.rmtree(temp_dir)
\ No newline at end of file
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+def _build_artifacts(cli_path: str, config_path: str, fqbn: str, code: str, output_dir: str, use_cache: bool, libraries: dict | None,
+                     required_libraries: list[str] | None = None) -> tuple[bool, str, dict, str]:
+    """
+    Compiles the sketch into `output_dir`, or finds an identical previous build in the cache.
+    Returns (success, artifacts directory or error message, memory usage, cache status).
+    """
+    cache = get_build_cache(config_path) if use_cache else None
+    input_dir = None
+    cache_status = "Build cache disabled."
+    memory_usage = {}
+
+    if cache is not None:
+        # Installed first so that the key covers the versions the sketch will build against.
+        success, result = install_libraries(cli_path, config_path, required_libraries or [])
+        if not success:
+            return False, f"❌ Compilation failed: {result}", {}, cache_status
+        with metrics.timer("build_phase_seconds", fqbn=fqbn, phase="cache_lookup"):
+            key_source = code + json.dumps(libraries or {}, sort_keys=True)
+            key = BuildCache.make_key(key_source, fqbn, get_core_version(cli_path, config_path, fqbn),
+                                     get_library_versions(cli_path, config_path))
+            input_dir = cache.lookup(key)
+        if input_dir:
+            memory_usage = cache.read_metadata(input_dir).get("memory_usage", {})
+            print(f"   - ♻️ Build cache hit ({key[:12]}), skipping compilation.")
+            cache_status = f"♻️ Build cache hit ({cache.stats()})."
+
+    if input_dir is None:
+        with metrics.timer("build_phase_seconds", fqbn=fqbn, phase="compile"):
+            success, result = compile_sketch(cli_path, config_path, fqbn, code, output_dir, libraries, required_libraries)
+        if not success:
+            error_msg = f"❌ Compilation failed: {result}"
+            print(f"   - {error_msg}")
+            return False, error_msg, {}, cache_status
+        memory_usage = parse_memory_usage(result)
+        print(f"   - ✅ Compilation successful. {format_memory_usage(memory_usage)}")
+        input_dir = output_dir
+        if cache is not None:
+            with metrics.timer("build_phase_seconds", fqbn=fqbn, phase="cache_store"):
+                input_dir = cache.store(key, output_dir, {"fqbn": fqbn, "memory_usage": memory_usage}) or output_dir
+            cache_status = f"Build cache miss, compiled and stored ({cache.stats()})."
+
+    return True, input_dir, memory_usage, cache_status
+
+def upload_artifacts(cli_path: str, config_path: str, port: str, fqbn: str, input_dir: str) -> tuple[bool, str]:
+    """Uploads previously built artifacts from `input_dir` to the board on `port`."""
+    # The uploader needs exclusive access, so drop any pooled connection first.
+    with metrics.timer("build_phase_seconds", fqbn=fqbn, phase="release_port"):
+        release_port(port)
+    print(f"   - Uploading to port {port}...")
+    upload_args = ["upload", "-p", port, "--fqbn", fqbn, "--input-dir", input_dir]
+    with metrics.timer("build_phase_seconds", fqbn=fqbn, phase="upload"):
+        success, result = run_cli_command(cli_path, config_path, upload_args)
+    if not success:
+        error_msg = f"❌ Upload failed on {port}: {result}"
+        print(f"   - {error_msg}")
+        return False, error_msg
+    return True, result
@@ -1,33 +1,164 @@
 # src/arduino_board_finder.py
 
+import json
+import os
+import threading
 from .cli_utils import run_cli_command
 
+CATALOG_FILE_NAME = "board_catalog.json"
+DATA_DIR_NAME = "arduino_data"
+
+
+def installed_cores_signature(config_path: str) -> str:
+    """
+    Cheap fingerprint of the installed cores: the vendor/arch/version directories
+    under the local data dir. It changes whenever a core is installed, upgraded or removed.
+    """
+    hardware_root = os.path.join(os.path.dirname(os.path.abspath(config_path)), DATA_DIR_NAME, "packages")
+    entries = []
+    if os.path.isdir(hardware_root):
+        for vendor in sorted(os.listdir(hardware_root)):
+            hardware_dir = os.path.join(hardware_root, vendor, "hardware")
+            if not os.path.isdir(hardware_dir): continue
+            for arch in sorted(os.listdir(hardware_dir)):
+                arch_dir = os.path.join(hardware_dir, arch)
+                if not os.path.isdir(arch_dir): continue
+                for version in sorted(os.listdir(arch_dir)):
+                    entries.append(f"{vendor}:{arch}@{version}")
+    return ";".join(entries)
+
+
+class BoardCatalog:
+    """
+    Index of every board known to the installed cores, built from one
+    `board listall` call and persisted next to arduino-cli.yaml. It is rebuilt
+    only when the set of installed cores changes.
+    """
+
+    def __init__(self, cli_path: str, config_path: str):
+        self.cli_path = cli_path
+        self.config_path = config_path
+        self.path = os.path.join(os.path.dirname(os.path.abspath(config_path)), CATALOG_FILE_NAME)
+        self.signature = None
+        self.fqbn_by_name: dict[str, str] = {}
+        self.details_by_fqbn: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _load_from_disk(self, signature: str) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("cores_signature") != signature:
+            return False
+        self.fqbn_by_name = data.get("fqbn_by_name", {})
+        self.details_by_fqbn = data.get("details_by_fqbn", {})
+        return True
+
+    def _rebuild(self, signature: str) -> tuple[bool, str | None]:
+        print("--- Building Arduino board catalog (board listall) ---")
+        success, data = run_cli_command(self.cli_path, self.config_path, ["board", "listall", "--format", "json"], expect_json=True)
+        if not success:
+            return False, data
+        if not isinstance(data, dict) or not data.get('boards'):
+            return False, "No boards found by listall command"
+
+        fqbn_by_name, details_by_fqbn = {}, {}
+        for board in data['boards']:
+            name, fqbn = board.get('name'), board.get('fqbn')
+            if not name or not fqbn: continue
+            # The first FQBN listed for a name wins, as with the previous linear scan.
+            fqbn_by_name.setdefault(name, fqbn)
+            details_by_fqbn[fqbn] = board
+        self.fqbn_by_name, self.details_by_fqbn = fqbn_by_name, details_by_fqbn
+
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"cores_signature": signature, "fqbn_by_name": fqbn_by_name, "details_by_fqbn": details_by_fqbn}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not persist board catalog: {e}")
+        return True, None
+
+    def ensure_loaded(self) -> tuple[bool, str | None]:
+        """Makes sure the index matches the installed cores. Returns (success, error)."""
+        signature = installed_cores_signature(self.config_path)
+        with self._lock:
+            if self.signature == signature and self.fqbn_by_name:
+                return True, None
+            if not self._load_from_disk(signature):
+                success, error = self._rebuild(signature)
+                if not success:
+                    return False, error
+            self.signature = signature
+            return True, None
+
+
+_catalogs: dict[str, BoardCatalog] = {}
+
+
+def get_board_catalog(cli_path: str, config_path: str) -> BoardCatalog:
+    if config_path not in _catalogs:
+        _catalogs[config_path] = BoardCatalog(cli_path, config_path)
+    return _catalogs[config_path]
+
+
 def get_available_boards(cli_path: str, config_path: str) -> list[str]:
     """
     Gets a list of all board names known by the installed cores.
     """
-    success, data = run_cli_command(cli_path, config_path, ["board", "listall", "--format", "json"], expect_json=True)
-    
+    catalog = get_board_catalog(cli_path, config_path)
+    success, error = catalog.ensure_loaded()
+
     if not success:
-        print(f"❌ Error fetching all available boards: {data}")
+        print(f"❌ Error fetching all available boards: {error}")
         return ["Error: Could not list boards"]
 
-    if 'boards' in data and data.get('boards'):
-        return sorted(list(set(b['name'] for b in data['boards'])))
-    
-    return ["Error: No boards found by listall command"]
+    return sorted(catalog.fqbn_by_name.keys())
 
 def get_fqbn_by_name(cli_path: str, config_path: str, board_name: str) -> tuple[str | None, str | None]:
     """
     Finds the FQBN for a given board name.
     """
-    success, data = run_cli_command(cli_path, config_path, ["board", "listall", "--format", "json"], expect_json=True)
+    catalog = get_board_catalog(cli_path, config_path)
+    success, error = catalog.ensure_loaded()
 
-    if not success or 'boards' not in data:
+    if not success:
         return None, f"Could not retrieve board list to find FQBN for '{board_name}'"
-    
-    for board in data['boards']:
-        if board.get('name') == board_name:
-            return board.get('fqbn'), None
 
-    return None, f"FQBN for '{board_name}' not found."
\ No newline at end of file
+    fqbn = catalog.fqbn_by_name.get(board_name)
+    if fqbn:
+        return fqbn, None
+
+    return None, f"FQBN for '{board_name}' not found."
+
+def get_board_details(cli_path: str, config_path: str, fqbn: str) -> dict | None:
+    """Returns the listall entry for an FQBN, or None if it is unknown."""
+    catalog = get_board_catalog(cli_path, config_path)
+    success, _ = catalog.ensure_loaded()
+    return catalog.details_by_fqbn.get(fqbn) if success else None
+
+_clocks: dict[str, int | None] = {}
+
+def get_board_clock(cli_path: str, config_path: str, fqbn: str) -> int | None:
+    """
+    CPU clock of a board in Hz (its build.f_cpu property, menu options of the
+    FQBN included), or None if the core does not define one. Cached per FQBN.
+    """
+    if fqbn not in _clocks:
+        success, output = run_cli_command(cli_path, config_path, ["board", "details", "-b", fqbn, "--show-properties=expanded"])
+        if not success:
+            return None  # Not cached: the core may be installed later.
+        clock = None
+        for line in output.splitlines():
+            key, _, value = line.strip().partition('=')
+            if key == "build.f_cpu":
+                try:
+                    clock = int(value.rstrip("uUlL"))
+                except ValueError:
+                    pass
+                break
+        _clocks[fqbn] = clock
+    return _clocks[fqbn]
@@ -0,0 +1,83 @@
+# src/arduino_environment.py
+
+import threading
+from .arduino_installer import setup_arduino_cli
+from .arduino_board_finder import get_available_boards
+from .port_registry import PortRegistry
+
+INITIALIZING_MESSAGE = "Initializing arduino-cli..."
+
+class ArduinoEnvironment:
+    """
+    Sets up arduino-cli and fetches the board list on a background thread, so
+    importing the nodes never blocks ComfyUI's startup. Serial ports are kept
+    up to date separately by `port_registry`, which does not need arduino-cli.
+
+    Callers either peek at the current state (INPUT_TYPES) or wait for it
+    (node functions) with `wait()`.
+    """
+
+    def __init__(self, install_dir: str):
+        self.install_dir = install_dir
+        self.cli_path = None
+        self.config_path = None
+        self.error = None
+        self.boards = [INITIALIZING_MESSAGE]
+        self.port_registry = PortRegistry()
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the background initialization once. Safe to call repeatedly."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._initialize, name="arduino-cli-init", daemon=True)
+                self._thread.start()
+        self.port_registry.start()
+
+    def _initialize(self):
+        try:
+            print("--- Initializing ComfyUI-Arduino: Setting up arduino-cli (background) ---")
+            cli_path, config_path, error = setup_arduino_cli(self.install_dir)
+            if error is not None:
+                print(f"FATAL: ComfyUI-Arduino setup failed: {error}")
+                self.error = error
+                self.boards = ["Error: CLI setup failed"]
+                return
+
+            print("--- Fetching board lists ---")
+            self.cli_path, self.config_path = cli_path, config_path
+            self.boards = get_available_boards(cli_path, config_path)
+            self.port_registry.set_cli(cli_path, config_path)
+            print("--- ComfyUI-Arduino: arduino-cli ready ---")
+        except Exception as e:
+            self.error = f"Unexpected error during initialization: {e}"
+            print(f"FATAL: ComfyUI-Arduino setup failed: {self.error}")
+        finally:
+            self._ready.set()
+
+    @property
+    def ports(self) -> list[str]:
+        """Current serial ports ("<device> - <description>"), from the background scan."""
+        return self.port_registry.port_labels()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Blocks until initialization finished (successfully or not). Returns False on timeout."""
+        self.start()
+        return self._ready.wait(timeout)
+
+    def check(self, timeout: float | None = None) -> str | None:
+        """
+        Waits for initialization and returns None if arduino-cli is usable,
+        otherwise a message explaining why not (still initializing, or failed).
+        """
+        if not self.wait(timeout):
+            return INITIALIZING_MESSAGE
+        if self.error is not None:
+            return f"Setup failed: {self.error}"
+        return None
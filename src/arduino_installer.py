@@ -3,19 +3,38 @@
 import os
 import platform
 import shutil
+import hashlib
 import requests
 import zipfile
 import tarfile
-import io
+import json
 import textwrap
+from urllib.parse import urlparse
 from .cli_utils import run_cli_command
+from .arduino_board_finder import installed_cores_signature
 
 # --- Constants ---
-BASE_URL = "https://downloads.arduino.cc/arduino-cli/arduino-cli_latest"
+# Pinned, so that the archive can be checked against the checksums published with that release.
+ARDUINO_CLI_VERSION = "1.1.1"
+BASE_URL = f"https://downloads.arduino.cc/arduino-cli/arduino-cli_{ARDUINO_CLI_VERSION}"
+CHECKSUMS_URL = f"https://github.com/arduino/arduino-cli/releases/download/v{ARDUINO_CLI_VERSION}/{ARDUINO_CLI_VERSION}-checksums.txt"
 BIN_DIR_NAME = "bin"
 DATA_DIR_NAME = "arduino_data"
 CONFIG_FILE_NAME = "arduino-cli.yaml"
 CORE_TO_INSTALL = "arduino:avr"
+MANIFEST_FILE_NAME = "install_manifest.json"
+CACHE_DIR_NAME = "downloads"
+CHECKSUMS_FILE_NAME = "checksums.txt"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 30  # Seconds without data before a download attempt gives up.
+DOWNLOAD_ATTEMPTS = 3
+
+# Environment overrides, for mirrors and air-gapped machines.
+ENV_ARCHIVE = "COMFY_ARDUINO_CLI_ARCHIVE"  # A local arduino-cli archive to install from.
+ENV_CACHE_DIR = "COMFY_ARDUINO_CLI_CACHE"  # Directory holding (or receiving) downloaded archives.
+ENV_URL = "COMFY_ARDUINO_CLI_URL"  # Download URL to use instead of downloads.arduino.cc.
+ENV_SHA256 = "COMFY_ARDUINO_CLI_SHA256"  # Expected SHA-256 of the archive.
+ENV_CHECKSUMS_URL = "COMFY_ARDUINO_CLI_CHECKSUMS_URL"  # Checksums file to use instead of the release's.
 
 def get_platform_specific_url():
     system = platform.system()
@@ -27,11 +46,181 @@ def get_platform_specific_url():
         return f"{BASE_URL}_macOS_ARM64.tar.gz" if "arm64" in arch else f"{BASE_URL}_macOS_64bit.tar.gz"
     raise NotImplementedError(f"Unsupported OS: {system} {arch}")
 
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _find_sha256(path: str, name: str | None) -> str | None:
+    """The digest in a '<sha256>  <file name>' file: the line for `name`, or the first line if `name` is None."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if fields and (name is None or (len(fields) >= 2 and fields[-1].lstrip('*') == name)):
+                    return fields[0].lower()
+    except OSError:
+        pass
+    return None
+
+def _published_checksums(cache_dir: str) -> str | None:
+    """Path of the release's checksums file, downloaded into the cache once. None if it cannot be fetched."""
+    url = os.environ.get(ENV_CHECKSUMS_URL) or CHECKSUMS_URL
+    path = os.path.join(cache_dir, f"arduino-cli_{ARDUINO_CLI_VERSION}_{CHECKSUMS_FILE_NAME}")
+    if os.path.exists(path):
+        return path
+    try:
+        response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"   ⚠️ Could not fetch the published checksums from {url}: {e}")
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(f"{path}.tmp", 'wb') as f: f.write(response.content)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+def _expected_sha256(archive_path: str, cache_dir: str) -> str | None:
+    """
+    The archive's expected digest: from the environment, a '<archive>.sha256'
+    file, a 'checksums.txt' next to the archive, or else the checksums file
+    published with the pinned arduino-cli release. None if none has it.
+    """
+    if os.environ.get(ENV_SHA256):
+        return os.environ[ENV_SHA256].strip().lower()
+    name = os.path.basename(archive_path)
+    for path, wanted in ((f"{archive_path}.sha256", None), (os.path.join(os.path.dirname(archive_path), CHECKSUMS_FILE_NAME), name)):
+        digest = _find_sha256(path, wanted)
+        if digest: return digest
+    published = _published_checksums(cache_dir)
+    return _find_sha256(published, name) if published else None
+
+def _verify_archive(archive_path: str, expected: str) -> tuple[bool, str]:
+    """Checks the archive against its expected digest. Returns (success, digest or error message)."""
+    actual = _sha256(archive_path)
+    if actual != expected:
+        return False, f"Checksum mismatch for {archive_path}: expected {expected}, got {actual}."
+    return True, actual
+
+def _require_sha256(archive_path: str, cache_dir: str) -> str:
+    expected = _expected_sha256(archive_path, cache_dir)
+    if expected is None:
+        raise RuntimeError(f"No checksum available for {os.path.basename(archive_path)}. Set {ENV_SHA256}, "
+                           f"or put a {CHECKSUMS_FILE_NAME} with its SHA-256 next to the archive.")
+    return expected
+
+def _download(url: str, archive_path: str):
+    """
+    Streams `url` to `archive_path` in chunks through a '.part' file. A failed
+    attempt, in this run or an earlier one, resumes where it stopped with an
+    HTTP Range request. Raises requests' exceptions once every attempt failed.
+    """
+    part_path = f"{archive_path}.part"
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        try:
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            with requests.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 416:
+                    # The range starts past the end: the partial file is not this archive's.
+                    os.remove(part_path)
+                    raise requests.exceptions.HTTPError(f"Range not satisfiable for a {offset}-byte partial download.")
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0  # The server ignored the range and sends the whole archive.
+                length = response.headers.get("Content-Length")
+                total = offset + int(length) if length else None
+                if offset: print(f"   Resuming download at {offset} bytes...")
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            size = os.path.getsize(part_path)
+            if total is not None and size != total:
+                raise requests.exceptions.ConnectionError(f"Connection closed after {size} of {total} bytes.")
+            os.replace(part_path, archive_path)
+            print(f"   Downloaded {size / 1e6:.1f} MB.")
+            return
+        except requests.exceptions.RequestException as e:
+            if attempt == DOWNLOAD_ATTEMPTS: raise
+            print(f"   ⚠️ Download attempt {attempt} failed: {e}")
+
+def _fetch_archive(install_dir: str) -> str:
+    """
+    Path of a verified arduino-cli archive: the local archive named by the
+    environment, the one already in the download cache, or a new download into
+    the cache. Raises RuntimeError if there is no checksum to verify against or
+    the archive does not match it.
+    """
+    cache_dir = os.environ.get(ENV_CACHE_DIR) or os.path.join(install_dir, CACHE_DIR_NAME)
+    seeded = os.environ.get(ENV_ARCHIVE)
+    if seeded:
+        print(f"   Using local archive: {seeded}")
+        success, result = _verify_archive(seeded, _require_sha256(seeded, cache_dir))
+        if not success: raise RuntimeError(result)
+        return seeded
+
+    url = os.environ.get(ENV_URL) or get_platform_specific_url()
+    archive_path = os.path.join(cache_dir, os.path.basename(urlparse(url).path))
+    # Known before the download, so that nothing is fetched that could not be verified.
+    expected = _require_sha256(archive_path, cache_dir)
+    if os.path.exists(archive_path):
+        success, result = _verify_archive(archive_path, expected)
+        if success:
+            print(f"   Using cached archive: {archive_path}")
+            return archive_path
+        print(f"   ⚠️ {result} Downloading it again.")
+        os.remove(archive_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    print(f"   Downloading from: {url}")
+    _download(url, archive_path)
+    success, result = _verify_archive(archive_path, expected)
+    if not success:
+        os.remove(archive_path)
+        raise RuntimeError(result)
+    return archive_path
+
+def _extract_archive(archive_path: str, bin_dir: str):
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as z: z.extractall(bin_dir)
+    else:
+        with tarfile.open(archive_path, mode="r:gz") as t: t.extractall(bin_dir)
+
 def get_cli_executable_path(install_dir: str) -> str:
     bin_dir = os.path.join(install_dir, BIN_DIR_NAME)
     executable_name = "arduino-cli.exe" if platform.system() == "Windows" else "arduino-cli"
     return os.path.join(bin_dir, executable_name)
 
+def _installation_state(cli_path: str, config_path: str) -> dict:
+    """What a verified installation looks like on disk; compared against the saved manifest."""
+    cli_stat = os.stat(cli_path)
+    return {
+        "cli_path": cli_path,
+        "cli_size": cli_stat.st_size,
+        "cli_mtime": cli_stat.st_mtime,
+        "config_mtime": os.path.getmtime(config_path),
+        "core": CORE_TO_INSTALL,
+        "cores_signature": installed_cores_signature(config_path),
+    }
+
+def _is_installation_verified(install_dir: str, cli_path: str, config_path: str) -> bool:
+    try:
+        with open(os.path.join(install_dir, MANIFEST_FILE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f) == _installation_state(cli_path, config_path)
+    except (OSError, ValueError):
+        return False
+
+def _write_manifest(install_dir: str, cli_path: str, config_path: str):
+    manifest_path = os.path.join(install_dir, MANIFEST_FILE_NAME)
+    try:
+        with open(f"{manifest_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(_installation_state(cli_path, config_path), f, indent=2)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+    except OSError as e:
+        print(f"⚠️ Could not write installation manifest: {e}")
+
 def setup_arduino_cli(install_dir: str) -> tuple[str | None, str | None, str | None]:
     cli_path = get_cli_executable_path(install_dir)
     data_dir = os.path.join(install_dir, DATA_DIR_NAME)
@@ -43,14 +232,9 @@ def setup_arduino_cli(install_dir: str) -> tuple[str | None, str | None, str | N
         if os.path.exists(bin_dir): shutil.rmtree(bin_dir)
         os.makedirs(bin_dir, exist_ok=True)
         try:
-            url = get_platform_specific_url()
-            print(f"   Downloading from: {url}")
-            response = requests.get(url, stream=True); response.raise_for_status()
+            archive_path = _fetch_archive(install_dir)
             print("   Extracting archive...")
-            if url.endswith(".zip"):
-                with zipfile.ZipFile(io.BytesIO(response.content)) as z: z.extractall(bin_dir)
-            else:
-                with tarfile.open(fileobj=io.BytesIO(response.content), mode="r:gz") as t: t.extractall(bin_dir)
+            _extract_archive(archive_path, bin_dir)
             if platform.system() != "Windows": os.chmod(cli_path, 0o755)
             print(f"✅ arduino-cli installed successfully: {cli_path}")
         except Exception as e:
@@ -72,6 +256,11 @@ def setup_arduino_cli(install_dir: str) -> tuple[str | None, str | None, str | N
         except Exception as e:
             return None, None, f"Failed to write config file: {e}"
             
+    # Nothing changed since the last successful check: skip the `core list` subprocess.
+    if _is_installation_verified(install_dir, cli_path, config_path):
+        print(f"✅ arduino-cli and core '{CORE_TO_INSTALL}' verified by installation manifest.")
+        return cli_path, config_path, None
+
     print("--- Verifying arduino-cli core installation ---")
     success, data = run_cli_command(cli_path, config_path, ["core", "list", "--format", "json"], expect_json=True)
     if not success: return None, None, f"Error checking installed cores: {data}"
@@ -95,4 +284,5 @@ def setup_arduino_cli(install_dir: str) -> tuple[str | None, str | None, str | N
         if not success: return None, None, f"Error installing core: {res}"
         print(f"✅ Core '{CORE_TO_INSTALL}' installed successfully.")
 
+    _write_manifest(install_dir, cli_path, config_path)
     return cli_path, config_path, None
\ No newline at end of file
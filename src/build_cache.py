@@ -0,0 +1,197 @@
+# src/build_cache.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from .cli_utils import run_cli_command
+from .arduino_board_finder import DATA_DIR_NAME, installed_cores_signature
+
+CACHE_DIR_NAME = "build_cache"
+MANIFEST_NAME = "entry.json"
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Build outputs needed by `arduino-cli upload --input-dir`.
+ARTIFACT_EXTENSIONS = (".hex", ".bin", ".elf", ".eep", ".uf2", ".zip", ".map")
+
+
+# (config_path, platform id) -> (installed cores signature, version), so cache hits skip `core list`.
+_core_versions: dict[tuple[str, str], tuple[str, str]] = {}
+# config_path -> (installed libraries signature, versions), so cache hits skip `lib list`.
+_library_versions: dict[str, tuple[str, str]] = {}
+_versions_lock = threading.Lock()
+
+
+def _installed_libraries_signature(config_path: str) -> str:
+    """
+    Cheap fingerprint of the sketchbook libraries: each library directory and the
+    mtime of its library.properties, which `lib install`/`lib upgrade` rewrite.
+    """
+    libraries_root = os.path.join(os.path.dirname(os.path.abspath(config_path)), DATA_DIR_NAME, "user", "libraries")
+    entries = []
+    if os.path.isdir(libraries_root):
+        for name in sorted(os.listdir(libraries_root)):
+            properties = os.path.join(libraries_root, name, "library.properties")
+            mtime = os.path.getmtime(properties) if os.path.isfile(properties) else 0
+            entries.append(f"{name}@{mtime}")
+    return ";".join(entries)
+
+
+def get_core_version(cli_path: str, config_path: str, fqbn: str) -> str:
+    """
+    Returns the installed version of the core that provides `fqbn` (e.g. "1.8.6"
+    for "arduino:avr:uno"), or "unknown" if it cannot be determined. Asks
+    arduino-cli once per platform until the installed cores change.
+    """
+    platform_id = ":".join(fqbn.split(":")[:2])
+    signature = installed_cores_signature(config_path)
+    with _versions_lock:
+        cached = _core_versions.get((config_path, platform_id))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    success, data = run_cli_command(cli_path, config_path, ["core", "list", "--format", "json"], expect_json=True)
+    if not success or not isinstance(data, dict):
+        return "unknown"  # Not cached: arduino-cli may answer next time.
+    version = "unknown"
+    for core in data.get('platforms', []):
+        if isinstance(core, dict) and core.get('id') == platform_id:
+            version = str(core.get('installed_version') or core.get('installed') or "unknown")
+            break
+    with _versions_lock:
+        _core_versions[(config_path, platform_id)] = (signature, version)
+    return version
+
+
+def get_library_versions(cli_path: str, config_path: str) -> str:
+    """
+    Returns the installed libraries as "name@version;..." (sorted), or "unknown"
+    if arduino-cli cannot list them. Asks arduino-cli again only when the
+    sketchbook libraries change.
+    """
+    signature = _installed_libraries_signature(config_path)
+    with _versions_lock:
+        cached = _library_versions.get(config_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    success, data = run_cli_command(cli_path, config_path, ["lib", "list", "--format", "json"], expect_json=True)
+    if not success:
+        return "unknown"
+    # arduino-cli 0.x prints a bare list, 1.x wraps it in {"installed_libraries": [...]}.
+    entries = data.get('installed_libraries', []) if isinstance(data, dict) else data
+    libraries = []
+    for entry in entries if isinstance(entries, list) else []:
+        library = entry.get('library', entry) if isinstance(entry, dict) else None
+        if isinstance(library, dict) and library.get('name'):
+            libraries.append(f"{library['name']}@{library.get('version', '')}")
+    versions = ";".join(sorted(libraries))
+    with _versions_lock:
+        _library_versions[config_path] = (signature, versions)
+    return versions
+
+
+class BuildCache:
+    """
+    Persistent, content-addressed store of compiled sketches.
+
+    Each entry is a directory named after the cache key and holds the build
+    artifacts plus a small manifest. Entries are evicted least-recently-used
+    first once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def make_key(code: str, fqbn: str, core_version: str, library_versions: str = "") -> str:
+        digest = hashlib.sha256()
+        for part in (code, fqbn, core_version, library_versions):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def lookup(self, key: str) -> str | None:
+        """Returns the directory holding the artifacts for `key`, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+        with self._lock:
+            if not os.path.isfile(manifest_path):
+                self.misses += 1
+                return None
+            self.hits += 1
+            # The manifest's mtime records the last use, for LRU eviction.
+            os.utime(manifest_path, None)
+            return entry_dir
+
+    def read_metadata(self, entry_dir: str) -> dict:
+        """Returns the manifest stored with an entry (the metadata passed to `store`), or {}."""
+        try:
+            with open(os.path.join(entry_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def store(self, key: str, build_dir: str, metadata: dict) -> str | None:
+        """Copies the build artifacts from `build_dir` into the cache. Returns the entry directory."""
+        artifacts = [f for f in os.listdir(build_dir) if f.endswith(ARTIFACT_EXTENSIONS)]
+        if not artifacts:
+            return None
+
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in artifacts:
+            shutil.copy2(os.path.join(build_dir, name), os.path.join(tmp_dir, name))
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump({**metadata, "key": key, "artifacts": artifacts, "created": time.time()}, f, indent=2)
+
+        with self._lock:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._evict()
+        return entry_dir
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """(last_used, size_in_bytes, path) for every complete entry."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            manifest_path = os.path.join(path, MANIFEST_NAME)
+            if not os.path.isfile(manifest_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(manifest_path), size, path))
+        return entries
+
+    def _evict(self):
+        # Called with self._lock held.
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self.max_bytes:
+            _, size, path = entries.pop(0)
+            print(f"   - Build cache full, evicting {os.path.basename(path)[:12]}.")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def stats(self) -> str:
+        return f"{self.hits} hit(s), {self.misses} miss(es) this session"
+
+
+_caches: dict[str, BuildCache] = {}
+
+
+def get_build_cache(config_path: str) -> BuildCache:
+    """Returns the build cache stored next to the arduino-cli config file."""
+    root = os.path.join(os.path.dirname(os.path.abspath(config_path)), CACHE_DIR_NAME)
+    if root not in _caches:
+        _caches[root] = BuildCache(root)
+    return _caches[root]
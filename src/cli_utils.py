@@ -3,11 +3,26 @@
 import subprocess
 import json
 import os
+from .metrics import metrics
+
+# Command groups whose sub-command is part of the metrics label ("core list", "board list", ...).
+_COMMAND_GROUPS = ("board", "core", "lib", "config", "cache")
 
 def run_cli_command(cli_path: str, config_path: str, args: list, expect_json=False):
     """
     Runs a command with arduino-cli using a specific config file.
     """
+    if not metrics.enabled:
+        return _run_cli_command(cli_path, config_path, args, expect_json)
+
+    command_label = " ".join(args[:2]) if args and args[0] in _COMMAND_GROUPS else (args[0] if args else "?")
+    with metrics.timer("cli_command_seconds", command=command_label):
+        success, result = _run_cli_command(cli_path, config_path, args, expect_json)
+    if not success:
+        metrics.inc("cli_failures_total", command=command_label)
+    return success, result
+
+def _run_cli_command(cli_path: str, config_path: str, args: list, expect_json=False):
     # Prepend the config file argument to every command
     command = [cli_path, "--config-file", config_path] + args
     
@@ -0,0 +1,228 @@
+# src/code_block.py
+
+"""
+Immutable code block passed between the native nodes.
+
+Each node used to deepcopy the whole block before adding one pin or variable,
+so a chain of N nodes copied O(N²) data and ComfyUI's output cache kept every
+copy alive. A CodeBlock instead records a single change plus a reference to the
+block it was derived from: deriving is O(1) and all blocks of a chain share
+their common history.
+
+The familiar dict layout ("setup_pins", "pin_states", ...) is still available
+through the read-only Mapping interface. It is rebuilt from the change chain on
+first access and cached, so the code generator can keep treating blocks as dicts.
+"""
+
+import hashlib
+import json
+from collections.abc import Mapping
+from types import MappingProxyType
+
+_CHANGE_VARIABLE = "variable"
+_CHANGE_PIN_STATE = "pin_state"
+_CHANGE_FRAME_BUFFER = "frame_buffer"
+_CHANGE_ARRAY = "array"
+_CHANGE_SEQUENCE = "sequence"
+# Redundancy checks walk back at most this many changes before materializing a
+# checkpoint, which keeps deriving O(1) amortized without a state per block.
+_MAX_UNMATERIALIZED_CHAIN = 64
+
+def _change_key(change: tuple) -> tuple:
+    """What a change sets: later changes with the same key override earlier ones."""
+    # Scalars and arrays share one namespace.
+    return (_CHANGE_VARIABLE if change[0] == _CHANGE_ARRAY else change[0], change[1])
+
+def _state_has(state: dict, change: tuple) -> bool:
+    """Whether `change` would leave a materialized state as it is."""
+    if change[0] == _CHANGE_VARIABLE:
+        return change[1] in state["shared_variable_names"] or change[1] in state["array_variables"]
+    if change[0] == _CHANGE_ARRAY:
+        _, name, length, element_type = change
+        return state["array_variables"].get(name) == {"length": length, "element_type": element_type}
+    if change[0] == _CHANGE_SEQUENCE:
+        _, name, keyframes, storage, loop, autoplay, capacity = change
+        return state["sequences"].get(name) == {"keyframes": keyframes, "storage": storage, "loop": loop,
+                                                "autoplay": autoplay, "capacity": capacity}
+    if change[0] == _CHANGE_FRAME_BUFFER:
+        _, name, output, width, height, color_order, pins, serpentine = change
+        return state["frame_buffers"].get(name) == {"output": output, "width": width, "height": height,
+                                                    "color_order": color_order, "pins": pins, "serpentine": serpentine}
+    _, pin, pin_type, value = change
+    return state["pin_states"].get(f"state_pin_{pin}") == {"type": pin_type, "value": value}
+
+class CodeBlock(Mapping):
+    """A persistent (structurally shared) code block. Use `empty()` and the `with_*` methods."""
+
+    __slots__ = ("_parent", "_change", "_digest", "_state")
+
+    def __init__(self, parent: "CodeBlock | None" = None, change: tuple | None = None):
+        self._parent = parent
+        self._change = change
+        # Chained digest: stable across processes (unlike hash() of str) and O(1) to derive.
+        digest = hashlib.sha256(parent._digest if parent is not None else b"")
+        digest.update(json.dumps(change).encode('utf-8'))
+        self._digest = digest.digest()
+        self._state = None
+
+    @classmethod
+    def empty(cls) -> "CodeBlock":
+        return _EMPTY
+
+    # --- Deriving new blocks ---
+
+    def with_variable(self, name: str) -> "CodeBlock":
+        """Returns a block that also shares `name` with the host (`self` if it already does)."""
+        return self._derive((_CHANGE_VARIABLE, name))
+
+    def with_array_variable(self, name: str, length: int, element_type: str) -> "CodeBlock":
+        """Returns a block that shares the array `name` of `length` elements (replacing a variable of that name)."""
+        return self._derive((_CHANGE_ARRAY, name, length, element_type))
+
+    def with_pin_state(self, pin: int, pin_type: str, value) -> "CodeBlock":
+        """Returns a block that drives `pin` as an OUTPUT with the given initial state."""
+        return self._derive((_CHANGE_PIN_STATE, pin, pin_type, value))
+
+    def _derive(self, change: tuple) -> "CodeBlock":
+        """
+        Returns a block recording `change`, or `self` if the change would not alter
+        the state, so that redundant nodes keep the digest (and cache keys) stable.
+        """
+        key = _change_key(change)
+        node, steps = self, 0
+        while node is not None and node._state is None:
+            if node._change is not None and _change_key(node._change) == key:
+                # Declaring a variable is a no-op once the name is a variable or an array.
+                redundant = node._change == change or change[0] == _CHANGE_VARIABLE
+                return self if redundant else CodeBlock(self, change)
+            node, steps = node._parent, steps + 1
+            if steps > _MAX_UNMATERIALIZED_CHAIN:
+                node = self
+                self._materialize()
+        if node is not None and _state_has(node._state, change):
+            return self
+        return CodeBlock(self, change)
+
+    def with_frame_buffer(self, name: str, output: str, width: int, height: int, color_order: str,
+                          pins: list[int], serpentine: bool = False) -> "CodeBlock":
+        """Returns a block that also declares the frame buffer `name` (replacing one of the same name)."""
+        return self._derive((_CHANGE_FRAME_BUFFER, name, output, width, height, color_order, tuple(pins), serpentine))
+
+    def with_sequence(self, name: str, keyframes: list[tuple[int, str, int, str]], storage: str,
+                      loop: bool = False, autoplay: bool = False, capacity: int = 0) -> "CodeBlock":
+        """
+        Returns a block that also declares the keyframe sequence `name` (replacing
+        one of the same name). Keyframes are (time_ms, variable, value, interpolation).
+        """
+        return self._derive((_CHANGE_SEQUENCE, name, tuple(tuple(k) for k in keyframes), storage, loop, autoplay, capacity))
+
+    # --- Dict view ---
+
+    def _materialize(self) -> dict:
+        if self._state is not None:
+            return self._state
+
+        # Walk back to the nearest block that was already materialized (or the root).
+        changes = []
+        node = self
+        while node is not None and node._state is None:
+            if node._change is not None:
+                changes.append(node._change)
+            node = node._parent
+        base = node._state if node is not None else None
+
+        setup_pins = set(base["setup_pins"]) if base else set()
+        shared_variable_names = list(base["shared_variable_names"]) if base else []
+        known_variables = set(shared_variable_names)
+        pin_states = dict(base["pin_states"]) if base else {}
+        frame_buffers = dict(base["frame_buffers"]) if base else {}
+        array_variables = dict(base["array_variables"]) if base else {}
+        sequences = dict(base["sequences"]) if base else {}
+        for change in reversed(changes):
+            if change[0] == _CHANGE_VARIABLE:
+                if change[1] not in known_variables and change[1] not in array_variables:
+                    known_variables.add(change[1])
+                    shared_variable_names.append(change[1])
+            elif change[0] == _CHANGE_ARRAY:
+                _, name, length, element_type = change
+                if name in known_variables:
+                    known_variables.discard(name)
+                    shared_variable_names.remove(name)
+                array_variables[name] = MappingProxyType({"length": length, "element_type": element_type})
+            elif change[0] == _CHANGE_SEQUENCE:
+                _, name, keyframes, storage, loop, autoplay, capacity = change
+                sequences[name] = MappingProxyType({"keyframes": tuple(tuple(k) for k in keyframes), "storage": storage,
+                                                    "loop": loop, "autoplay": autoplay, "capacity": capacity})
+            elif change[0] == _CHANGE_FRAME_BUFFER:
+                _, name, output, width, height, color_order, pins, serpentine = change
+                frame_buffers[name] = MappingProxyType({"output": output, "width": width, "height": height,
+                                                        "color_order": color_order, "pins": tuple(pins), "serpentine": serpentine})
+            else:
+                _, pin, pin_type, value = change
+                setup_pins.add(pin)
+                pin_states[f"state_pin_{pin}"] = MappingProxyType({"type": pin_type, "value": value})
+
+        self._state = {
+            "setup_pins": frozenset(setup_pins),
+            "setup_code": (),
+            "loop_steps": (),  # Kept for potential future use, but ignored by current generator
+            "global_vars": (),
+            "shared_variable_names": tuple(shared_variable_names),
+            "pin_states": MappingProxyType(pin_states),
+            "frame_buffers": MappingProxyType(frame_buffers),
+            "array_variables": MappingProxyType(array_variables),
+            "sequences": MappingProxyType(sequences),
+        }
+        return self._state
+
+    def __getitem__(self, key):
+        return self._materialize()[key]
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __len__(self):
+        return len(self._materialize())
+
+    # --- Identity ---
+
+    @property
+    def digest(self) -> str:
+        """Hex digest of the block's change history."""
+        return self._digest.hex()
+
+    def __hash__(self):
+        return int.from_bytes(self._digest[:8], "big")
+
+    def __eq__(self, other):
+        if isinstance(other, CodeBlock):
+            return self._digest == other._digest
+        return NotImplemented
+
+    def __repr__(self):
+        return f"CodeBlock({self.digest[:12]})"
+
+    # Immutable, so copies can share the instance.
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # Flatten the chain so pickling long chains does not recurse once per block.
+        changes = []
+        node = self
+        while node is not None:
+            if node._change is not None:
+                changes.append(node._change)
+            node = node._parent
+        return (_from_changes, (tuple(reversed(changes)),))
+
+def _from_changes(changes: tuple) -> CodeBlock:
+    block = _EMPTY
+    for change in changes:
+        block = CodeBlock(block, tuple(change))
+    return block
+
+_EMPTY = CodeBlock()
@@ -1,97 +1,516 @@
 # src/code_generator.py
 
+import hashlib
+import json
+import re
+from .firmware_runtime import RUNTIME_LIBRARY_NAME, get_runtime_version
+from .protocol_codec import VALUE_MIN, VALUE_MAX
+
+MIN_SERIAL_BUFFER_SIZE = 64
+MAX_SERIAL_BUFFER_SIZE = 250
+FINGERPRINT_PLACEHOLDER = "__FIRMWARE_FINGERPRINT__"
+_FINGERPRINT_RE = re.compile(r'#define FIRMWARE_FINGERPRINT "([0-9a-f]+)"')
+
+# Storage for shared variables: C type and the range values are clamped to (None: no clamping).
+SHARED_VARIABLE_TYPES = {
+    "int16": ("int16_t", -32768, 32767),
+    "int8": ("int8_t", -128, 127),
+    "uint8": ("uint8_t", 0, 255),
+}
+DEFAULT_SHARED_VARIABLE_TYPE = "int16"
+
+# Frame buffers: bulk 8-bit channel data (LED pixels, PWM banks) shown all at once on commit.
+FRAME_OUTPUTS = ["neopixel", "pwm"]
+COLOR_ORDERS = {"GRB": 3, "RGB": 3, "BGR": 3, "mono": 1}  # Channels per pixel, in wire order.
+NEOPIXEL_LIBRARY = "Adafruit NeoPixel"
+MAX_FRAME_LENGTH = 4096
+# Sketches with a frame buffer get a larger serial buffer, so each chunk carries ~100 bytes of frame data.
+FRAME_SERIAL_BUFFER_SIZE = 128
+
+# Array variables: element storage uses SHARED_VARIABLE_TYPES. Capped so that a whole array
+# fits one range request or reply (a 'W:' line of 32 int16 values takes ~230 bytes of the
+# MAX_SERIAL_BUFFER_SIZE line buffer), which makes whole-array reads and writes atomic.
+MAX_ARRAY_LENGTH = 32
+
+# Keyframe sequences, played back by the board on its own clock (see _compile_keyframes).
+SEQUENCE_STORAGES = ["progmem", "stream"]  # Baked into flash, or streamed into a RAM ring buffer.
+INTERPOLATIONS = ["step", "linear"]
+MAX_RAMP_MS = 32767  # Longer ramps are split, so the firmware's interpolation stays within int32.
+DEFAULT_SEQUENCE_CAPACITY = 32
+MAX_SEQUENCE_CAPACITY = 255
+
+# Serial line speeds. The sketch opens Serial at the chosen rate; the host may step the
+# link up to a faster one after connecting (see device_client.negotiate_baud_rate).
+BAUD_RATES = [9600, 19200, 38400, 57600, 115200, 230400, 250000, 500000, 1000000, 2000000]
+DEFAULT_BAUD_RATE = 9600
+MIN_NEGOTIATED_BAUD_RATE = 115200
+# Largest clock mismatch a UART tolerates reliably; 115200 baud on a 16 MHz AVR is 2.1% off.
+MAX_BAUD_ERROR = 0.025
+
 def create_communication_map(code_block: dict) -> dict:
+    """
+    Assigns every variable its protocol index. Variables are grouped by storage
+    type (shared, then arrays, then digital, then analog pins, each sorted by
+    name) so the firmware can keep each group in its own compact array. An
+    array takes `length` consecutive indices starting at its "index".
+    """
     comm_map = {}
     index = 0
     for name in sorted(code_block.get('shared_variable_names', [])):
         comm_map[name] = {"index": index, "type": "shared"}
         index += 1
-    for pin_name in sorted(code_block.get('pin_states', {}).keys()):
-        details = code_block['pin_states'][pin_name]
-        if pin_name not in comm_map:
-            comm_map[pin_name] = { "index": index, "type": details["type"], "pin_number": int(pin_name.split('_')[2]) }
-            index += 1
+    array_variables = code_block.get('array_variables', {})
+    for name in sorted(array_variables):
+        details = array_variables[name]
+        comm_map[name] = {"index": index, "type": "array", "length": details["length"], "element_type": details["element_type"]}
+        index += details["length"]
+    pin_states = code_block.get('pin_states', {})
+    for pin_type in ("digital", "analog"):
+        for pin_name in sorted(pin_states.keys()):
+            details = pin_states[pin_name]
+            if pin_name not in comm_map and details["type"] == pin_type:
+                comm_map[pin_name] = { "index": index, "type": details["type"], "pin_number": int(pin_name.split('_')[2]) }
+                index += 1
     return comm_map
 
-def generate_arduino_code(code_block: dict, cadence_ms: int, comm_map: dict) -> str:
-    total_vars = len(comm_map)
-    has_comms = total_vars > 0
+def check_frame_buffer(output: str, width: int, height: int, color_order: str, pins: list[int]):
+    """Raises ValueError if the frame buffer cannot be generated as described."""
+    if output not in FRAME_OUTPUTS:
+        raise ValueError(f"Unknown frame buffer output '{output}'. Use one of {FRAME_OUTPUTS}.")
+    if color_order not in COLOR_ORDERS:
+        raise ValueError(f"Unknown color order '{color_order}'. Use one of {list(COLOR_ORDERS)}.")
+    length = width * height * COLOR_ORDERS[color_order]
+    if not 0 < length <= MAX_FRAME_LENGTH:
+        raise ValueError(f"A frame buffer holds 1 to {MAX_FRAME_LENGTH} channel values, not {length}.")
+    if output == "neopixel":
+        if color_order == "mono":
+            raise ValueError("NeoPixel strips need a color order with three channels.")
+        if len(pins) != 1:
+            raise ValueError("A NeoPixel strip needs exactly one data pin.")
+    elif len(pins) != length:
+        raise ValueError(f"A PWM frame buffer of {length} values needs {length} pins, got {len(pins)}.")
+
+def check_array_variable(length: int, element_type: str):
+    """Raises ValueError if the array variable cannot be generated as described."""
+    if element_type not in SHARED_VARIABLE_TYPES:
+        raise ValueError(f"Unknown element type '{element_type}'. Use one of {list(SHARED_VARIABLE_TYPES)}.")
+    if not 0 < length <= MAX_ARRAY_LENGTH:
+        raise ValueError(f"An array variable holds 1 to {MAX_ARRAY_LENGTH} values, not {length}.")
+
+def uart_baud_error(baud_rate: int, f_cpu: int) -> float:
+    """
+    Relative error of the rate closest to `baud_rate` an AVR USART derives
+    from an `f_cpu` Hz clock, in normal (16x) or double speed (8x) mode.
+    """
+    errors = []
+    for samples in (16, 8):
+        divisor = round(f_cpu / (samples * baud_rate))
+        if 1 <= divisor <= 4096:
+            errors.append(abs(f_cpu / (samples * divisor) - baud_rate) / baud_rate)
+    return min(errors, default=1.0)
+
+def check_baud_rate(baud_rate: int, fqbn: str, f_cpu: int | None = None):
+    """
+    Raises ValueError if the board cannot run its serial port at `baud_rate`.
+    The clock is only checked on AVR boards, whose USART divides the CPU clock;
+    other cores (and unknown clocks) are trusted with every rate in BAUD_RATES.
+    """
+    if baud_rate not in BAUD_RATES:
+        raise ValueError(f"Unsupported baud rate {baud_rate}. Use one of {BAUD_RATES}.")
+    if f_cpu and fqbn.split(':')[1:2] == ["avr"]:
+        error = uart_baud_error(baud_rate, f_cpu)
+        if error > MAX_BAUD_ERROR:
+            raise ValueError(f"{baud_rate} baud is {error:.1%} off on a {f_cpu / 1e6:g} MHz board (at most {MAX_BAUD_ERROR:.1%} is reliable).")
+
+def get_negotiable_baud_rates(baud_rate: int, fqbn: str, f_cpu: int | None = None) -> list[int]:
+    """Rates the link may step up to from `baud_rate`, fastest first."""
+    rates = []
+    for rate in reversed(BAUD_RATES):
+        if rate <= max(baud_rate, MIN_NEGOTIATED_BAUD_RATE - 1): break
+        try:
+            check_baud_rate(rate, fqbn, f_cpu)
+            rates.append(rate)
+        except ValueError:
+            continue
+    return rates
+
+def create_frame_map(code_block: dict) -> dict:
+    """
+    Assigns every frame buffer its protocol id (sorted by name) and the number
+    of channel values it holds, which is what the host sends per frame.
+    """
+    frame_map = {}
+    frame_buffers = code_block.get('frame_buffers', {})
+    for frame_id, name in enumerate(sorted(frame_buffers)):
+        details = dict(frame_buffers[name])
+        details["pins"] = list(details["pins"])
+        details["channels"] = COLOR_ORDERS[details["color_order"]]
+        details["length"] = details["width"] * details["height"] * details["channels"]
+        frame_map[name] = {"id": frame_id, **details}
+    return frame_map
+
+def resolve_variable_index(comm_map: dict, name: str) -> int:
+    """
+    Protocol index of a variable, or of one element of an array variable
+    addressed as 'name[i]'. Raises KeyError for an unknown name, ValueError for
+    a bad element or a bare array name.
+    """
+    base, bracket, element = name.partition('[')
+    details = comm_map.get(base)
+    if details is None or (bracket and details["type"] != "array"):
+        raise KeyError(name)
+    if not bracket:
+        if details["type"] == "array":
+            raise ValueError(f"'{name}' is an array variable. Address one element as '{name}[0]', or use the array nodes.")
+        return details["index"]
+    try:
+        if not element.endswith(']'): raise ValueError
+        element_index = int(element[:-1])
+    except ValueError:
+        raise ValueError(f"Invalid element '{name}'. Use '{base}[i]' with an integer i.")
+    if not 0 <= element_index < details["length"]:
+        raise ValueError(f"Element {element_index} is out of range for '{base}' ({details['length']} elements).")
+    return details["index"] + element_index
+
+def get_value_count(comm_map: dict) -> int:
+    """Number of protocol indices (array elements count one each)."""
+    return sum(details.get("length", 1) for details in comm_map.values())
+
+def check_sequence(storage: str, capacity: int):
+    """Raises ValueError if the sequence cannot be generated as described."""
+    if storage not in SEQUENCE_STORAGES:
+        raise ValueError(f"Unknown sequence storage '{storage}'. Use one of {SEQUENCE_STORAGES}.")
+    if storage == "stream" and not 0 < capacity <= MAX_SEQUENCE_CAPACITY:
+        raise ValueError(f"A streamed sequence buffers 1 to {MAX_SEQUENCE_CAPACITY} entries, not {capacity}.")
+
+def compile_keyframes(keyframes, comm_map: dict) -> tuple[list[tuple[int, int, int, int, int]], int]:
+    """
+    Compiles (time_ms, variable, value, interpolation) keyframes into the
+    firmware's entries, (start_ms, duration_ms, index, from, to) sorted by start,
+    plus the sequence length in ms. A keyframe's interpolation shapes the way to
+    the variable's next keyframe: "step" holds the value, "linear" ramps to the
+    next value. Returns ([], 0) for no keyframes.
+    """
+    by_index = {}
+    for time_ms, variable, value, interpolation in keyframes:
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation '{interpolation}'. Use one of {INTERPOLATIONS}.")
+        if time_ms < 0:
+            raise ValueError(f"Keyframe time {time_ms} ms is negative.")
+        if not VALUE_MIN <= value <= VALUE_MAX:
+            raise ValueError(f"Keyframe value {value} does not fit in int16.")
+        try:
+            index = resolve_variable_index(comm_map, variable)
+        except KeyError:
+            raise ValueError(f"Keyframe for unknown variable '{variable}'.")
+        by_index.setdefault(index, []).append((time_ms, value, interpolation))
+
+    entries = []
+    for index, frames in by_index.items():
+        frames.sort(key=lambda f: f[0])  # Stable: of two keyframes at one time, the later one wins.
+        for (time_ms, value, interpolation), following in zip(frames, frames[1:] + [None]):
+            if interpolation != "linear" or following is None or following[0] == time_ms:
+                entries.append((time_ms, 0, index, value, value))
+                continue
+            total, target = following[0] - time_ms, following[1]
+            for offset in range(0, total, MAX_RAMP_MS):
+                end = min(total, offset + MAX_RAMP_MS)
+                entries.append((time_ms + offset, end - offset, index,
+                                value + (target - value) * offset // total, value + (target - value) * end // total))
+    entries.sort(key=lambda e: e[0])
+    return entries, max((e[0] + e[1] for e in entries), default=0)
+
+def create_sequence_map(code_block: dict, comm_map: dict) -> dict:
+    """
+    Assigns every sequence its protocol id (sorted by name). Baked sequences
+    get their compiled "entries" and "length_ms", and the "indices" of the
+    variables they drive; streamed ones receive their entries at run time
+    (see sequence.SequenceStreamer).
+    """
+    sequence_map = {}
+    sequences = code_block.get('sequences', {})
+    for sequence_id, name in enumerate(sorted(sequences)):
+        details = sequences[name]
+        check_sequence(details["storage"], details["capacity"])
+        entries, length_ms = compile_keyframes(details["keyframes"], comm_map) if details["storage"] == "progmem" else ([], 0)
+        if details["storage"] == "progmem" and not entries:
+            raise ValueError(f"Sequence '{name}' has no keyframes to bake into the sketch.")
+        sequence_map[name] = {"id": sequence_id, "storage": details["storage"], "loop": details["loop"], "autoplay": details["autoplay"],
+                              "capacity": details["capacity"] if details["storage"] == "stream" else 0,
+                              "entries": entries, "length_ms": length_ms, "indices": sorted({e[2] for e in entries})}
+    return sequence_map
+
+def get_serial_buffer_size(comm_map: dict, frame_map: dict | None = None) -> int:
+    """
+    Size of the firmware's line buffer. It grows with the number of variables so
+    that a batch frame can address all of them, and with the longest array so
+    that a range request can carry it whole, within what a small AVR can spare.
+    """
+    size = 4 + 12 * len(comm_map)
+    longest_array = max((d["length"] for d in comm_map.values() if d["type"] == "array"), default=0)
+    if longest_array:
+        size = max(size, 16 + 7 * longest_array)  # Up to "-32768," per value in an ASCII 'W:' line.
+    if frame_map:
+        size = max(size, FRAME_SERIAL_BUFFER_SIZE)
+    return min(MAX_SERIAL_BUFFER_SIZE, max(MIN_SERIAL_BUFFER_SIZE, size))
+
+def get_required_libraries(frame_map: dict) -> list[str]:
+    """Third-party Arduino libraries the sketch includes, to be installed before compiling."""
+    return [NEOPIXEL_LIBRARY] if any(f["output"] == "neopixel" for f in frame_map.values()) else []
+
+def _generate_frame_code(frame_map: dict) -> tuple[str, list[str]]:
+    """
+    Frame buffer storage plus the two hooks the runtime calls (comfyFrameData,
+    comfyFrameShow), and the setup lines. NeoPixel frames are written straight
+    into the strip's pixel buffer, which only reaches the LEDs on show().
+    """
+    lines, setup_lines = [], []
+    if get_required_libraries(frame_map):
+        lines.append("#include <Adafruit_NeoPixel.h>")
+    data_cases, show_cases = [], []
+    for name, frame in frame_map.items():
+        i, length = frame["id"], frame["length"]
+        if frame["output"] == "neopixel":
+            pixels = frame["width"] * frame["height"]
+            lines.append(f"Adafruit_NeoPixel comfyStrip{i}({pixels}, {frame['pins'][0]}, NEO_{frame['color_order']} + NEO_KHZ800); // {name}")
+            data_cases.append(f"    case {i}: *length = {length}; return comfyStrip{i}.getPixels();")
+            show_cases.append(f"    case {i}: comfyStrip{i}.show(); break;")
+            setup_lines.append(f"  comfyStrip{i}.begin();")
+        else:
+            lines.append(f"uint8_t comfyFrame{i}[{length}]; // {name}")
+            lines.append(f"const uint8_t comfyFramePins{i}[{length}] = {{{', '.join(str(p) for p in frame['pins'])}}};")
+            data_cases.append(f"    case {i}: *length = {length}; return comfyFrame{i};")
+            show_cases.append(f"    case {i}: for (uint16_t p = 0; p < {length}; p++) analogWrite(comfyFramePins{i}[p], comfyFrame{i}[p]); break;")
+            setup_lines += [f"  pinMode({pin}, OUTPUT);" for pin in frame["pins"]]
+        setup_lines.append(f"  comfyFrameShow({i}); // Starts dark")
+
+    lines.append("uint8_t* comfyFrameData(uint8_t id, uint16_t* length) {")
+    if data_cases:
+        lines += ["  switch (id) {"] + data_cases + ["  }"]
+    lines += ["  *length = 0;", "  return NULL;", "}"]
+    lines.append("void comfyFrameShow(uint8_t id) {")
+    if show_cases:
+        lines += ["  switch (id) {"] + show_cases + ["  }"]
+    lines.append("}")
+    return "\n".join(lines), setup_lines
+
+def _generate_storage_code(comm_map: dict, shared_type: str) -> str:
+    """
+    Type-specialized variable storage: shared variables in an array of `shared_type`,
+    each array variable in its own array of its element type, digital outputs
+    bit-packed, PWM outputs as uint8_t. Relies on the grouped index order of
+    create_communication_map, so each group is a contiguous index range.
+    """
+    if shared_type not in SHARED_VARIABLE_TYPES:
+        raise ValueError(f"Unknown shared variable type '{shared_type}'. Use one of {list(SHARED_VARIABLE_TYPES)}.")
+    c_type, low, high = SHARED_VARIABLE_TYPES[shared_type]
+    groups = ("shared", "array", "digital", "analog")
+    ordered = sorted(comm_map.values(), key=lambda d: d['index'])
+    if [d['type'] for d in ordered] != sorted((d['type'] for d in ordered), key=groups.index):
+        raise ValueError("comm_map indices must be grouped by type (see create_communication_map).")
+    counts = {kind: sum(d.get('length', 1) for d in comm_map.values() if d['type'] == kind) for kind in groups}
+    arrays = [d for d in ordered if d['type'] == 'array']
+    output_count = counts["digital"] + counts["analog"]
+    array_end = counts['shared'] + counts['array']
+
+    lines = [
+        f"#define SHARED_END {counts['shared']}",
+        f"#define ARRAY_END {array_end}",
+        f"#define DIGITAL_END {array_end + counts['digital']}",
+        f"{c_type} sharedValues[{max(1, counts['shared'])}];",
+    ]
+    for i, details in enumerate(arrays):
+        lines.append(f"{SHARED_VARIABLE_TYPES[details['element_type']][0]} arrayValues{i}[{details['length']}];")
+    lines += [
+        f"uint8_t digitalBits[{max(1, (counts['digital'] + 7) // 8)}];",
+        f"uint8_t pwmValues[{max(1, counts['analog'])}];",
+        f"uint8_t outputDirtyBits[{max(1, (output_count + 7) // 8)}];",
+        "unsigned long lastApplyMs = 0;",
+        "inline bool outputDirty(uint16_t slot) { return outputDirtyBits[slot >> 3] & (1 << (slot & 7)); }",
+        "int comfyReadValue(uint16_t index) {",
+    ]
+    if counts["shared"]:
+        lines.append("  if (index < SHARED_END) return sharedValues[index];")
+    for i, details in enumerate(arrays):
+        lines.append(f"  if (index < {details['index'] + details['length']}) return arrayValues{i}[index - {details['index']}];")
+    if counts["digital"]:
+        lines.append("  if (index < DIGITAL_END) { index -= ARRAY_END; return (digitalBits[index >> 3] >> (index & 7)) & 1; }")
+    lines.append("  return pwmValues[index - DIGITAL_END];" if counts["analog"] else "  return 0;")
+    lines.append("}")
+
+    # Writes are clamped to what the storage can hold; only real changes mark an output dirty.
+    lines.append("void comfyWriteValue(uint16_t index, int value) {")
+    if counts["shared"]:
+        lines.append("  if (index < SHARED_END) {")
+        lines.append(f"    value = constrain(value, {low}, {high});")
+        lines.append("    sharedValues[index] = value;\n    return;\n  }")
+    for i, details in enumerate(arrays):
+        _, element_low, element_high = SHARED_VARIABLE_TYPES[details['element_type']]
+        clamp = f"constrain(value, {element_low}, {element_high})" if element_low is not None else "value"
+        lines.append(f"  if (index < {details['index'] + details['length']}) {{ arrayValues{i}[index - {details['index']}] = {clamp}; return; }}")
+    if counts["digital"]:
+        lines.append("""  if (index < DIGITAL_END) {
+    uint16_t bit = index - ARRAY_END;
+    uint8_t mask = 1 << (bit & 7);
+    if (((digitalBits[bit >> 3] & mask) != 0) == (value != 0)) return;
+    digitalBits[bit >> 3] ^= mask;
+  } else {""")
+    else:
+        lines.append("  {")
+    if counts["analog"]:
+        lines.append("""    value = constrain(value, 0, 255);
+    if (pwmValues[index - DIGITAL_END] == value) return;
+    pwmValues[index - DIGITAL_END] = value;""")
+    else:
+        lines.append("    return;")
+    lines.append("  }")
+    if output_count:
+        lines.append("  uint16_t slot = index - ARRAY_END;")
+        lines.append("  outputDirtyBits[slot >> 3] |= 1 << (slot & 7);")
+    lines.append("}")
+
+    # Only outputs whose value changed since the last pass are rewritten.
+    lines.append("void applyControlValues() {")
+    for details in comm_map.values():
+        slot = details['index'] - array_end
+        if details['type'] == 'digital':
+            lines.append(f"  if (outputDirty({slot})) digitalWrite({details['pin_number']}, comfyReadValue({details['index']}));")
+        elif details['type'] == 'analog':
+            lines.append(f"  if (outputDirty({slot})) analogWrite({details['pin_number']}, comfyReadValue({details['index']}));")
+    lines.append("  memset(outputDirtyBits, 0, sizeof(outputDirtyBits));")
+    lines.append("}")
+    return "\n".join(lines)
+
+def _generate_sequence_code(sequence_map: dict) -> tuple[str, list[str]]:
+    """
+    Sequence tables (PROGMEM, so they cost flash rather than RAM), ring buffers
+    for streamed sequences, the comfySequences table the runtime plays them
+    from, and the setup lines starting autoplay sequences.
+    """
+    lines, rows, setup_lines = [], [], []
+    for name, sequence in sequence_map.items():
+        i = sequence["id"]
+        flags = "COMFY_SEQ_LOOP" if sequence["loop"] else "0"
+        if sequence["storage"] == "progmem":
+            lines.append(f"const ComfySequenceEntry comfySequenceTable{i}[] PROGMEM = {{ // {name}")
+            lines += [f"  {{{start}UL, {duration}, {index}, {start_value}, {end_value}}},"
+                      for start, duration, index, start_value, end_value in sequence["entries"]]
+            lines.append("};")
+            rows.append(f"  {{comfySequenceTable{i}, NULL, 0, {len(sequence['entries'])}, {sequence['length_ms']}UL, {flags}}},")
+        else:
+            lines.append(f"ComfySequenceEntry comfySequenceRing{i}[{sequence['capacity']}]; // {name}")
+            rows.append(f"  {{NULL, comfySequenceRing{i}, {sequence['capacity']}, 0, 0UL, {flags}}},")
+        if sequence["autoplay"]:
+            setup_lines.append(f"  comfySequenceControl({i}, COMFY_SEQ_PLAY, 0); // Autoplay {name}")
+    if rows:
+        lines += ["ComfySequence comfySequences[] = {"] + rows + ["};"]
+    else:
+        lines.append("ComfySequence comfySequences[1];")
+    lines.append(f"extern const uint8_t comfySequenceCount = {len(rows)};")
+    return "\n".join(lines), setup_lines
+
+def generate_arduino_code(code_block: dict, cadence_ms: int, comm_map: dict, protocol: str = "ascii",
+                          shared_type: str = DEFAULT_SHARED_VARIABLE_TYPE, frame_map: dict | None = None,
+                          sequence_map: dict | None = None, baud_rate: int = DEFAULT_BAUD_RATE) -> str:
+    """
+    Generates the sketch. `protocol` selects the serial protocol: "ascii" for the
+    human-readable line protocol, "binary" for COBS-framed packets with a CRC
+    (see protocol_codec). Outputs are applied every `cadence_ms`, and only those
+    whose value changed since the previous pass. `shared_type` is the storage
+    type of shared variables (see SHARED_VARIABLE_TYPES). `frame_map` defaults
+    to create_frame_map(code_block), `sequence_map` to create_sequence_map(code_block, comm_map).
+    Serial opens at `baud_rate`.
+    """
+    if frame_map is None:
+        frame_map = create_frame_map(code_block)
+    if sequence_map is None:
+        sequence_map = create_sequence_map(code_block, comm_map)
+    cadence_ms = max(0, int(cadence_ms))
+    total_vars = get_value_count(comm_map)
+    buffer_size = get_serial_buffer_size(comm_map, frame_map)
+    has_comms = total_vars > 0 or bool(frame_map) or bool(sequence_map)
 
     control_code = ""
+    frame_setup_lines, sequence_setup_lines = [], []
     if has_comms:
-        control_array_def = f"int controlValues[{total_vars}];"
-        apply_state_lines = ["void applyControlValues() {"]
-        for name, details in comm_map.items():
-            if details['type'] == 'digital':
-                apply_state_lines.append(f"  digitalWrite({details['pin_number']}, controlValues[{details['index']}]);")
-            elif details['type'] == 'analog':
-                apply_state_lines.append(f"  analogWrite({details['pin_number']}, controlValues[{details['index']}]);")
-        apply_state_lines.append("}")
-        
-        process_command_lines = [
-            "void processSerialCommand() {",
-            "  char command_type = serialBuffer[0];",
-            "  if ((command_type != 'S' && command_type != 'G') || serialBuffer[1] != ':') return;",
-            "  int index = atoi(serialBuffer + 2);",
-            f"  if (index < 0 || index >= {total_vars}) return;",
-            "",
-            "  if (command_type == 'S') {",
-            "    char* valueStr = strchr(serialBuffer + 2, ':');",
-            "    if (!valueStr) return;",
-            "    controlValues[index] = atoi(valueStr + 1);",
-            "    Serial.print(\"OK:S:\"); Serial.println(index);",
-            "  }",
-            # THE FIX: This now handles 'G' requests for ALL variables, not just shared ones.
-            " else if (command_type == 'G') {",
-            "    Serial.print(\"R:\"); Serial.print(index); Serial.print(\":\"); Serial.println(controlValues[index]);",
-            "  }",
-            "}",
-        ]
-        
+        storage_code = _generate_storage_code(comm_map, shared_type)
+        frame_code, frame_setup_lines = _generate_frame_code(frame_map)
+        sequence_code, sequence_setup_lines = _generate_sequence_code(sequence_map)
+        # The ASCII runtime never touches the transmit buffer, so it only needs a placeholder.
+        tx_buffer_size = "COMFY_SERIAL_BUFFER_SIZE" if protocol == "binary" else "1"
+
+        # The serial runtime lives in the ComfyArduinoRuntime library (see firmware_runtime);
+        # the sketch only provides the variable table it works on.
         control_code = f"""
-#define SERIAL_BUFFER_SIZE 64
-char serialBuffer[SERIAL_BUFFER_SIZE];
-byte serialBufferPos = 0;
-{control_array_def}
-{'\n'.join(apply_state_lines)}
-{'\n'.join(process_command_lines)}
-void checkSerialInput() {{
-  while (Serial.available() > 0) {{
-    char inChar = Serial.read();
-    if (inChar == '\\n' || inChar == '\\r') {{
-      if (serialBufferPos > 0) {{
-        serialBuffer[serialBufferPos] = '\\0';
-        processSerialCommand();
-        serialBufferPos = 0;
-      }}
-    }} else if (serialBufferPos < SERIAL_BUFFER_SIZE - 1) {{
-      serialBuffer[serialBufferPos++] = inChar;
-    }}
-  }}
-}}"""
+#include <{RUNTIME_LIBRARY_NAME}.h>
 
+#define COMFY_RUNTIME_VERSION "{get_runtime_version()}"
+#define FIRMWARE_FINGERPRINT "{FINGERPRINT_PLACEHOLDER}"
+#define COMFY_SERIAL_BUFFER_SIZE {buffer_size}
+extern const char comfyFirmwareFingerprint[] = FIRMWARE_FINGERPRINT;
+extern const uint16_t comfyValueCount = {total_vars};
+extern const uint8_t comfySerialBufferSize = COMFY_SERIAL_BUFFER_SIZE;
+extern const unsigned long comfyBaudRate = {int(baud_rate)}UL;
+uint8_t comfySerialBuffer[COMFY_SERIAL_BUFFER_SIZE];
+uint8_t comfyTxBuffer[{tx_buffer_size}];
+#define CADENCE_MS {cadence_ms}UL
+{storage_code}
+{frame_code}
+{sequence_code}"""
+
+    runtime_prefix = "comfyBinary" if protocol == "binary" else "comfyAscii"
     setup_lines = []
-    if has_comms: setup_lines.append("  Serial.begin(9600);")
+    if has_comms: setup_lines.append("  Serial.begin(comfyBaudRate);")
     for pin in sorted(list(code_block.get('setup_pins', set()))):
         setup_lines.append(f"  pinMode({pin}, OUTPUT);")
     for name, details in comm_map.items():
+        if details['type'] == 'array': continue  # Globals start zeroed.
         initial_value = 0
         if details['type'] != 'shared' and name in code_block['pin_states']:
             val = code_block['pin_states'][name]['value']
             if isinstance(val, str) and val.upper() == 'HIGH': initial_value = 1
             elif isinstance(val, str) and val.upper() == 'LOW': initial_value = 0
             else: initial_value = val
-        setup_lines.append(f"  controlValues[{details['index']}] = {initial_value}; // Initial state for {name}")
+        setup_lines.append(f"  comfyWriteValue({details['index']}, {initial_value}); // Initial state for {name}")
+    setup_lines += frame_setup_lines
+    setup_lines += sequence_setup_lines
+    if has_comms:
+        # Every output starts dirty so its initial state is written once.
+        setup_lines.append("  memset(outputDirtyBits, 0xFF, sizeof(outputDirtyBits));")
+        setup_lines.append("  applyControlValues();")
+        setup_lines.append("  lastApplyMs = millis();")
+        setup_lines.append(f"  {runtime_prefix}AnnounceReady();")
 
-    loop_body = "  applyControlValues();" if has_comms else "// Empty loop"
-    serial_check_call = "  checkSerialInput();" if has_comms else ""
+    # Serial input is polled every iteration; outputs are applied every cadence_ms.
+    loop_body = """  unsigned long now = millis();
+  if (now - lastApplyMs >= CADENCE_MS) {
+    lastApplyMs = now;
+    applyControlValues();
+  }""" if has_comms else "// Empty loop"
+    serial_check_call = f"  {runtime_prefix}CheckSerialInput();\n  {runtime_prefix}TelemetryTick();" if has_comms else ""
+    if sequence_map:
+        # Sequences run on the board's clock; their values go out with the next apply pass.
+        serial_check_call += "\n  comfySequencesTick();"
+    setup_code = "\n".join(setup_lines)
     final_code = f"""
 {control_code}
 void setup() {{
-{'\n'.join(setup_lines)}
+{setup_code}
 }}
 void loop() {{
 {serial_check_call}
 {loop_body}
 }}"""
-    return final_code.strip()
\ No newline at end of file
+    final_code = final_code.strip()
+    return final_code.replace(FINGERPRINT_PLACEHOLDER, compute_firmware_fingerprint(final_code, comm_map))
+
+def compute_firmware_fingerprint(code: str, comm_map: dict) -> str:
+    """Short hash identifying a sketch and the comm map it was generated with."""
+    digest = hashlib.sha256(code.encode('utf-8'))
+    digest.update(json.dumps(comm_map, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def get_firmware_fingerprint(code: str) -> str | None:
+    """Extracts the fingerprint embedded by generate_arduino_code, if any."""
+    match = _FINGERPRINT_RE.search(code)
+    return match.group(1) if match else None
\ No newline at end of file
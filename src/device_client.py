@@ -0,0 +1,500 @@
+# src/device_client.py
+
+"""
+Reads and writes variables on a board described by an ARDUINO_PROFILES entry,
+using whichever wire protocol its sketch was generated with.
+
+All functions return (success, result). On failure, result is a status string
+ready to be shown by a node.
+"""
+
+from . import protocol_codec as codec
+import time
+from .code_generator import get_serial_buffer_size, MAX_FRAME_LENGTH, DEFAULT_BAUD_RATE
+from .serial_communicator import (send_and_receive, send_and_receive_many, send_and_receive_frame,
+                                  send_and_receive_frames, connection_pool, ASCII_TAG_MAX_LEN)
+from . import telemetry
+
+PROTOCOL_ASCII = "ascii"
+PROTOCOL_BINARY = "binary"
+PROTOCOLS = [PROTOCOL_ASCII, PROTOCOL_BINARY]
+# Values per ASCII range read: about 450 characters, half a second of reply at 9600 baud.
+ASCII_RANGE_CHUNK = 64
+# Seconds a board gets to answer at a rate it just switched to, and to fall back to its
+# boot rate when that answer never came through (COMFY_BAUD_PROBATION_MS, plus slack).
+BAUD_CONFIRM_TIMEOUT = 0.3
+BAUD_PROBATION = 1.2
+
+
+def _split_frames(prefix: str, items: list[str], max_len: int) -> list[list[str]]:
+    """
+    Groups ASCII batch items into as few frames as possible, each fitting the
+    firmware's line buffer ('prefix' + comma-joined items + terminator).
+    """
+    frames, current, length = [], [], len(prefix) + 1
+    for item in items:
+        extra = len(item) + (1 if current else 0)
+        if current and length + extra > max_len:
+            frames.append(current)
+            current, length, extra = [], len(prefix) + 1, len(item)
+        current.append(item)
+        length += extra
+    if current: frames.append(current)
+    return frames
+
+
+def _ascii_line_size(profile: dict) -> int:
+    # Room left in the firmware's line buffer once the sequence tag is in.
+    return _serial_buffer_size(profile) - ASCII_TAG_MAX_LEN
+
+
+def _binary_batch_size(profile: dict) -> int:
+    # Worst case per item is a 2-byte varint index plus a 2-byte value; keep room
+    # for the opcode, sequence byte, count, CRC, COBS overhead and delimiter.
+    return max(1, (_serial_buffer_size(profile) - 8) // 4)
+
+
+def _serial_buffer_size(profile: dict) -> int:
+    return get_serial_buffer_size(profile.get("comm_map", {}), profile.get("frame_map"))
+
+
+def _frame_chunk_size(profile: dict, frame_id: int) -> int:
+    """Bytes of packed frame data that fit one request, tag included."""
+    if profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY:
+        # Opcode, sequence byte, id, 2-byte offset, flags, CRC, COBS overhead and the slack _binary_batch_size keeps.
+        return _serial_buffer_size(profile) - 10
+    prefix = f"F:{frame_id}:{MAX_FRAME_LENGTH}:9:"
+    return (_ascii_line_size(profile) - len(prefix) - 1) // 2
+
+
+def _binary_range_size(profile: dict) -> int:
+    # int16 values per range request or reply, with the same room for framing as _frame_chunk_size.
+    return max(1, (_serial_buffer_size(profile) - 10) // 2)
+
+
+def _chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# --- ASCII line protocol ---
+
+def _ascii_set(port: str, profile: dict, items: list[tuple[int, int]]) -> tuple[bool, str]:
+    if len(items) == 1:
+        index, value = items[0]
+        success, response = send_and_receive(port, f"S:{index}:{value}\n")
+        if not success: return False, f"❌ ERROR: {response}"
+        if not response.startswith(f"OK:S:{index}"):
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+        return True, response
+
+    entries = [f"{index}={value}" for index, value in items]
+    frames = _split_frames("M:", entries, _ascii_line_size(profile))
+    responses = send_and_receive_many(port, ["M:" + ",".join(frame) + "\n" for frame in frames])
+    for frame, (success, response) in zip(frames, responses):
+        if not success: return False, f"❌ ERROR: {response}"
+        if response != f"OK:M:{len(frame)}":
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+    return True, f"OK:M:{len(items)}"
+
+
+def _ascii_get(port: str, profile: dict, indices: list[int]) -> tuple[bool, list[int] | str]:
+    if len(indices) == 1:
+        index = indices[0]
+        success, response = send_and_receive(port, f"G:{index}\n")
+        if not success: return False, f"❌ ERROR: {response}"
+        parts = response.split(':')
+        if len(parts) != 3 or parts[0] != 'R' or parts[1] != str(index):
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+        try:
+            return True, [int(parts[2])]
+        except ValueError:
+            return False, f"⚠️ INVALID VALUE in response: {response}"
+
+    values = []
+    entries = [str(index) for index in indices]
+    frames = _split_frames("Q:", entries, _ascii_line_size(profile))
+    responses = send_and_receive_many(port, ["Q:" + ",".join(frame) + "\n" for frame in frames])
+    for frame, (success, response) in zip(frames, responses):
+        if not success: return False, f"❌ ERROR: {response}"
+        if not response.startswith("R:Q:"):
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+        parts = response[4:].split(',')
+        if len(parts) != len(frame):
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+        try:
+            values.extend(int(part) for part in parts)
+        except ValueError:
+            return False, f"⚠️ INVALID VALUE in response: {response}"
+    return True, values
+
+
+def _ascii_set_range(port: str, profile: dict, start: int, values: list[int]) -> tuple[bool, str]:
+    # The widest start index any frame can have sizes the prefix for all of them.
+    frames = _split_frames(f"W:{start + len(values)}:", [str(v) for v in values], _ascii_line_size(profile))
+    requests, offset = [], start
+    for frame in frames:
+        requests.append(f"W:{offset}:" + ",".join(frame) + "\n")
+        offset += len(frame)
+    for frame, (success, response) in zip(frames, send_and_receive_many(port, requests)):
+        if not success: return False, f"❌ ERROR: {response}"
+        if response != f"OK:W:{len(frame)}":
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+    return True, f"OK:W:{len(values)}"
+
+
+def _ascii_get_range(port: str, profile: dict, start: int, count: int) -> tuple[bool, list[int] | str]:
+    # The request is tiny, but long replies are split so each one arrives well within the reply timeout.
+    chunks = [(offset, min(ASCII_RANGE_CHUNK, start + count - offset)) for offset in range(start, start + count, ASCII_RANGE_CHUNK)]
+    responses = send_and_receive_many(port, [f"A:{offset}:{size}\n" for offset, size in chunks])
+    values = []
+    for (offset, size), (success, response) in zip(chunks, responses):
+        if not success: return False, f"❌ ERROR: {response}"
+        prefix = f"R:A:{offset}:"
+        if not response.startswith(prefix):
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+        parts = response[len(prefix):].split(',')
+        if len(parts) != size:
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+        try:
+            values.extend(int(part) for part in parts)
+        except ValueError:
+            return False, f"⚠️ INVALID VALUE in response: {response}"
+    return True, values
+
+
+# --- Binary framed protocol ---
+
+def _binary_set(port: str, profile: dict, items: list[tuple[int, int]]) -> tuple[bool, str]:
+    try:
+        if len(items) == 1:
+            success, reply = send_and_receive_frame(port, codec.encode_set(*items[0]))
+            if not success: return False, f"❌ ERROR: {reply}"
+            if codec.decode_set_reply(reply) != items[0][0]:
+                return False, "⚠️ UNEXPECTED RESPONSE: acknowledgement for another index."
+            return True, "OK:S"
+
+        chunks = _chunks(items, _binary_batch_size(profile))
+        replies = send_and_receive_frames(port, [codec.encode_set_many(chunk) for chunk in chunks])
+        for chunk, (success, reply) in zip(chunks, replies):
+            if not success: return False, f"❌ ERROR: {reply}"
+            if codec.decode_set_many_reply(reply) != len(chunk):
+                return False, "⚠️ UNEXPECTED RESPONSE: device applied fewer values than sent."
+        return True, f"OK:M:{len(items)}"
+    except ValueError as e:
+        # Covers both out-of-range values and codec.FrameError.
+        return False, f"❌ ERROR: {e}"
+
+
+def _binary_get(port: str, profile: dict, indices: list[int]) -> tuple[bool, list[int] | str]:
+    try:
+        if len(indices) == 1:
+            success, reply = send_and_receive_frame(port, codec.encode_get(indices[0]))
+            if not success: return False, f"❌ ERROR: {reply}"
+            index, value = codec.decode_get_reply(reply)
+            if index != indices[0]:
+                return False, "⚠️ UNEXPECTED RESPONSE: value for another index."
+            return True, [value]
+
+        values = []
+        chunks = _chunks(indices, _binary_batch_size(profile))
+        replies = send_and_receive_frames(port, [codec.encode_get_many(chunk) for chunk in chunks])
+        for chunk, (success, reply) in zip(chunks, replies):
+            if not success: return False, f"❌ ERROR: {reply}"
+            chunk_values = codec.decode_get_many_reply(reply)
+            if len(chunk_values) != len(chunk):
+                return False, "⚠️ UNEXPECTED RESPONSE: wrong number of values."
+            values.extend(chunk_values)
+        return True, values
+    except ValueError as e:
+        return False, f"❌ ERROR: {e}"
+
+
+def _binary_set_range(port: str, profile: dict, start: int, values: list[int]) -> tuple[bool, str]:
+    size = _binary_range_size(profile)
+    try:
+        chunks = [(start + i, values[i:i + size]) for i in range(0, len(values), size)]
+        replies = send_and_receive_frames(port, [codec.encode_set_range(offset, chunk) for offset, chunk in chunks])
+        for (_, chunk), (success, reply) in zip(chunks, replies):
+            if not success: return False, f"❌ ERROR: {reply}"
+            if codec.decode_set_range_reply(reply) != len(chunk):
+                return False, "⚠️ UNEXPECTED RESPONSE: device applied fewer values than sent."
+        return True, f"OK:W:{len(values)}"
+    except ValueError as e:
+        return False, f"❌ ERROR: {e}"
+
+
+def _binary_get_range(port: str, profile: dict, start: int, count: int) -> tuple[bool, list[int] | str]:
+    size = _binary_range_size(profile)
+    try:
+        chunks = [(offset, min(size, start + count - offset)) for offset in range(start, start + count, size)]
+        replies = send_and_receive_frames(port, [codec.encode_get_range(offset, n) for offset, n in chunks])
+        values = []
+        for (offset, n), (success, reply) in zip(chunks, replies):
+            if not success: return False, f"❌ ERROR: {reply}"
+            reply_start, chunk_values = codec.decode_get_range_reply(reply)
+            if reply_start != offset or len(chunk_values) != n:
+                return False, "⚠️ UNEXPECTED RESPONSE: wrong range of values."
+            values.extend(chunk_values)
+        return True, values
+    except ValueError as e:
+        return False, f"❌ ERROR: {e}"
+
+
+# --- Public API ---
+
+def set_values(port: str, profile: dict, items: list[tuple[int, int]]) -> tuple[bool, str]:
+    """Writes (index, value) pairs. One pair uses a single SET, more use batched frames sent pipelined."""
+    # Both protocols carry int16 values; ASCII boards would silently wrap larger ones.
+    for _, value in items:
+        if not codec.VALUE_MIN <= value <= codec.VALUE_MAX:
+            return False, f"❌ ERROR: Value {value} does not fit in int16."
+    if profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY:
+        return _binary_set(port, profile, items)
+    return _ascii_set(port, profile, items)
+
+
+def get_values(port: str, profile: dict, indices: list[int]) -> tuple[bool, list[int] | str]:
+    """Reads the values at `indices`, returned in the same order."""
+    if profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY:
+        return _binary_get(port, profile, indices)
+    return _ascii_get(port, profile, indices)
+
+
+def set_range(port: str, profile: dict, start: int, values: list[int]) -> tuple[bool, str]:
+    """Writes `values` to consecutive indices from `start` on (an array variable), in as few requests as fit, sent pipelined."""
+    if not values:
+        return True, "OK:W:0"
+    if profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY:
+        return _binary_set_range(port, profile, start, values)
+    return _ascii_set_range(port, profile, start, values)
+
+
+def get_range(port: str, profile: dict, start: int, count: int) -> tuple[bool, list[int] | str]:
+    """Reads the `count` consecutive values from index `start` on (an array variable)."""
+    if count <= 0:
+        return True, []
+    if profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY:
+        return _binary_get_range(port, profile, start, count)
+    return _ascii_get_range(port, profile, start, count)
+
+
+def write_frame(port: str, profile: dict, frame_id: int, length: int, data: bytes, bits: int = 8) -> tuple[bool, str]:
+    """
+    Writes a whole frame buffer: `data` holds its `length` values packed `bits`
+    per value (see protocol_codec.FRAME_PACKINGS). The chunks go out pipelined and
+    the last one commits, so the board shows the frame only if every chunk arrived.
+    """
+    chunk_size = _frame_chunk_size(profile, frame_id)
+    per_byte = 8 // bits
+    chunks = [(start * per_byte, data[start:start + chunk_size]) for start in range(0, len(data), chunk_size)]
+    binary = profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY
+    try:
+        if binary:
+            requests = [codec.encode_frame_write(frame_id, offset, bits, i == len(chunks) - 1, chunk)
+                        for i, (offset, chunk) in enumerate(chunks)]
+            replies = send_and_receive_frames(port, requests)
+        else:
+            requests = [f"F:{frame_id}:{offset}:{codec.frame_write_flags(bits, i == len(chunks) - 1)}:{chunk.hex()}\n"
+                        for i, (offset, chunk) in enumerate(chunks)]
+            replies = send_and_receive_many(port, requests)
+
+        shown = 0
+        for success, reply in replies:
+            if not success: return False, f"❌ ERROR: {reply}"
+            if binary:
+                _, shown = codec.decode_frame_write_reply(reply)
+            elif reply.startswith("OK:F:"):
+                shown = int(reply.split(':')[3])
+            else:
+                return False, f"⚠️ UNEXPECTED RESPONSE: {reply}"
+    except (ValueError, IndexError) as e:
+        return False, f"❌ ERROR: {e}"
+    if shown != length:
+        return False, "⚠️ Frame not shown: the board did not receive all of it."
+    return True, f"OK:F:{length}:{len(chunks)}"
+
+
+def control_sequence(port: str, profile: dict, sequence_id: int, action: int, position_ms: int = 0) -> tuple[bool, tuple[int, int] | str]:
+    """Plays, pauses, stops or seeks a sequence (see protocol_codec.SEQUENCE_ACTIONS). Returns (state, position in ms)."""
+    try:
+        if profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY:
+            success, reply = send_and_receive_frame(port, codec.encode_sequence_control(sequence_id, action, position_ms))
+            if not success: return False, f"❌ ERROR: {reply}"
+            return True, codec.decode_sequence_control_reply(reply)
+        success, response = send_and_receive(port, f"P:{sequence_id}:{action}:{position_ms}\n")
+        if not success: return False, f"❌ ERROR: {response}"
+        parts = response.split(':')
+        if len(parts) != 4 or parts[:2] != ["OK", "P"]:
+            return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+        return True, (int(parts[2]), int(parts[3]))
+    except ValueError as e:
+        return False, f"❌ ERROR: {e}"
+
+
+def append_sequence(port: str, profile: dict, sequence_id: int, entries: list[tuple[int, int, int, int, int]]) -> tuple[bool, tuple[int, int] | str]:
+    """
+    Buffers entries of a streamed sequence, pipelined in as few requests as fit.
+    Returns (entries buffered, space left in the board's ring). Send no more
+    entries than there is space, or a later request could overtake a rejected one;
+    an empty list just asks for the space left.
+    """
+    binary = profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY
+    try:
+        if binary:
+            size = max(1, (_serial_buffer_size(profile) - 10) // codec.SEQUENCE_ENTRY.size)
+            chunks = _chunks(entries, size) or [[]]
+            replies = send_and_receive_frames(port, [codec.encode_sequence_append(sequence_id, chunk) for chunk in chunks])
+        else:
+            texts = [",".join(map(str, entry)) for entry in entries]
+            chunks = _split_frames(f"K:{sequence_id}:", texts, _ascii_line_size(profile)) or [[]]
+            replies = send_and_receive_many(port, [f"K:{sequence_id}:" + ";".join(chunk) + "\n" for chunk in chunks])
+
+        buffered, space = 0, 0
+        for chunk, (success, reply) in zip(chunks, replies):
+            if not success: return False, f"❌ ERROR: {reply}"
+            if binary:
+                chunk_buffered, space = codec.decode_sequence_append_reply(reply)
+            elif reply.startswith("OK:K:"):
+                chunk_buffered, space = (int(part) for part in reply.split(':')[2:4])
+            else:
+                return False, f"⚠️ UNEXPECTED RESPONSE: {reply}"
+            buffered += chunk_buffered
+            if chunk_buffered != len(chunk):
+                return False, f"⚠️ The board buffered only {buffered} of {len(entries)} sequence entries."
+        return True, (buffered, space)
+    except ValueError as e:
+        return False, f"❌ ERROR: {e}"
+
+
+def identify(port: str, protocol: str = PROTOCOL_ASCII, timeout: float = 0.5, tagged: bool = False) -> tuple[bool, str]:
+    """
+    Asks the board which firmware it runs. On success, result is its fingerprint.
+    The timeout is short because boards running foreign sketches never answer.
+    The request is untagged by default, so that boards running an older runtime
+    answer too; a tagged one is resent if the board resets before answering.
+    """
+    if protocol == PROTOCOL_BINARY:
+        success, reply = send_and_receive_frame(port, codec.encode_identify(), timeout=timeout, tagged=tagged)
+        if not success: return False, reply
+        try:
+            return True, codec.decode_identify_reply(reply)
+        except ValueError as e:
+            return False, str(e)
+
+    success, response = send_and_receive(port, "I:\n", timeout=timeout, tagged=tagged)
+    if not success: return False, response
+    if not response.startswith("ID:"):
+        return False, f"Unexpected identify response: {response}"
+    return True, response[3:]
+
+
+def _request_baud_rate(port: str, protocol: str, baud_rate: int) -> tuple[bool, str]:
+    """Asks the board to switch to `baud_rate`; it answers at the current rate first."""
+    if protocol == PROTOCOL_BINARY:
+        success, reply = send_and_receive_frame(port, codec.encode_baud(baud_rate))
+        if not success: return False, reply
+        try:
+            switched = codec.decode_baud_reply(reply)
+        except ValueError as e:
+            return False, str(e)
+    else:
+        success, response = send_and_receive(port, f"B:{baud_rate}\n")
+        if not success: return False, response
+        if not response.startswith("OK:B:"):
+            return False, f"Unexpected baud response: {response}"
+        switched = int(response[5:]) if response[5:].isdigit() else 0
+    if switched != baud_rate:
+        return False, f"The board switched to {switched} baud instead of {baud_rate}."
+    return True, ""
+
+
+def negotiate_baud_rate(port: str, profile: dict, baud_rates: list[int]) -> tuple[bool, int | str]:
+    """
+    Steps the link up to the fastest of `baud_rates` (fastest first) that carries
+    an identify request intact. The board answers each switch request at the
+    current rate before changing; if the identify at the new rate does not get
+    through, the host goes back to the boot rate and waits for the board, which
+    never saw it, to do the same. On success, result is the rate now in use.
+    """
+    protocol = profile.get("protocol", PROTOCOL_ASCII)
+    boot_rate = profile.get("baud_rate", DEFAULT_BAUD_RATE)
+    current = connection_pool.get_baudrate(port)
+    for rate in baud_rates:
+        if rate <= current: break
+        success, error = _request_baud_rate(port, protocol, rate)
+        if not success: return False, f"❌ ERROR: The board did not switch to {rate} baud: {error}"
+        connection_pool.switch_baudrate(port, rate)
+        found, running = identify(port, protocol, timeout=BAUD_CONFIRM_TIMEOUT, tagged=True)
+        if found:
+            # Any identify that got through confirms the rate on the board, so the host stays there too.
+            connection_pool.set_baudrate(port, boot_rate, current=rate)
+            if running != profile.get("fingerprint"):
+                return False, f"❌ ERROR: {port} runs other firmware ({running})."
+            return True, rate
+        print(f"   - {port} is not reliable at {rate} baud, trying a lower rate.")
+        # Reopening also drops whatever garbled bytes arrived at the wrong rate.
+        connection_pool.set_baudrate(port, boot_rate, current=boot_rate)
+        connection_pool.close(port)
+        current = boot_rate
+        time.sleep(BAUD_PROBATION)
+    return True, current
+
+
+def get_streamed_values(port: str, indices: list[int], max_staleness_ms: int = 0) -> list[tuple[int, float]] | None:
+    """
+    Reads values from the port's telemetry table without any serial I/O. Returns
+    [(value, age_in_seconds)], or None if the port is not streaming all of `indices`
+    or one of them is older than `max_staleness_ms` (0 accepts any age).
+    """
+    stream = telemetry.get_stream(port)
+    if stream is None:
+        return None
+    max_age_s = max_staleness_ms / 1000.0 if max_staleness_ms > 0 else None
+    results = []
+    for index in indices:
+        entry = stream.get(index, max_age_s)
+        if entry is None:
+            return None
+        results.append(entry)
+    return results
+
+
+def subscribe(port: str, profile: dict, indices: list[int], interval_ms: int) -> tuple[bool, str]:
+    """
+    Asks the board to stream `indices` every `interval_ms` and starts the background
+    reader that keeps the latest values. An interval of 0 (or no indices) stops streaming.
+    """
+    protocol = profile.get("protocol", PROTOCOL_ASCII)
+    stopping = interval_ms <= 0 or not indices
+    if stopping:
+        indices, interval_ms = [], 0
+
+    # Register the listener before subscribing, so the first telemetry is not dropped.
+    stream = telemetry.start_stream(port, protocol)
+    stream.indices = list(indices)
+    stream.latest.clear()
+
+    success, result = _send_subscribe(port, protocol, indices, interval_ms)
+    if stopping or not success:
+        telemetry.stop_stream(port)
+    return success, result
+
+
+def _send_subscribe(port: str, protocol: str, indices: list[int], interval_ms: int) -> tuple[bool, str]:
+    try:
+        if protocol == PROTOCOL_BINARY:
+            success, reply = send_and_receive_frame(port, codec.encode_subscribe(interval_ms, indices))
+            if not success: return False, f"❌ ERROR: {reply}"
+            count = codec.decode_subscribe_reply(reply)
+        else:
+            success, response = send_and_receive(port, f"T:{interval_ms}:{','.join(str(i) for i in indices)}\n")
+            if not success: return False, f"❌ ERROR: {response}"
+            if not response.startswith("OK:T:"):
+                return False, f"⚠️ UNEXPECTED RESPONSE: {response}"
+            count = int(response[5:])
+    except ValueError as e:
+        return False, f"❌ ERROR: {e}"
+
+    if count != len(indices):
+        return False, f"⚠️ Device accepted {count} of {len(indices)} subscriptions (limit is 16)."
+    return True, f"OK:T:{count}"
@@ -0,0 +1,632 @@
+# src/device_simulator.py
+
+"""
+Simulated board for running the serial path without hardware (Linux/macOS only).
+
+SimulatedDevice opens a pseudo-terminal and answers on it like a sketch from
+generate_arduino_code: same variable table, same ASCII commands and replies
+(S/G/M/Q/A/W/I/T/F/P/K/B), same binary frames, same sequence tags, same value clamping
+per variable type, same frame buffers and sequence playback. The serial code
+under test simply opens
+`device.port` like a real board.
+
+To make measurements realistic it can emulate the wire speed of a baud rate
+(a baud switch changes the emulated speed; a pty never garbles bytes),
+add a fixed processing delay per command, and flip random bits in its replies.
+reboot() emulates a board reset: input is lost while it boots, then it
+announces READY like a freshly started sketch.
+"""
+
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+from collections import deque
+from . import protocol_codec as codec
+from .code_generator import SHARED_VARIABLE_TYPES, DEFAULT_SHARED_VARIABLE_TYPE, get_serial_buffer_size, get_value_count
+
+MAX_SUBSCRIPTIONS = 16  # COMFY_MAX_SUBSCRIPTIONS in the runtime.
+MAX_RAMPS = 8  # COMFY_MAX_RAMPS in the runtime.
+SEQUENCE_TICK = 0.001  # Seconds between sequence ticks while one plays (loop() runs at least this often).
+SEQ_STOPPED, SEQ_PLAYING, SEQ_PAUSED = 0, 1, 2  # COMFY_SEQ_* states.
+
+
+class SimulatedDevice:
+    """
+    A fake board on a pty. Use as a context manager, or call start() and stop().
+
+    Args:
+        comm_map: The communication map the simulated sketch was generated from.
+        protocol: "ascii" or "binary".
+        baudrate: Emulated line speed (10 bits per byte, both directions). None for no limit.
+        processing_delay: Seconds spent handling each command.
+        noise: Probability that any byte the device sends has one bit flipped.
+        fingerprint: Reported by the identify command.
+        shared_type: Storage type of shared variables (see SHARED_VARIABLE_TYPES).
+        seed: Seed for the noise generator, for reproducible runs.
+        frame_map: The sketch's frame buffers (see create_frame_map). Committed
+            frames are kept in `shown_frames`, keyed by frame id.
+        sequence_map: The sketch's sequences (see create_sequence_map).
+    """
+
+    def __init__(self, comm_map: dict, protocol: str = "ascii", baudrate: int | None = None, processing_delay: float = 0.0,
+                 noise: float = 0.0, fingerprint: str = "simulated", shared_type: str = DEFAULT_SHARED_VARIABLE_TYPE, seed: int | None = None,
+                 frame_map: dict | None = None, sequence_map: dict | None = None):
+        self.comm_map = comm_map
+        self.protocol = protocol
+        self.byte_time = 10.0 / baudrate if baudrate else 0.0
+        self.baudrate = self._boot_baudrate = baudrate
+        self.processing_delay = processing_delay
+        self.noise = noise
+        self.fingerprint = fingerprint
+        self.buffer_size = get_serial_buffer_size(comm_map, frame_map)
+        self.values = [0] * get_value_count(comm_map)
+        self.commands_handled = 0
+        self.frames = {f["id"]: bytearray(f["length"]) for f in (frame_map or {}).values()}
+        self.shown_frames: dict[int, bytes] = {}
+        self.frames_shown = 0
+        self._writing_frame, self._next_offset, self._torn = None, 0, False
+        self.sequence_map = sequence_map or {}
+
+        _, shared_low, shared_high = SHARED_VARIABLE_TYPES[shared_type]
+        ranges = {"shared": (shared_low, shared_high), "digital": (0, 1), "analog": (0, 255)}
+        self._ranges = [None] * len(self.values)
+        self._types = [None] * len(self.values)
+        for details in comm_map.values():
+            value_range = ranges.get(details["type"])
+            if details["type"] == "array":
+                _, low, high = SHARED_VARIABLE_TYPES[details["element_type"]]
+                value_range = (low, high) if low is not None else (codec.VALUE_MIN, codec.VALUE_MAX)
+            for index in range(details["index"], details["index"] + details.get("length", 1)):
+                self._ranges[index] = value_range
+                self._types[index] = details["type"]
+
+        self._random = random.Random(seed)
+        self._reply_seq = None
+        self._replied = False
+        self._telemetry_indices: list[int] = []
+        self._telemetry_interval = 0.0
+        self._last_telemetry = 0.0
+        self._started_at = time.monotonic()
+        self._reset_sequences()
+        self._master = self._slave = None
+        self._wake_r = self._wake_w = None
+        self._booting_until = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self.port = None
+
+    # --- Lifecycle ---
+
+    def start(self) -> "SimulatedDevice":
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._wake_r, self._wake_w = os.pipe()
+        self._announce_ready()  # Before the host can open the port, like a board that booted long ago.
+        self._thread = threading.Thread(target=self._run, name=f"simulated-arduino-{self.port}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._wake_w is not None:
+            os.write(self._wake_w, b"x")
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        for fd in (self._master, self._slave, self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = self._wake_r = self._wake_w = None
+
+    def reboot(self, boot_time: float = 0.0):
+        """Resets the variables and subscriptions; input received during `boot_time` is lost."""
+        self.values = [0] * len(self.values)
+        self._telemetry_interval = 0.0
+        self._telemetry_indices = []
+        self._started_at = time.monotonic()
+        self._reset_sequences()
+        self._switch_baudrate(self._boot_baudrate)
+        self._booting_until = time.monotonic() + boot_time
+        os.write(self._wake_w, b"x")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _switch_baudrate(self, baudrate: int | None):
+        self.baudrate = baudrate
+        if self.byte_time and baudrate:
+            self.byte_time = 10.0 / baudrate
+
+    # --- Main loop (the sketch's loop()) ---
+
+    def _announce_ready(self):
+        self._reply_seq = None
+        if self.protocol == "binary":
+            self._reply_frame(codec.OP_READY)
+        else:
+            self._send(b"READY\r\n")
+
+    def _next_timeout(self) -> float | None:
+        """Seconds until the loop has something to do without input (None: wait for input)."""
+        now = time.monotonic()
+        deadlines = []
+        if self._booting_until:
+            deadlines.append(self._booting_until)
+        if self._telemetry_interval and self._telemetry_indices:
+            deadlines.append(self._last_telemetry + self._telemetry_interval)
+        if any(seq["state"] == SEQ_PLAYING for seq in self._sequences):
+            deadlines.append(now + SEQUENCE_TICK)
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def _run(self):
+        terminator = b"\x00" if self.protocol == "binary" else b"\n"
+        buffer = b""
+        while not self._stop.is_set():
+            try:
+                readable, _, _ = select.select([self._master, self._wake_r], [], [], self._next_timeout())
+                if self._wake_r in readable:
+                    os.read(self._wake_r, 64)
+                chunk = os.read(self._master, 4096) if self._master in readable else b""
+            except OSError:
+                return
+            if self._booting_until:
+                if time.monotonic() < self._booting_until:
+                    continue  # The bootloader swallows whatever arrives while it runs.
+                self._booting_until = 0.0
+                buffer = b""
+                self._announce_ready()
+            if chunk and self.byte_time:
+                time.sleep(len(chunk) * self.byte_time)
+            buffer += chunk
+            while True:
+                if self.protocol == "ascii":
+                    # The runtime accepts both \n and \r as line endings.
+                    buffer = buffer.replace(b"\r", b"\n")
+                if terminator not in buffer:
+                    break
+                message, buffer = buffer.split(terminator, 1)
+                if message:
+                    self._handle(message)
+            if self.protocol == "ascii" and len(buffer) > self.buffer_size - 1:
+                buffer = buffer[:self.buffer_size - 1]  # The firmware drops overflowing characters.
+            self._sequences_tick()
+            self._telemetry_tick()
+
+    def _millis(self) -> int:
+        return int((time.monotonic() - self._started_at) * 1000) & 0xFFFFFFFF
+
+    def _send(self, data: bytes):
+        if self.noise:
+            data = bytearray(data)
+            for i in range(len(data)):
+                if self._random.random() < self.noise:
+                    data[i] ^= 1 << self._random.randrange(8)
+            data = bytes(data)
+        if self.byte_time:
+            time.sleep(len(data) * self.byte_time)
+        try:
+            os.write(self._master, data)
+        except OSError:
+            pass
+
+    def _handle(self, message: bytes):
+        self.commands_handled += 1
+        if self.processing_delay:
+            time.sleep(self.processing_delay)
+        if self.protocol == "binary":
+            self._handle_frame(message)
+        else:
+            self._handle_line(message.decode('ascii', errors='replace'))
+
+    # --- Variable table ---
+
+    def _valid(self, index: int) -> bool:
+        return 0 <= index < len(self.values)
+
+    def write_value(self, index: int, value: int):
+        low, high = self._ranges[index]
+        if self._types[index] == "digital":
+            value = 1 if value != 0 else 0
+        self.values[index] = min(high, max(low, value))
+
+    # --- ASCII protocol ---
+
+    def _reply(self, line: str):
+        self._replied = True
+        if self._reply_seq is not None:
+            line = f"#{self._reply_seq}|{line}"
+        self._send(line.encode('ascii') + b"\r\n")
+
+    def _handle_line(self, line: str):
+        self._reply_seq, self._replied = None, False
+        if line.startswith('#'):
+            tag, sep, line = line.partition('|')
+            if not sep: return
+            self._reply_seq = _atoi(tag[1:]) & 0xFF
+        self._handle_command(line)
+        if not self._replied and self._reply_seq is not None:
+            self._reply("ERR")
+
+    def _handle_command(self, line: str):
+        if len(line) < 2 or line[1] != ':':
+            return
+        command, body = line[0], line[2:]
+        if command == 'I':
+            self._reply(f"ID:{self.fingerprint}")
+        elif command == 'B':
+            rate = _atoi(body)
+            if rate <= 0: return
+            self._reply(f"OK:B:{rate}")
+            self._switch_baudrate(rate)
+        elif command == 'T':
+            interval, _, indices = body.partition(':')
+            self._subscribe(_atoi(interval), [_atoi(i) for i in indices.split(',')] if indices else [])
+            self._reply(f"OK:T:{len(self._telemetry_indices)}")
+        elif command == 'M':
+            count = 0
+            for entry in body.split(','):
+                index, sep, value = entry.partition('=')
+                if not sep: break
+                if self._valid(_atoi(index)):
+                    self.write_value(_atoi(index), _atoi(value))
+                    count += 1
+            self._reply(f"OK:M:{count}")
+        elif command == 'Q':
+            self._reply("R:Q:" + ",".join(str(self.values[i]) if self._valid(i) else "" for i in map(_atoi, body.split(','))))
+        elif command == 'F':
+            parts = body.split(':', 3)
+            if len(parts) != 4: return
+            hex_digits = parts[3][:len(parts[3]) - len(parts[3]) % 2]
+            try:
+                data = bytes.fromhex(hex_digits)
+            except ValueError:
+                return
+            written = self._frame_write(_atoi(parts[0]), _atoi(parts[1]), _atoi(parts[2]), data)
+            if written is None: return
+            shown = self._frame_commit(_atoi(parts[0])) if _atoi(parts[2]) & codec.FRAME_COMMIT else 0
+            self._reply(f"OK:F:{written}:{shown}")
+        elif command == 'P':
+            parts = body.split(':')
+            if len(parts) < 2: return
+            state = self._sequence_control(_atoi(parts[0]), _atoi(parts[1]), _atoi(parts[2]) if len(parts) > 2 else 0)
+            if state is None: return
+            self._reply(f"OK:P:{state}:{self._sequence_position(_atoi(parts[0]))}")
+        elif command == 'K':
+            sequence_id, sep, entries = body.partition(':')
+            sequence_id = _atoi(sequence_id)
+            if not sep or not self._is_stream(sequence_id): return
+            buffered = 0
+            for text in entries.split(';') if entries else []:
+                fields = text.split(',')
+                if len(fields) != 5: break
+                if self._sequence_append(sequence_id, tuple(_atoi(f) for f in fields)) != 1: break
+                buffered += 1
+            self._reply(f"OK:K:{buffered}:{self._sequence_space(sequence_id)}")
+        elif command == 'A':
+            start, sep, count = body.partition(':')
+            start, count = _atoi(start), _atoi(count)
+            if not sep or start < 0 or count < 0 or start + count > len(self.values): return
+            self._reply(f"R:A:{start}:" + ",".join(str(v) for v in self.values[start:start + count]))
+        elif command == 'W':
+            start, sep, values = body.partition(':')
+            start, values = _atoi(start), values.split(',') if values else []
+            if not sep or start < 0 or start + len(values) > len(self.values): return
+            for offset, value in enumerate(values):
+                self.write_value(start + offset, _atoi(value))
+            self._reply(f"OK:W:{len(values)}")
+        elif command in ('S', 'G'):
+            index = _atoi(body)
+            if not self._valid(index):
+                return
+            if command == 'S':
+                _, sep, value = body.partition(':')
+                if not sep: return
+                self.write_value(index, _atoi(value))
+                self._reply(f"OK:S:{index}")
+            else:
+                self._reply(f"R:{index}:{self.values[index]}")
+
+    # --- Binary protocol ---
+
+    def _reply_frame(self, opcode: int, payload: bytes = b""):
+        if self._reply_seq is not None and opcode != codec.OP_TELEMETRY:
+            opcode, payload = opcode | codec.SEQ_FLAG, bytes([self._reply_seq]) + payload
+        self._send(codec.encode_frame(opcode, payload))
+
+    def _nak(self, reason: int):
+        seq = b"" if self._reply_seq is None else bytes([self._reply_seq])
+        self._send(codec.encode_frame(codec.OP_NAK, bytes([reason]) + seq))
+
+    def _handle_frame(self, frame: bytes):
+        self._reply_seq = None
+        if len(frame) > self.buffer_size:
+            return  # Overflowing frames are dropped silently, like the firmware does.
+        try:
+            opcode, payload = codec.decode_frame(frame)
+        except codec.FrameError:
+            self._nak(1)
+            return
+        if opcode != codec.OP_NAK and opcode & codec.SEQ_FLAG:
+            if not payload:
+                self._nak(2)
+                return
+            opcode &= ~codec.SEQ_FLAG
+            self._reply_seq, payload = payload[0], payload[1:]
+        reply = opcode | codec.REPLY_FLAG
+        try:
+            if opcode == codec.OP_SET:
+                index, pos = codec.decode_varint(payload, 0)
+                value, _ = codec.decode_value(payload, pos)
+                if not self._valid(index): raise codec.FrameError("bad index")
+                self.write_value(index, value)
+                self._reply_frame(reply, codec.encode_varint(index))
+            elif opcode == codec.OP_GET:
+                index, _ = codec.decode_varint(payload, 0)
+                if not self._valid(index): raise codec.FrameError("bad index")
+                self._reply_frame(reply, codec.encode_varint(index) + codec.encode_value(self.values[index]))
+            elif opcode == codec.OP_SET_MANY:
+                count, pos = codec.decode_varint(payload, 0)
+                items = []
+                for _ in range(count):
+                    index, pos = codec.decode_varint(payload, pos)
+                    value, pos = codec.decode_value(payload, pos)
+                    if not self._valid(index): raise codec.FrameError("bad index")
+                    items.append((index, value))
+                for index, value in items:
+                    self.write_value(index, value)
+                self._reply_frame(reply, codec.encode_varint(count))
+            elif opcode == codec.OP_GET_MANY:
+                count, pos = codec.decode_varint(payload, 0)
+                if (5 if self._reply_seq is not None else 4) + 2 * count > self.buffer_size: raise codec.FrameError("reply too long")
+                values = b""
+                for _ in range(count):
+                    index, pos = codec.decode_varint(payload, pos)
+                    if not self._valid(index): raise codec.FrameError("bad index")
+                    values += codec.encode_value(self.values[index])
+                self._reply_frame(reply, codec.encode_varint(count) + values)
+            elif opcode == codec.OP_GET_RANGE:
+                start, pos = codec.decode_varint(payload, 0)
+                count, pos = codec.decode_varint(payload, pos)
+                if start + count > len(self.values): raise codec.FrameError("bad range")
+                if (2 if self._reply_seq is not None else 1) + 7 + 2 * count > self.buffer_size: raise codec.FrameError("reply too long")
+                values = b"".join(codec.encode_value(v) for v in self.values[start:start + count])
+                self._reply_frame(reply, codec.encode_varint(start) + codec.encode_varint(count) + values)
+            elif opcode == codec.OP_SET_RANGE:
+                start, pos = codec.decode_varint(payload, 0)
+                if (len(payload) - pos) % 2: raise codec.FrameError("odd payload")
+                count = (len(payload) - pos) // 2
+                if start + count > len(self.values): raise codec.FrameError("bad range")
+                for offset in range(count):
+                    self.write_value(start + offset, codec.decode_value(payload, pos + 2 * offset)[0])
+                self._reply_frame(reply, codec.encode_varint(count))
+            elif opcode == codec.OP_SEQUENCE:
+                sequence_id, pos = codec.decode_varint(payload, 0)
+                if pos + 5 > len(payload): raise codec.FrameError("truncated")
+                state = self._sequence_control(sequence_id, payload[pos], struct.unpack_from("<I", payload, pos + 1)[0])
+                if state is None: raise codec.FrameError("bad sequence request")
+                self._reply_frame(reply, bytes([state]) + struct.pack("<I", self._sequence_position(sequence_id)))
+            elif opcode == codec.OP_SEQUENCE_APPEND:
+                sequence_id, pos = codec.decode_varint(payload, 0)
+                if (len(payload) - pos) % codec.SEQUENCE_ENTRY.size or not self._is_stream(sequence_id): raise codec.FrameError("bad append")
+                buffered = 0
+                for entry in codec.SEQUENCE_ENTRY.iter_unpack(payload[pos:]):
+                    if self._sequence_append(sequence_id, entry) != 1: break
+                    buffered += 1
+                self._reply_frame(reply, codec.encode_varint(buffered) + codec.encode_varint(self._sequence_space(sequence_id)))
+            elif opcode == codec.OP_BAUD:
+                if len(payload) < 4 or not struct.unpack_from("<I", payload, 0)[0]: raise codec.FrameError("bad baud rate")
+                self._reply_frame(reply, payload[:4])
+                self._switch_baudrate(struct.unpack_from("<I", payload, 0)[0])
+            elif opcode == codec.OP_IDENTIFY:
+                self._reply_frame(reply, self.fingerprint.encode('ascii'))
+            elif opcode == codec.OP_SUBSCRIBE:
+                interval, pos = codec.decode_varint(payload, 0)
+                count, pos = codec.decode_varint(payload, pos)
+                indices = []
+                for _ in range(count):
+                    index, pos = codec.decode_varint(payload, pos)
+                    indices.append(index)
+                self._subscribe(interval, indices)
+                self._reply_frame(reply, codec.encode_varint(len(self._telemetry_indices)))
+            elif opcode == codec.OP_FRAME_WRITE:
+                frame_id, pos = codec.decode_varint(payload, 0)
+                offset, pos = codec.decode_varint(payload, pos)
+                if pos >= len(payload): raise codec.FrameError("missing flags")
+                flags = payload[pos]
+                written = self._frame_write(frame_id, offset, flags, payload[pos + 1:])
+                if written is None: raise codec.FrameError("bad frame write")
+                shown = self._frame_commit(frame_id) if flags & codec.FRAME_COMMIT else 0
+                self._reply_frame(reply, codec.encode_varint(written) + codec.encode_varint(shown))
+            else:
+                self._nak(3)
+        except codec.FrameError:
+            self._nak(2)
+
+    # --- Frame buffers (comfyFrameWrite / comfyFrameCommit in the runtime) ---
+
+    def _frame_write(self, frame_id: int, offset: int, flags: int, data: bytes) -> int | None:
+        frame = self.frames.get(frame_id)
+        if frame is None or offset > len(frame):
+            return None
+        if offset == 0:
+            self._writing_frame, self._next_offset, self._torn = frame_id, 0, False
+        elif frame_id != self._writing_frame or offset != self._next_offset:
+            self._torn = True
+        bits = 8 >> ((flags >> 1) & 3)
+        mask = (1 << bits) - 1
+        pos = offset
+        for byte in data:
+            for shift in range(8 - bits, -1, -bits):
+                if pos >= len(frame): break
+                frame[pos] = ((byte >> shift) & mask) * (255 // mask)
+                pos += 1
+        self._next_offset = pos
+        return pos - offset
+
+    def _frame_commit(self, frame_id: int) -> int:
+        frame = self.frames.get(frame_id)
+        complete = frame is not None and frame_id == self._writing_frame and not self._torn and self._next_offset == len(frame)
+        self._writing_frame = None
+        if not complete:
+            return 0
+        self.shown_frames[frame_id] = bytes(frame)
+        self.frames_shown += 1
+        return len(frame)
+
+    # --- Sequences (ComfySequences.cpp in the runtime) ---
+
+    def _reset_sequences(self):
+        self._sequences = [None] * len(self.sequence_map)
+        for details in self.sequence_map.values():
+            table = [tuple(e) for e in details["entries"]] if details["storage"] == "progmem" else None
+            self._sequences[details["id"]] = {"table": table, "ring": deque(), "capacity": details["capacity"],
+                                              "length_ms": details["length_ms"], "loop": details["loop"],
+                                              "state": SEQ_STOPPED, "next": 0, "origin": 0, "position": 0}
+        self._ramps: list[tuple[int, tuple]] = []
+        for details in self.sequence_map.values():
+            if details["autoplay"]:
+                self._sequence_control(details["id"], codec.SEQUENCE_ACTIONS["play"], 0)
+
+    def _is_stream(self, sequence_id: int) -> bool:
+        return 0 <= sequence_id < len(self._sequences) and self._sequences[sequence_id]["table"] is None
+
+    def _advance(self, sequence_id: int, position: int):
+        seq = self._sequences[sequence_id]
+        while True:
+            if seq["table"] is not None:
+                entry = seq["table"][seq["next"]] if seq["next"] < len(seq["table"]) else None
+            else:
+                entry = seq["ring"][0] if seq["ring"] else None
+            if entry is None or entry[0] > position:
+                break
+            if seq["table"] is not None: seq["next"] += 1
+            else: seq["ring"].popleft()
+            start, duration, index, _, target = entry
+            self._ramps = [r for r in self._ramps if r[1][2] != index]
+            if position - start < duration and len(self._ramps) < MAX_RAMPS:
+                self._ramps.append((sequence_id, entry))
+            else:
+                self.write_value(index, target)
+        for ramp in [r for r in self._ramps if r[0] == sequence_id]:
+            start, duration, index = ramp[1][:3]
+            self.write_value(index, _ramp_value(ramp[1], position))
+            if position - start >= duration:
+                self._ramps.remove(ramp)
+
+    def _sequences_tick(self):
+        now = self._millis()
+        for sequence_id, seq in enumerate(self._sequences):
+            if seq["state"] != SEQ_PLAYING:
+                continue
+            position = now - seq["origin"]
+            self._advance(sequence_id, position)
+            if seq["table"] is None or position < seq["length_ms"]:
+                continue
+            if seq["loop"] and seq["length_ms"] > 0:
+                seq["origin"] += seq["length_ms"]
+                seq["next"] = 0
+                self._advance(sequence_id, now - seq["origin"])
+            else:
+                seq["state"], seq["next"], seq["position"] = SEQ_STOPPED, 0, 0
+
+    def _sequence_position(self, sequence_id: int) -> int:
+        if not 0 <= sequence_id < len(self._sequences): return 0
+        seq = self._sequences[sequence_id]
+        return self._millis() - seq["origin"] if seq["state"] == SEQ_PLAYING else seq["position"]
+
+    def _sequence_control(self, sequence_id: int, action: int, position_ms: int) -> int | None:
+        """comfySequenceControl: returns the new state, None for a bad request."""
+        if not 0 <= sequence_id < len(self._sequences): return None
+        seq = self._sequences[sequence_id]
+        now = self._millis()
+        position = self._sequence_position(sequence_id)
+        actions = codec.SEQUENCE_ACTIONS
+        if action == actions["stop"]:
+            self._ramps = [r for r in self._ramps if r[0] != sequence_id]
+            seq["state"], seq["next"], position = SEQ_STOPPED, 0, 0
+            seq["ring"].clear()
+        elif action == actions["play"]:
+            if seq["state"] != SEQ_PLAYING:
+                seq["state"], seq["origin"] = SEQ_PLAYING, now - position
+        elif action == actions["pause"]:
+            if seq["state"] == SEQ_PLAYING:
+                seq["state"] = SEQ_PAUSED
+        elif action == actions["seek"]:
+            position = position_ms
+            if seq["table"] is not None:
+                if seq["length_ms"] > 0 and position >= seq["length_ms"]:
+                    position = position % seq["length_ms"] if seq["loop"] else seq["length_ms"]
+                seq["next"] = 0
+            self._ramps = [r for r in self._ramps if r[0] != sequence_id]
+            self._advance(sequence_id, position)
+            seq["origin"] = now - position
+            if seq["state"] == SEQ_STOPPED:
+                seq["state"] = SEQ_PAUSED
+        elif action != actions["status"]:
+            return None
+        seq["position"] = position
+        return seq["state"]
+
+    def _sequence_append(self, sequence_id: int, entry: tuple) -> int:
+        """comfySequenceAppend: 1 if buffered, 0 if the ring is full, -1 for a bad entry."""
+        if not self._is_stream(sequence_id) or not 0 <= entry[2] < len(self.values) or not 0 <= entry[1] <= 32767:
+            return -1
+        seq = self._sequences[sequence_id]
+        if len(seq["ring"]) >= seq["capacity"]:
+            return 0
+        seq["ring"].append(tuple(entry))
+        return 1
+
+    def _sequence_space(self, sequence_id: int) -> int:
+        return self._sequences[sequence_id]["capacity"] - len(self._sequences[sequence_id]["ring"]) if self._is_stream(sequence_id) else 0
+
+    # --- Telemetry ---
+
+    def _subscribe(self, interval_ms: int, indices: list[int]):
+        self._telemetry_interval = max(0, interval_ms) / 1000.0
+        self._telemetry_indices = [i for i in indices if self._valid(i)][:MAX_SUBSCRIPTIONS]
+        self._last_telemetry = time.monotonic()
+
+    def _telemetry_tick(self):
+        if not self._telemetry_interval or not self._telemetry_indices:
+            return
+        now = time.monotonic()
+        if now - self._last_telemetry < self._telemetry_interval:
+            return
+        self._last_telemetry = now
+        values = [self.values[i] for i in self._telemetry_indices]
+        if self.protocol == "binary":
+            payload = struct.pack("<I", self._millis()) + codec.encode_varint(len(values)) + b"".join(codec.encode_value(v) for v in values)
+            self._reply_frame(codec.OP_TELEMETRY, payload)
+        else:
+            # Unsolicited, so never tagged: written directly rather than through _reply().
+            self._send((f"D:{self._millis()}:" + ",".join(map(str, values)) + "\r\n").encode('ascii'))
+
+
+def _ramp_value(entry: tuple, position: int) -> int:
+    """rampValue() in the runtime, with C's truncating integer division."""
+    start, duration, _, start_value, target = entry
+    elapsed = position - start
+    if elapsed >= duration:
+        return target
+    step = abs((target - start_value) * elapsed) // duration
+    return start_value + (step if target >= start_value else -step)
+
+
+def _atoi(text: str) -> int:
+    """C atoi(): leading whitespace, optional sign, digits; stops at the first other character."""
+    text = text.lstrip()
+    end = 1 if text[:1] in ('-', '+') else 0
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    try:
+        return int(text[:end])
+    except ValueError:
+        return 0
@@ -0,0 +1,893 @@
+# src/firmware_runtime.py
+
+"""
+Static part of the generated firmware, shipped to arduino-cli as a small
+Arduino library ("ComfyArduinoRuntime").
+
+The runtime holds everything that does not depend on the workflow: serial
+parsing for both protocols, COBS/CRC framing and command dispatch. The
+generated sketch only provides the variable table through the symbols
+declared in the header. Because these sources never change between
+workflows, arduino-cli compiles them once per build directory and reuses
+the objects afterwards.
+"""
+
+import hashlib
+
+RUNTIME_LIBRARY_NAME = "ComfyArduinoRuntime"
+
+RUNTIME_HEADER = r"""
+#ifndef COMFY_ARDUINO_RUNTIME_H
+#define COMFY_ARDUINO_RUNTIME_H
+
+#include <Arduino.h>
+
+// --- Provided by the generated sketch ---
+extern const uint16_t comfyValueCount;
+extern const char comfyFirmwareFingerprint[];
+extern uint8_t comfySerialBuffer[];
+extern const uint8_t comfySerialBufferSize;
+extern uint8_t comfyTxBuffer[];  // Binary protocol only.
+extern const unsigned long comfyBaudRate;  // The rate setup() opens Serial at.
+int comfyReadValue(uint16_t index);
+void comfyWriteValue(uint16_t index, int value);
+uint8_t* comfyFrameData(uint8_t id, uint16_t* length);  // NULL for an unknown frame buffer.
+void comfyFrameShow(uint8_t id);
+
+// --- Provided by the runtime; call the functions matching the protocol ---
+void comfyAsciiAnnounceReady();  // End of setup()
+void comfyAsciiCheckSerialInput();  // loop()
+void comfyAsciiTelemetryTick();  // loop()
+void comfyBinaryAnnounceReady();
+void comfyBinaryCheckSerialInput();
+void comfyBinaryTelemetryTick();
+
+// --- Line speed switching, shared by both protocols ---
+// After a switch the host confirms the new rate with an identify request; if none
+// arrives within COMFY_BAUD_PROBATION_MS, the board falls back to comfyBaudRate.
+#define COMFY_BAUD_PROBATION_MS 1000
+void comfyBaudSwitch(unsigned long rate);  // Call once the reply to the switch request is sent.
+void comfyBaudConfirm();
+void comfyBaudTick();  // Called by the Check*SerialInput functions.
+
+// --- Telemetry subscriptions, shared by both protocols ---
+#define COMFY_MAX_SUBSCRIPTIONS 16
+extern uint16_t comfyTelemetryIndices[];
+extern uint8_t comfyTelemetryCount;
+void comfyTelemetryReset(unsigned long intervalMs);
+bool comfyTelemetryAdd(uint16_t index);
+bool comfyTelemetryDue();
+
+// --- Frame buffers, shared by both protocols ---
+// Request flags: bit 0 commits the frame, bits 1-2 give the packing (0: 8-bit values,
+// 1: 4-bit, 2: 2-bit, 3: 1-bit, most significant bits first).
+#define COMFY_FRAME_COMMIT 0x01
+int comfyFrameWrite(uint8_t id, uint16_t offset, uint8_t flags, const uint8_t* data, uint8_t len);
+uint16_t comfyFrameCommit(uint8_t id);
+
+// --- Keyframe sequences, shared by both protocols ---
+// An entry sets variable `index` at `start` ms of sequence time: to `to` at once if
+// `duration` is 0, else ramping linearly from `from` to `to` over `duration` ms (at most 32767).
+struct ComfySequenceEntry { uint32_t start; uint16_t duration; uint16_t index; int16_t from; int16_t to; };
+struct ComfySequence {
+  const ComfySequenceEntry* table;  // PROGMEM entries baked into the sketch, or NULL.
+  ComfySequenceEntry* ring;         // RAM ring buffer of a streamed sequence, or NULL.
+  uint16_t capacity;                // Ring size.
+  uint16_t count;                   // Table entries, or entries waiting in the ring.
+  uint32_t lengthMs;                // Table: end of its last entry, where a loop restarts.
+  uint8_t flags;
+  // Playback state, zero-initialized.
+  uint8_t state;
+  uint16_t next;                    // Table: next entry to start.
+  uint16_t head;                    // Ring: oldest waiting entry.
+  uint32_t origin;                  // millis() at sequence time 0, while playing.
+  uint32_t position;                // Sequence time while paused or stopped.
+};
+#define COMFY_SEQ_LOOP 0x01
+#define COMFY_SEQ_STOPPED 0
+#define COMFY_SEQ_PLAYING 1
+#define COMFY_SEQ_PAUSED 2
+#define COMFY_SEQ_STOP 0
+#define COMFY_SEQ_PLAY 1
+#define COMFY_SEQ_PAUSE 2
+#define COMFY_SEQ_SEEK 3
+#define COMFY_SEQ_STATUS 4
+#define COMFY_MAX_RAMPS 8
+extern ComfySequence comfySequences[];  // Provided by the sketch
+extern const uint8_t comfySequenceCount;
+void comfySequencesTick();  // loop()
+int comfySequenceControl(uint8_t id, uint8_t action, uint32_t positionMs);
+uint32_t comfySequencePosition(uint8_t id);
+int comfySequenceAppend(uint8_t id, const ComfySequenceEntry* entry);
+uint16_t comfySequenceSpace(uint8_t id);
+
+#endif
+""".strip() + "\n"
+
+ASCII_SOURCE = r"""
+#include "ComfyArduinoRuntime.h"
+
+#include <ctype.h>
+
+static uint8_t asciiPos = 0;
+static int replySeq = -1;  // Sequence tag of the request being answered, -1 if untagged.
+static bool replied = false;
+
+// Starts a reply line, echoing the request's '#<seq>|' tag so the host can match it.
+static void beginReply() {
+  replied = true;
+  if (replySeq < 0) return;
+  Serial.print('#'); Serial.print(replySeq); Serial.print('|');
+}
+
+static void processAsciiCommand(char* buffer) {
+  char command_type = buffer[0];
+  if (buffer[1] != ':') return;
+
+  // Identify: reports the fingerprint of the running firmware (and confirms a new line speed).
+  if (command_type == 'I') { comfyBaudConfirm(); beginReply(); Serial.print("ID:"); Serial.println(comfyFirmwareFingerprint); return; }
+
+  // Baud: 'B:rate' answers at the current rate, then switches to the new one.
+  if (command_type == 'B') {
+    unsigned long rate = strtoul(buffer + 2, NULL, 10);
+    if (rate == 0) return;
+    beginReply(); Serial.print("OK:B:"); Serial.println(rate);
+    comfyBaudSwitch(rate);
+    return;
+  }
+
+  // Subscribe: 'T:interval_ms:idx,idx,...' streams those values every interval ('T:0' stops).
+  if (command_type == 'T') {
+    char* cursor = buffer + 2;
+    comfyTelemetryReset(strtoul(cursor, &cursor, 10));
+    if (*cursor == ':') {
+      cursor++;
+      while (*cursor) {
+        int index = atoi(cursor);
+        if (index >= 0 && index < (int)comfyValueCount) comfyTelemetryAdd(index);
+        cursor = strchr(cursor, ',');
+        if (!cursor) break;
+        cursor++;
+      }
+    }
+    beginReply(); Serial.print("OK:T:"); Serial.println(comfyTelemetryCount);
+    return;
+  }
+
+  // Batch commands: 'M:idx=val,idx=val,...' sets many values, 'Q:idx,idx,...' reads many.
+  if (command_type == 'M') {
+    char* cursor = buffer + 2;
+    int count = 0;
+    while (*cursor) {
+      int index = atoi(cursor);
+      char* valueStr = strchr(cursor, '=');
+      if (!valueStr) break;
+      if (index >= 0 && index < (int)comfyValueCount) { comfyWriteValue(index, atoi(valueStr + 1)); count++; }
+      cursor = strchr(valueStr, ',');
+      if (!cursor) break;
+      cursor++;
+    }
+    beginReply(); Serial.print("OK:M:"); Serial.println(count);
+    return;
+  }
+  if (command_type == 'Q') {
+    char* cursor = buffer + 2;
+    beginReply(); Serial.print("R:Q:");
+    while (*cursor) {
+      int index = atoi(cursor);
+      if (index >= 0 && index < (int)comfyValueCount) Serial.print(comfyReadValue(index));
+      cursor = strchr(cursor, ',');
+      if (!cursor) break;
+      Serial.print(',');
+      cursor++;
+    }
+    Serial.println();
+    return;
+  }
+
+  // Frame data: 'F:id:offset:flags:hex' (see comfyFrameWrite), answered with 'OK:F:<written>:<shown>'.
+  if (command_type == 'F') {
+    char* cursor = buffer + 2;
+    uint8_t id = strtoul(cursor, &cursor, 10);
+    if (*cursor++ != ':') return;
+    uint16_t offset = strtoul(cursor, &cursor, 10);
+    if (*cursor++ != ':') return;
+    uint8_t flags = strtoul(cursor, &cursor, 10);
+    if (*cursor++ != ':') return;
+    // Decoded in place: the bytes never overtake the hex digits they come from.
+    uint8_t* data = (uint8_t*)cursor;
+    uint8_t len = 0;
+    while (isxdigit(cursor[0]) && isxdigit(cursor[1])) {
+      char pair[3] = {cursor[0], cursor[1], '\0'};
+      data[len++] = strtoul(pair, NULL, 16);
+      cursor += 2;
+    }
+    int written = comfyFrameWrite(id, offset, flags, data, len);
+    if (written < 0) return;
+    uint16_t shown = (flags & COMFY_FRAME_COMMIT) ? comfyFrameCommit(id) : 0;
+    beginReply(); Serial.print("OK:F:"); Serial.print(written); Serial.print(':'); Serial.println(shown);
+    return;
+  }
+
+  // Sequences: 'P:id:action:ms' controls playback (see comfySequenceControl), answered with
+  // 'OK:P:<state>:<position>'; 'K:id:start,duration,index,from,to;...' buffers entries of a
+  // streamed sequence, answered with 'OK:K:<buffered>:<space left>'.
+  if (command_type == 'P') {
+    char* cursor = buffer + 2;
+    uint8_t id = strtoul(cursor, &cursor, 10);
+    if (*cursor++ != ':') return;
+    uint8_t action = strtoul(cursor, &cursor, 10);
+    uint32_t positionMs = (*cursor == ':') ? strtoul(cursor + 1, NULL, 10) : 0;
+    int state = comfySequenceControl(id, action, positionMs);
+    if (state < 0) return;
+    beginReply(); Serial.print("OK:P:"); Serial.print(state); Serial.print(':'); Serial.println(comfySequencePosition(id));
+    return;
+  }
+  if (command_type == 'K') {
+    char* cursor = buffer + 2;
+    uint8_t id = strtoul(cursor, &cursor, 10);
+    if (*cursor++ != ':' || id >= comfySequenceCount || comfySequences[id].table) return;
+    int buffered = 0;
+    while (*cursor) {
+      ComfySequenceEntry entry;
+      entry.start = strtoul(cursor, &cursor, 10);
+      if (*cursor++ != ',') break;
+      entry.duration = strtoul(cursor, &cursor, 10);
+      if (*cursor++ != ',') break;
+      entry.index = strtoul(cursor, &cursor, 10);
+      if (*cursor++ != ',') break;
+      entry.from = strtol(cursor, &cursor, 10);
+      if (*cursor++ != ',') break;
+      entry.to = strtol(cursor, &cursor, 10);
+      if (comfySequenceAppend(id, &entry) <= 0) break;
+      buffered++;
+      if (*cursor++ != ';') break;
+    }
+    beginReply(); Serial.print("OK:K:"); Serial.print(buffered); Serial.print(':'); Serial.println(comfySequenceSpace(id));
+    return;
+  }
+
+  // Ranges (array variables): 'A:start:count' reads, answered with 'R:A:<start>:v,v,...';
+  // 'W:start:v,v,...' writes consecutive values, answered with 'OK:W:<count>'.
+  if (command_type == 'A' || command_type == 'W') {
+    char* cursor = buffer + 2;
+    uint32_t start = strtoul(cursor, &cursor, 10);
+    if (*cursor++ != ':') return;
+    if (command_type == 'A') {
+      uint32_t count = strtoul(cursor, NULL, 10);
+      if (start + count > comfyValueCount) return;
+      beginReply(); Serial.print("R:A:"); Serial.print(start); Serial.print(':');
+      for (uint16_t i = 0; i < count; i++) {
+        if (i > 0) Serial.print(',');
+        Serial.print(comfyReadValue(start + i));
+      }
+      Serial.println();
+      return;
+    }
+    // Count first so a write past the end is rejected instead of applied partially.
+    uint32_t count = *cursor ? 1 : 0;
+    for (char* c = cursor; *c; c++) if (*c == ',') count++;
+    if (start + count > comfyValueCount) return;
+    for (uint16_t i = 0; i < count; i++) {
+      comfyWriteValue(start + i, atoi(cursor));
+      if (i + 1 < count) cursor = strchr(cursor, ',') + 1;  // Counted above, so the comma is there.
+    }
+    beginReply(); Serial.print("OK:W:"); Serial.println(count);
+    return;
+  }
+
+  if (command_type != 'S' && command_type != 'G') return;
+  int index = atoi(buffer + 2);
+  if (index < 0 || index >= (int)comfyValueCount) return;
+
+  if (command_type == 'S') {
+    char* valueStr = strchr(buffer + 2, ':');
+    if (!valueStr) return;
+    comfyWriteValue(index, atoi(valueStr + 1));
+    beginReply(); Serial.print("OK:S:"); Serial.println(index);
+  } else if (command_type == 'G') {
+    beginReply(); Serial.print("R:"); Serial.print(index); Serial.print(":"); Serial.println(comfyReadValue(index));
+  }
+}
+
+// Strips an optional '#<seq>|' tag, runs the command, and answers tagged requests
+// that produced no reply with 'ERR', so the host never waits out a timeout for them.
+static void processAsciiLine() {
+  char* buffer = (char*)comfySerialBuffer;
+  replySeq = -1;
+  replied = false;
+  if (buffer[0] == '#') {
+    char* bar = strchr(buffer, '|');
+    if (!bar) return;
+    replySeq = atoi(buffer + 1) & 0xFF;
+    buffer = bar + 1;
+  }
+  processAsciiCommand(buffer);
+  if (!replied && replySeq >= 0) { beginReply(); Serial.println("ERR"); }
+}
+
+// Tells the host the sketch (re)started, so it resends requests lost while the board was resetting.
+void comfyAsciiAnnounceReady() { Serial.println("READY"); }
+
+// Emits 'D:<millis>:v,v,...' for the subscribed values when the interval has elapsed.
+void comfyAsciiTelemetryTick() {
+  if (!comfyTelemetryDue()) return;
+  Serial.print("D:"); Serial.print(millis()); Serial.print(':');
+  for (uint8_t i = 0; i < comfyTelemetryCount; i++) {
+    if (i > 0) Serial.print(',');
+    Serial.print(comfyReadValue(comfyTelemetryIndices[i]));
+  }
+  Serial.println();
+}
+
+void comfyAsciiCheckSerialInput() {
+  comfyBaudTick();
+  while (Serial.available() > 0) {
+    char inChar = Serial.read();
+    if (inChar == '\n' || inChar == '\r') {
+      if (asciiPos > 0) {
+        comfySerialBuffer[asciiPos] = '\0';
+        processAsciiLine();
+        asciiPos = 0;
+      }
+    } else if (asciiPos < comfySerialBufferSize - 1) {
+      comfySerialBuffer[asciiPos++] = inChar;
+    }
+  }
+}
+""".strip() + "\n"
+
+BINARY_SOURCE = r"""
+#include "ComfyArduinoRuntime.h"
+
+// Firmware side of protocol_codec: COBS-framed packets terminated by 0x00,
+// 'opcode | payload | crc8'. Corrupted frames are dropped and answered with a NAK.
+// Requests with SEQ_FLAG set carry a sequence byte first; the reply (or NAK) echoes it.
+#define OP_SET 0x01
+#define OP_GET 0x02
+#define OP_SET_MANY 0x03
+#define OP_GET_MANY 0x04
+#define OP_IDENTIFY 0x05
+#define OP_SUBSCRIBE 0x06
+#define OP_FRAME_WRITE 0x07
+#define OP_GET_RANGE 0x08
+#define OP_SET_RANGE 0x09
+#define OP_SEQUENCE 0x0A
+#define OP_SEQUENCE_APPEND 0x0B
+#define OP_BAUD 0x0C
+#define OP_TELEMETRY 0x10
+#define OP_READY 0x11
+#define OP_NAK 0x7F
+#define REPLY_FLAG 0x80
+#define SEQ_FLAG 0x40
+#define NAK_CRC 1
+#define NAK_BAD_REQUEST 2
+#define NAK_UNKNOWN_OPCODE 3
+
+static uint8_t framePos = 0;
+static bool frameOverflow = false;
+static bool replyTagged = false;
+static uint8_t replySeq = 0;
+
+static uint8_t crc8(const uint8_t* data, uint8_t len) {
+  uint8_t crc = 0;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (uint8_t b = 0; b < 8; b++) crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+  }
+  return crc;
+}
+
+// Decodes a COBS frame in place. Returns the decoded length, or 0 if the frame is malformed.
+static uint8_t cobsDecode(uint8_t* buf, uint8_t len) {
+  uint8_t readPos = 0, writePos = 0;
+  while (readPos < len) {
+    uint8_t code = buf[readPos++];
+    if (code == 0 || readPos + code - 1 > len) return 0;
+    for (uint8_t i = 1; i < code; i++) buf[writePos++] = buf[readPos++];
+    if (code != 0xFF && readPos < len) buf[writePos++] = 0;
+  }
+  return writePos;
+}
+
+static bool readVarint(uint8_t len, uint8_t* pos, uint16_t* out) {
+  uint16_t result = 0;
+  uint8_t shift = 0;
+  while (*pos < len && shift < 16) {
+    uint8_t b = comfySerialBuffer[(*pos)++];
+    result |= (uint16_t)(b & 0x7F) << shift;
+    if (!(b & 0x80)) { *out = result; return true; }
+    shift += 7;
+  }
+  return false;
+}
+
+static uint8_t writeVarint(uint8_t pos, uint16_t value) {
+  while (value >= 0x80) { comfyTxBuffer[pos++] = (value & 0x7F) | 0x80; value >>= 7; }
+  comfyTxBuffer[pos++] = (uint8_t)value;
+  return pos;
+}
+
+static int16_t readValue(uint8_t pos) {
+  return (int16_t)(comfySerialBuffer[pos] | ((uint16_t)comfySerialBuffer[pos + 1] << 8));
+}
+
+static uint32_t readU32(uint8_t pos) {
+  uint32_t value = 0;
+  for (uint8_t i = 0; i < 4; i++) value |= (uint32_t)comfySerialBuffer[pos + i] << (8 * i);
+  return value;
+}
+
+static uint8_t writeU32(uint8_t pos, uint32_t value) {
+  for (uint8_t i = 0; i < 4; i++) comfyTxBuffer[pos++] = (uint8_t)(value >> (8 * i));
+  return pos;
+}
+
+static uint8_t writeValue(uint8_t pos, int16_t value) {
+  comfyTxBuffer[pos++] = (uint8_t)(value & 0xFF);
+  comfyTxBuffer[pos++] = (uint8_t)((uint16_t)value >> 8);
+  return pos;
+}
+
+// Appends the CRC to comfyTxBuffer[0..len) and writes it COBS-encoded, followed by the 0x00 delimiter.
+static void sendFrame(uint8_t len) {
+  comfyTxBuffer[len] = crc8(comfyTxBuffer, len);
+  len++;
+  uint8_t start = 0;
+  while (start <= len) {
+    uint8_t end = start;
+    while (end < len && comfyTxBuffer[end] != 0 && end - start < 254) end++;
+    Serial.write((uint8_t)(end - start + 1));
+    Serial.write(comfyTxBuffer + start, end - start);
+    if (end - start == 254 && end < len) { start = end; continue; }
+    start = end + 1;
+  }
+  Serial.write((uint8_t)0);
+}
+
+static void sendNak(uint8_t reason) {
+  comfyTxBuffer[0] = OP_NAK;
+  comfyTxBuffer[1] = reason;
+  if (replyTagged) { comfyTxBuffer[2] = replySeq; sendFrame(3); }
+  else sendFrame(2);
+}
+
+static void processFrame(uint8_t len) {
+  replyTagged = false;  // A corrupted frame's sequence byte cannot be trusted.
+  len = cobsDecode(comfySerialBuffer, len);
+  if (len < 2 || crc8(comfySerialBuffer, len - 1) != comfySerialBuffer[len - 1]) { sendNak(NAK_CRC); return; }
+  len--;
+  uint8_t opcode = comfySerialBuffer[0];
+  uint8_t pos = 1;
+  if (opcode != OP_NAK && (opcode & SEQ_FLAG)) {
+    if (len < 2) { sendNak(NAK_BAD_REQUEST); return; }
+    opcode &= ~SEQ_FLAG;
+    replyTagged = true;
+    replySeq = comfySerialBuffer[pos++];
+  }
+  uint16_t index, count;
+  uint32_t newBaudRate = 0;
+  uint8_t out = 0;
+  comfyTxBuffer[out++] = opcode | REPLY_FLAG | (replyTagged ? SEQ_FLAG : 0);
+  if (replyTagged) comfyTxBuffer[out++] = replySeq;
+
+  if (opcode == OP_SET) {
+    if (!readVarint(len, &pos, &index) || index >= comfyValueCount || pos + 2 > len) { sendNak(NAK_BAD_REQUEST); return; }
+    comfyWriteValue(index, readValue(pos));
+    out = writeVarint(out, index);
+  } else if (opcode == OP_GET) {
+    if (!readVarint(len, &pos, &index) || index >= comfyValueCount) { sendNak(NAK_BAD_REQUEST); return; }
+    out = writeVarint(out, index);
+    out = writeValue(out, comfyReadValue(index));
+  } else if (opcode == OP_SET_MANY) {
+    if (!readVarint(len, &pos, &count)) { sendNak(NAK_BAD_REQUEST); return; }
+    // Validate the whole frame first so a bad request never applies partially.
+    uint8_t start = pos;
+    for (uint16_t i = 0; i < count; i++) {
+      if (!readVarint(len, &pos, &index) || index >= comfyValueCount || pos + 2 > len) { sendNak(NAK_BAD_REQUEST); return; }
+      pos += 2;
+    }
+    pos = start;
+    for (uint16_t i = 0; i < count; i++) {
+      readVarint(len, &pos, &index);
+      comfyWriteValue(index, readValue(pos));
+      pos += 2;
+    }
+    out = writeVarint(out, count);
+  } else if (opcode == OP_GET_MANY) {
+    if (!readVarint(len, &pos, &count) || out + 3 + 2 * count > comfySerialBufferSize) { sendNak(NAK_BAD_REQUEST); return; }
+    out = writeVarint(out, count);
+    for (uint16_t i = 0; i < count; i++) {
+      if (!readVarint(len, &pos, &index) || index >= comfyValueCount) { sendNak(NAK_BAD_REQUEST); return; }
+      out = writeValue(out, comfyReadValue(index));
+    }
+  } else if (opcode == OP_GET_RANGE) {
+    uint16_t start;
+    if (!readVarint(len, &pos, &start) || !readVarint(len, &pos, &count)
+        || (uint32_t)start + count > comfyValueCount || out + 7 + 2 * (uint32_t)count > comfySerialBufferSize) { sendNak(NAK_BAD_REQUEST); return; }
+    out = writeVarint(out, start);
+    out = writeVarint(out, count);
+    for (uint16_t i = 0; i < count; i++) out = writeValue(out, comfyReadValue(start + i));
+  } else if (opcode == OP_SET_RANGE) {
+    uint16_t start;
+    if (!readVarint(len, &pos, &start) || (len - pos) % 2 != 0) { sendNak(NAK_BAD_REQUEST); return; }
+    count = (len - pos) / 2;
+    if ((uint32_t)start + count > comfyValueCount) { sendNak(NAK_BAD_REQUEST); return; }
+    for (uint16_t i = 0; i < count; i++, pos += 2) comfyWriteValue(start + i, readValue(pos));
+    out = writeVarint(out, count);
+  } else if (opcode == OP_SEQUENCE) {
+    uint16_t id;
+    if (!readVarint(len, &pos, &id) || pos + 5 > len) { sendNak(NAK_BAD_REQUEST); return; }
+    int state = comfySequenceControl(id, comfySerialBuffer[pos], readU32(pos + 1));
+    if (state < 0) { sendNak(NAK_BAD_REQUEST); return; }
+    comfyTxBuffer[out++] = (uint8_t)state;
+    out = writeU32(out, comfySequencePosition(id));
+  } else if (opcode == OP_SEQUENCE_APPEND) {
+    // Entries are 12 bytes: start (uint32), duration and index (uint16), from and to (int16), all little-endian.
+    uint16_t id;
+    if (!readVarint(len, &pos, &id) || (len - pos) % 12 != 0 || id >= comfySequenceCount || comfySequences[id].table) { sendNak(NAK_BAD_REQUEST); return; }
+    uint16_t buffered = 0;
+    for (; pos < len; pos += 12) {
+      ComfySequenceEntry entry;
+      entry.start = readU32(pos);
+      entry.duration = (uint16_t)readValue(pos + 4);
+      entry.index = (uint16_t)readValue(pos + 6);
+      entry.from = readValue(pos + 8);
+      entry.to = readValue(pos + 10);
+      if (comfySequenceAppend(id, &entry) <= 0) break;
+      buffered++;
+    }
+    out = writeVarint(out, buffered);
+    out = writeVarint(out, comfySequenceSpace(id));
+  } else if (opcode == OP_BAUD) {
+    if (pos + 4 > len || (newBaudRate = readU32(pos)) == 0) { sendNak(NAK_BAD_REQUEST); return; }
+    out = writeU32(out, newBaudRate);
+  } else if (opcode == OP_IDENTIFY) {
+    comfyBaudConfirm();
+    for (const char* fp = comfyFirmwareFingerprint; *fp; fp++) comfyTxBuffer[out++] = (uint8_t)*fp;
+  } else if (opcode == OP_SUBSCRIBE) {
+    uint16_t interval;
+    if (!readVarint(len, &pos, &interval) || !readVarint(len, &pos, &count)) { sendNak(NAK_BAD_REQUEST); return; }
+    comfyTelemetryReset(interval);
+    for (uint16_t i = 0; i < count; i++) {
+      if (!readVarint(len, &pos, &index)) { sendNak(NAK_BAD_REQUEST); return; }
+      if (index < comfyValueCount) comfyTelemetryAdd(index);
+    }
+    out = writeVarint(out, comfyTelemetryCount);
+  } else if (opcode == OP_FRAME_WRITE) {
+    uint16_t id, offset;
+    if (!readVarint(len, &pos, &id) || !readVarint(len, &pos, &offset) || pos >= len) { sendNak(NAK_BAD_REQUEST); return; }
+    uint8_t flags = comfySerialBuffer[pos++];
+    int written = comfyFrameWrite(id, offset, flags, comfySerialBuffer + pos, len - pos);
+    if (written < 0) { sendNak(NAK_BAD_REQUEST); return; }
+    out = writeVarint(out, written);
+    out = writeVarint(out, (flags & COMFY_FRAME_COMMIT) ? comfyFrameCommit(id) : 0);
+  } else {
+    sendNak(NAK_UNKNOWN_OPCODE);
+    return;
+  }
+  sendFrame(out);
+  if (newBaudRate) comfyBaudSwitch(newBaudRate);  // The reply goes out at the old rate.
+}
+
+// Unsolicited frame sent once from setup(), see comfyAsciiAnnounceReady().
+void comfyBinaryAnnounceReady() {
+  comfyTxBuffer[0] = OP_READY;
+  sendFrame(1);
+}
+
+// Unsolicited frame: OP_TELEMETRY | millis (uint32 LE) | count | int16 values.
+void comfyBinaryTelemetryTick() {
+  if (!comfyTelemetryDue()) return;
+  unsigned long now = millis();
+  uint8_t out = 0;
+  comfyTxBuffer[out++] = OP_TELEMETRY;
+  for (uint8_t i = 0; i < 4; i++) comfyTxBuffer[out++] = (uint8_t)(now >> (8 * i));
+  out = writeVarint(out, comfyTelemetryCount);
+  for (uint8_t i = 0; i < comfyTelemetryCount; i++) out = writeValue(out, comfyReadValue(comfyTelemetryIndices[i]));
+  sendFrame(out);
+}
+
+void comfyBinaryCheckSerialInput() {
+  comfyBaudTick();
+  while (Serial.available() > 0) {
+    uint8_t inByte = Serial.read();
+    if (inByte == 0) {
+      if (framePos > 0 && !frameOverflow) processFrame(framePos);
+      framePos = 0;
+      frameOverflow = false;
+    } else if (framePos < comfySerialBufferSize) {
+      comfySerialBuffer[framePos++] = inByte;
+    } else {
+      frameOverflow = true;
+    }
+  }
+}
+""".strip() + "\n"
+
+BAUD_SOURCE = r"""
+#include "ComfyArduinoRuntime.h"
+
+static bool onProbation = false;
+static unsigned long switchedAt = 0;
+
+void comfyBaudSwitch(unsigned long rate) {
+  Serial.flush();  // Waits until the reply has left at the old rate.
+  Serial.end();
+  Serial.begin(rate);
+  onProbation = rate != comfyBaudRate;
+  switchedAt = millis();
+}
+
+void comfyBaudConfirm() { onProbation = false; }
+
+void comfyBaudTick() {
+  if (onProbation && millis() - switchedAt >= COMFY_BAUD_PROBATION_MS) comfyBaudSwitch(comfyBaudRate);
+}
+""".strip() + "\n"
+
+TELEMETRY_SOURCE = r"""
+#include "ComfyArduinoRuntime.h"
+
+uint16_t comfyTelemetryIndices[COMFY_MAX_SUBSCRIPTIONS];
+uint8_t comfyTelemetryCount = 0;
+static unsigned long telemetryInterval = 0;
+static unsigned long lastTelemetry = 0;
+
+void comfyTelemetryReset(unsigned long intervalMs) {
+  telemetryInterval = intervalMs;
+  comfyTelemetryCount = 0;
+  lastTelemetry = millis();
+}
+
+bool comfyTelemetryAdd(uint16_t index) {
+  if (comfyTelemetryCount >= COMFY_MAX_SUBSCRIPTIONS) return false;
+  comfyTelemetryIndices[comfyTelemetryCount++] = index;
+  return true;
+}
+
+bool comfyTelemetryDue() {
+  if (telemetryInterval == 0 || comfyTelemetryCount == 0) return false;
+  unsigned long now = millis();
+  if (now - lastTelemetry < telemetryInterval) return false;
+  lastTelemetry = now;
+  return true;
+}
+""".strip() + "\n"
+
+FRAMES_SOURCE = r"""
+#include "ComfyArduinoRuntime.h"
+
+// A frame arrives as chunks written in order from offset 0, the last one with
+// COMFY_FRAME_COMMIT. The frame is only shown if no chunk went missing, so the
+// outputs never display a mix of two frames' data that was torn by a lost chunk.
+static int16_t writingFrame = -1;
+static uint16_t nextOffset = 0;
+static bool torn = false;
+
+// Unpacks `len` bytes of packed values into frame `id` from value `offset` on,
+// scaled to 0-255. Returns the number of values written, -1 for a bad request.
+int comfyFrameWrite(uint8_t id, uint16_t offset, uint8_t flags, const uint8_t* data, uint8_t len) {
+  uint16_t length;
+  uint8_t* frame = comfyFrameData(id, &length);
+  if (!frame || offset > length) return -1;
+  if (offset == 0) { writingFrame = id; nextOffset = 0; torn = false; }
+  else if (id != writingFrame || offset != nextOffset) torn = true;
+
+  uint8_t bits = 8 >> ((flags >> 1) & 3);
+  uint8_t mask = (uint8_t)((1 << bits) - 1);
+  uint8_t scale = 255 / mask;
+  uint16_t pos = offset;
+  for (uint8_t i = 0; i < len && pos < length; i++) {
+    for (int8_t shift = 8 - bits; shift >= 0 && pos < length; shift -= bits) {
+      frame[pos++] = ((data[i] >> shift) & mask) * scale;
+    }
+  }
+  nextOffset = pos;
+  return pos - offset;
+}
+
+// Shows frame `id` if it arrived complete. Returns its length, or 0 if it was not shown.
+uint16_t comfyFrameCommit(uint8_t id) {
+  uint16_t length;
+  bool complete = comfyFrameData(id, &length) && id == writingFrame && !torn && nextOffset == length;
+  writingFrame = -1;
+  if (!complete) return 0;
+  comfyFrameShow(id);
+  return length;
+}
+""".strip() + "\n"
+
+SEQUENCES_SOURCE = r"""
+#include "ComfyArduinoRuntime.h"
+
+// Sequences play on millis(): sequence time is millis() - origin while playing, so
+// timing only depends on how often loop() runs. Ramps in progress are shared by all
+// sequences; a newer entry for a variable takes over from its running ramp.
+struct ComfyRamp { uint8_t sequence; ComfySequenceEntry entry; };
+static ComfyRamp ramps[COMFY_MAX_RAMPS];
+static uint8_t rampCount = 0;
+
+static int16_t rampValue(const ComfySequenceEntry& entry, uint32_t position) {
+  uint32_t elapsed = position - entry.start;
+  if (elapsed >= entry.duration) return entry.to;
+  // |to - from| <= 65535 and elapsed < 32768, so the product fits in int32.
+  return entry.from + (int32_t)((int32_t)entry.to - entry.from) * (int32_t)elapsed / entry.duration;
+}
+
+// The next entry to start: entry `next` of a table, or the oldest entry waiting in a ring.
+static bool peekEntry(ComfySequence& seq, ComfySequenceEntry* entry) {
+  if (seq.table) {
+    if (seq.next >= seq.count) return false;
+    memcpy_P(entry, seq.table + seq.next, sizeof(ComfySequenceEntry));
+  } else {
+    if (seq.count == 0) return false;
+    *entry = seq.ring[seq.head];
+  }
+  return true;
+}
+
+static void popEntry(ComfySequence& seq) {
+  if (seq.table) { seq.next++; return; }
+  seq.head = (seq.head + 1) % seq.capacity;
+  seq.count--;
+}
+
+static void dropRamps(uint8_t id) {
+  uint8_t kept = 0;
+  for (uint8_t i = 0; i < rampCount; i++) if (ramps[i].sequence != id) ramps[kept++] = ramps[i];
+  rampCount = kept;
+}
+
+// Starts every entry of sequence `id` due at `position` and moves its ramps there.
+// Entries that already ended by then are applied at their final value, which is
+// how a seek restores the state of every variable at the new position.
+static void advance(uint8_t id, uint32_t position) {
+  ComfySequence& seq = comfySequences[id];
+  ComfySequenceEntry entry;
+  while (peekEntry(seq, &entry) && entry.start <= position) {
+    popEntry(seq);
+    for (uint8_t i = 0; i < rampCount; i++) {
+      if (ramps[i].entry.index == entry.index) { ramps[i] = ramps[--rampCount]; break; }
+    }
+    // With every ramp slot taken, an entry jumps straight to its target.
+    if (position - entry.start < entry.duration && rampCount < COMFY_MAX_RAMPS) {
+      ramps[rampCount].sequence = id;
+      ramps[rampCount].entry = entry;
+      rampCount++;
+    } else {
+      comfyWriteValue(entry.index, entry.to);
+    }
+  }
+  for (uint8_t i = 0; i < rampCount;) {
+    if (ramps[i].sequence != id) { i++; continue; }
+    comfyWriteValue(ramps[i].entry.index, rampValue(ramps[i].entry, position));
+    if (position - ramps[i].entry.start >= ramps[i].entry.duration) ramps[i] = ramps[--rampCount];
+    else i++;
+  }
+}
+
+void comfySequencesTick() {
+  unsigned long now = millis();
+  for (uint8_t id = 0; id < comfySequenceCount; id++) {
+    ComfySequence& seq = comfySequences[id];
+    if (seq.state != COMFY_SEQ_PLAYING) continue;
+    uint32_t position = now - seq.origin;
+    advance(id, position);
+    if (!seq.table || position < seq.lengthMs) continue;
+    // A table ends once its last entry is applied. Moving the origin by exactly one
+    // length keeps a looping sequence from drifting, however late this tick runs.
+    if ((seq.flags & COMFY_SEQ_LOOP) && seq.lengthMs > 0) {
+      seq.origin += seq.lengthMs;
+      seq.next = 0;
+      advance(id, now - seq.origin);
+    } else {
+      seq.state = COMFY_SEQ_STOPPED;
+      seq.next = 0;
+      seq.position = 0;
+    }
+  }
+}
+
+// Actions: COMFY_SEQ_STOP rewinds (emptying a ring), COMFY_SEQ_PLAY, COMFY_SEQ_PAUSE,
+// COMFY_SEQ_SEEK jumps to `positionMs` (a stopped sequence becomes paused there),
+// COMFY_SEQ_STATUS changes nothing. Returns the new state, -1 for a bad request.
+int comfySequenceControl(uint8_t id, uint8_t action, uint32_t positionMs) {
+  if (id >= comfySequenceCount) return -1;
+  ComfySequence& seq = comfySequences[id];
+  unsigned long now = millis();
+  uint32_t position = comfySequencePosition(id);
+  switch (action) {
+    case COMFY_SEQ_STOP:
+      dropRamps(id);
+      seq.state = COMFY_SEQ_STOPPED;
+      seq.next = seq.head = 0;
+      if (!seq.table) seq.count = 0;
+      position = 0;
+      break;
+    case COMFY_SEQ_PLAY:
+      if (seq.state != COMFY_SEQ_PLAYING) { seq.state = COMFY_SEQ_PLAYING; seq.origin = now - position; }
+      break;
+    case COMFY_SEQ_PAUSE:
+      if (seq.state == COMFY_SEQ_PLAYING) seq.state = COMFY_SEQ_PAUSED;
+      break;
+    case COMFY_SEQ_SEEK:
+      position = positionMs;
+      if (seq.table) {
+        // Replays the table from the start up to the new position.
+        if (seq.lengthMs > 0 && position >= seq.lengthMs) position = (seq.flags & COMFY_SEQ_LOOP) ? position % seq.lengthMs : seq.lengthMs;
+        seq.next = 0;
+      }
+      dropRamps(id);
+      advance(id, position);
+      seq.origin = now - position;
+      if (seq.state == COMFY_SEQ_STOPPED) seq.state = COMFY_SEQ_PAUSED;
+      break;
+    case COMFY_SEQ_STATUS:
+      break;
+    default:
+      return -1;
+  }
+  seq.position = position;
+  return seq.state;
+}
+
+uint32_t comfySequencePosition(uint8_t id) {
+  if (id >= comfySequenceCount) return 0;
+  ComfySequence& seq = comfySequences[id];
+  return seq.state == COMFY_SEQ_PLAYING ? millis() - seq.origin : seq.position;
+}
+
+// Queues an entry of a streamed sequence; entries must arrive in start order.
+// Returns 1 if it was buffered, 0 if the ring is full, -1 for a bad request.
+int comfySequenceAppend(uint8_t id, const ComfySequenceEntry* entry) {
+  if (id >= comfySequenceCount || comfySequences[id].table || entry->index >= comfyValueCount || entry->duration > 32767) return -1;
+  ComfySequence& seq = comfySequences[id];
+  if (seq.count >= seq.capacity) return 0;
+  seq.ring[(seq.head + seq.count) % seq.capacity] = *entry;
+  seq.count++;
+  return 1;
+}
+
+uint16_t comfySequenceSpace(uint8_t id) {
+  if (id >= comfySequenceCount || comfySequences[id].table) return 0;
+  return comfySequences[id].capacity - comfySequences[id].count;
+}
+""".strip() + "\n"
+
+LIBRARY_PROPERTIES = f"""
+name={RUNTIME_LIBRARY_NAME}
+version=1.0.0
+author=ComfyUI-Arduino
+maintainer=ComfyUI-Arduino
+sentence=Serial command runtime for sketches generated by ComfyUI-Arduino.
+paragraph=Generated file, do not edit.
+category=Communication
+url=https://github.com/Juste-Leo2/ComfyUI-Arduino
+architectures=*
+dot_a_linkage=true
+""".strip() + "\n"
+
+
+def get_runtime_library_files() -> dict[str, str]:
+    """Library files, keyed by their path relative to the library root."""
+    return {
+        "library.properties": LIBRARY_PROPERTIES,
+        f"src/{RUNTIME_LIBRARY_NAME}.h": RUNTIME_HEADER,
+        "src/ComfyAsciiProtocol.cpp": ASCII_SOURCE,
+        "src/ComfyBinaryProtocol.cpp": BINARY_SOURCE,
+        "src/ComfyBaud.cpp": BAUD_SOURCE,
+        "src/ComfyTelemetry.cpp": TELEMETRY_SOURCE,
+        "src/ComfyFrames.cpp": FRAMES_SOURCE,
+        "src/ComfySequences.cpp": SEQUENCES_SOURCE,
+    }
+
+
+def get_runtime_version() -> str:
+    """Hash of the runtime sources. Embedded in every sketch so that a runtime change
+    also changes the sketch's build-cache key and firmware fingerprint."""
+    digest = hashlib.sha256()
+    for path, content in sorted(get_runtime_library_files().items()):
+        digest.update(path.encode('utf-8'))
+        digest.update(content.encode('utf-8'))
+    return digest.hexdigest()[:16]
@@ -0,0 +1,116 @@
+# src/frame_buffer.py
+
+"""
+Turns ComfyUI images and float lists into frame buffer payloads.
+
+Everything is vectorized with NumPy: the image is area-resampled to the frame
+size, converted to the frame's channel order, gamma-corrected, scaled by the
+brightness, quantized to the requested bit depth and packed into bytes. The
+result goes to the board with device_client.write_frame.
+"""
+
+import json
+import numpy as np
+from .protocol_codec import FRAME_PACKINGS
+
+LUMA_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+_CHANNEL_INDICES = {"RGB": [0, 1, 2], "GRB": [1, 0, 2], "BGR": [2, 1, 0]}
+
+
+def _resize_area(pixels: np.ndarray, height: int, width: int) -> np.ndarray:
+    """
+    Box-filter resize of an (H, W, C) array: every output pixel is the mean of
+    the source pixels it covers. Rows, then columns, are summed per bin with
+    np.add.reduceat; when upscaling, bins repeat a single source pixel, which
+    reduceat returns as is (nearest-neighbour).
+    """
+    if pixels.shape[:2] == (height, width):
+        return pixels
+
+    def bins(src: int, dst: int) -> tuple[np.ndarray, np.ndarray]:
+        starts = np.arange(dst) * src // dst
+        return starts, np.maximum(np.diff(np.append(starts, src)), 1)
+
+    y0, rows_per_bin = bins(pixels.shape[0], height)
+    x0, cols_per_bin = bins(pixels.shape[1], width)
+    rows = np.add.reduceat(pixels, y0, axis=0, dtype=np.float64) / rows_per_bin[:, None, None]
+    return (np.add.reduceat(rows, x0, axis=1) / cols_per_bin[None, :, None]).astype(np.float32)
+
+
+def _to_channels(pixels: np.ndarray, color_order: str) -> np.ndarray:
+    """Converts (H, W, C) gray, RGB or RGBA pixels to the frame's channels, in wire order."""
+    if pixels.shape[2] == 4:
+        pixels = pixels[..., :3]  # Alpha has no meaning for an LED.
+    if color_order == "mono":
+        return pixels if pixels.shape[2] == 1 else (pixels[..., :3] @ LUMA_WEIGHTS)[..., None]
+    if pixels.shape[2] == 1:
+        pixels = np.repeat(pixels, 3, axis=2)
+    return pixels[..., _CHANNEL_INDICES[color_order]]
+
+
+def image_to_values(image, frame: dict, batch_index: int = 0) -> np.ndarray:
+    """
+    Converts a ComfyUI IMAGE ([batch, height, width, channels] floats in 0-1,
+    a torch tensor or any array) into the frame's flat channel values, in the
+    order the LEDs or pins are wired.
+    """
+    pixels = image.detach().cpu().numpy() if hasattr(image, "detach") else np.asarray(image)
+    if pixels.ndim == 4:
+        pixels = pixels[min(batch_index, pixels.shape[0] - 1)]
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    pixels = _resize_area(pixels.astype(np.float32, copy=False), frame["height"], frame["width"])
+    return _wire_order(_to_channels(pixels, frame["color_order"]), frame)
+
+
+def list_to_values(values: str, frame: dict) -> np.ndarray:
+    """
+    Parses a JSON list or comma/whitespace-separated floats (0-1). Either one
+    value per channel (RGB order for color frames) or one gray value per pixel.
+    """
+    text = values.strip()
+    flat = np.asarray(json.loads(text) if text.startswith('[') else text.replace(',', ' ').split(), dtype=np.float32).ravel()
+    pixels = frame["width"] * frame["height"]
+    channels = 1 if flat.size == pixels else 3 if frame["channels"] == 3 else 1
+    if flat.size != pixels * channels:
+        raise ValueError(f"Expected {pixels} or {frame['length']} values for a {frame['width']}x{frame['height']} frame, got {flat.size}.")
+    grid = flat.reshape(frame["height"], frame["width"], channels)
+    return _wire_order(_to_channels(grid, frame["color_order"]), frame)
+
+
+def _wire_order(pixels: np.ndarray, frame: dict) -> np.ndarray:
+    if frame.get("serpentine"):
+        # Matrices wired in a zigzag run every other row backwards.
+        pixels = pixels.copy()
+        pixels[1::2] = pixels[1::2, ::-1]
+    return pixels.reshape(-1)
+
+
+def wire_bits(bit_depth: int) -> int:
+    """Smallest packing that holds `bit_depth` bits per value."""
+    return next(bits for bits in sorted(FRAME_PACKINGS) if bits >= bit_depth)
+
+
+def quantize_and_pack(values: np.ndarray, bit_depth: int = 8, gamma: float = 1.0, brightness: float = 1.0) -> tuple[bytes, int]:
+    """
+    Applies gamma and brightness to 0-1 values, quantizes them to `bit_depth`
+    bits and packs them MSB first. Returns (packed bytes, bits per packed value).
+    The board scales the packed values back to 0-255.
+    """
+    bits = wire_bits(bit_depth)
+    levels = (1 << bit_depth) - 1
+    wire_levels = (1 << bits) - 1
+    linear = np.clip(values, 0.0, 1.0) ** gamma * np.clip(brightness, 0.0, 1.0)
+    quantized = np.rint(linear * levels)
+    if levels != wire_levels:
+        quantized = np.rint(quantized * (wire_levels / levels))
+    quantized = quantized.astype(np.uint8)
+    if bits == 8:
+        return quantized.tobytes(), bits
+
+    per_byte = 8 // bits
+    padded = np.zeros(-(-quantized.size // per_byte) * per_byte, dtype=np.uint8)
+    padded[:quantized.size] = quantized
+    shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+    packed = np.bitwise_or.reduce(padded.reshape(-1, per_byte) << shifts, axis=1).astype(np.uint8)
+    return packed.tobytes(), bits
@@ -0,0 +1,192 @@
+# src/metrics.py
+
+"""
+Lightweight timing and counter instrumentation for the serial and build paths.
+
+Series are identified by a metric name plus a few labels (port, command,
+phase, ...). Durations go into fixed-bucket histograms, everything else into
+counters. Collection is off unless COMFY_ARDUINO_METRICS=1 is set or the
+Arduino Metrics node turns it on; while off, `timer()` returns a shared no-op
+and `inc()` returns immediately, so instrumented code pays one attribute check.
+"""
+
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the max for the overflow bucket)."""
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+
+class _NullTimer:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry, self.name, self.labels = registry, name, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._histograms: dict[tuple, _Histogram] = {}
+        self._counters: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    # --- Recording ---
+
+    def timer(self, name: str, **labels):
+        """Context manager that records the duration of its block into histogram `name`."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    # --- Reporting ---
+
+    def snapshot(self) -> dict:
+        """JSON-serializable copy of every series."""
+        with self._lock:
+            histograms = [{"name": name, "labels": dict(labels), "count": h.count, "sum": h.total,
+                           "min": h.min if h.count else 0.0, "max": h.max,
+                           "p50": h.quantile(0.5), "p90": h.quantile(0.9), "p99": h.quantile(0.99),
+                           "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h.counts))}
+                          for (name, labels), h in sorted(self._histograms.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {"enabled": self.enabled, "histograms": histograms, "counters": counters}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (histograms with cumulative buckets)."""
+        def fmt(labels: dict, extra: str = "") -> str:
+            parts = [f'{k}="{v}"' for k, v in labels.items()] + ([extra] if extra else [])
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        snapshot = self.snapshot()
+        lines, typed = [], set()
+        for h in snapshot["histograms"]:
+            name = f"arduino_{h['name']}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, n in h["buckets"].items():
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{fmt(h['labels'], le)} {cumulative}")
+            lines.append(f"{name}_sum{fmt(h['labels'])} {h['sum']:.6f}")
+            lines.append(f"{name}_count{fmt(h['labels'])} {h['count']}")
+        for c in snapshot["counters"]:
+            name = f"arduino_{c['name']}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(c['labels'])} {c['value']:g}")
+        return "\n".join(lines) + "\n"
+
+    def to_text(self) -> str:
+        """Human-readable summary, one line per series."""
+        snapshot = self.snapshot()
+        if not snapshot["histograms"] and not snapshot["counters"]:
+            return "No metrics recorded yet." + ("" if self.enabled else " Collection is disabled.")
+        lines = [f"{'series':58} {'count':>7} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for h in snapshot["histograms"]:
+            label = h["name"] + _fmt_labels(h["labels"])
+            mean = h["sum"] / h["count"] if h["count"] else 0.0
+            lines.append(f"{label:58} {h['count']:7} {mean * 1000:9.2f} {h['p50'] * 1000:9.2f} {h['p99'] * 1000:9.2f} {h['max'] * 1000:9.2f}")
+        for c in snapshot["counters"]:
+            lines.append(f"{c['name'] + _fmt_labels(c['labels']):58} {c['value']:7g}")
+        return "\n".join(lines)
+
+    def dump(self, path: str, fmt: str = "prometheus"):
+        """Writes the metrics to `path` atomically, as Prometheus text or JSON."""
+        content = self.to_json() if fmt == "json" else self.to_prometheus()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def _fmt_labels(labels: dict) -> str:
+    return "[" + ", ".join(f"{k}={v}" for k, v in labels.items()) + "]" if labels else ""
+
+
+# --- Shared registry used by all instrumented code ---
+metrics = MetricsRegistry(enabled=os.environ.get("COMFY_ARDUINO_METRICS", "") not in ("", "0"))
@@ -0,0 +1,155 @@
+# src/port_registry.py
+
+"""
+Live view of the serial ports, refreshed in the background.
+
+Enumeration runs on a polling thread, so INPUT_TYPES always reads a cached
+list and boards plugged in after startup show up without restarting ComfyUI.
+Each port's USB VID/PID is matched against known Arduino boards (and, once
+arduino-cli is ready, against `arduino-cli board list`) to suggest its FQBN.
+"""
+
+import threading
+import time
+import serial.tools.list_ports
+from .cli_utils import run_cli_command
+from .serial_communicator import release_port
+
+NO_PORTS_MESSAGE = "No COM ports found"
+SCANNING_MESSAGE = "Scanning serial ports..."
+DEFAULT_POLL_INTERVAL = 2.0  # Seconds between background scans.
+MIN_REFRESH_INTERVAL = 0.5   # Explicit refreshes closer together than this reuse the last scan.
+
+# Official Arduino boards identified by their USB VID/PID. Clones behind generic
+# USB-serial chips (CH340, FTDI, CP210x) cannot be told apart this way.
+KNOWN_BOARDS = {
+    (0x2341, 0x0043): "arduino:avr:uno",
+    (0x2341, 0x0001): "arduino:avr:uno",
+    (0x2A03, 0x0043): "arduino:avr:uno",
+    (0x2341, 0x0243): "arduino:avr:uno",
+    (0x2341, 0x0010): "arduino:avr:mega",
+    (0x2341, 0x0042): "arduino:avr:mega",
+    (0x2A03, 0x0010): "arduino:avr:mega",
+    (0x2A03, 0x0042): "arduino:avr:mega",
+    (0x2341, 0x0036): "arduino:avr:leonardo",
+    (0x2341, 0x8036): "arduino:avr:leonardo",
+    (0x2A03, 0x0036): "arduino:avr:leonardo",
+    (0x2A03, 0x8036): "arduino:avr:leonardo",
+    (0x2341, 0x0037): "arduino:avr:micro",
+    (0x2341, 0x8037): "arduino:avr:micro",
+    (0x2341, 0x0058): "arduino:megaavr:nona4809",
+}
+
+
+def _port_label(info: dict) -> str:
+    return f"{info['device']} - {info['description']}"
+
+
+def _parse_board_list(data) -> dict[str, str]:
+    """Maps port address to FQBN from `arduino-cli board list --format json` (old and new layouts)."""
+    entries = data.get('detected_ports', []) if isinstance(data, dict) else data
+    fqbns = {}
+    for entry in entries or []:
+        if not isinstance(entry, dict): continue
+        port = entry.get('port', {})
+        boards = entry.get('matching_boards') or port.get('boards') or []
+        address = port.get('address')
+        if address and boards and boards[0].get('fqbn'):
+            fqbns[address] = boards[0]['fqbn']
+    return fqbns
+
+
+class PortRegistry:
+    """Cached, background-refreshed list of serial ports with board detection."""
+
+    def __init__(self, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._ports: dict[str, dict] = {}
+        self._cli_fqbns: dict[str, str] = {}
+        self._cli_scanned: frozenset | None = None
+        self._cli = None
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll_loop, name="arduino-port-registry", daemon=True)
+                self._thread.start()
+
+    def set_cli(self, cli_path: str, config_path: str):
+        """Enables arduino-cli based detection, for boards that are not in KNOWN_BOARDS."""
+        self._cli = (cli_path, config_path)
+        self._cli_scanned = None  # The next background scan queries arduino-cli.
+
+    def _poll_loop(self):
+        while True:
+            try:
+                self.refresh(force=True)
+            except Exception as e:
+                print(f"   - Port scan failed: {e}")
+            time.sleep(self.poll_interval)
+
+    # --- Scanning ---
+
+    def refresh(self, force: bool = False):
+        """Rescans the ports, unless the last scan is more recent than MIN_REFRESH_INTERVAL."""
+        with self._scan_lock:
+            if not force and time.monotonic() - self._last_scan < MIN_REFRESH_INTERVAL:
+                return
+            ports = {}
+            for p in serial.tools.list_ports.comports():
+                ports[p.device] = {"device": p.device, "description": p.description,
+                                   "vid": p.vid, "pid": p.pid, "serial_number": p.serial_number}
+            first_scan = not self._last_scan
+            self._last_scan = time.monotonic()
+
+            with self._lock:
+                added = ports.keys() - self._ports.keys()
+                removed = self._ports.keys() - ports.keys()
+                self._ports = ports
+            for port in sorted(added) if not first_scan else ():
+                print(f"   - Serial port connected: {_port_label(ports[port])}")
+            for port in sorted(removed):
+                print(f"   - Serial port disconnected: {port}")
+                # Drop pooled handles and readers that point at a board that is gone.
+                release_port(port)
+
+            # arduino-cli is slow to query, so only ask it again when the set of ports changed.
+            if self._cli is not None and frozenset(ports) != self._cli_scanned:
+                self._query_cli(ports)
+
+    def _query_cli(self, ports: dict):
+        self._cli_scanned = frozenset(ports)
+        if not any(self._known_fqbn(info) is None for info in ports.values()):
+            return
+        success, data = run_cli_command(*self._cli, ["board", "list", "--format", "json"], expect_json=True)
+        if success:
+            with self._lock:
+                self._cli_fqbns = _parse_board_list(data)
+
+    # --- Lookups (never block on enumeration) ---
+
+    @staticmethod
+    def _known_fqbn(info: dict) -> str | None:
+        if info.get('vid') is None or info.get('pid') is None:
+            return None
+        return KNOWN_BOARDS.get((info['vid'], info['pid']))
+
+    def port_labels(self) -> list[str]:
+        if not self._last_scan:
+            return [SCANNING_MESSAGE]
+        with self._lock:
+            ports = sorted(self._ports.values(), key=lambda info: info['device'])
+        return [_port_label(info) for info in ports] or [NO_PORTS_MESSAGE]
+
+    def detect_fqbn(self, port: str) -> str | None:
+        """FQBN suggested for the board on `port`, or None if it cannot be identified."""
+        with self._lock:
+            info = self._ports.get(port)
+            cli_fqbn = self._cli_fqbns.get(port)
+        if info is None:
+            return None
+        return self._known_fqbn(info) or cli_fqbn
@@ -0,0 +1,169 @@
+# src/profile_store.py
+
+"""
+Device profiles that survive ComfyUI restarts.
+
+A profile describes what a board runs: port, FQBN, comm map, wire protocol,
+baud rate, firmware fingerprint, and when it was uploaded and last verified.
+Every profile stored or loaded tells the connection pool which rate its port
+runs at. Profiles are
+kept in a small JSON file, rewritten atomically on every change and read
+lazily on first use. A profile read from disk is only trusted once the board
+has confirmed, with a single identify request, that it still runs that firmware.
+"""
+
+import json
+import os
+import threading
+import time
+from collections.abc import MutableMapping
+from .code_generator import DEFAULT_BAUD_RATE
+from .device_client import identify, PROTOCOL_ASCII
+from .serial_communicator import connection_pool
+
+PROFILES_FILE_NAME = "device_profiles.json"
+STORE_VERSION = 1
+# Long enough for a board that resets when its port is opened to boot and answer.
+VERIFY_TIMEOUT = 2.0
+# Seconds before a board that did not answer is asked again; until then its profile is not used.
+VERIFY_RETRY_INTERVAL = 30.0
+
+
+def _use_baud_rate(port: str, profile: dict):
+    # Profiles from before the baud rate was configurable ran at the default.
+    connection_pool.set_baudrate(port, profile.get("baud_rate", DEFAULT_BAUD_RATE), profile.get("link_baud_rate"))
+
+
+class ProfileStore(MutableMapping):
+    """
+    Port -> profile mapping backed by a JSON file. Looking a port up verifies
+    its profile against the board the first time; profiles stored during this
+    session (right after an upload) are trusted as they are.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._profiles: dict[str, dict] = {}
+        self._verified: set[str] = set()
+        self._unanswered: dict[str, float] = {}  # port -> time.monotonic() of the last unanswered identify
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # --- Persistence ---
+
+    def _load(self):
+        # Called with self._lock held.
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read device profiles from {self.path}: {e}")
+            return
+        if not isinstance(data, dict) or data.get("version") != STORE_VERSION:
+            return
+        profiles = data.get("profiles", {})
+        if isinstance(profiles, dict):
+            self._profiles = {port: p for port, p in profiles.items() if isinstance(p, dict)}
+        if self._profiles:
+            print(f"--- Arduino: Loaded {len(self._profiles)} saved profile(s): {', '.join(sorted(self._profiles))} ---")
+
+    def _save(self):
+        # Called with self._lock held.
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": STORE_VERSION, "profiles": self._profiles}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not save device profiles to {self.path}: {e}")
+
+    # --- Verification ---
+
+    def _verify(self, port: str, profile: dict) -> bool | None:
+        """True if the board runs the profile's firmware, False if it runs another one, None if it does not answer."""
+        fingerprint = profile.get("fingerprint")
+        if not fingerprint:
+            return False
+        _use_baud_rate(port, profile)
+        found, running = identify(port, profile.get("protocol", PROTOCOL_ASCII), timeout=VERIFY_TIMEOUT, tagged=True)
+        if not found:
+            return None
+        return running == fingerprint
+
+    def lookup(self, port: str) -> dict | None:
+        """Returns the profile for `port` once it is trusted, or None."""
+        with self._lock:
+            self._load()
+            profile = self._profiles.get(port)
+            if profile is None or port in self._verified:
+                return profile
+            if time.monotonic() - self._unanswered.get(port, -VERIFY_RETRY_INTERVAL) < VERIFY_RETRY_INTERVAL:
+                return None
+
+        # Serial I/O happens outside the lock; a concurrent lookup at worst verifies twice.
+        verified = self._verify(port, profile)
+        with self._lock:
+            if self._profiles.get(port) is not profile:
+                return self._profiles.get(port) if port in self._verified else None
+            if verified is None:
+                # Unplugged or busy: keep the profile for later, but do not use it now,
+                # and do not make every node wait for the board again right away.
+                self._unanswered[port] = time.monotonic()
+                return None
+            self._unanswered.pop(port, None)
+            if not verified:
+                print(f"--- Arduino: Saved profile for {port} dropped, the board runs other firmware. ---")
+                del self._profiles[port]
+                self._save()
+                return None
+            profile["verified_at"] = time.time()
+            self._verified.add(port)
+            self._save()
+            print(f"--- Arduino: Saved profile for {port} verified (firmware {profile.get('fingerprint')}). ---")
+            return profile
+
+    # --- Mapping interface (what the nodes use) ---
+
+    def __getitem__(self, port: str) -> dict:
+        profile = self.lookup(port)
+        if profile is None:
+            raise KeyError(port)
+        return profile
+
+    def __contains__(self, port) -> bool:
+        return self.lookup(port) is not None
+
+    def __setitem__(self, port: str, profile: dict):
+        with self._lock:
+            self._load()
+            profile = dict(profile)
+            profile.setdefault("verified_at", time.time())
+            _use_baud_rate(port, profile)
+            self._profiles[port] = profile
+            self._verified.add(port)
+            self._unanswered.pop(port, None)
+            self._save()
+
+    def __delitem__(self, port: str):
+        with self._lock:
+            self._load()
+            del self._profiles[port]
+            self._verified.discard(port)
+            self._unanswered.pop(port, None)
+            self._save()
+
+    def __iter__(self):
+        # Iterates over every saved port, verified or not; lookups verify on access.
+        with self._lock:
+            self._load()
+            return iter(list(self._profiles))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._profiles)
@@ -0,0 +1,343 @@
+# src/protocol_codec.py
+
+"""
+Binary framing used by sketches generated with protocol="binary".
+
+A frame on the wire is:  COBS( opcode | payload | crc8 ) + 0x00
+
+- opcode:  1 byte. Replies use the request opcode with the high bit set.
+- seq:     optional. If the opcode has SEQ_FLAG set, the first payload byte is
+           a sequence number that the reply echoes (also with SEQ_FLAG), so
+           several requests can be in flight. NAKs carry it after the reason.
+- payload: indices are unsigned LEB128 varints, values are little-endian int16.
+- crc8:    CRC-8 (polynomial 0x07, init 0x00) over opcode + payload.
+
+COBS guarantees the encoded frame contains no 0x00 byte, so 0x00 always marks
+the end of a frame and the receiver can resynchronise after any corruption.
+"""
+
+import struct
+
+OP_SET = 0x01
+OP_GET = 0x02
+OP_SET_MANY = 0x03
+OP_GET_MANY = 0x04
+OP_IDENTIFY = 0x05
+OP_SUBSCRIBE = 0x06
+OP_FRAME_WRITE = 0x07
+OP_GET_RANGE = 0x08
+OP_SET_RANGE = 0x09
+OP_SEQUENCE = 0x0A
+OP_SEQUENCE_APPEND = 0x0B
+OP_BAUD = 0x0C       # Answered at the current rate, then the device switches.
+OP_TELEMETRY = 0x10  # Unsolicited: sent by the device, never answered.
+OP_READY = 0x11      # Unsolicited: sent once when the sketch starts.
+OP_NAK = 0x7F
+REPLY_FLAG = 0x80
+SEQ_FLAG = 0x40
+
+NAK_REASONS = {1: "CRC mismatch", 2: "bad request", 3: "unknown opcode"}
+
+# OP_FRAME_WRITE flags: commit bit, and the value packing in bits 1-2.
+FRAME_COMMIT = 0x01
+FRAME_PACKINGS = {8: 0, 4: 1, 2: 2, 1: 3}  # Bits per value -> packing code.
+
+# Sequence playback (comfySequenceControl in the runtime).
+SEQUENCE_ACTIONS = {"stop": 0, "play": 1, "pause": 2, "seek": 3, "status": 4}
+SEQUENCE_STATES = {0: "stopped", 1: "playing", 2: "paused"}
+# A sequence entry: start (uint32), duration and index (uint16), from and to (int16).
+SEQUENCE_ENTRY = struct.Struct("<IHHhh")
+
+FRAME_DELIMITER = b"\x00"
+VALUE_MIN, VALUE_MAX = -32768, 32767
+
+
+class FrameError(ValueError):
+    """Raised when a frame is corrupted, truncated or not the expected reply."""
+
+
+def crc8(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def cobs_encode(data: bytes) -> bytes:
+    out = bytearray()
+    block = bytearray()
+    for byte in data:
+        if byte == 0:
+            out.append(len(block) + 1)
+            out += block
+            block.clear()
+        else:
+            block.append(byte)
+            if len(block) == 254:
+                out.append(0xFF)
+                out += block
+                block.clear()
+    out.append(len(block) + 1)
+    out += block
+    return bytes(out)
+
+
+def cobs_decode(data: bytes) -> bytes:
+    out = bytearray()
+    pos = 0
+    while pos < len(data):
+        code = data[pos]
+        pos += 1
+        if code == 0 or pos + code - 1 > len(data):
+            raise FrameError("Invalid COBS encoding.")
+        out += data[pos:pos + code - 1]
+        pos += code - 1
+        if code != 0xFF and pos < len(data):
+            out.append(0)
+    return bytes(out)
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        raise ValueError("Varints must be non-negative.")
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """Returns (value, next_position)."""
+    result, shift = 0, 0
+    while pos < len(data):
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+    raise FrameError("Truncated varint.")
+
+
+def encode_value(value: int) -> bytes:
+    if not VALUE_MIN <= value <= VALUE_MAX:
+        raise ValueError(f"Value {value} does not fit the binary protocol's 16-bit range.")
+    return struct.pack("<h", value)
+
+
+def decode_value(data: bytes, pos: int) -> tuple[int, int]:
+    if pos + 2 > len(data):
+        raise FrameError("Truncated value.")
+    return struct.unpack_from("<h", data, pos)[0], pos + 2
+
+
+def encode_frame(opcode: int, payload: bytes = b"") -> bytes:
+    body = bytes([opcode]) + payload
+    return cobs_encode(body + bytes([crc8(body)])) + FRAME_DELIMITER
+
+
+def decode_frame(frame: bytes) -> tuple[int, bytes]:
+    """Decodes a frame (without its 0x00 delimiter) into (opcode, payload)."""
+    body = cobs_decode(frame)
+    if len(body) < 2:
+        raise FrameError("Frame too short.")
+    if crc8(body[:-1]) != body[-1]:
+        raise FrameError("CRC mismatch.")
+    return body[0], body[1:-1]
+
+
+# --- Sequence tags ---
+
+def tag_frame(frame: bytes, seq: int) -> bytes:
+    """Re-encodes a request frame (with its delimiter) so that it carries sequence number `seq`."""
+    opcode, payload = decode_frame(frame.rstrip(FRAME_DELIMITER))
+    return encode_frame(opcode | SEQ_FLAG, bytes([seq & 0xFF]) + payload)
+
+
+def untag_frame(frame: bytes) -> tuple[int | None, bytes]:
+    """
+    Splits a reply frame (without delimiter) into (seq, frame without the tag).
+    seq is None for untagged replies, which are returned unchanged.
+    """
+    opcode, payload = decode_frame(frame)
+    if opcode == OP_NAK:
+        if len(payload) < 2:
+            return None, frame
+        return payload[1], encode_frame(OP_NAK, payload[:1])[:-1]
+    if opcode & SEQ_FLAG and payload:
+        return payload[0], encode_frame(opcode & ~SEQ_FLAG, payload[1:])[:-1]
+    return None, frame
+
+
+# --- Requests ---
+
+def encode_set(index: int, value: int) -> bytes:
+    return encode_frame(OP_SET, encode_varint(index) + encode_value(value))
+
+
+def encode_get(index: int) -> bytes:
+    return encode_frame(OP_GET, encode_varint(index))
+
+
+def encode_set_many(items: list[tuple[int, int]]) -> bytes:
+    payload = encode_varint(len(items)) + b"".join(encode_varint(i) + encode_value(v) for i, v in items)
+    return encode_frame(OP_SET_MANY, payload)
+
+
+def encode_get_many(indices: list[int]) -> bytes:
+    return encode_frame(OP_GET_MANY, encode_varint(len(indices)) + b"".join(encode_varint(i) for i in indices))
+
+
+def encode_identify() -> bytes:
+    return encode_frame(OP_IDENTIFY)
+
+
+def encode_subscribe(interval_ms: int, indices: list[int]) -> bytes:
+    payload = encode_varint(interval_ms) + encode_varint(len(indices)) + b"".join(encode_varint(i) for i in indices)
+    return encode_frame(OP_SUBSCRIBE, payload)
+
+
+def frame_write_flags(bits: int, commit: bool) -> int:
+    return (FRAME_PACKINGS[bits] << 1) | (FRAME_COMMIT if commit else 0)
+
+
+def encode_frame_write(frame_id: int, offset: int, bits: int, commit: bool, data: bytes) -> bytes:
+    """Writes packed `data` into frame buffer `frame_id` from value `offset` on; `commit` shows the frame."""
+    payload = encode_varint(frame_id) + encode_varint(offset) + bytes([frame_write_flags(bits, commit)]) + data
+    return encode_frame(OP_FRAME_WRITE, payload)
+
+
+def encode_get_range(start: int, count: int) -> bytes:
+    """Reads the `count` consecutive values from index `start` on (an array variable)."""
+    return encode_frame(OP_GET_RANGE, encode_varint(start) + encode_varint(count))
+
+
+def encode_set_range(start: int, values: list[int]) -> bytes:
+    """Writes `values` to consecutive indices from `start` on; the count follows from the frame length."""
+    return encode_frame(OP_SET_RANGE, encode_varint(start) + b"".join(encode_value(v) for v in values))
+
+
+def encode_sequence_control(sequence_id: int, action: int, position_ms: int = 0) -> bytes:
+    return encode_frame(OP_SEQUENCE, encode_varint(sequence_id) + bytes([action]) + struct.pack("<I", position_ms))
+
+
+def encode_sequence_append(sequence_id: int, entries: list[tuple[int, int, int, int, int]]) -> bytes:
+    """Buffers (start, duration, index, from, to) entries of a streamed sequence."""
+    return encode_frame(OP_SEQUENCE_APPEND, encode_varint(sequence_id) + b"".join(SEQUENCE_ENTRY.pack(*e) for e in entries))
+
+
+def encode_baud(baud_rate: int) -> bytes:
+    return encode_frame(OP_BAUD, struct.pack("<I", baud_rate))
+
+
+# --- Replies ---
+
+def _expect_reply(frame: bytes, request_opcode: int) -> bytes:
+    opcode, payload = decode_frame(frame)
+    if opcode == OP_NAK:
+        reason = NAK_REASONS.get(payload[0] if payload else 0, "unknown error")
+        raise FrameError(f"Device rejected the request: {reason}.")
+    if opcode != request_opcode | REPLY_FLAG:
+        raise FrameError(f"Unexpected reply opcode 0x{opcode:02X}.")
+    return payload
+
+
+def decode_set_reply(frame: bytes) -> int:
+    """Returns the acknowledged index."""
+    return decode_varint(_expect_reply(frame, OP_SET), 0)[0]
+
+
+def decode_get_reply(frame: bytes) -> tuple[int, int]:
+    """Returns (index, value)."""
+    payload = _expect_reply(frame, OP_GET)
+    index, pos = decode_varint(payload, 0)
+    return index, decode_value(payload, pos)[0]
+
+
+def decode_set_many_reply(frame: bytes) -> int:
+    """Returns the number of values the device applied."""
+    return decode_varint(_expect_reply(frame, OP_SET_MANY), 0)[0]
+
+
+def decode_get_many_reply(frame: bytes) -> list[int]:
+    payload = _expect_reply(frame, OP_GET_MANY)
+    count, pos = decode_varint(payload, 0)
+    values = []
+    for _ in range(count):
+        value, pos = decode_value(payload, pos)
+        values.append(value)
+    return values
+
+
+def decode_identify_reply(frame: bytes) -> str:
+    """Returns the firmware fingerprint reported by the device."""
+    return _expect_reply(frame, OP_IDENTIFY).decode('ascii', errors='replace')
+
+
+def decode_subscribe_reply(frame: bytes) -> int:
+    """Returns the number of values the device now streams."""
+    return decode_varint(_expect_reply(frame, OP_SUBSCRIBE), 0)[0]
+
+
+def decode_frame_write_reply(frame: bytes) -> tuple[int, int]:
+    """Returns (values written, frame length shown or 0)."""
+    payload = _expect_reply(frame, OP_FRAME_WRITE)
+    written, pos = decode_varint(payload, 0)
+    return written, decode_varint(payload, pos)[0]
+
+
+def decode_get_range_reply(frame: bytes) -> tuple[int, list[int]]:
+    """Returns (start index, values)."""
+    payload = _expect_reply(frame, OP_GET_RANGE)
+    start, pos = decode_varint(payload, 0)
+    count, pos = decode_varint(payload, pos)
+    values = []
+    for _ in range(count):
+        value, pos = decode_value(payload, pos)
+        values.append(value)
+    return start, values
+
+
+def decode_set_range_reply(frame: bytes) -> int:
+    """Returns the number of values the device applied."""
+    return decode_varint(_expect_reply(frame, OP_SET_RANGE), 0)[0]
+
+
+def decode_sequence_control_reply(frame: bytes) -> tuple[int, int]:
+    """Returns (state, position in ms)."""
+    payload = _expect_reply(frame, OP_SEQUENCE)
+    if len(payload) < 5:
+        raise FrameError("Truncated sequence reply.")
+    return payload[0], struct.unpack_from("<I", payload, 1)[0]
+
+
+def decode_sequence_append_reply(frame: bytes) -> tuple[int, int]:
+    """Returns (entries buffered, space left in the ring)."""
+    payload = _expect_reply(frame, OP_SEQUENCE_APPEND)
+    buffered, pos = decode_varint(payload, 0)
+    return buffered, decode_varint(payload, pos)[0]
+
+
+def decode_baud_reply(frame: bytes) -> int:
+    """Returns the rate the device switched to."""
+    payload = _expect_reply(frame, OP_BAUD)
+    if len(payload) < 4:
+        raise FrameError("Truncated baud reply.")
+    return struct.unpack_from("<I", payload, 0)[0]
+
+
+def decode_telemetry_payload(payload: bytes) -> tuple[int, list[int]]:
+    """Decodes the payload of an OP_TELEMETRY frame into (device_millis, values)."""
+    if len(payload) < 4:
+        raise FrameError("Truncated telemetry frame.")
+    device_ms = struct.unpack_from("<I", payload, 0)[0]
+    count, pos = decode_varint(payload, 4)
+    values = []
+    for _ in range(count):
+        value, pos = decode_value(payload, pos)
+        values.append(value)
+    return device_ms, values
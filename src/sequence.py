@@ -0,0 +1,149 @@
+# src/sequence.py
+
+"""
+Keyframe sequences on the host side.
+
+A sequence is a timeline of keyframes (time_ms, variable, value, interpolation)
+that the board plays back on its own millis() clock, so its timing no longer
+depends on the graph or the serial link. Baked sequences are compiled into the
+sketch by generate_arduino_code. Streamed sequences live in a small RAM ring on
+the board: a SequenceStreamer compiles the timeline against the port's comm map
+and feeds its entries from a background thread as the board plays them.
+"""
+
+import json
+import threading
+import time
+from . import protocol_codec as codec
+from .code_generator import compile_keyframes, INTERPOLATIONS
+from .device_client import control_sequence, append_sequence
+from .serial_communicator import release_hooks
+from .write_coalescer import mark_sequence_driven
+
+# Bounds of the wait between two refills of a full ring.
+MIN_POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.5
+STOP_TIMEOUT = 3.0  # Seconds stop() waits for a request in progress.
+
+
+def parse_keyframes(text: str) -> list[tuple[int, str, int, str]]:
+    """
+    Accepts a JSON list of {"time_ms", "variable", "value", "interpolation"}
+    objects or [time_ms, variable, value, interpolation] lists, or plain text
+    with one 'time_ms, variable, value[, interpolation]' keyframe per line.
+    The interpolation defaults to "step".
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if text.startswith('['):
+        rows = []
+        for item in json.loads(text):
+            if isinstance(item, dict):
+                item = [item.get("time_ms"), item.get("variable"), item.get("value"), item.get("interpolation", INTERPOLATIONS[0])]
+            rows.append(list(item))
+    else:
+        rows = [[field.strip() for field in line.split(',')] for line in text.splitlines() if line.strip()]
+    keyframes = []
+    for row in rows:
+        if len(row) not in (3, 4):
+            raise ValueError(f"Keyframe {row} is not of the form time_ms, variable, value[, interpolation].")
+        interpolation = str(row[3]).strip().lower() if len(row) == 4 else INTERPOLATIONS[0]
+        keyframes.append((int(float(row[0])), str(row[1]), int(float(row[2])), interpolation))
+    return keyframes
+
+
+class SequenceStreamer:
+    """Empties a streamed sequence's ring on the board, then keeps it filled with `entries` until all are sent."""
+
+    def __init__(self, port: str, profile: dict, sequence: dict, entries: list[tuple[int, int, int, int, int]], play: bool = True):
+        self.port = port
+        self.profile = profile
+        self.sequence = sequence
+        self.entries = entries
+        self.play = play
+        self.sent = 0
+        self.last_error: str | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"arduino-sequence-{port}-{sequence['id']}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        sequence_id = self.sequence["id"]
+        success, result = control_sequence(self.port, self.profile, sequence_id, codec.SEQUENCE_ACTIONS["stop"])
+        if not success:
+            self.last_error = result
+            return
+        space, started_at, idle_polls = self.sequence["capacity"], None, 0
+        while not self._stop.is_set():
+            if self.sent < len(self.entries) and space == 0:
+                # Wait for the oldest buffered entry to play, judged by the host's clock,
+                # backing off while the board frees nothing (e.g. the sequence is paused).
+                due = self.entries[self.sent - self.sequence["capacity"]][0] / 1000
+                delay = due - (time.monotonic() - started_at) if started_at is not None else MAX_POLL_INTERVAL
+                delay = max(delay, MIN_POLL_INTERVAL * 2 ** idle_polls)
+                if self._stop.wait(min(MAX_POLL_INTERVAL, delay)):
+                    return
+            success, result = append_sequence(self.port, self.profile, sequence_id, self.entries[self.sent:self.sent + space])
+            if not success:
+                self.last_error = result
+                return
+            buffered, space = result
+            self.sent += buffered
+            idle_polls = 0 if buffered else min(idle_polls + 1, 6)
+            if self.play and started_at is None:
+                success, result = control_sequence(self.port, self.profile, sequence_id, codec.SEQUENCE_ACTIONS["play"])
+                if not success:
+                    self.last_error = result
+                    return
+                started_at = time.monotonic() - result[1] / 1000
+            if self.sent >= len(self.entries):
+                return
+
+    def stop(self):
+        self._stop.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(STOP_TIMEOUT)
+
+    @property
+    def done(self) -> bool:
+        return not self._thread.is_alive()
+
+
+_streamers: dict[tuple[str, int], SequenceStreamer] = {}
+_streamers_lock = threading.Lock()
+
+
+def stream_sequence(port: str, profile: dict, sequence: dict, keyframes: list[tuple[int, str, int, str]], play: bool = True) -> SequenceStreamer:
+    """
+    Compiles `keyframes` against the port's comm map and starts streaming them
+    into `sequence` (a sequence_map entry), replacing a stream already running
+    into it. Raises ValueError for keyframes that do not compile.
+    """
+    entries, _ = compile_keyframes(keyframes, profile.get("comm_map", {}))
+    mark_sequence_driven(port, (entry[2] for entry in entries))
+    key = (port, sequence["id"])
+    with _streamers_lock:
+        previous = _streamers.pop(key, None)
+    if previous is not None:
+        previous.stop()
+    streamer = SequenceStreamer(port, profile, sequence, entries, play)
+    with _streamers_lock:
+        _streamers[key] = streamer
+    return streamer
+
+
+def get_streamer(port: str, sequence_id: int) -> SequenceStreamer | None:
+    with _streamers_lock:
+        return _streamers.get((port, sequence_id))
+
+
+def stop_streamers(port: str):
+    with _streamers_lock:
+        streamers = [_streamers.pop(key) for key in list(_streamers) if key[0] == port]
+    for streamer in streamers:
+        streamer.stop()
+
+
+# Entries target the firmware the port runs now; stop feeding before an upload or unplug.
+release_hooks.append(stop_streamers)
@@ -1,64 +1,645 @@
 # src/serial_communicator.py
 
 import serial
+import threading
 import time
+from . import protocol_codec as codec
+from .metrics import metrics
 
-def send_and_receive(port: str, command: str, timeout: float = 2.0) -> tuple[bool, str]:
+DEFAULT_BAUDRATE = 9600
+DEFAULT_IDLE_TIMEOUT = 30.0  # Seconds a port may stay open without being used.
+DEFAULT_WINDOW = 4           # Requests in flight per port.
+DEFAULT_WINDOW_BYTES = 48    # Request bytes in flight per port; an AVR's serial receive buffer holds 64.
+ASCII_TAG_MAX_LEN = len("#255|")  # Room a sequence tag takes in the firmware's line buffer.
+READ_POLL_TIMEOUT = 0.1      # Read timeout for backends without cancel_read(), so readers notice close().
+
+
+class _PooledConnection:
+    """A single open serial port plus the lock that serializes its users."""
+
+    def __init__(self, ser: serial.Serial):
+        self.ser = ser
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+
+
+class SerialConnectionPool:
+    """
+    Keeps one long-lived serial connection per port.
+
+    Ports are opened on first use, reused across node executions, reopened
+    after an error and closed by a background reaper once they have been idle
+    for longer than `idle_timeout` seconds.
+
+    Each port opens at the rate its board listens at: the one its firmware
+    boots with (from the profile, `baudrate` if unknown), or the faster one
+    the link was stepped up to. The board keeps a stepped-up rate while the
+    port is closed, until it restarts.
     """
-    Opens a serial port, sends a command, and waits for a single line response.
-    
+
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT, baudrate: int = DEFAULT_BAUDRATE):
+        self.idle_timeout = idle_timeout
+        self.baudrate = baudrate
+        self._boot_baudrates: dict[str, int] = {}
+        self._baudrates: dict[str, int] = {}
+        self._connections: dict[str, _PooledConnection] = {}
+        self._lock = threading.Lock()
+        # One lock per port, so opening a slow port never holds up the others.
+        self._open_locks: dict[str, threading.Lock] = {}
+        self._reaper = None
+        self.on_close = None  # Called with the port before it is closed, to stop its reader.
+
+    def _open(self, port: str) -> serial.Serial:
+        # Create the serial object without opening it immediately, so that DTR
+        # can be set to False *before* opening. This prevents the auto-reset signal.
+        with metrics.timer("serial_open_seconds", port=port):
+            return self._open_unmetered(port)
+
+    def _open_unmetered(self, port: str) -> serial.Serial:
+        # serial_for_url also accepts URLs such as rfc2217://host:port or loop://.
+        ser = serial.serial_for_url(port, do_not_open=True)
+        ser.baudrate = self.get_baudrate(port)
+        # Reads block until data arrives and PortTransport wakes them with cancel_read().
+        # Backends without it (e.g. rfc2217) poll instead, so a closing reader still exits.
+        ser.timeout = None if hasattr(ser, "cancel_read") else READ_POLL_TIMEOUT
+        ser.dtr = False
+        ser.open()
+
+        # No settling delay: the board is ready when it answers. If opening reset it
+        # anyway, its READY announcement makes the transport resend what was lost.
+        ser.reset_input_buffer()
+        ser.reset_output_buffer()
+        print(f"   - Serial port {port} opened and kept in the connection pool.")
+        return ser
+
+    def _get(self, port: str) -> _PooledConnection:
+        with self._lock:
+            conn = self._connections.get(port)
+            if conn is not None and conn.ser.is_open:
+                return conn
+            open_lock = self._open_locks.setdefault(port, threading.Lock())
+        # Opening can be slow (USB enumeration, network ports); only this port waits for it.
+        with open_lock:
+            with self._lock:
+                conn = self._connections.get(port)
+            if conn is None or not conn.ser.is_open:
+                conn = _PooledConnection(self._open(port))
+            with self._lock:
+                self._connections[port] = conn
+                self._start_reaper()
+            return conn
+
+    def get_serial(self, port: str) -> serial.Serial:
+        """Returns the open serial object for `port`, for callers that read it continuously."""
+        conn = self._get(port)
+        conn.last_used = time.monotonic()
+        return conn.ser
+
+    def get_baudrate(self, port: str) -> int:
+        """The rate the board on `port` is believed to listen at."""
+        return self._baudrates.get(port, self._boot_baudrates.get(port, self.baudrate))
+
+    def set_baudrate(self, port: str, baudrate: int, current: int | None = None):
+        """
+        Records the rate the firmware on `port` boots with and, if given, the one
+        it listens at now. An open connection keeps its rate (the board did not
+        restart); only a port whose current rate is unknown takes the boot rate.
+        """
+        with self._lock:
+            self._boot_baudrates[port] = baudrate
+            if current is not None or port not in self._baudrates:
+                self._baudrates[port] = current or baudrate
+                conn = self._connections.get(port)
+            else:
+                conn = None
+        if conn is not None:
+            self.switch_baudrate(port, self._baudrates[port])
+
+    def switch_baudrate(self, port: str, baudrate: int):
+        """Changes the rate of an open connection, without recording it (e.g. to try a rate)."""
+        with self._lock:
+            conn = self._connections.get(port)
+        if conn is not None and conn.ser.is_open and conn.ser.baudrate != baudrate:
+            conn.ser.baudrate = baudrate
+
+    def fall_back_baudrate(self, port: str) -> int | None:
+        """
+        Returns to the boot rate, assuming the board restarted since the link was
+        stepped up. Returns that rate, or None if the port already runs at it.
+        """
+        with self._lock:
+            boot = self._boot_baudrates.get(port, self.baudrate)
+            current = self._baudrates.get(port, boot)
+            conn = self._connections.get(port)
+            trying = conn is not None and conn.ser.is_open and conn.ser.baudrate != current
+            if current == boot or trying:
+                return None
+            self._baudrates[port] = boot
+        self.switch_baudrate(port, boot)
+        return boot
+
+    def forget_baudrate(self, port: str):
+        """The board restarts (e.g. it is flashed): it will listen at the boot rate of its next firmware."""
+        with self._lock:
+            self._baudrates.pop(port, None)
+
+    def touch(self, port: str):
+        """Marks `port` as in use, so the reaper does not close it."""
+        with self._lock:
+            conn = self._connections.get(port)
+        if conn is not None:
+            conn.last_used = time.monotonic()
+
+    def close(self, port: str):
+        """Closes a port and forgets it, e.g. before arduino-cli needs it for an upload."""
+        with self._lock:
+            conn = self._connections.pop(port, None)
+        if conn is not None:
+            if self.on_close is not None:
+                self.on_close(port)
+            with conn.lock:
+                if conn.ser.is_open:
+                    conn.ser.close()
+
+    def close_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle_ports = [p for p, c in self._connections.items() if now - c.last_used > self.idle_timeout]
+        for port in idle_ports:
+            print(f"   - Closing idle serial port {port}.")
+            self.close(port)
+
+    def close_all(self):
+        with self._lock:
+            ports = list(self._connections.keys())
+        for port in ports:
+            self.close(port)
+
+    def _start_reaper(self):
+        # Called with self._lock held.
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name="arduino-serial-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1.0, min(self.idle_timeout, 10.0)))
+            self.close_idle()
+            with self._lock:
+                if not self._connections:
+                    self._reaper = None
+                    return
+
+
+# --- Shared pool used by all nodes ---
+connection_pool = SerialConnectionPool()
+
+
+def _cancel_read(ser: serial.Serial):
+    # Wakes a thread blocked in ser.read(). Not every pyserial backend supports it.
+    cancel = getattr(ser, "cancel_read", None)
+    if cancel is not None and ser.is_open:
+        cancel()
+
+
+class _Request:
+    __slots__ = ("key", "wire", "size", "started", "finished", "success", "reply", "done")
+
+    def __init__(self, key: int, wire: bytes):
+        self.key, self.wire, self.size = key, wire, len(wire)
+        self.started = time.perf_counter()
+        self.finished = None
+        self.success, self.reply = False, None
+        self.done = threading.Event()
+
+    def complete(self, success: bool, reply):
+        self.success, self.reply = success, reply
+        self.finished = time.perf_counter()
+        self.done.set()
+
+
+class PortTransport:
+    """
+    Multiplexes requests over one open port.
+
+    Each request is tagged with a sequence number that the firmware echoes in
+    its reply ('#<seq>|' on ASCII lines, SEQ_FLAG plus a byte in binary frames),
+    so up to `window` requests and `window_bytes` bytes can be in flight at once.
+    A background reader owns the port's input: it hands each reply to the
+    request with the same tag and unsolicited messages (telemetry) to the
+    port's listener. Untagged replies, such as an identify answer or the NAK
+    for a corrupted frame, go to the oldest outstanding request, because the
+    board answers in order.
+
+    Waiting is event-driven: the reader blocks in read() until bytes arrive
+    and callers block on their request's event until the reader completes it.
+    When the board announces READY (it just booted, e.g. because opening the
+    port reset it), outstanding requests were lost in the reset and are resent.
+    """
+
+    def __init__(self, port: str, terminator: bytes, window: int = DEFAULT_WINDOW, window_bytes: int = DEFAULT_WINDOW_BYTES):
+        self.port = port
+        self.terminator = terminator
+        self.binary = terminator == codec.FRAME_DELIMITER
+        self.window = max(1, min(window, 255))
+        self.window_bytes = window_bytes
+        # Outstanding requests by key, oldest first. Tagged requests use their
+        # sequence number (1..255) as key, untagged ones a negative counter.
+        self._pending: dict[int, _Request] = {}
+        self._bytes_in_flight = 0
+        self._next_seq = 1
+        self._next_untagged = -1
+        self._cond = threading.Condition()  # Guards the pending table and the port's writes.
+        self._stop = threading.Event()
+        self._ser = connection_pool.get_serial(port)
+        self._ser.reset_input_buffer()
+        self._thread = threading.Thread(target=self._read_loop, name=f"arduino-serial-{port}", daemon=True)
+        self._thread.start()
+
+    @property
+    def is_alive(self) -> bool:
+        return not self._stop.is_set() and self._thread.is_alive()
+
+    def close(self, reason: str = "Transport closed."):
+        self._stop.set()
+        self._fail_pending(reason)
+        _cancel_read(self._ser)
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    # --- Sending ---
+
+    def _tag(self, data: bytes, seq: int) -> bytes:
+        if self.binary:
+            return codec.tag_frame(data, seq)
+        return b"#%d|" % seq + data
+
+    def _allocate_seq(self) -> int:
+        # Called with self._cond held; at most `window` (< 256) numbers are in use.
+        while self._next_seq in self._pending:
+            self._next_seq = self._next_seq % 255 + 1
+        seq = self._next_seq
+        self._next_seq = seq % 255 + 1
+        return seq
+
+    def _has_room(self, size: int) -> bool:
+        if not self._pending:
+            return True  # A request larger than the byte window still goes out on its own.
+        return len(self._pending) < self.window and self._bytes_in_flight + size <= self.window_bytes
+
+    def _submit(self, data: bytes, tagged: bool, timeout: float) -> _Request:
+        """
+        Waits for room in the window, registers the request and writes it. Both
+        happen under the same lock, so the pending table is in wire order.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._stop.is_set() and not self._has_room(len(data)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError
+                self._cond.wait(remaining)
+            if self._stop.is_set():
+                raise serial.SerialException(f"The reader of {self.port} has stopped.")
+            if tagged:
+                key = self._allocate_seq()
+                wire = self._tag(data, key)
+            else:
+                key, wire = self._next_untagged, data
+                self._next_untagged -= 1
+            request = _Request(key, wire)
+            self._pending[key] = request
+            self._bytes_in_flight += request.size
+            try:
+                self._ser.write(wire)
+            except Exception:
+                self._remove(request)
+                raise
+        connection_pool.touch(self.port)
+        return request
+
+    def _remove(self, request: _Request) -> bool:
+        with self._cond:
+            if self._pending.get(request.key) is not request:
+                return False
+            del self._pending[request.key]
+            self._bytes_in_flight -= request.size
+            self._cond.notify_all()
+            return True
+
+    def exchange_many(self, payloads: list[bytes], timeout: float, tagged: bool = True) -> list[tuple[bool, bytes | str, float]]:
+        """
+        Sends all `payloads`, keeping up to the window in flight, and collects the
+        replies in order as (success, reply or error, seconds). Each request gets
+        `timeout` seconds from the moment it is sent (or resent after a board
+        reset). Write errors are raised.
+        """
+        requests = []
+        for data in payloads:
+            try:
+                requests.append(self._submit(data, tagged, timeout))
+            except TimeoutError:
+                break  # Nothing was answered for a whole timeout: the rest would time out too.
+
+        timeout_message = f"Timeout: No response from {self.port} after {timeout}s."
+        results = []
+        for request in requests:
+            # request.started moves forward if the request is resent, so re-check after each wait.
+            while not request.done.wait(max(0.0, request.started + timeout - time.perf_counter())):
+                if time.perf_counter() >= request.started + timeout and self._remove(request):
+                    request.complete(False, timeout_message)
+            results.append((request.success, request.reply, request.finished - request.started))
+        results += [(False, timeout_message, timeout)] * (len(payloads) - len(requests))
+        return results
+
+    # --- Receiving ---
+
+    def _read_loop(self):
+        buffer = b""
+        failed = False
+        try:
+            while not self._stop.is_set():
+                # Blocks until at least one byte arrives or close() cancels the read.
+                chunk = self._ser.read(max(1, self._ser.in_waiting))
+                if not chunk:
+                    continue
+                buffer += chunk
+                while self.terminator in buffer:
+                    message, buffer = buffer.split(self.terminator, 1)
+                    if message.rstrip(b"\r"):
+                        self._dispatch(message)
+        except Exception as e:
+            # Closing the port (release, idle reaper) also ends up here.
+            if not self._stop.is_set() and self._ser.is_open:
+                print(f"   - Serial reader on {self.port} stopped: {e}")
+                failed = True
+        finally:
+            self._stop.set()
+            self._fail_pending(f"Serial Error on port {self.port}: the port was closed.")
+            if failed:
+                # Do not leave a dead handle in the pool; the next request reopens the port.
+                connection_pool.close(self.port)
+
+    def _fail_pending(self, reason: str):
+        with self._cond:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._bytes_in_flight = 0
+            self._cond.notify_all()
+        for request in pending:
+            request.complete(False, reason)
+
+    def _resend_pending(self):
+        """
+        The board rebooted and lost whatever it had received: send the outstanding
+        requests again. Only tagged ones, since a request that did get through
+        would be answered twice, and only a tag tells the second answer apart.
+        """
+        with self._cond:
+            pending = [request for request in self._pending.values() if request.key > 0]
+            now = time.perf_counter()
+            for request in pending:
+                request.started = now
+            if pending:
+                self._ser.write(b"".join(request.wire for request in pending))
+        with _transports_lock:
+            _board_resets[self.port] = _board_resets.get(self.port, 0) + 1
+        metrics.inc("serial_board_resets_total", port=self.port)
+        if pending:
+            print(f"   - Board on {self.port} restarted, resending {len(pending)} request(s).")
+
+    def _is_ready(self, message: bytes) -> bool:
+        if self.binary:
+            try:
+                return codec.decode_frame(message)[0] == codec.OP_READY
+            except codec.FrameError:
+                return False
+        return message.rstrip(b"\r") == b"READY"
+
+    def _parse(self, message: bytes) -> tuple[bool, int | None, bytes | None]:
+        """Returns (unsolicited, seq, reply without its tag). reply is None for corrupted frames."""
+        if self.binary:
+            try:
+                if codec.decode_frame(message)[0] == codec.OP_TELEMETRY:
+                    return True, None, message
+                seq, reply = codec.untag_frame(message)
+                return False, seq, reply
+            except codec.FrameError:
+                return False, None, None
+        line = message.rstrip(b"\r")
+        if line.startswith(b"D:"):
+            return True, None, message
+        if line.startswith(b"#"):
+            tag, sep, rest = line.partition(b"|")
+            if sep and tag[1:].isdigit():
+                return False, int(tag[1:]), rest
+        return False, None, message
+
+    def _dispatch(self, message: bytes):
+        if self._is_ready(message):
+            self._resend_pending()
+            return
+        unsolicited, seq, reply = self._parse(message)
+        listener = get_port_listener(self.port)
+        if unsolicited:
+            if listener is not None:
+                connection_pool.touch(self.port)
+                listener.on_message(message)
+            return
+        if reply is None:
+            # A corrupted frame. While streaming it is most likely telemetry, so drop it;
+            # otherwise it is the oldest request's reply and its decoder reports the error.
+            if listener is not None:
+                return
+            reply = message
+
+        with self._cond:
+            if seq is not None:
+                request = self._pending.get(seq)
+            else:
+                request = next(iter(self._pending.values()), None)
+        if request is None or not self._remove(request):
+            metrics.inc("serial_unmatched_replies_total", port=self.port)
+            return
+        request.complete(True, reply)
+
+
+# --- Per-port transports and listeners ---
+
+_transports: dict[str, PortTransport] = {}
+_transports_lock = threading.Lock()
+_port_locks: dict[str, threading.Lock] = {}
+_board_resets: dict[str, int] = {}
+
+# Receives the unsolicited messages of a port (e.g. a telemetry stream).
+_port_listeners = {}
+_port_listeners_lock = threading.Lock()
+
+
+def register_port_listener(port: str, listener):
+    """`listener` must provide on_message(message) and stop()."""
+    with _port_listeners_lock:
+        _port_listeners[port] = listener
+
+
+def unregister_port_listener(port: str, listener=None):
+    with _port_listeners_lock:
+        if listener is None or _port_listeners.get(port) is listener:
+            _port_listeners.pop(port, None)
+
+
+def get_port_listener(port: str):
+    with _port_listeners_lock:
+        return _port_listeners.get(port)
+
+
+def get_transport(port: str, terminator: bytes) -> PortTransport:
+    """Returns the live transport for `port`, opening the port and starting its reader if needed."""
+    with _transports_lock:
+        port_lock = _port_locks.setdefault(port, threading.Lock())
+    with port_lock:
+        with _transports_lock:
+            transport = _transports.get(port)
+        if transport is not None and transport.is_alive and transport.terminator == terminator:
+            return transport
+        if transport is not None:
+            transport.close("The port switched protocols.")
+        transport = PortTransport(port, terminator)
+        with _transports_lock:
+            _transports[port] = transport
+        return transport
+
+
+def is_port_read(port: str) -> bool:
+    """True while a transport is reading `port`, i.e. while its listener receives messages."""
+    with _transports_lock:
+        transport = _transports.get(port)
+    return transport is not None and transport.is_alive
+
+
+def board_reset_count(port: str) -> int:
+    """Number of READY announcements seen on `port`; a change means the board lost its state."""
+    with _transports_lock:
+        return _board_resets.get(port, 0)
+
+
+def _close_transport(port: str, reason: str):
+    with _transports_lock:
+        transport = _transports.pop(port, None)
+    if transport is not None:
+        transport.close(reason)
+
+
+# Closing a pooled port (release, idle reaper, error) first stops the transport reading it.
+connection_pool.on_close = lambda port: _close_transport(port, f"Port {port} was closed.")
+
+
+# Called with the port name before release_port closes it, e.g. to stop background writers.
+release_hooks = []
+
+
+def release_port(port: str):
+    """Stops the port's listener and reader and closes the pooled connection to `port`."""
+    for hook in list(release_hooks):
+        hook(port)
+    listener = get_port_listener(port)
+    if listener is not None:
+        listener.stop()
+    connection_pool.close(port)
+    connection_pool.forget_baudrate(port)
+
+
+_OPCODE_NAMES = {value: name[3:].lower() for name, value in vars(codec).items() if name.startswith("OP_")}
+
+
+def _command_label(data: bytes, terminator: bytes) -> str:
+    """Short name of a request for metrics: the ASCII command letter or the binary opcode."""
+    if terminator != b"\x00":
+        return data[:1].decode('ascii', errors='replace') or "?"
+    try:
+        opcode, _ = codec.decode_frame(data.rstrip(b"\x00"))
+    except codec.FrameError:
+        return "?"
+    return _OPCODE_NAMES.get(opcode, f"0x{opcode:02x}")
+
+
+def _exchange_many(port: str, payloads: list[bytes], terminator: bytes, timeout: float, tagged: bool = True) -> list[tuple[bool, bytes | str]]:
+    """
+    Sends `payloads` pipelined and returns one (success, reply or error) per payload,
+    in order. Replies are returned without the terminator and sequence tag.
+    """
+    results = _exchange_many_unmetered(port, payloads, terminator, timeout, tagged)
+    if metrics.enabled:
+        for data, (success, reply, seconds) in zip(payloads, results):
+            command = _command_label(data, terminator)
+            metrics.observe("serial_transaction_seconds", seconds, port=port, command=command)
+            metrics.inc("serial_bytes_sent_total", len(data), port=port)
+            if success:
+                metrics.inc("serial_bytes_received_total", len(reply) + len(terminator), port=port)
+            elif reply.startswith("Timeout"):
+                metrics.inc("serial_timeouts_total", port=port, command=command)
+            else:
+                metrics.inc("serial_errors_total", port=port, command=command)
+    return [(success, reply) for success, reply, _ in results]
+
+
+def _exchange_many_unmetered(port: str, payloads: list[bytes], terminator: bytes, timeout: float, tagged: bool) -> list[tuple[bool, bytes | str, float]]:
+    # A serial error closes the port; it is reopened and the requests are sent once more.
+    for attempt in range(2):
+        try:
+            results = get_transport(port, terminator).exchange_many(payloads, timeout, tagged)
+            if attempt == 0 and all(not success and reply.startswith("Timeout") for success, reply, _ in results):
+                # Silence at a stepped-up rate: the board probably restarted at its boot rate.
+                baudrate = connection_pool.fall_back_baudrate(port)
+                if baudrate is not None:
+                    print(f"   - No answer from {port} at the negotiated rate, back to {baudrate} baud.")
+                    metrics.inc("serial_retries_total", port=port)
+                    continue
+            return results
+        except (serial.SerialException, OSError) as e:
+            _close_transport(port, f"Serial Error on port {port}: {e}")
+            connection_pool.close(port)
+            if attempt == 1:
+                return [(False, f"Serial Error on port {port}: {e}", 0.0)] * len(payloads)
+            metrics.inc("serial_retries_total", port=port)
+        except Exception as e:
+            return [(False, f"An unexpected error occurred: {e}", 0.0)] * len(payloads)
+
+
+def send_and_receive(port: str, command: str, timeout: float = 2.0, tagged: bool = True) -> tuple[bool, str]:
+    """
+    Sends a command over the pooled connection and waits for a single line response.
+
     Args:
         port: The COM port to connect to (e.g., "COM3").
         command: The command string to send (must end with '\\n').
         timeout: Time in seconds to wait for a response.
+        tagged: Adds a sequence tag. Use False for boards that may not run the
+            ComfyArduino runtime, e.g. when identifying them.
 
     Returns:
         A tuple (success, message). On success, message is the response from the device.
         On failure, message is an error description.
     """
-    ser = None # Initialize ser to None
-    try:
-        # --- THE FINAL FIX: A MORE ROBUST WAY TO OPEN THE PORT ---
-        # 1. Create the serial object without opening it immediately.
-        ser = serial.Serial()
-        
-        # 2. Configure all parameters, including the port and baudrate.
-        ser.port = port
-        ser.baudrate = 9600
-        ser.timeout = 0.1
-        
-        # 3. Set dtr to False *before* opening. This prevents the auto-reset signal.
-        ser.dtr = False
-        
-        # 4. Now, open the port. The connection is established with DTR already low.
-        ser.open()
-        
-        # A small delay after opening is still good practice.
-        time.sleep(0.1) 
-        
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
+    return send_and_receive_many(port, [command], timeout, tagged)[0]
+
+
+def send_and_receive_many(port: str, commands: list[str], timeout: float = 2.0, tagged: bool = True) -> list[tuple[bool, str]]:
+    """Pipelined send_and_receive: sends all commands without waiting and returns the responses in order."""
+    results = _exchange_many(port, [command.encode('utf-8') for command in commands], b"\n", timeout, tagged)
+    return [(True, reply.decode('utf-8', errors='replace').strip()) if success else (False, reply)
+            for success, reply in results]
+
+
+def send_and_receive_frame(port: str, frame: bytes, timeout: float = 2.0, tagged: bool = True) -> tuple[bool, bytes | str]:
+    """
+    Binary counterpart of send_and_receive: sends one encoded frame (see
+    protocol_codec) and returns the next 0x00-delimited frame, without its delimiter.
+    """
+    return _exchange_many(port, [frame], b"\x00", timeout, tagged)[0]
+
 
-        ser.write(command.encode('utf-8'))
-        
-        # Add a tiny delay to give the Arduino time to process the command
-        # before we start waiting for the reply.
-        time.sleep(0.05)
-
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                response = ser.readline().decode('utf-8').strip()
-                if response:
-                    return True, response
-        
-        return False, f"Timeout: No response from {port} after {timeout}s."
-
-    except serial.SerialException as e:
-        return False, f"Serial Error on port {port}: {e}"
-    except Exception as e:
-        return False, f"An unexpected error occurred: {e}"
-    finally:
-        # Ensure the port is always closed, even if an error occurs.
-        if ser and ser.is_open:
-            ser.close()
\ No newline at end of file
+def send_and_receive_frames(port: str, frames: list[bytes], timeout: float = 2.0, tagged: bool = True) -> list[tuple[bool, bytes | str]]:
+    """Pipelined send_and_receive_frame: returns the reply frames in request order."""
+    return _exchange_many(port, frames, b"\x00", timeout, tagged)
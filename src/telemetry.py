@@ -0,0 +1,122 @@
+# src/telemetry.py
+
+"""
+Host side of the firmware's subscribe mode.
+
+Once a port is subscribed, the board pushes the selected values at a fixed
+rate. The port's transport (see serial_communicator.PortTransport) already
+reads everything the board sends; a TelemetryStream registers as the port's
+listener and keeps the telemetry lines or frames in a timestamped latest-value
+table. Receiver nodes can then read values from the table without any serial I/O.
+"""
+
+import threading
+import time
+from . import protocol_codec as codec
+from .serial_communicator import register_port_listener, unregister_port_listener, is_port_read
+
+
+class TelemetryStream:
+    """Latest-value table for one port, fed by the port's transport."""
+
+    def __init__(self, port: str, protocol: str):
+        self.port = port
+        self.protocol = protocol
+        self.indices: list[int] = []
+        # index -> (value, host monotonic time, device millis)
+        self.latest: dict[int, tuple[int, float, int]] = {}
+        self._stop = threading.Event()
+
+    # --- Lifecycle ---
+
+    def start(self):
+        register_port_listener(self.port, self)
+
+    def stop(self):
+        self._stop.set()
+        unregister_port_listener(self.port, self)
+        with _streams_lock:
+            if _streams.get(self.port) is self:
+                del _streams[self.port]
+
+    @property
+    def is_stopped(self) -> bool:
+        return self._stop.is_set()
+
+    @property
+    def is_running(self) -> bool:
+        # If the port's reader died (e.g. the board was unplugged), the table goes stale.
+        return not self._stop.is_set() and is_port_read(self.port)
+
+    # --- Reading ---
+
+    def on_message(self, message: bytes):
+        """Called by the transport's reader for each unsolicited message."""
+        if self.protocol == "binary":
+            try:
+                opcode, payload = codec.decode_frame(message)
+                if opcode == codec.OP_TELEMETRY:
+                    self._record(*codec.decode_telemetry_payload(payload))
+            except codec.FrameError:
+                pass  # Corrupted frame: drop it, the next one resynchronises.
+            return
+        line = message.decode('utf-8', errors='replace').strip()
+        parts = line.split(':')
+        try:
+            if len(parts) == 3 and parts[0] == "D":
+                self._record(int(parts[1]), [int(v) for v in parts[2].split(',')])
+        except ValueError:
+            pass
+
+    def _record(self, device_ms: int, values: list[int]):
+        indices = self.indices
+        if len(values) != len(indices):
+            return  # Belongs to a previous subscription.
+        now = time.monotonic()
+        for index, value in zip(indices, values):
+            self.latest[index] = (value, now, device_ms)
+
+    # --- Latest-value table ---
+
+    def get(self, index: int, max_age_s: float | None = None) -> tuple[int, float] | None:
+        """Returns (value, age_in_seconds), or None if unknown or older than `max_age_s`."""
+        entry = self.latest.get(index)
+        if entry is None:
+            return None
+        value, received, _ = entry
+        age = time.monotonic() - received
+        if max_age_s is not None and age > max_age_s:
+            return None
+        return value, age
+
+
+_streams: dict[str, TelemetryStream] = {}
+_streams_lock = threading.Lock()
+
+
+def get_stream(port: str) -> TelemetryStream | None:
+    with _streams_lock:
+        stream = _streams.get(port)
+    return stream if stream is not None and stream.is_running else None
+
+
+def start_stream(port: str, protocol: str) -> TelemetryStream:
+    """Returns the running stream for `port`, starting one if needed."""
+    with _streams_lock:
+        stream = _streams.get(port)
+        if stream is not None and not stream.is_stopped and stream.protocol == protocol:
+            return stream
+    if stream is not None:
+        stream.stop()
+    stream = TelemetryStream(port, protocol)
+    with _streams_lock:
+        _streams[port] = stream
+    stream.start()
+    return stream
+
+
+def stop_stream(port: str):
+    with _streams_lock:
+        stream = _streams.get(port)
+    if stream is not None:
+        stream.stop()
@@ -0,0 +1,213 @@
+# src/write_coalescer.py
+
+"""
+Coalesced writes for the sender nodes.
+
+Workflows often set the same variable many times a second, or to the value the
+board already holds. Instead of a serial round trip per write, a port's
+PortWriteCoalescer keeps only the latest pending value of each variable, drops
+values equal to what the board last acknowledged, and a background flusher
+sends the rest as one batched set at most once per flush interval. Nodes only
+queue, so graph execution never waits on the port. Variables that keyframe
+sequences drive change on the board without the host knowing, so writes to
+them are never suppressed.
+"""
+
+import threading
+import time
+from . import protocol_codec as codec
+from .device_client import set_values, PROTOCOL_ASCII, PROTOCOL_BINARY
+from .metrics import metrics
+from .serial_communicator import board_reset_count, release_hooks
+
+DEFAULT_FLUSH_INTERVAL_MS = 20
+RETRY_DELAY = 1.0  # Seconds before a failed flush is tried again.
+STOP_TIMEOUT = 3.0  # Seconds stop() waits for a flush in progress.
+
+
+class PortWriteCoalescer:
+    """Pending and acknowledged values for one port, plus the thread that flushes them."""
+
+    def __init__(self, port: str, profile: dict, flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS):
+        self.port = port
+        self.profile = profile
+        self.flush_interval = flush_interval_ms / 1000
+        self.last_error: str | None = None
+        # index -> value; dicts keep the order in which variables were first queued.
+        self._pending: dict[int, int] = {}
+        self._in_flight: dict[int, int] = {}
+        self._acked: dict[int, int] = {}
+        # Acknowledged values only hold until the board restarts.
+        self._acked_resets = board_reset_count(port)
+        # Baked sequences that play from boot drive their variables before any node asks.
+        self._autoplay_driven = frozenset(i for s in profile.get("sequence_map", {}).values() if s.get("autoplay") for i in s.get("indices", []))
+        self._next_flush = 0.0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"arduino-writer-{port}", daemon=True)
+        self._thread.start()
+
+    # --- Queueing (called by the nodes) ---
+
+    def queue(self, items: list[tuple[int, int]]) -> bool:
+        """
+        Queues (index, value) writes. Returns True if the board already
+        acknowledged every value, i.e. nothing had to be queued.
+        """
+        if self.profile.get("protocol", PROTOCOL_ASCII) == PROTOCOL_BINARY:
+            for _, value in items:
+                codec.encode_value(value)  # Raises ValueError now rather than in the flusher.
+        all_acked = True
+        driven = self._autoplay_driven | _sequence_driven.get(self.port, frozenset())
+        with self._cond:
+            self._forget_if_reset()
+            for index, value in items:
+                if index in driven:
+                    expected = None
+                elif index in self._in_flight:
+                    expected = self._in_flight[index]
+                    all_acked = False
+                else:
+                    expected = self._acked.get(index)
+                if value == expected:
+                    # Also cancels an older pending value for the same variable.
+                    self._pending.pop(index, None)
+                    metrics.inc("coalescer_writes_suppressed_total", port=self.port)
+                    continue
+                if index in self._pending:
+                    metrics.inc("coalescer_writes_coalesced_total", port=self.port)
+                self._pending[index] = value
+                all_acked = False
+            if self._pending:
+                self._cond.notify_all()
+        return all_acked
+
+    def record_sent(self, items: list[tuple[int, int]]):
+        """Takes note of values written directly (not through the queue), which supersede pending ones."""
+        with self._cond:
+            self._forget_if_reset()
+            for index, value in items:
+                self._pending.pop(index, None)
+                self._in_flight.pop(index, None)
+                self._acked[index] = value
+
+    def forget(self, indices):
+        """Drops the acknowledged values of `indices`, which the board may no longer hold."""
+        with self._cond:
+            for index in indices:
+                self._acked.pop(index, None)
+
+    def _forget_if_reset(self):
+        # Called with self._cond held.
+        resets = board_reset_count(self.port)
+        if resets != self._acked_resets:
+            self._acked.clear()
+            self._acked_resets = resets
+
+    # --- Flushing ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._pending:
+                        delay = self._next_flush - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                self._forget_if_reset()
+                resets = self._acked_resets
+                items = list(self._pending.items())
+                self._in_flight = dict(self._pending)
+                self._pending.clear()
+                self._next_flush = time.monotonic() + self.flush_interval
+
+            with metrics.timer("coalescer_flush_seconds", port=self.port):
+                success, message = set_values(self.port, self.profile, items)
+
+            with self._cond:
+                in_flight, self._in_flight = self._in_flight, {}
+                if success:
+                    self.last_error = None
+                    # Values that reached the board before a restart are gone again,
+                    # and values overwritten directly meanwhile are not the board's any more.
+                    if board_reset_count(self.port) == resets:
+                        self._acked.update((index, value) for index, value in items if index in in_flight)
+                else:
+                    self.last_error = message
+                    metrics.inc("coalescer_flush_failures_total", port=self.port)
+                    for index, value in items:
+                        if index in in_flight:
+                            self._pending.setdefault(index, value)  # Newer values win.
+                    self._next_flush = max(self._next_flush, time.monotonic() + RETRY_DELAY)
+
+    def stop(self):
+        """Drops pending writes and ends the flusher, waiting for a flush in progress."""
+        with self._cond:
+            self._stopped = True
+            self._pending.clear()
+            self._cond.notify_all()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(STOP_TIMEOUT)
+        with _coalescers_lock:
+            if _coalescers.get(self.port) is self:
+                del _coalescers[self.port]
+
+    @property
+    def is_stopped(self) -> bool:
+        return self._stopped
+
+
+_coalescers: dict[str, PortWriteCoalescer] = {}
+_coalescers_lock = threading.Lock()
+# port -> variables driven by sequences played or streamed since the port's firmware was uploaded.
+_sequence_driven: dict[str, frozenset[int]] = {}
+
+
+def get_coalescer(port: str, profile: dict, flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS) -> PortWriteCoalescer:
+    """Returns the port's coalescer, starting a new one if the port got a new profile (i.e. new firmware)."""
+    with _coalescers_lock:
+        coalescer = _coalescers.get(port)
+        if coalescer is not None and not coalescer.is_stopped and coalescer.profile is profile:
+            coalescer.flush_interval = flush_interval_ms / 1000
+            return coalescer
+    if coalescer is not None:
+        coalescer.stop()
+    coalescer = PortWriteCoalescer(port, profile, flush_interval_ms)
+    with _coalescers_lock:
+        _coalescers[port] = coalescer
+    return coalescer
+
+
+def record_sent(port: str, items: list[tuple[int, int]]):
+    """Keeps a port's coalescer, if any, in step with a direct write."""
+    with _coalescers_lock:
+        coalescer = _coalescers.get(port)
+    if coalescer is not None:
+        coalescer.record_sent(items)
+
+
+def mark_sequence_driven(port: str, indices):
+    """Stops suppressing writes to variables a sequence drives: their values on the board are the sequence's."""
+    indices = frozenset(indices)
+    with _coalescers_lock:
+        _sequence_driven[port] = _sequence_driven.get(port, frozenset()) | indices
+        coalescer = _coalescers.get(port)
+    if coalescer is not None:
+        coalescer.forget(indices)
+
+
+def stop_coalescer(port: str):
+    with _coalescers_lock:
+        _sequence_driven.pop(port, None)
+        coalescer = _coalescers.get(port)
+    if coalescer is not None:
+        coalescer.stop()
+
+
+# Queued writes target the firmware the port runs now; drop them before an upload or unplug.
+release_hooks.append(stop_coalescer)
@@ -0,0 +1,129 @@
+# tests/conftest.py
+
+import os
+import select
+import shutil
+import subprocess
+import sys
+import threading
+import tty
+import pytest
+
+# Import the src modules directly: importing the package itself sets up arduino-cli.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.serial_communicator import connection_pool
+
+
+class FakeBoard:
+    """
+    A minimal board on a pty: every line the host writes is passed to
+    `handler(line)`, and the line it returns (if any) is sent back, with the
+    request's sequence tag.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.lines: list[str] = []
+        self.tags: list[str] = []  # The '#<seq>|' tag of each line, "" if untagged.
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        buffer = b""
+        while not self._stop.is_set():
+            if not select.select([self._master], [], [], 0.05)[0]:
+                continue
+            try:
+                buffer += os.read(self._master, 1024)
+            except OSError:
+                return
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                line = line.strip(b"\r").decode()
+                # Requests may carry a '#<seq>|' tag, which the firmware echoes in its reply.
+                tag, sep, rest = line.partition("|")
+                tag = f"{tag}|" if sep and tag[:1] == "#" and tag[1:].isdigit() else ""
+                line = rest if tag else line
+                self.tags.append(tag)
+                self.lines.append(line)
+                reply = self.handler(line)
+                if reply is not None:
+                    # Telemetry ('D:' lines) is never tagged.
+                    reply = "\r\n".join(r if r.startswith("D:") else tag + r for r in reply.split("\r\n"))
+                    os.write(self._master, f"{reply}\r\n".encode())
+
+    def send(self, line: str):
+        """Writes an unsolicited line, as a board pushing telemetry would."""
+        os.write(self._master, f"{line}\r\n".encode())
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(1.0)
+        os.close(self._master)
+        os.close(self._slave)
+
+
+@pytest.fixture
+def fake_board():
+    boards = []
+
+    def create(handler) -> FakeBoard:
+        boards.append(FakeBoard(handler))
+        return boards[-1]
+
+    yield create
+    connection_pool.close_all()
+    for board in boards:
+        board.close()
+
+
+FIRMWARE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "firmware")
+
+
+class Firmware:
+    """A generated sketch compiled for the host against tests/firmware."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def run(self, data: bytes, loops: int = 5, step_ms: int = 1, timed: bool = False) -> tuple[bytes, str]:
+        """Returns (what the sketch printed, its log of baud rates and pin writes)."""
+        args = [self.path, str(loops), str(step_ms)] + (["timed"] if timed else [])
+        result = subprocess.run(args, input=data, capture_output=True, timeout=60)
+        assert result.returncode == 0, result.stderr.decode(errors="replace")
+        return result.stdout, result.stderr.decode()
+
+
+@pytest.fixture
+def build_firmware(tmp_path):
+    compiler = shutil.which("g++")
+    if compiler is None:
+        pytest.skip("g++ is needed to run generated firmware on the host.")
+
+    def build(sketch: str, library_files: dict | None = None) -> Firmware:
+        # Like the Arduino builder: the sketch gets Arduino.h, libraries are compiled alongside it.
+        sketch_path = tmp_path / "sketch.cpp"
+        sketch_path.write_text("#include <Arduino.h>\n" + sketch)
+        sources, include_dirs = [str(sketch_path), os.path.join(FIRMWARE_DIR, "harness.cpp")], {FIRMWARE_DIR}
+        for relative_path, content in (library_files or {}).items():
+            path = tmp_path / "libraries" / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+            include_dirs.add(str(path.parent))
+            if path.suffix == ".cpp":
+                sources.append(str(path))
+        exe = str(tmp_path / "firmware")
+        # The sanitizers turn undefined behaviour (overflows, null pointer arithmetic) into failures.
+        command = [compiler, "-std=gnu++17", "-g", "-fsanitize=address,undefined", "-fno-sanitize-recover=all",
+                   *(f"-I{d}" for d in sorted(include_dirs)), *sources, "-o", exe]
+        result = subprocess.run(command, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        return Firmware(exe)
+
+    return build
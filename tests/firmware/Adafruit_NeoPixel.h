@@ -0,0 +1,30 @@
+// tests/firmware/Adafruit_NeoPixel.h
+// Stand-in for the Adafruit NeoPixel library: show() logs the pixel buffer as
+// "NEO<pin>=<hex bytes in wire order>;" instead of driving LEDs.
+
+#pragma once
+#include <Arduino.h>
+
+#define NEO_RGB 0x06
+#define NEO_GRB 0x52
+#define NEO_BGR 0x24
+#define NEO_KHZ800 0x0000
+
+class Adafruit_NeoPixel {
+ public:
+  Adafruit_NeoPixel(uint16_t n, int16_t pin, uint16_t type) : numBytes(n * 3), pin(pin) { pixels = (uint8_t*)calloc(numBytes, 1); }
+  ~Adafruit_NeoPixel() { free(pixels); }
+  void begin() {}
+  void show() {
+    std::string entry = "NEO" + std::to_string(pin) + "=";
+    char hex[3];
+    for (uint16_t i = 0; i < numBytes; i++) { snprintf(hex, sizeof(hex), "%02x", pixels[i]); entry += hex; }
+    harnessLog(entry);
+  }
+  uint8_t* getPixels() { return pixels; }
+
+ private:
+  uint16_t numBytes;
+  int16_t pin;
+  uint8_t* pixels;
+};
@@ -0,0 +1,75 @@
+// tests/firmware/Arduino.h
+// Just enough of the Arduino core to run generated sketches on the host (see harness.cpp).
+// int is 32 bits here, as on ARM and ESP32 boards.
+
+#pragma once
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <string>
+
+typedef uint8_t byte;
+typedef bool boolean;
+#define HIGH 1
+#define LOW 0
+#define INPUT 0
+#define OUTPUT 1
+#define DEC 10
+#define HEX 16
+#define F_CPU 16000000UL
+#define PROGMEM
+#define memcpy_P memcpy
+#define constrain(amt, low, high) ((amt) < (low) ? (low) : ((amt) > (high) ? (high) : (amt)))
+static inline uint8_t pgm_read_byte(const void* p) { return *(const uint8_t*)p; }
+static inline uint16_t pgm_read_word(const void* p) { return *(const uint16_t*)p; }
+static inline uint32_t pgm_read_dword(const void* p) { return *(const uint32_t*)p; }
+
+extern std::string harnessInput;
+extern size_t harnessInputPos;
+extern std::string harnessOutput;
+
+struct HarnessSerial {
+  void begin(unsigned long baud);
+  void end() {}
+  void flush() {}
+  operator bool() { return true; }
+  int available() { return (int)(harnessInput.size() - harnessInputPos); }
+  int read() { return harnessInputPos < harnessInput.size() ? (uint8_t)harnessInput[harnessInputPos++] : -1; }
+  int availableForWrite() { return 64; }
+  size_t write(uint8_t b) { harnessOutput.push_back((char)b); return 1; }
+  size_t write(const uint8_t* p, size_t n) { harnessOutput.append((const char*)p, n); return n; }
+  void print(const char* s) { harnessOutput += s; }
+  void print(char c) { harnessOutput.push_back(c); }
+  void print(long v, int base = DEC) {
+    char text[24];
+    snprintf(text, sizeof(text), base == HEX ? "%lX" : "%ld", v);
+    harnessOutput += text;
+  }
+  void print(unsigned long v, int base = DEC) {
+    char text[24];
+    snprintf(text, sizeof(text), base == HEX ? "%lX" : "%lu", v);
+    harnessOutput += text;
+  }
+  void print(int v, int base = DEC) { print((long)v, base); }
+  void print(unsigned int v, int base = DEC) { print((unsigned long)v, base); }
+  void print(short v, int base = DEC) { print((long)v, base); }
+  void print(unsigned short v, int base = DEC) { print((unsigned long)v, base); }
+  void print(signed char v, int base = DEC) { print((long)v, base); }
+  void print(unsigned char v, int base = DEC) { print((unsigned long)v, base); }
+  template <class T> void println(T v) { print(v); harnessOutput += "\r\n"; }
+  template <class T> void println(T v, int base) { print(v, base); harnessOutput += "\r\n"; }
+  void println() { harnessOutput += "\r\n"; }
+};
+extern HarnessSerial Serial;
+
+void pinMode(int pin, int mode);
+void digitalWrite(int pin, int value);
+void analogWrite(int pin, int value);
+int digitalRead(int pin);
+int analogRead(int pin);
+unsigned long millis();
+unsigned long micros();
+void delay(unsigned long ms);
+// Appends an entry to the pin log, for stand-ins of output libraries.
+void harnessLog(const std::string& entry);
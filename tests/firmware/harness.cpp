@@ -0,0 +1,66 @@
+// tests/firmware/harness.cpp
+// Runs a sketch on the host. stdin is what the host sends over serial, stdout what
+// the sketch prints, stderr a log of baud rates and pin writes ("D13=1;A9=128;").
+// Usage: harness [loops] [ms_per_loop] [timed]. With "timed", input after a
+// "\x02<ms>\x02" marker only arrives once millis() reaches <ms>.
+
+#include <Arduino.h>
+#include <iostream>
+#include <iterator>
+#include <utility>
+#include <vector>
+
+std::string harnessInput;
+size_t harnessInputPos = 0;
+std::string harnessOutput;
+HarnessSerial Serial;
+
+static std::string pinLog;
+static unsigned long nowMs = 0;
+static bool timed = false;
+
+static std::string stamp() { return timed ? "@" + std::to_string(nowMs) : ""; }
+
+void HarnessSerial::begin(unsigned long baud) { pinLog += "BAUD=" + std::to_string(baud) + stamp() + ";"; }
+void pinMode(int, int) {}
+void digitalWrite(int pin, int value) { pinLog += "D" + std::to_string(pin) + "=" + std::to_string(value) + stamp() + ";"; }
+void analogWrite(int pin, int value) { pinLog += "A" + std::to_string(pin) + "=" + std::to_string(value) + stamp() + ";"; }
+int digitalRead(int) { return 0; }
+int analogRead(int) { return 0; }
+unsigned long millis() { return nowMs; }
+unsigned long micros() { return nowMs * 1000; }
+void delay(unsigned long ms) { nowMs += ms; }
+void harnessLog(const std::string& entry) { pinLog += entry + stamp() + ";"; }
+
+void setup();
+void loop();
+
+int main(int argc, char** argv) {
+  int loops = argc > 1 ? atoi(argv[1]) : 5;
+  int step = argc > 2 ? atoi(argv[2]) : 1;
+  timed = argc > 3 && std::string(argv[3]) == "timed";
+  std::string all((std::istreambuf_iterator<char>(std::cin)), std::istreambuf_iterator<char>());
+
+  std::vector<std::pair<unsigned long, std::string>> chunks;
+  size_t pos = 0;
+  unsigned long at = 0;
+  while (true) {
+    size_t marker = timed ? all.find('\x02', pos) : std::string::npos;
+    if (marker == std::string::npos) { chunks.push_back({at, all.substr(pos)}); break; }
+    chunks.push_back({at, all.substr(pos, marker - pos)});
+    size_t end = all.find('\x02', marker + 1);
+    at = strtoul(all.substr(marker + 1, end - marker - 1).c_str(), NULL, 10);
+    pos = end + 1;
+  }
+
+  size_t next = 0;
+  setup();
+  for (int i = 0; i < loops; i++) {
+    while (next < chunks.size() && chunks[next].first <= nowMs) harnessInput += chunks[next++].second;
+    loop();
+    nowMs += step;
+  }
+  std::cout << harnessOutput;
+  std::cerr << pinLog;
+  return 0;
+}
@@ -0,0 +1,75 @@
+# tests/test_arduino_actions.py
+
+import os
+from src.arduino_actions import parse_memory_usage, format_memory_usage
+
+AVR_OUTPUT = """\
+Sketch uses 924 bytes (2%) of program storage space. Maximum is 32256 bytes.
+Global variables use 9 bytes (0%) of dynamic memory, leaving 2039 bytes for local variables. Maximum is 2048 bytes.
+"""
+
+ESP32_OUTPUT = """\
+Sketch uses 263773 bytes (20%) of program storage space. Maximum is 1310720 bytes.
+Global variables use 20296 bytes (6%) of dynamic memory, leaving 307384 bytes for local variables. Maximum is 327680 bytes.
+"""
+
+# Cores without a RAM size report only the flash line.
+SAM_OUTPUT = """\
+Sketch uses 10640 bytes (2%) of program storage space. Maximum is 524288 bytes.
+"""
+
+
+def test_avr_output():
+    assert parse_memory_usage(AVR_OUTPUT) == {"program": {"used": 924, "max": 32256, "percent": 2.9},
+                                              "data": {"used": 9, "max": 2048, "percent": 0.4}}
+
+
+def test_esp32_output():
+    usage = parse_memory_usage("Compiling sketch...\n" + ESP32_OUTPUT)
+    assert usage["program"] == {"used": 263773, "max": 1310720, "percent": 20.1}
+    assert usage["data"] == {"used": 20296, "max": 327680, "percent": 6.2}
+
+
+def test_missing_sections_are_left_out():
+    assert parse_memory_usage(SAM_OUTPUT) == {"program": {"used": 10640, "max": 524288, "percent": 2.0}}
+    assert parse_memory_usage("") == {}
+    assert parse_memory_usage(None) == {}
+
+
+def test_format():
+    assert format_memory_usage(parse_memory_usage(AVR_OUTPUT)) == "📊 Flash: 924/32256 bytes (2.9%), RAM: 9/2048 bytes (0.4%)"
+    assert format_memory_usage({}) == "📊 Memory usage not reported by the compiler."
+
+
+def test_unknown_maximum():
+    usage = parse_memory_usage("Sketch uses 1234 bytes of program storage space.\nGlobal variables use 56 bytes of dynamic memory.\n")
+    assert usage == {"program": {"used": 1234, "max": None, "percent": None}, "data": {"used": 56, "max": None, "percent": None}}
+    assert format_memory_usage(usage) == "📊 Flash: 1234 bytes, RAM: 56 bytes"
+
+
+def test_fleet_upload_compiles_once(tmp_path, monkeypatch):
+    from src import arduino_actions, build_cache
+    calls = []
+
+    def run(cli_path, config_path, args, expect_json=False):
+        calls.append(args[0])
+        if args[0] == "compile":
+            output_dir = args[args.index("--output-dir") + 1]
+            with open(os.path.join(output_dir, "comfyui_sketch.ino.hex"), "w") as f: f.write(":00000001FF\n")
+            return True, AVR_OUTPUT
+        if args[0] == "upload":
+            port = args[args.index("-p") + 1]
+            return (False, "programmer is not responding") if port == "COM5" else (True, "")
+        return True, {}
+
+    monkeypatch.setattr(arduino_actions, "run_cli_command", run)
+    monkeypatch.setattr(build_cache, "run_cli_command", run)
+    config_path = str(tmp_path / "arduino-cli.yaml")
+    success, message, results, usage = arduino_actions.compile_and_upload_to_many(
+        "cli", config_path, ["COM3", "COM4", "COM3", "COM5"], "arduino:avr:uno", "void setup() {}\nvoid loop() {}", max_workers=2)
+    assert not success
+    assert calls.count("compile") == 1 and calls.count("upload") == 3
+    assert [port for port, r in results.items() if r["success"]] == ["COM3", "COM4"]
+    assert "programmer is not responding" in results["COM5"]["message"]
+    assert "2/3 board(s) updated" in message
+    assert usage["program"]["used"] == 924
@@ -0,0 +1,35 @@
+# tests/test_arduino_environment.py
+
+import threading
+from src import arduino_environment
+from src.arduino_environment import ArduinoEnvironment, INITIALIZING_MESSAGE
+
+
+def test_initializes_in_the_background(monkeypatch):
+    release = threading.Event()
+
+    def setup(install_dir):
+        release.wait(5)
+        return "cli", "config", None
+
+    monkeypatch.setattr(arduino_environment, "setup_arduino_cli", setup)
+    monkeypatch.setattr(arduino_environment, "get_available_boards", lambda cli, config: ["Arduino Uno"])
+    environment = ArduinoEnvironment("install")
+    monkeypatch.setattr(environment.port_registry, "start", lambda: None)
+    monkeypatch.setattr(environment.port_registry, "set_cli", lambda cli_path, config_path: None)
+    environment.start()
+    assert environment.boards == [INITIALIZING_MESSAGE]
+    assert environment.check(timeout=0.05) == INITIALIZING_MESSAGE
+
+    release.set()
+    assert environment.check(timeout=5) is None
+    assert (environment.cli_path, environment.config_path) == ("cli", "config")
+    assert environment.boards == ["Arduino Uno"]
+
+
+def test_setup_failure_is_reported(monkeypatch):
+    monkeypatch.setattr(arduino_environment, "setup_arduino_cli", lambda install_dir: (None, None, "no network"))
+    environment = ArduinoEnvironment("install")
+    monkeypatch.setattr(environment.port_registry, "start", lambda: None)
+    assert environment.check(timeout=5) == "Setup failed: no network"
+    assert environment.boards == ["Error: CLI setup failed"]
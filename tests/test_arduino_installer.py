@@ -0,0 +1,208 @@
+# tests/test_arduino_installer.py
+
+import hashlib
+import io
+import os
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from src import arduino_installer as installer
+
+ARCHIVE_NAME = f"arduino-cli_{installer.ARDUINO_CLI_VERSION}_Linux_64bit.tar.gz"
+
+
+def _make_archive() -> bytes:
+    # Random content does not compress, so the archive spans several download chunks.
+    data = os.urandom(5 * installer.DOWNLOAD_CHUNK_SIZE)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as t:
+        info = tarfile.TarInfo("arduino-cli")
+        info.size = len(data)
+        t.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+PAYLOAD = _make_archive()
+PAYLOAD_SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class _ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Serves PAYLOAD with Range support, and the server's `checksums` text (404 if
+    None). The server's `cut_after` ends the next full archive response early.
+    """
+
+    def do_GET(self):
+        server = self.server
+        if self.path.endswith("checksums.txt"):
+            server.checksum_requests += 1
+            body = server.checksums.encode() if server.checksums is not None else b""
+            self.send_response(200 if server.checksums is not None else 404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        server.ranges.append(self.headers.get("Range"))
+        start = int(self.headers["Range"][len("bytes="):].rstrip("-")) if self.headers.get("Range") else None
+        if start is not None and start >= len(PAYLOAD):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = PAYLOAD[start or 0:]
+        self.send_response(206 if start is not None else 200)
+        if start is not None:
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if start is None and server.cut_after is not None:
+            body, server.cut_after = body[:server.cut_after], None
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    for name in (installer.ENV_ARCHIVE, installer.ENV_CACHE_DIR, installer.ENV_URL, installer.ENV_SHA256, installer.ENV_CHECKSUMS_URL):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """A release server for the archive and its checksums, used through the environment overrides."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ArchiveHandler)
+    httpd.ranges, httpd.cut_after, httpd.checksum_requests = [], None, 0
+    httpd.checksums = f"{'f' * 64}  arduino-cli_other.zip\n{PAYLOAD_SHA256}  {ARCHIVE_NAME}\n"
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.url = f"{base}/{ARCHIVE_NAME}"
+    monkeypatch.setenv(installer.ENV_URL, httpd.url)
+    monkeypatch.setenv(installer.ENV_CHECKSUMS_URL, f"{base}/{installer.ARDUINO_CLI_VERSION}-checksums.txt")
+    monkeypatch.setenv(installer.ENV_CACHE_DIR, str(tmp_path / "cache"))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _read(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_platform_url_is_pinned():
+    url = installer.get_platform_specific_url()
+    assert f"arduino-cli_{installer.ARDUINO_CLI_VERSION}_" in url and "latest" not in url
+
+
+def test_download_resumes_with_range(server, tmp_path):
+    server.cut_after = 3 * installer.DOWNLOAD_CHUNK_SIZE
+    archive_path = str(tmp_path / ARCHIVE_NAME)
+    installer._download(server.url, archive_path)
+    assert _read(archive_path) == PAYLOAD
+    assert server.ranges == [None, f"bytes={3 * installer.DOWNLOAD_CHUNK_SIZE}-"]
+    assert not os.path.exists(f"{archive_path}.part")
+
+
+def test_download_resumes_part_file_from_earlier_run(server, tmp_path):
+    archive_path = str(tmp_path / ARCHIVE_NAME)
+    with open(f"{archive_path}.part", 'wb') as f:
+        f.write(PAYLOAD[:1000])
+    installer._download(server.url, archive_path)
+    assert _read(archive_path) == PAYLOAD
+    assert server.ranges == ["bytes=1000-"]
+
+
+def test_download_restarts_after_416(server, tmp_path):
+    archive_path = str(tmp_path / ARCHIVE_NAME)
+    with open(f"{archive_path}.part", 'wb') as f:
+        f.write(PAYLOAD + b"stale")
+    installer._download(server.url, archive_path)
+    assert _read(archive_path) == PAYLOAD
+    assert server.ranges == [f"bytes={len(PAYLOAD) + 5}-", None]
+
+
+def test_fetch_verifies_against_published_checksums(server, tmp_path):
+    archive_path = installer._fetch_archive(str(tmp_path / "install"))
+    assert _read(archive_path) == PAYLOAD
+    # The second install reuses the cached archive and checksums file.
+    assert installer._fetch_archive(str(tmp_path / "install")) == archive_path
+    assert len(server.ranges) == 1 and server.checksum_requests == 1
+
+
+def test_fetch_fails_without_checksum(server, tmp_path):
+    server.checksums = None
+    with pytest.raises(RuntimeError, match="No checksum available"):
+        installer._fetch_archive(str(tmp_path / "install"))
+    server.checksums = f"{PAYLOAD_SHA256}  arduino-cli_other.zip\n"
+    with pytest.raises(RuntimeError, match="No checksum available"):
+        installer._fetch_archive(str(tmp_path / "install"))
+    assert server.ranges == []  # Nothing downloaded that could not be verified.
+
+
+def test_fetch_replaces_cached_archive_with_wrong_digest(server, tmp_path):
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    (cache / ARCHIVE_NAME).write_bytes(PAYLOAD[:-10] + b"corrupted!")
+    archive_path = installer._fetch_archive(str(tmp_path / "install"))
+    assert _read(archive_path) == PAYLOAD
+    assert server.ranges == [None]
+
+
+def test_fetch_deletes_download_with_wrong_digest(server, tmp_path, monkeypatch):
+    monkeypatch.setenv(installer.ENV_SHA256, "0" * 64)
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        installer._fetch_archive(str(tmp_path / "install"))
+    assert not (tmp_path / "cache" / ARCHIVE_NAME).exists()
+    assert server.checksum_requests == 0
+
+
+def test_fetch_uses_local_archive(server, tmp_path, monkeypatch):
+    local = tmp_path / "seeded.tar.gz"
+    local.write_bytes(PAYLOAD)
+    (tmp_path / installer.CHECKSUMS_FILE_NAME).write_text(f"{PAYLOAD_SHA256}  seeded.tar.gz\n")
+    monkeypatch.setenv(installer.ENV_ARCHIVE, str(local))
+    assert installer._fetch_archive(str(tmp_path / "install")) == str(local)
+    monkeypatch.setenv(installer.ENV_SHA256, "0" * 64)
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        installer._fetch_archive(str(tmp_path / "install"))
+    assert server.ranges == [] and server.checksum_requests == 0
+
+
+@pytest.fixture
+def installed_cli(tmp_path, monkeypatch):
+    """An install dir whose arduino-cli binary exists and reports the AVR core."""
+    cli_path = installer.get_cli_executable_path(str(tmp_path))
+    os.makedirs(os.path.dirname(cli_path))
+    with open(cli_path, 'w') as f: f.write("#!/bin/sh\n")
+    calls = []
+
+    def run(cli, config, args, expect_json=False):
+        calls.append(args)
+        return True, {"platforms": [{"id": installer.CORE_TO_INSTALL}]}
+
+    monkeypatch.setattr(installer, "run_cli_command", run)
+    return str(tmp_path), calls
+
+
+def test_manifest_skips_core_check(installed_cli):
+    install_dir, calls = installed_cli
+    cli_path, config_path, error = installer.setup_arduino_cli(install_dir)
+    assert error is None and os.path.isfile(config_path)
+    assert calls == [["core", "list", "--format", "json"]]
+
+    assert installer.setup_arduino_cli(install_dir) == (cli_path, config_path, None)
+    assert len(calls) == 1
+
+
+def test_manifest_is_invalidated_by_core_changes(installed_cli):
+    install_dir, calls = installed_cli
+    installer.setup_arduino_cli(install_dir)
+    os.makedirs(os.path.join(install_dir, installer.DATA_DIR_NAME, "packages", "arduino", "hardware", "avr", "1.8.6"))
+    installer.setup_arduino_cli(install_dir)
+    assert len(calls) == 2
@@ -0,0 +1,59 @@
+# tests/test_board_finder.py
+
+import os
+import pytest
+from src import arduino_board_finder as finder
+
+BOARDS = {"boards": [
+    {"name": "Arduino Uno", "fqbn": "arduino:avr:uno"},
+    {"name": "Arduino Nano", "fqbn": "arduino:avr:nano"},
+    {"name": "Arduino Uno", "fqbn": "arduino:avr:uno_duplicate"},
+]}
+
+
+@pytest.fixture
+def fake_cli(tmp_path, monkeypatch):
+    calls = []
+
+    def run(cli_path, config_path, args, expect_json=False):
+        calls.append(args)
+        return True, BOARDS
+
+    monkeypatch.setattr(finder, "run_cli_command", run)
+    monkeypatch.setattr(finder, "_catalogs", {})
+    return str(tmp_path / "arduino-cli.yaml"), calls
+
+
+def _install_core(config_path: str, version: str):
+    os.makedirs(os.path.join(os.path.dirname(config_path), finder.DATA_DIR_NAME, "packages", "arduino", "hardware", "avr", version))
+
+
+def test_lookups_use_one_listall(fake_cli):
+    config_path, calls = fake_cli
+    assert finder.get_available_boards("cli", config_path) == ["Arduino Nano", "Arduino Uno"]
+    assert finder.get_fqbn_by_name("cli", config_path, "Arduino Uno") == ("arduino:avr:uno", None)
+    assert finder.get_fqbn_by_name("cli", config_path, "Mega")[0] is None
+    assert finder.get_board_details("cli", config_path, "arduino:avr:nano")["name"] == "Arduino Nano"
+    assert len(calls) == 1
+
+
+def test_catalog_is_persisted_until_cores_change(fake_cli, monkeypatch):
+    config_path, calls = fake_cli
+    _install_core(config_path, "1.8.6")
+    finder.get_available_boards("cli", config_path)
+    assert os.path.isfile(os.path.join(os.path.dirname(config_path), finder.CATALOG_FILE_NAME))
+
+    # A new session loads the catalog from disk.
+    monkeypatch.setattr(finder, "_catalogs", {})
+    assert finder.get_fqbn_by_name("cli", config_path, "Arduino Nano") == ("arduino:avr:nano", None)
+    assert len(calls) == 1
+
+    _install_core(config_path, "1.8.7")
+    finder.get_available_boards("cli", config_path)
+    assert len(calls) == 2
+
+
+def test_listall_failure(fake_cli, monkeypatch):
+    config_path, _ = fake_cli
+    monkeypatch.setattr(finder, "run_cli_command", lambda *args, **kwargs: (False, "boom"))
+    assert finder.get_available_boards("cli", config_path) == ["Error: Could not list boards"]
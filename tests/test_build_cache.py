@@ -0,0 +1,91 @@
+# tests/test_build_cache.py
+
+import os
+import pytest
+from src import build_cache
+from src.build_cache import BuildCache
+
+
+@pytest.fixture
+def fake_cli(tmp_path, monkeypatch):
+    """Answers `core list`/`lib list` from `replies` and records every call."""
+    replies = {
+        "core": {"platforms": [{"id": "arduino:avr", "installed_version": "1.8.6"}]},
+        "lib": {"installed_libraries": [{"library": {"name": "Servo", "version": "1.2.1"}}]},
+    }
+    calls = []
+
+    def run(cli_path, config_path, args, expect_json=False):
+        calls.append(args[0])
+        return True, replies[args[0]]
+
+    monkeypatch.setattr(build_cache, "run_cli_command", run)
+    monkeypatch.setattr(build_cache, "_core_versions", {})
+    monkeypatch.setattr(build_cache, "_library_versions", {})
+    return str(tmp_path / "arduino-cli.yaml"), replies, calls
+
+
+def _install(config_path: str, *parts: str):
+    os.makedirs(os.path.join(os.path.dirname(config_path), build_cache.DATA_DIR_NAME, *parts), exist_ok=True)
+
+
+def test_core_version_is_memoized_until_cores_change(fake_cli):
+    config_path, replies, calls = fake_cli
+    _install(config_path, "packages", "arduino", "hardware", "avr", "1.8.6")
+    assert build_cache.get_core_version("cli", config_path, "arduino:avr:uno") == "1.8.6"
+    assert build_cache.get_core_version("cli", config_path, "arduino:avr:nano") == "1.8.6"
+    assert calls == ["core"]
+
+    replies["core"]["platforms"][0]["installed_version"] = "1.8.7"
+    _install(config_path, "packages", "arduino", "hardware", "avr", "1.8.7")
+    assert build_cache.get_core_version("cli", config_path, "arduino:avr:uno") == "1.8.7"
+    assert calls == ["core", "core"]
+
+
+def test_library_versions_are_memoized_until_libraries_change(fake_cli):
+    config_path, replies, calls = fake_cli
+    assert build_cache.get_library_versions("cli", config_path) == "Servo@1.2.1"
+    assert build_cache.get_library_versions("cli", config_path) == "Servo@1.2.1"
+    assert calls == ["lib"]
+
+    replies["lib"] = [{"library": {"name": "Servo", "version": "1.2.2"}}, {"library": {"name": "Adafruit NeoPixel", "version": "1.12.0"}}]
+    _install(config_path, "user", "libraries", "Adafruit_NeoPixel")
+    assert build_cache.get_library_versions("cli", config_path) == "Adafruit NeoPixel@1.12.0;Servo@1.2.2"
+
+
+def test_key_covers_every_input():
+    base = BuildCache.make_key("code", "arduino:avr:uno", "1.8.6", "Servo@1.2.1")
+    assert base == BuildCache.make_key("code", "arduino:avr:uno", "1.8.6", "Servo@1.2.1")
+    assert len({base, BuildCache.make_key("code2", "arduino:avr:uno", "1.8.6", "Servo@1.2.1"),
+                BuildCache.make_key("code", "arduino:avr:nano", "1.8.6", "Servo@1.2.1"),
+                BuildCache.make_key("code", "arduino:avr:uno", "1.8.7", "Servo@1.2.1"),
+                BuildCache.make_key("code", "arduino:avr:uno", "1.8.6", "Servo@1.2.2")}) == 5
+
+
+def _build_dir(tmp_path, name: str, size: int) -> str:
+    path = tmp_path / name
+    path.mkdir()
+    (path / "comfyui_sketch.ino.hex").write_bytes(b"x" * size)
+    (path / "comfyui_sketch.ino.o").write_bytes(b"not an artifact")
+    return str(path)
+
+
+def test_store_and_lookup(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    assert cache.lookup("a") is None
+    entry = cache.store("a", _build_dir(tmp_path, "build", 10), {"fqbn": "arduino:avr:uno"})
+    assert cache.lookup("a") == entry
+    assert sorted(os.listdir(entry)) == ["comfyui_sketch.ino.hex", build_cache.MANIFEST_NAME]
+    assert cache.stats() == "1 hit(s), 1 miss(es) this session"
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"), max_bytes=2500)
+    cache.store("old", _build_dir(tmp_path, "b1", 1000), {})
+    cache.store("used", _build_dir(tmp_path, "b2", 1000), {})
+    os.utime(os.path.join(cache.root, "old", build_cache.MANIFEST_NAME), (1, 1))
+    os.utime(os.path.join(cache.root, "used", build_cache.MANIFEST_NAME), (2, 2))
+    assert cache.lookup("used")
+    cache.store("new", _build_dir(tmp_path, "b3", 1000), {})
+    assert cache.lookup("old") is None
+    assert cache.lookup("used") and cache.lookup("new")
@@ -0,0 +1,108 @@
+# tests/test_code_block.py
+
+import copy
+import pickle
+from src.code_block import CodeBlock
+
+
+def _chain() -> CodeBlock:
+    return CodeBlock.empty().with_variable("speed").with_pin_state(13, "digital", "LOW").with_pin_state(9, "analog", 128)
+
+
+def test_equal_histories_have_equal_digests():
+    a, b = _chain(), _chain()
+    assert a is not b
+    assert a == b and hash(a) == hash(b) and a.digest == b.digest
+
+
+def test_different_histories_differ():
+    base = CodeBlock.empty().with_variable("speed")
+    assert base.with_variable("a").with_variable("b") != base.with_variable("b").with_variable("a")
+    assert base.with_pin_state(13, "digital", "LOW") != base.with_pin_state(13, "digital", "HIGH")
+
+
+def test_redundant_changes_keep_the_block():
+    block = _chain()
+    assert block.with_variable("speed") is block
+    assert block.with_pin_state(13, "digital", "LOW") is block
+    assert block.with_pin_state(13, "digital", "HIGH") != block
+    # Setting a pin back to an earlier state is a change, returning to it again is not.
+    toggled = block.with_pin_state(13, "digital", "HIGH").with_pin_state(13, "digital", "LOW")
+    assert toggled != block and toggled.with_pin_state(13, "digital", "LOW") is toggled
+
+
+def test_redundant_changes_are_found_beyond_the_walk_limit():
+    block = CodeBlock.empty().with_variable("speed").with_pin_state(2, "digital", "LOW")
+    for i in range(200):
+        block = block.with_variable(f"v{i}")
+    assert block.with_variable("speed") is block
+    assert block.with_pin_state(2, "digital", "LOW") is block
+    assert block.with_variable("v0").with_variable("v199") is block
+
+
+def test_deriving_leaves_parent_unchanged():
+    parent = CodeBlock.empty().with_variable("speed")
+    dict(parent)  # Materialize before deriving.
+    child = parent.with_variable("angle")
+    assert parent["shared_variable_names"] == ("speed",)
+    assert child["shared_variable_names"] == ("speed", "angle")
+
+
+def test_dict_view():
+    block = _chain()
+    assert block["setup_pins"] == {13, 9}
+    assert dict(block["pin_states"]["state_pin_13"]) == {"type": "digital", "value": "LOW"}
+    assert block["shared_variable_names"] == ("speed",)
+
+
+def test_pickle_round_trip():
+    block = _chain()
+    restored = pickle.loads(pickle.dumps(block))
+    assert restored == block
+    assert dict(restored) == dict(block)
+
+
+def test_pickle_long_chain():
+    block = CodeBlock.empty()
+    for i in range(5000):
+        block = block.with_variable(f"v{i}")
+    restored = pickle.loads(pickle.dumps(block))
+    assert restored == block
+    assert len(restored["shared_variable_names"]) == 5000
+
+
+def test_copies_share_the_instance():
+    block = _chain()
+    assert copy.copy(block) is block
+    assert copy.deepcopy({"code": block})["code"] is block
+
+
+def test_frame_buffers():
+    block = _chain().with_frame_buffer("matrix", "neopixel", 16, 16, "GRB", [6], serpentine=True)
+    assert dict(block["frame_buffers"]["matrix"]) == {"output": "neopixel", "width": 16, "height": 16, "color_order": "GRB",
+                                                      "pins": (6,), "serpentine": True}
+    assert block.with_frame_buffer("matrix", "neopixel", 16, 16, "GRB", [6], serpentine=True) is block
+    resized = block.with_frame_buffer("matrix", "neopixel", 8, 8, "GRB", [6], serpentine=True)
+    assert resized["frame_buffers"]["matrix"]["width"] == 8
+
+
+def test_array_variables():
+    block = _chain().with_array_variable("levels", 4, "uint8")
+    assert dict(block["array_variables"]["levels"]) == {"length": 4, "element_type": "uint8"}
+    assert block.with_array_variable("levels", 4, "uint8") is block
+    assert block.with_variable("levels") is block  # Already declared, as an array.
+    assert block.with_array_variable("levels", 8, "uint8")["array_variables"]["levels"]["length"] == 8
+
+
+def test_array_replaces_variable_of_same_name():
+    block = CodeBlock.empty().with_variable("levels").with_array_variable("levels", 2, "int16")
+    assert block["shared_variable_names"] == ()
+    assert "levels" in block["array_variables"]
+
+
+def test_sequences():
+    keyframes = [(0, "speed", 0, "linear"), (1000, "speed", 255, "step")]
+    block = _chain().with_sequence("fade", keyframes, "progmem", loop=True, autoplay=True)
+    assert block["sequences"]["fade"]["keyframes"] == ((0, "speed", 0, "linear"), (1000, "speed", 255, "step"))
+    assert block.with_sequence("fade", [list(k) for k in keyframes], "progmem", loop=True, autoplay=True) is block
+    assert not block.with_sequence("fade", keyframes, "progmem", loop=False, autoplay=True)["sequences"]["fade"]["loop"]
@@ -0,0 +1,100 @@
+# tests/test_code_generator.py
+
+import pytest
+from src.code_generator import (create_communication_map, check_array_variable, get_serial_buffer_size, compile_keyframes,
+                                create_sequence_map, uart_baud_error, check_baud_rate, get_negotiable_baud_rates,
+                                MAX_ARRAY_LENGTH, MAX_SERIAL_BUFFER_SIZE, MAX_RAMP_MS, MAX_BAUD_ERROR)
+
+COMM_MAP = {
+    "speed": {"index": 0, "type": "shared"},
+    "levels": {"index": 1, "type": "array", "length": 3, "element_type": "uint8"},
+    "state_pin_13": {"index": 4, "type": "digital", "pin_number": 13},
+}
+
+
+def test_arrays_follow_the_shared_scalars():
+    code_block = {"shared_variable_names": ["speed"], "pin_states": {"state_pin_13": {"type": "digital", "value": "LOW"}},
+                  "array_variables": {"levels": {"length": 3, "element_type": "uint8"}}}
+    comm_map = create_communication_map(code_block)
+    assert comm_map["levels"] == {"index": 1, "type": "array", "length": 3, "element_type": "uint8"}
+    assert comm_map["state_pin_13"]["index"] == 4
+
+
+def test_check_array_variable():
+    check_array_variable(MAX_ARRAY_LENGTH, "int16")
+    with pytest.raises(ValueError, match="holds 1 to"):
+        check_array_variable(MAX_ARRAY_LENGTH + 1, "int16")
+    with pytest.raises(ValueError, match="Unknown element type"):
+        check_array_variable(4, "float")
+
+
+def test_longest_array_fits_one_ascii_write():
+    comm_map = {"levels": {"index": 0, "type": "array", "length": MAX_ARRAY_LENGTH, "element_type": "int16"}}
+    # Tagged, from a four-digit start index, every value at its widest.
+    line = "#255|W:9999:" + ",".join(["-32768"] * MAX_ARRAY_LENGTH)
+    assert len(line) < get_serial_buffer_size(comm_map) <= MAX_SERIAL_BUFFER_SIZE
+
+
+def test_compile_keyframes_step_and_linear():
+    entries, length_ms = compile_keyframes([(0, "speed", 0, "linear"), (1000, "speed", 200, "step"), (500, "levels[2]", 7, "step")], COMM_MAP)
+    assert entries == [(0, 1000, 0, 0, 200), (500, 0, 3, 7, 7), (1000, 0, 0, 200, 200)]
+    assert length_ms == 1000
+
+
+def test_compile_keyframes_splits_long_ramps():
+    entries, length_ms = compile_keyframes([(0, "speed", 0, "linear"), (2 * MAX_RAMP_MS + 2, "speed", 1000, "step")], COMM_MAP)
+    assert [e[1] for e in entries[:-1]] == [MAX_RAMP_MS, MAX_RAMP_MS, 2]
+    assert entries[1][3] == entries[0][4]  # Each piece continues where the last one ended.
+    assert length_ms == 2 * MAX_RAMP_MS + 2
+
+
+def test_compile_no_keyframes():
+    assert compile_keyframes([], COMM_MAP) == ([], 0)
+
+
+@pytest.mark.parametrize("keyframe, message", [
+    ((0, "speed", 1, "cubic"), "Unknown interpolation"),
+    ((-1, "speed", 1, "step"), "negative"),
+    ((0, "speed", 40000, "step"), "int16"),
+    ((0, "missing", 1, "step"), "unknown variable 'missing'"),
+    ((0, "levels[3]", 1, "step"), "out of range"),
+    ((0, "levels", 1, "step"), "array variable"),
+])
+def test_compile_keyframes_errors(keyframe, message):
+    with pytest.raises(ValueError, match=message):
+        compile_keyframes([keyframe], COMM_MAP)
+
+
+def test_sequence_map_records_driven_indices():
+    sequences = {"fade": {"keyframes": [(0, "levels[1]", 0, "linear"), (100, "speed", 5, "step")], "storage": "progmem", "loop": True, "autoplay": True, "capacity": 0},
+                 "live": {"keyframes": [], "storage": "stream", "loop": False, "autoplay": False, "capacity": 8}}
+    sequence_map = create_sequence_map({"sequences": sequences}, COMM_MAP)
+    assert sequence_map["fade"]["indices"] == [0, 2]
+    assert sequence_map["live"]["indices"] == [] and sequence_map["live"]["capacity"] == 8
+
+
+def test_uart_baud_error_at_16_mhz():
+    # 115200 only comes close in double speed mode (divisor 17: 117647 baud); 250000 divides 16 MHz exactly.
+    assert uart_baud_error(115200, 16_000_000) == pytest.approx(0.02124, abs=1e-5)
+    assert uart_baud_error(250000, 16_000_000) == 0.0
+    assert uart_baud_error(9600, 16_000_000) == pytest.approx(0.0016, abs=1e-4)
+    assert uart_baud_error(2000000, 8_000_000) == pytest.approx(1.0)  # Below the smallest divisor.
+
+
+def test_check_baud_rate():
+    check_baud_rate(115200, "arduino:avr:uno", 16_000_000)
+    check_baud_rate(250000, "arduino:avr:uno", 16_000_000)
+    with pytest.raises(ValueError, match="Unsupported baud rate"):
+        check_baud_rate(12345, "arduino:avr:uno", 16_000_000)
+    with pytest.raises(ValueError, match="8 MHz"):
+        check_baud_rate(115200, "arduino:avr:pro", 8_000_000)
+    assert uart_baud_error(115200, 8_000_000) > MAX_BAUD_ERROR
+    # Only AVR clocks are checked; unknown clocks are trusted.
+    check_baud_rate(115200, "esp32:esp32:esp32", 8_000_000)
+    check_baud_rate(115200, "arduino:avr:pro", None)
+
+
+def test_negotiable_baud_rates():
+    assert get_negotiable_baud_rates(9600, "arduino:avr:uno", 16_000_000) == [2000000, 1000000, 500000, 250000, 115200]  # Not 230400: 3.5% off.
+    assert get_negotiable_baud_rates(500000, "arduino:avr:uno", 16_000_000) == [2000000, 1000000]
+    assert 115200 not in get_negotiable_baud_rates(9600, "arduino:avr:pro", 8_000_000)
@@ -0,0 +1,65 @@
+# tests/test_device_client.py
+
+from src import device_client
+from src.code_generator import get_serial_buffer_size
+
+PROFILE = {"protocol": "ascii", "comm_map": {"speed": {"index": 0, "type": "shared"}, "angle": {"index": 1, "type": "shared"}}}
+
+
+def _ascii_device(values: dict):
+    """Answers S/G/M/Q lines the way the generated ASCII firmware does."""
+    def handle(line: str):
+        command, _, body = line.partition(":")
+        if command == "S":
+            index, value = body.split(":")
+            values[int(index)] = int(value)
+            return f"OK:S:{index}"
+        if command == "G":
+            return f"R:{body}:{values.get(int(body), 0)}"
+        if command == "M":
+            for entry in body.split(","):
+                index, value = entry.split("=")
+                values[int(index)] = int(value)
+            return f"OK:M:{len(body.split(','))}"
+        if command == "Q":
+            return "R:Q:" + ",".join(str(values.get(int(index), 0)) for index in body.split(","))
+    return handle
+
+
+def test_single_value_round_trip(fake_board):
+    board = fake_board(_ascii_device({}))
+    assert device_client.set_values(board.port, PROFILE, [(1, -12)]) == (True, "OK:S:1")
+    assert device_client.get_values(board.port, PROFILE, [1]) == (True, [-12])
+    assert board.lines == ["S:1:-12", "G:1"]
+
+
+def test_batches_are_split_to_fit_the_line_buffer(fake_board):
+    values = {}
+    board = fake_board(_ascii_device(values))
+    items = [(index, 1000 + index) for index in range(40)]
+    assert device_client.set_values(board.port, PROFILE, items) == (True, "OK:M:40")
+    assert values == dict(items)
+    assert len(board.lines) > 1
+    assert all(len(line) + 1 <= get_serial_buffer_size(PROFILE["comm_map"]) for line in board.lines)
+    assert device_client.get_values(board.port, PROFILE, [index for index, _ in reversed(items)]) == (True, [value for _, value in reversed(items)])
+
+
+def test_unexpected_response(fake_board):
+    board = fake_board(lambda line: "ERR")
+    success, message = device_client.set_values(board.port, PROFILE, [(0, 1)])
+    assert not success and "UNEXPECTED RESPONSE" in message
+
+
+def test_identify(fake_board):
+    board = fake_board(lambda line: "ID:0123456789abcdef" if line == "I:" else None)
+    assert device_client.identify(board.port) == (True, "0123456789abcdef")
+    silent = fake_board(lambda line: None)
+    success, message = device_client.identify(silent.port, timeout=0.2)
+    assert not success and "Timeout" in message
+
+
+def test_values_outside_int16_are_rejected(fake_board):
+    board = fake_board(_ascii_device({}))
+    success, message = device_client.set_values(board.port, PROFILE, [(0, 1), (1, 40000)])
+    assert not success and "40000" in message
+    assert board.lines == []
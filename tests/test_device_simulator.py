@@ -0,0 +1,136 @@
+# tests/test_device_simulator.py
+
+"""The serial path end to end against SimulatedDevice, in both protocols."""
+
+import time
+import pytest
+from src import device_client
+from src import protocol_codec as codec
+from src.code_generator import create_communication_map
+from src.device_simulator import SimulatedDevice
+from src.serial_communicator import connection_pool
+
+CODE_BLOCK = {
+    "setup_pins": {13, 9},
+    "pin_states": {"state_pin_13": {"type": "digital", "value": "LOW"}, "state_pin_9": {"type": "analog", "value": 0}},
+    "shared_variable_names": [f"v{i}" for i in range(80)],
+}
+COMM_MAP = create_communication_map(CODE_BLOCK)
+
+
+@pytest.fixture(params=["ascii", "binary"])
+def device(request):
+    with SimulatedDevice(COMM_MAP, protocol=request.param, fingerprint="0123456789abcdef") as device:
+        yield device, {"protocol": request.param, "comm_map": COMM_MAP}
+    connection_pool.close_all()
+
+
+def test_single_values(device):
+    device, profile = device
+    speed, pwm = COMM_MAP["v0"]["index"], COMM_MAP["state_pin_9"]["index"]
+    assert device_client.set_values(device.port, profile, [(speed, -7)])[0]
+    assert device_client.set_values(device.port, profile, [(pwm, 300)])[0]
+    assert device_client.get_values(device.port, profile, [speed]) == (True, [-7])
+    assert device_client.get_values(device.port, profile, [pwm]) == (True, [255])  # Clamped like the firmware.
+
+
+def test_batches_larger_than_the_buffer(device):
+    device, profile = device
+    items = [(details["index"], 1000 + details["index"]) for name, details in COMM_MAP.items() if name.startswith("v")]
+    assert device_client.set_values(device.port, profile, items)[0]
+    assert device.commands_handled > 1  # Split into several frames.
+    success, values = device_client.get_values(device.port, profile, [index for index, _ in items])
+    assert success and values == [value for _, value in items]
+
+
+def test_identify(device):
+    device, profile = device
+    assert device_client.identify(device.port, profile["protocol"]) == (True, "0123456789abcdef")
+
+
+def test_noise_is_reported_not_raised():
+    with SimulatedDevice(COMM_MAP, protocol="binary", noise=1.0, seed=1) as device:
+        success, message = device_client.get_values(device.port, {"protocol": "binary", "comm_map": COMM_MAP}, [0])
+    connection_pool.close_all()
+    assert not success and message.startswith("❌ ERROR")
+
+
+def _simulated_reply(frame: bytes) -> bytes:
+    device = SimulatedDevice({"my_variable": {"index": 0, "type": "shared"}}, protocol="binary")
+    sent = []
+    device._send = sent.append  # Capture replies instead of writing to a pty.
+    device._handle_frame(frame)
+    assert len(sent) == 1
+    return sent[0][:-1]
+
+
+def test_bad_crc_request_is_nakked():
+    body = codec.cobs_decode(codec.encode_set(0, 5)[:-1])
+    reply = _simulated_reply(codec.cobs_encode(body[:-1] + bytes([body[-1] ^ 0xFF])))
+    assert codec.decode_frame(reply) == (codec.OP_NAK, bytes([1]))
+
+
+def test_unknown_index_is_a_bad_request():
+    reply = _simulated_reply(codec.encode_get(5)[:-1])
+    assert codec.decode_frame(reply) == (codec.OP_NAK, bytes([2]))
+
+
+def test_requests_lost_in_a_reset_are_resent(device):
+    device, profile = device
+    index = COMM_MAP["v1"]["index"]
+    assert device_client.set_values(device.port, profile, [(index, 5)])[0]
+    # The board resets and drops everything it receives while its bootloader runs.
+    device.reboot(boot_time=0.2)
+    success, values = device_client.get_values(device.port, profile, [index])
+    assert success and values == [0]  # Answered after READY, by the rebooted board.
+
+
+def test_replies_are_not_delayed_by_polling(device):
+    device, profile = device
+    device_client.get_values(device.port, profile, [0])  # Opens the port.
+    started = time.perf_counter()
+    for _ in range(20):
+        assert device_client.get_values(device.port, profile, [0])[0]
+    assert time.perf_counter() - started < 0.5
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+def test_array_ranges(protocol):
+    code_block = {"setup_pins": set(), "pin_states": {}, "shared_variable_names": ["speed"],
+                  "array_variables": {"levels": {"length": 32, "element_type": "int16"}}}
+    comm_map = create_communication_map(code_block)
+    profile = {"protocol": protocol, "comm_map": comm_map}
+    levels = comm_map["levels"]["index"]
+    values = [-32768 + 1000 * i for i in range(32)]
+    with SimulatedDevice(comm_map, protocol=protocol) as device:
+        assert device_client.set_range(device.port, profile, levels, values) == (True, "OK:W:32")
+        assert device.commands_handled == 1  # A whole array is one request.
+        assert device_client.get_range(device.port, profile, levels, 32) == (True, values)
+        assert device_client.get_range(device.port, profile, levels + 30, 2) == (True, values[30:])
+        assert not device_client.set_range(device.port, profile, levels + 31, [1, 2])[0]
+    connection_pool.close_all()
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+def test_baud_negotiation(protocol):
+    profile = {"protocol": protocol, "comm_map": COMM_MAP, "fingerprint": "0123456789abcdef", "baud_rate": 9600}
+    with SimulatedDevice(COMM_MAP, protocol=protocol, baudrate=9600, fingerprint="0123456789abcdef") as device:
+        connection_pool.set_baudrate(device.port, 9600)
+        assert device_client.negotiate_baud_rate(device.port, profile, [1000000, 250000]) == (True, 1000000)
+        assert device.baudrate == 1000000 and connection_pool.get_baudrate(device.port) == 1000000
+        assert device_client.set_values(device.port, profile, [(0, 5)])[0]
+        assert device_client.get_values(device.port, profile, [0]) == (True, [5])
+    connection_pool.forget_baudrate(device.port)
+    connection_pool.close_all()
+
+
+def test_baud_negotiation_stays_with_the_board():
+    # The identify confirms the new rate on the board even though the firmware is not the profile's.
+    profile = {"protocol": "ascii", "comm_map": COMM_MAP, "fingerprint": "other firmware", "baud_rate": 9600}
+    with SimulatedDevice(COMM_MAP, baudrate=9600) as device:
+        connection_pool.set_baudrate(device.port, 9600)
+        success, message = device_client.negotiate_baud_rate(device.port, profile, [250000])
+        assert not success and "other firmware" in message
+        assert device.baudrate == connection_pool.get_baudrate(device.port) == 250000
+    connection_pool.forget_baudrate(device.port)
+    connection_pool.close_all()
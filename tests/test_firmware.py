@@ -0,0 +1,269 @@
+# tests/test_firmware.py
+
+"""Generated sketches compiled and run on the host (see tests/firmware)."""
+
+from src import protocol_codec as codec
+from src.code_generator import (generate_arduino_code, create_communication_map, create_sequence_map, get_firmware_fingerprint,
+                                FINGERPRINT_PLACEHOLDER)
+from src.firmware_runtime import get_runtime_library_files
+
+CODE_BLOCK = {
+    "setup_pins": {13, 9},
+    "pin_states": {"state_pin_13": {"type": "digital", "value": "LOW"}, "state_pin_9": {"type": "analog", "value": 0}},
+    "shared_variable_names": ["speed", "angle"],
+}
+RUNTIME = get_runtime_library_files()
+
+
+def _sketch(code_block=CODE_BLOCK, **options):
+    comm_map = create_communication_map(code_block)
+    return generate_arduino_code(code_block, 10, comm_map, **options), comm_map
+
+
+def _lines(output: bytes) -> list[str]:
+    """What an ASCII sketch printed after announcing READY at the end of setup()."""
+    lines = output.decode().split()
+    assert lines[0] == "READY"
+    return lines[1:]
+
+
+def _frames(output: bytes) -> list[bytes]:
+    """The frames a binary sketch sent after its OP_READY announcement."""
+    frames = [frame for frame in output.split(codec.FRAME_DELIMITER) if frame]
+    assert codec.decode_frame(frames[0])[0] == codec.OP_READY
+    return frames[1:]
+
+
+def test_set_and_get(build_firmware):
+    sketch, comm_map = _sketch()
+    speed, pin = comm_map["speed"]["index"], comm_map["state_pin_13"]["index"]
+    output, pins = build_firmware(sketch, RUNTIME).run(f"S:{speed}:42\nG:{speed}\nS:{pin}:1\n".encode(), loops=20)
+    assert _lines(output) == [f"OK:S:{speed}", f"R:{speed}:42", f"OK:S:{pin}"]
+    assert "D13=1" in pins
+
+
+def test_batch_set_and_get(build_firmware):
+    sketch, comm_map = _sketch()
+    speed, angle, pwm = comm_map["speed"]["index"], comm_map["angle"]["index"], comm_map["state_pin_9"]["index"]
+    output, pins = build_firmware(sketch, RUNTIME).run(f"M:{speed}=7,{angle}=-3,{pwm}=128\nQ:{angle},{speed},{pwm}\n".encode(), loops=20)
+    assert _lines(output) == ["OK:M:3", "R:Q:-3,7,128"]
+    assert "A9=128" in pins
+
+
+def test_unknown_index_is_ignored(build_firmware):
+    sketch, comm_map = _sketch()
+    output, _ = build_firmware(sketch, RUNTIME).run(f"S:{len(comm_map)}:1\nM:99=1,0=5\nQ:0\n".encode(), loops=20)
+    assert _lines(output) == ["OK:M:1", "R:Q:5"]
+
+
+
+
+def test_binary_set_and_get(build_firmware):
+    sketch, comm_map = _sketch(protocol="binary")
+    speed, angle, pwm = comm_map["speed"]["index"], comm_map["angle"]["index"], comm_map["state_pin_9"]["index"]
+    requests = [codec.encode_set(speed, -300), codec.encode_get(speed),
+                codec.encode_set_many([(angle, 7), (pwm, 128)]), codec.encode_get_many([pwm, angle, speed])]
+    output, pins = build_firmware(sketch, RUNTIME).run(b"".join(requests), loops=20)
+    set_reply, get_reply, many_reply, query_reply = _frames(output)
+    assert codec.decode_set_reply(set_reply) == speed
+    assert codec.decode_get_reply(get_reply) == (speed, -300)
+    assert codec.decode_set_many_reply(many_reply) == 2
+    assert codec.decode_get_many_reply(query_reply) == [128, 7, -300]
+    assert "A9=128" in pins
+
+
+def test_binary_bad_crc_is_nakked(build_firmware):
+    sketch, _ = _sketch(protocol="binary")
+    body = codec.cobs_decode(codec.encode_get(0)[:-1])
+    corrupted = codec.cobs_encode(body[:-1] + bytes([body[-1] ^ 0xFF])) + codec.FRAME_DELIMITER
+    output, _ = build_firmware(sketch, RUNTIME).run(corrupted + codec.encode_get(0), loops=20)
+    nak, reply = _frames(output)
+    assert codec.decode_frame(nak) == (codec.OP_NAK, bytes([1]))
+    assert codec.decode_get_reply(reply) == (0, 0)
+
+
+def test_identify_reports_the_embedded_fingerprint(build_firmware):
+    for protocol in ("ascii", "binary"):
+        sketch, _ = _sketch(protocol=protocol)
+        fingerprint = get_firmware_fingerprint(sketch)
+        assert fingerprint and FINGERPRINT_PLACEHOLDER not in sketch
+        request = codec.encode_identify() if protocol == "binary" else b"I:\n"
+        output, _ = build_firmware(sketch, RUNTIME).run(request, loops=20)
+        if protocol == "binary":
+            assert codec.decode_identify_reply(_frames(output)[0]) == fingerprint
+        else:
+            assert _lines(output) == [f"ID:{fingerprint}"]
+
+
+def test_fingerprint_tracks_code_and_comm_map():
+    sketch, comm_map = _sketch()
+    assert get_firmware_fingerprint(_sketch()[0]) == get_firmware_fingerprint(sketch)
+    assert get_firmware_fingerprint(_sketch(protocol="binary")[0]) != get_firmware_fingerprint(sketch)
+    other = dict(CODE_BLOCK, shared_variable_names=["speed", "angle", "gain"])
+    assert get_firmware_fingerprint(_sketch(other)[0]) != get_firmware_fingerprint(sketch)
+    assert get_firmware_fingerprint("void setup() {}") is None
+
+
+def test_runtime_changes_reach_the_fingerprint(monkeypatch):
+    from src import firmware_runtime
+    sketch, _ = _sketch()
+    assert f'COMFY_RUNTIME_VERSION "{firmware_runtime.get_runtime_version()}"' in sketch
+    monkeypatch.setattr(firmware_runtime, "ASCII_SOURCE", firmware_runtime.ASCII_SOURCE + "\n// changed\n")
+    assert get_firmware_fingerprint(_sketch()[0]) != get_firmware_fingerprint(sketch)
+
+
+def test_ascii_telemetry(build_firmware):
+    sketch, comm_map = _sketch()
+    speed, angle = comm_map["speed"]["index"], comm_map["angle"]["index"]
+    output, _ = build_firmware(sketch, RUNTIME).run(f"S:{speed}:5\nT:10:{speed},{angle}\n".encode(), loops=35)
+    lines = _lines(output)
+    assert lines[:2] == [f"OK:S:{speed}", "OK:T:2"]
+    samples = [line.split(":") for line in lines[2:]]
+    assert len(samples) >= 2 and all(tag == "D" and values == "5,0" for tag, _, values in samples)
+    times = [int(device_ms) for _, device_ms, _ in samples]
+    assert all(later - earlier >= 10 for earlier, later in zip(times, times[1:]))
+
+
+def test_binary_telemetry(build_firmware):
+    sketch, comm_map = _sketch(protocol="binary")
+    angle = comm_map["angle"]["index"]
+    output, _ = build_firmware(sketch, RUNTIME).run(codec.encode_set(angle, -9) + codec.encode_subscribe(10, [angle]), loops=35)
+    frames = _frames(output)
+    assert codec.decode_subscribe_reply(frames[1]) == 1
+    telemetry = [codec.decode_frame(frame) for frame in frames[2:]]
+    assert len(telemetry) >= 2 and all(opcode == codec.OP_TELEMETRY for opcode, _ in telemetry)
+    assert all(codec.decode_telemetry_payload(payload)[1] == [-9] for _, payload in telemetry)
+
+
+def test_outputs_are_applied_at_cadence_and_only_when_changed(build_firmware):
+    sketch, comm_map = _sketch()  # cadence_ms=10
+    pin, pwm, speed = comm_map["state_pin_13"]["index"], comm_map["state_pin_9"]["index"], comm_map["speed"]["index"]
+    serial_input = f"S:{pin}:1\n\x0215\x02S:{pin}:1\nS:{speed}:3\n\x0225\x02S:{pwm}:50\n"
+    _, pins = build_firmware(sketch, RUNTIME).run(serial_input.encode(), loops=40, timed=True)
+    writes = [entry for entry in pins.split(";") if entry and not entry.startswith("BAUD")]
+    # Initial states once in setup(), then only the outputs that changed, on cadence ticks.
+    assert writes == ["D13=0@0", "A9=0@0", "D13=1@10", "A9=50@30"]
+
+
+def test_shared_values_are_clamped_to_their_type(build_firmware):
+    for shared_type, expected in (("int16", ["32767", "-32768"]), ("int8", ["127", "-128"]), ("uint8", ["255", "0"])):
+        sketch, comm_map = _sketch(shared_type=shared_type)
+        speed, angle = comm_map["speed"]["index"], comm_map["angle"]["index"]
+        output, _ = build_firmware(sketch, RUNTIME).run(f"M:{speed}=99999,{angle}=-99999\nQ:{speed},{angle}\n".encode(), loops=20)
+        assert _lines(output)[-1] == "R:Q:" + ",".join(expected), shared_type
+
+
+def test_sequence_tags_are_echoed(build_firmware):
+    sketch, comm_map = _sketch()
+    speed = comm_map["speed"]["index"]
+    output, _ = build_firmware(sketch, RUNTIME).run(f"#7|S:{speed}:4\n#8|G:{speed}\nI:\n".encode(), loops=20)
+    lines = _lines(output)
+    assert lines[:2] == [f"#7|OK:S:{speed}", f"#8|R:{speed}:4"] and lines[2].startswith("ID:")
+
+    sketch, _ = _sketch(protocol="binary")
+    requests = codec.tag_frame(codec.encode_set(speed, 4), 200) + codec.tag_frame(codec.encode_get(99), 201)
+    output, _ = build_firmware(sketch, RUNTIME).run(requests, loops=20)
+    (seq_set, set_reply), (seq_nak, nak) = [codec.untag_frame(frame) for frame in _frames(output)]
+    assert (seq_set, codec.decode_set_reply(set_reply)) == (200, speed)
+    assert seq_nak == 201 and codec.decode_frame(nak) == (codec.OP_NAK, bytes([2]))
+
+
+def _frame_sketch(output: str, width: int, color_order: str, pins: list[int], **options):
+    code_block = {"setup_pins": set(), "pin_states": {}, "shared_variable_names": [],
+                  "frame_buffers": {"strip": {"output": output, "width": width, "height": 1, "color_order": color_order,
+                                              "pins": pins, "serpentine": False}}}
+    return _sketch(code_block, **options)[0]
+
+
+def test_pwm_frame_is_shown_on_commit(build_firmware):
+    sketch = _frame_sketch("pwm", 2, "mono", [3, 5])
+    # 8-bit values written without commit, then a 1-bit frame (flags 7: packing 3, commit).
+    output, pins = build_firmware(sketch, RUNTIME).run(b"F:0:0:0:80ff\nF:0:0:7:80\n", loops=20)
+    assert _lines(output) == ["OK:F:2:0", "OK:F:2:2"]
+    assert pins.endswith(";A3=0;A5=0;A3=255;A5=0;")  # Dark at boot, never the uncommitted frame.
+
+
+def test_torn_frame_is_not_shown(build_firmware):
+    sketch = _frame_sketch("pwm", 4, "mono", [3, 5, 6, 9])
+    output, pins = build_firmware(sketch, RUNTIME).run(b"F:0:0:0:0102\nF:0:3:1:04\nF:1:0:1:00\n", loops=20)
+    assert _lines(output) == ["OK:F:2:0", "OK:F:1:0"]  # The chunk for value 2 went missing; frame 1 does not exist.
+    assert "A3=1" not in pins
+
+
+def test_binary_neopixel_frame(build_firmware):
+    sketch = _frame_sketch("neopixel", 2, "GRB", [6], protocol="binary")
+    output, pins = build_firmware(sketch, RUNTIME).run(codec.encode_frame_write(0, 0, 8, True, bytes(range(1, 7))), loops=20)
+    assert [codec.decode_frame_write_reply(frame) for frame in _frames(output)] == [(6, 6)]
+    assert pins.endswith("NEO6=010203040506;")
+
+
+ARRAY_BLOCK = {"setup_pins": set(), "pin_states": {}, "shared_variable_names": ["speed"],
+               "array_variables": {"levels": {"length": 32, "element_type": "int16"}, "mask": {"length": 3, "element_type": "uint8"}}}
+
+
+def test_ascii_array_ranges(build_firmware):
+    sketch, comm_map = _sketch(ARRAY_BLOCK)
+    levels, mask = comm_map["levels"]["index"], comm_map["mask"]["index"]
+    values = [-32768 + i for i in range(32)]
+    requests = (f"W:{levels}:" + ",".join(map(str, values)) + f"\nA:{levels}:32\nW:{mask}:-5,300,7\nA:{mask}:3\n"
+                f"W:{mask + 2}:1,2\n")  # Past the end: rejected whole.
+    output, _ = build_firmware(sketch, RUNTIME).run(requests.encode(), loops=20)
+    assert _lines(output) == ["OK:W:32", f"R:A:{levels}:" + ",".join(map(str, values)), "OK:W:3", f"R:A:{mask}:0,255,7"]
+
+
+def test_binary_array_ranges(build_firmware):
+    sketch, comm_map = _sketch(ARRAY_BLOCK, protocol="binary")
+    levels, mask = comm_map["levels"]["index"], comm_map["mask"]["index"]
+    values = list(range(-16, 16))
+    requests = [codec.encode_set_range(levels, values), codec.encode_get_range(levels, 32), codec.encode_get_range(mask + 2, 2)]
+    output, _ = build_firmware(sketch, RUNTIME).run(b"".join(requests), loops=20)
+    set_reply, get_reply, nak = _frames(output)
+    assert codec.decode_set_range_reply(set_reply) == 32
+    assert codec.decode_get_range_reply(get_reply) == (levels, values)
+    assert codec.decode_frame(nak)[0] == codec.OP_NAK
+
+
+def _sequence_sketch(storage: str, keyframes: list, **options):
+    code_block = {"setup_pins": set(), "pin_states": {}, "shared_variable_names": ["speed"],
+                  "sequences": {"fade": {"keyframes": keyframes, "storage": storage, "loop": False,
+                                         "autoplay": storage == "progmem", "capacity": 4 if storage == "stream" else 0}}}
+    comm_map = create_communication_map(code_block)
+    return generate_arduino_code(code_block, 10, comm_map, sequence_map=create_sequence_map(code_block, comm_map), **options)
+
+
+def test_baked_sequence_plays_from_boot(build_firmware):
+    sketch = _sequence_sketch("progmem", [(0, "speed", 0, "linear"), (100, "speed", 100, "step")])
+    serial_input = "\x0250\x02G:0\n\x02150\x02G:0\nP:0:4\n"
+    output, _ = build_firmware(sketch, RUNTIME).run(serial_input.encode(), loops=40, step_ms=5, timed=True)
+    halfway, done, status = _lines(output)
+    assert 40 <= int(halfway.split(":")[2]) <= 60
+    assert done == "R:0:100"
+    assert status.startswith("OK:P:")
+
+
+def test_streamed_sequence(build_firmware):
+    sketch = _sequence_sketch("stream", [])
+    serial_input = "K:0:0,0,0,7,7;20,0,0,-3,-3\nP:0:1\n\x0210\x02G:0\n\x0240\x02G:0\n"
+    output, _ = build_firmware(sketch, RUNTIME).run(serial_input.encode(), loops=20, step_ms=5, timed=True)
+    append, play, first, second = _lines(output)
+    assert append == "OK:K:2:2"
+    assert play.startswith("OK:P:1:")  # Playing.
+    assert (first, second) == ("R:0:7", "R:0:-3")
+
+
+def test_baud_switch_falls_back_without_identify(build_firmware):
+    sketch, _ = _sketch(baud_rate=9600)
+    output, log = build_firmware(sketch, RUNTIME).run(b"B:115200\n", loops=150, step_ms=10, timed=True)
+    assert _lines(output) == ["OK:B:115200"]
+    bauds = [entry for entry in log.split(";") if entry.startswith("BAUD=")]
+    assert [entry.split("@")[0] for entry in bauds] == ["BAUD=9600", "BAUD=115200", "BAUD=9600"]
+    switched, fell_back = (int(entry.split("@")[1]) for entry in bauds[1:])
+    assert fell_back - switched >= 1000
+
+
+def test_baud_switch_is_kept_once_confirmed(build_firmware):
+    sketch, _ = _sketch(protocol="binary", baud_rate=9600)
+    output, log = build_firmware(sketch, RUNTIME).run(codec.encode_baud(250000) + codec.encode_identify(), loops=150, step_ms=10)
+    baud_reply, _ = _frames(output)
+    assert codec.decode_baud_reply(baud_reply) == 250000
+    assert [entry for entry in log.split(";") if entry.startswith("BAUD=")] == ["BAUD=9600", "BAUD=250000"]
@@ -0,0 +1,70 @@
+# tests/test_frame_buffer.py
+
+import numpy as np
+import pytest
+from src import device_client
+from src.code_generator import create_communication_map, create_frame_map
+from src.device_simulator import SimulatedDevice
+from src.frame_buffer import image_to_values, list_to_values, quantize_and_pack, wire_bits
+from src.serial_communicator import connection_pool
+
+
+def _frame(width: int, height: int, color_order: str = "RGB", serpentine: bool = False) -> dict:
+    channels = 1 if color_order == "mono" else 3
+    return {"id": 0, "width": width, "height": height, "color_order": color_order, "serpentine": serpentine,
+            "channels": channels, "length": width * height * channels}
+
+
+def test_area_resize_averages_source_pixels():
+    image = np.zeros((1, 4, 4, 3), dtype=np.float32)
+    image[0, :2, :2] = 1.0  # Top-left quarter white.
+    values = image_to_values(image, _frame(2, 2, "mono"))
+    assert values.tolist() == pytest.approx([1.0, 0.0, 0.0, 0.0])
+
+
+def test_upscaling_repeats_pixels():
+    image = np.array([[[0.0], [1.0]]], dtype=np.float32)
+    assert image_to_values(image, _frame(4, 1, "mono")).tolist() == [0.0, 0.0, 1.0, 1.0]
+
+
+def test_color_order_and_serpentine_rows():
+    grid = "[1, 0, 0,  0, 1, 0,  0, 0, 1,  1, 1, 1]"  # 2x2 RGB: red, green / blue, white.
+    values = list_to_values(grid, _frame(2, 2, "GRB", serpentine=True))
+    # GRB order; the second row runs backwards.
+    assert values.tolist() == [0, 1, 0,  1, 0, 0,  1, 1, 1,  0, 0, 1]
+
+
+def test_gray_list_fills_every_channel():
+    assert list_to_values("0.5, 1", _frame(2, 1)).tolist() == [0.5] * 3 + [1.0] * 3
+    with pytest.raises(ValueError):
+        list_to_values("0.5, 1, 0", _frame(2, 1))
+
+
+def test_quantize_and_pack():
+    values = np.array([0.0, 1.0, 1.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0], dtype=np.float32)
+    assert quantize_and_pack(values, bit_depth=1) == (bytes([0b01101001, 0b10000000]), 1)
+    assert quantize_and_pack(np.array([0.5, 1.0]), bit_depth=8, brightness=0.5) == (bytes([64, 128]), 8)
+    assert quantize_and_pack(np.array([0.25]), bit_depth=8, gamma=2.0)[0] == bytes([16])
+    assert wire_bits(3) == 4 and wire_bits(5) == 8
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+@pytest.mark.parametrize("bit_depth", [8, 4, 1])
+def test_write_frame_in_chunks(protocol, bit_depth):
+    code_block = {"setup_pins": set(), "pin_states": {}, "shared_variable_names": ["speed"],
+                  "frame_buffers": {"matrix": {"output": "neopixel", "width": 16, "height": 16, "color_order": "GRB",
+                                               "pins": [6], "serpentine": True}}}
+    comm_map, frame_map = create_communication_map(code_block), create_frame_map(code_block)
+    frame = frame_map["matrix"]
+    values = np.random.default_rng(0).random(frame["length"], dtype=np.float32)
+    data, bits = quantize_and_pack(values, bit_depth)
+    profile = {"protocol": protocol, "comm_map": comm_map, "frame_map": frame_map}
+    with SimulatedDevice(comm_map, protocol=protocol, frame_map=frame_map) as device:
+        success, message = device_client.write_frame(device.port, profile, frame["id"], frame["length"], data, bits)
+    connection_pool.close_all()
+    assert success, message
+    if bit_depth == 8:
+        assert int(message.split(":")[3]) > 1  # 768 bytes do not fit one request.
+    levels = (1 << bits) - 1
+    expected = np.rint(np.rint(values * ((1 << bit_depth) - 1)) * (levels / ((1 << bit_depth) - 1))).astype(int) * (255 // levels)
+    assert list(device.shown_frames[frame["id"]]) == expected.tolist()
@@ -0,0 +1,58 @@
+# tests/test_metrics.py
+
+import json
+import pytest
+from src.metrics import MetricsRegistry, metrics
+from src.serial_communicator import send_and_receive
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry()
+    with registry.timer("x"):
+        pass
+    registry.inc("y")
+    assert registry.snapshot() == {"enabled": False, "histograms": [], "counters": []}
+    assert registry.to_text() == "No metrics recorded yet. Collection is disabled."
+
+
+def test_histograms_and_counters():
+    registry = MetricsRegistry(enabled=True)
+    for seconds in (0.0004, 0.003, 0.003, 2.0):
+        registry.observe("serial_transaction_seconds", seconds, port="COM3", command="S")
+    registry.inc("serial_timeouts_total", port="COM3")
+    registry.inc("serial_timeouts_total", port="COM3")
+    histogram = registry.snapshot()["histograms"][0]
+    assert histogram["count"] == 4 and histogram["labels"] == {"command": "S", "port": "COM3"}
+    assert histogram["p50"] == 0.005 and histogram["max"] == 2.0
+    assert registry.snapshot()["counters"][0]["value"] == 2
+
+    text = registry.to_prometheus()
+    assert "# TYPE arduino_serial_transaction_seconds histogram" in text
+    assert 'arduino_serial_transaction_seconds_bucket{command="S",port="COM3",le="+Inf"} 4' in text
+    assert 'arduino_serial_timeouts_total{port="COM3"} 2' in text
+
+
+def test_dump(tmp_path):
+    registry = MetricsRegistry(enabled=True)
+    registry.inc("cli_failures_total", command="core list")
+    registry.dump(str(tmp_path / "metrics.json"), fmt="json")
+    assert json.loads((tmp_path / "metrics.json").read_text())["counters"][0]["labels"] == {"command": "core list"}
+
+
+@pytest.fixture
+def enabled_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+def test_serial_transactions_are_instrumented(fake_board, enabled_metrics):
+    board = fake_board(lambda line: "OK:S:0" if line.startswith("S:") else None)
+    assert send_and_receive(board.port, "S:0:1\n")[0]
+    assert not send_and_receive(board.port, "G:0\n", timeout=0.1)[0]
+    snapshot = enabled_metrics.snapshot()
+    transactions = {h["labels"]["command"]: h["count"] for h in snapshot["histograms"] if h["name"] == "serial_transaction_seconds"}
+    assert transactions == {"S": 1, "G": 1}
+    counters = {c["name"]: c["value"] for c in snapshot["counters"]}
+    assert counters["serial_timeouts_total"] == 1 and counters["serial_bytes_sent_total"] == 10
@@ -0,0 +1,63 @@
+# tests/test_port_registry.py
+
+from types import SimpleNamespace
+import pytest
+from src import port_registry
+from src.port_registry import PortRegistry
+
+
+def _port(device, vid=None, pid=None, description="USB Serial"):
+    return SimpleNamespace(device=device, description=description, vid=vid, pid=pid, serial_number=None)
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    """The ports the fake enumeration reports; tests edit the list in place."""
+    current = []
+    released = []
+    monkeypatch.setattr(port_registry.serial.tools.list_ports, "comports", lambda: list(current))
+    monkeypatch.setattr(port_registry, "release_port", released.append)
+    return current, released
+
+
+def test_scan_and_hotplug(ports):
+    current, released = ports
+    registry = PortRegistry()
+    assert registry.port_labels() == [port_registry.SCANNING_MESSAGE]
+    registry.refresh()
+    assert registry.port_labels() == [port_registry.NO_PORTS_MESSAGE]
+
+    current.append(_port("/dev/ttyACM0", 0x2341, 0x0043, "Arduino Uno"))
+    registry.refresh()  # Debounced: the previous scan is too recent.
+    assert registry.port_labels() == [port_registry.NO_PORTS_MESSAGE]
+    registry.refresh(force=True)
+    assert registry.port_labels() == ["/dev/ttyACM0 - Arduino Uno"]
+
+    current.clear()
+    registry.refresh(force=True)
+    assert released == ["/dev/ttyACM0"]
+
+
+def test_detection_prefers_vid_pid_and_queries_cli_once_per_port_set(ports, monkeypatch):
+    current, _ = ports
+    current += [_port("/dev/ttyACM0", 0x2341, 0x0042), _port("/dev/ttyUSB0", 0x1A86, 0x7523)]
+    calls = []
+
+    def run(cli_path, config_path, args, expect_json=False):
+        calls.append(args)
+        return True, {"detected_ports": [{"port": {"address": "/dev/ttyUSB0"}, "matching_boards": [{"fqbn": "arduino:avr:nano"}]}]}
+
+    monkeypatch.setattr(port_registry, "run_cli_command", run)
+    registry = PortRegistry()
+    registry.set_cli("cli", "config")
+    registry.refresh(force=True)
+    registry.refresh(force=True)
+    assert registry.detect_fqbn("/dev/ttyACM0") == "arduino:avr:mega"
+    assert registry.detect_fqbn("/dev/ttyUSB0") == "arduino:avr:nano"
+    assert registry.detect_fqbn("/dev/ttyS9") is None
+    assert len(calls) == 1
+
+
+def test_parse_old_board_list_layout():
+    data = [{"port": {"address": "COM3", "boards": [{"fqbn": "arduino:avr:uno"}]}}, {"port": {"address": "COM4"}}]
+    assert port_registry._parse_board_list(data) == {"COM3": "arduino:avr:uno"}
@@ -0,0 +1,85 @@
+# tests/test_profile_store.py
+
+import json
+import pytest
+from src import profile_store
+from src.profile_store import ProfileStore
+
+PROFILE = {"port": "/dev/ttyACM0", "protocol": "ascii", "fingerprint": "abc123", "comm_map": {"speed": {"index": 0}}}
+
+
+@pytest.fixture
+def board(monkeypatch):
+    """Stands in for identify(); `answer` is the fingerprint the board reports, or None for no reply."""
+    state = {"answer": "abc123", "calls": 0}
+
+    def identify(port, protocol, timeout, tagged):
+        state["calls"] += 1
+        if state["answer"] is None:
+            return False, "❌ ERROR: No reply."
+        return True, state["answer"]
+
+    monkeypatch.setattr(profile_store, "identify", identify)
+    return state
+
+
+def _saved_store(tmp_path) -> ProfileStore:
+    path = str(tmp_path / profile_store.PROFILES_FILE_NAME)
+    ProfileStore(path)["/dev/ttyACM0"] = PROFILE
+    return ProfileStore(path)
+
+
+def test_profiles_survive_a_restart(tmp_path, board):
+    store = _saved_store(tmp_path)
+    with open(store.path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["version"] == profile_store.STORE_VERSION
+    assert list(store) == ["/dev/ttyACM0"]
+    assert store["/dev/ttyACM0"]["comm_map"] == PROFILE["comm_map"]
+
+
+def test_profiles_stored_this_session_are_not_verified(tmp_path, board):
+    store = ProfileStore(str(tmp_path / profile_store.PROFILES_FILE_NAME))
+    store["/dev/ttyACM0"] = PROFILE
+    assert "/dev/ttyACM0" in store
+    assert board["calls"] == 0
+
+
+def test_saved_profile_is_verified_once(tmp_path, board):
+    store = _saved_store(tmp_path)
+    assert store.lookup("/dev/ttyACM0")["fingerprint"] == "abc123"
+    assert store.lookup("/dev/ttyACM0") is not None
+    assert board["calls"] == 1
+    assert "verified_at" in store["/dev/ttyACM0"]
+
+
+def test_profile_for_other_firmware_is_dropped(tmp_path, board):
+    board["answer"] = "ffffff"
+    store = _saved_store(tmp_path)
+    assert store.lookup("/dev/ttyACM0") is None
+    assert len(store) == 0
+    assert len(ProfileStore(store.path)) == 0
+
+
+def test_unanswered_board_is_not_asked_again_right_away(tmp_path, board, monkeypatch):
+    board["answer"] = None
+    store = _saved_store(tmp_path)
+    assert store.lookup("/dev/ttyACM0") is None
+    assert store.lookup("/dev/ttyACM0") is None
+    assert board["calls"] == 1
+    assert len(store) == 1  # kept for when the board comes back
+
+    board["answer"] = "abc123"
+    clock = profile_store.time.monotonic() + profile_store.VERIFY_RETRY_INTERVAL
+    monkeypatch.setattr(profile_store.time, "monotonic", lambda: clock)
+    assert store.lookup("/dev/ttyACM0") is not None
+    assert board["calls"] == 2
+
+
+def test_unreadable_file_starts_empty(tmp_path, board):
+    path = tmp_path / profile_store.PROFILES_FILE_NAME
+    path.write_text("{not json", encoding="utf-8")
+    store = ProfileStore(str(path))
+    assert len(store) == 0
+    store["/dev/ttyUSB0"] = PROFILE
+    assert list(ProfileStore(str(path))) == ["/dev/ttyUSB0"]
@@ -0,0 +1,103 @@
+# tests/test_protocol_codec.py
+
+import pytest
+from src import protocol_codec as codec
+
+
+@pytest.mark.parametrize("data", [b"", b"\x00", b"\x00\x00", b"\x11\x22\x00\x33", bytes(range(1, 255)), bytes(range(256)) * 3])
+def test_cobs_round_trip(data):
+    encoded = codec.cobs_encode(data)
+    assert b"\x00" not in encoded
+    assert codec.cobs_decode(encoded) == data
+
+
+def test_cobs_rejects_truncated_block():
+    with pytest.raises(codec.FrameError):
+        codec.cobs_decode(b"\x05\x01\x02")
+
+
+def test_crc8_check_value():
+    # CRC-8 (poly 0x07, init 0x00) of "123456789".
+    assert codec.crc8(b"123456789") == 0xF4
+
+
+@pytest.mark.parametrize("value", [0, 1, 0x7F, 0x80, 300, 0x3FFF, 0x4000, 2 ** 32 - 1])
+def test_varint_round_trip(value):
+    encoded = codec.encode_varint(value)
+    assert codec.decode_varint(b"\xAA" + encoded, 1) == (value, 1 + len(encoded))
+
+
+def test_varint_errors():
+    with pytest.raises(ValueError):
+        codec.encode_varint(-1)
+    with pytest.raises(codec.FrameError):
+        codec.decode_varint(b"\x80\x80", 0)
+
+
+def test_value_range():
+    assert codec.decode_value(codec.encode_value(codec.VALUE_MIN), 0) == (codec.VALUE_MIN, 2)
+    with pytest.raises(ValueError):
+        codec.encode_value(codec.VALUE_MAX + 1)
+
+
+def test_frame_round_trip():
+    frame = codec.encode_set_many([(0, -5), (200, 32767)])
+    assert frame.endswith(codec.FRAME_DELIMITER) and frame.count(codec.FRAME_DELIMITER) == 1
+    opcode, payload = codec.decode_frame(frame[:-1])
+    assert opcode == codec.OP_SET_MANY
+    assert payload == codec.encode_varint(2) + codec.encode_varint(0) + codec.encode_value(-5) + codec.encode_varint(200) + codec.encode_value(32767)
+
+
+def _corrupt_crc(frame: bytes) -> bytes:
+    body = codec.cobs_decode(frame.rstrip(codec.FRAME_DELIMITER))
+    return codec.cobs_encode(body[:-1] + bytes([body[-1] ^ 0xFF]))
+
+
+def test_corrupted_frame_fails_crc():
+    with pytest.raises(codec.FrameError, match="CRC"):
+        codec.decode_frame(_corrupt_crc(codec.encode_get(3)))
+
+
+def test_replies():
+    reply = codec.encode_frame(codec.OP_GET | codec.REPLY_FLAG, codec.encode_varint(7) + codec.encode_value(-3))[:-1]
+    assert codec.decode_get_reply(reply) == (7, -3)
+    reply = codec.encode_frame(codec.OP_GET_MANY | codec.REPLY_FLAG, codec.encode_varint(2) + codec.encode_value(1) + codec.encode_value(2))[:-1]
+    assert codec.decode_get_many_reply(reply) == [1, 2]
+    with pytest.raises(codec.FrameError, match="Unexpected reply"):
+        codec.decode_set_reply(reply)
+
+
+def test_crc_nak_is_an_error():
+    nak = codec.encode_frame(codec.OP_NAK, bytes([1]))[:-1]
+    with pytest.raises(codec.FrameError, match="CRC mismatch"):
+        codec.decode_set_reply(nak)
+    with pytest.raises(codec.FrameError, match="CRC"):
+        codec.decode_get_reply(_corrupt_crc(codec.encode_frame(codec.OP_GET | codec.REPLY_FLAG, b"\x01\x02\x00")))
+
+
+def test_subscribe_and_telemetry():
+    opcode, payload = codec.decode_frame(codec.encode_subscribe(20, [3, 200])[:-1])
+    assert opcode == codec.OP_SUBSCRIBE
+    assert payload == codec.encode_varint(20) + codec.encode_varint(2) + codec.encode_varint(3) + codec.encode_varint(200)
+    telemetry = (123456).to_bytes(4, "little") + codec.encode_varint(2) + codec.encode_value(-1) + codec.encode_value(9)
+    assert codec.decode_telemetry_payload(telemetry) == (123456, [-1, 9])
+    with pytest.raises(codec.FrameError):
+        codec.decode_telemetry_payload(b"\x01\x02")
+
+
+def test_tag_round_trip():
+    tagged = codec.tag_frame(codec.encode_get(7), 42)
+    opcode, payload = codec.decode_frame(tagged[:-1])
+    assert opcode == codec.OP_GET | codec.SEQ_FLAG and payload[0] == 42
+    reply = codec.encode_frame(codec.OP_GET | codec.REPLY_FLAG | codec.SEQ_FLAG, bytes([42]) + codec.encode_varint(7) + codec.encode_value(-3))
+    seq, untagged = codec.untag_frame(reply[:-1])
+    assert seq == 42
+    assert codec.decode_get_reply(untagged) == (7, -3)
+
+
+def test_tagged_nak_carries_seq():
+    reply = codec.encode_frame(codec.OP_NAK, bytes([2, 9]))[:-1]
+    seq, untagged = codec.untag_frame(reply)
+    assert seq == 9
+    with pytest.raises(codec.FrameError, match="bad request"):
+        codec.decode_get_reply(untagged)
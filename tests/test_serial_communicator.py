@@ -0,0 +1,133 @@
+# tests/test_serial_communicator.py
+
+import threading
+import time
+import serial
+from serial.urlhandler import protocol_loop
+from src.serial_communicator import DEFAULT_WINDOW, READ_POLL_TIMEOUT, connection_pool, send_and_receive, send_and_receive_many, release_port
+
+
+def _count_opens(monkeypatch) -> list[str]:
+    opened = []
+    original = connection_pool._open
+    monkeypatch.setattr(connection_pool, "_open", lambda port: (opened.append(port), original(port))[1])
+    return opened
+
+
+def test_connection_is_reused(fake_board, monkeypatch):
+    board = fake_board(lambda line: f"ECHO:{line}")
+    opened = _count_opens(monkeypatch)
+    for i in range(3):
+        assert send_and_receive(board.port, f"G:{i}\n") == (True, f"ECHO:G:{i}")
+    assert opened == [board.port]
+
+
+def test_released_port_is_reopened(fake_board, monkeypatch):
+    board = fake_board(lambda line: "OK")
+    opened = _count_opens(monkeypatch)
+    assert send_and_receive(board.port, "I\n")[0]
+    release_port(board.port)
+    assert board.port not in connection_pool._connections
+    assert send_and_receive(board.port, "I\n")[0]
+    assert opened == [board.port, board.port]
+
+
+def test_silent_board_times_out(fake_board):
+    board = fake_board(lambda line: None)
+    success, message = send_and_receive(board.port, "I\n", timeout=0.2)
+    assert not success and board.port in message
+
+
+def test_idle_ports_are_closed(fake_board, monkeypatch):
+    board = fake_board(lambda line: "OK")
+    assert send_and_receive(board.port, "I\n")[0]
+    monkeypatch.setattr(connection_pool, "idle_timeout", 0.0)
+    connection_pool.close_idle()
+    assert board.port not in connection_pool._connections
+
+
+def test_missing_port_fails_cleanly():
+    success, message = send_and_receive("/dev/does-not-exist", "I\n", timeout=0.2)
+    assert not success and "/dev/does-not-exist" in message
+
+
+def test_replies_are_matched_by_tag(fake_board):
+    board = fake_board(lambda line: None)
+
+    def answer_in_reverse():
+        while len(board.lines) < 3:
+            time.sleep(0.01)
+        for tag, line in reversed(list(zip(board.tags, board.lines))):
+            board.send(f"{tag}R:{line[2:]}:{int(line[2:]) * 10}")
+
+    threading.Thread(target=answer_in_reverse, daemon=True).start()
+    results = send_and_receive_many(board.port, ["G:1\n", "G:2\n", "G:3\n"])
+    assert results == [(True, "R:1:10"), (True, "R:2:20"), (True, "R:3:30")]
+    assert len(set(board.tags)) == 3 and all(board.tags)
+
+
+def test_untagged_reply_goes_to_the_oldest_request(fake_board):
+    board = fake_board(lambda line: "ID:foreign" if line == "I:" else None)
+    assert send_and_receive(board.port, "I:\n", tagged=False) == (True, "ID:foreign")
+    assert board.tags == [""]
+
+
+def test_window_limits_requests_in_flight(fake_board):
+    in_flight = []
+    board = fake_board(lambda line: None)
+
+    def answer_slowly():
+        answered = 0
+        while answered < 8:
+            time.sleep(0.05)
+            in_flight.append(len(board.lines) - answered)
+            if len(board.lines) > answered:
+                board.send(f"{board.tags[answered]}OK:S:{answered}")
+                answered += 1
+
+    threading.Thread(target=answer_slowly, daemon=True).start()
+    results = send_and_receive_many(board.port, [f"S:{i}:1\n" for i in range(8)])
+    assert [reply for _, reply in results] == [f"OK:S:{i}" for i in range(8)]
+    assert max(in_flight) == DEFAULT_WINDOW
+
+
+def test_slow_open_does_not_block_other_ports(fake_board, monkeypatch):
+    fast = fake_board(lambda line: "OK")
+    opening = threading.Event()
+    original = connection_pool._open
+
+    def open_port(port):
+        if port == "/dev/slow-port":
+            opening.set()
+            time.sleep(1.0)
+            raise serial.SerialException("could not open port")
+        return original(port)
+
+    monkeypatch.setattr(connection_pool, "_open", open_port)
+    slow = threading.Thread(target=send_and_receive, args=("/dev/slow-port", "G:0\n"))
+    slow.start()
+    assert opening.wait(1.0)
+    started = time.monotonic()
+    assert send_and_receive(fast.port, "G:0\n") == (True, "OK")
+    assert time.monotonic() - started < 0.5
+    slow.join()
+
+
+def test_backend_without_cancel_read_polls(monkeypatch):
+    # loop:// echoes what is written, so each request is answered by itself.
+    monkeypatch.delattr(protocol_loop.Serial, "cancel_read")
+    assert send_and_receive("loop://", "G:0\n") == (True, "G:0")
+    assert connection_pool.get_serial("loop://").timeout == READ_POLL_TIMEOUT
+    started = time.monotonic()
+    release_port("loop://")
+    assert time.monotonic() - started < 0.5
+    assert not any(t.name == "arduino-serial-loop://" for t in threading.enumerate())
+
+
+def test_blocking_reads_are_cancelled_on_release():
+    assert send_and_receive("loop://", "G:0\n") == (True, "G:0")
+    assert connection_pool.get_serial("loop://").timeout is None
+    started = time.monotonic()
+    release_port("loop://")
+    assert time.monotonic() - started < 0.5
+    assert not any(t.name == "arduino-serial-loop://" for t in threading.enumerate())
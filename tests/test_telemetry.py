@@ -0,0 +1,52 @@
+# tests/test_telemetry.py
+
+import time
+from src import device_client, telemetry
+from src.serial_communicator import send_and_receive
+
+PROFILE = {"protocol": "ascii", "comm_map": {"speed": {"index": 0}, "angle": {"index": 1}}}
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def _streaming_board(line: str):
+    if line.startswith("T:"):
+        indices = line.split(":")[2]
+        return f"OK:T:{len(indices.split(',')) if indices else 0}"
+    if line == "G:1":
+        # Telemetry arriving before the reply must not be taken for it.
+        return "D:120:5,6\r\nR:1:6"
+
+
+def test_streamed_values_are_read_without_serial_io(fake_board):
+    board = fake_board(_streaming_board)
+    assert device_client.subscribe(board.port, PROFILE, [0, 1], 20) == (True, "OK:T:2")
+    assert device_client.get_streamed_values(board.port, [0, 1]) is None
+
+    board.send("D:100:5,6")
+    _wait_for(lambda: device_client.get_streamed_values(board.port, [0, 1]) is not None)
+    sent = len(board.lines)
+    values = device_client.get_streamed_values(board.port, [1, 0], max_staleness_ms=1000)
+    assert [value for value, _ in values] == [6, 5]
+    assert len(board.lines) == sent
+
+    time.sleep(0.05)
+    assert device_client.get_streamed_values(board.port, [0], max_staleness_ms=10) is None
+
+    assert send_and_receive(board.port, "G:1\n") == (True, "R:1:6")
+
+    assert device_client.subscribe(board.port, PROFILE, [], 0) == (True, "OK:T:0")
+    assert telemetry.get_stream(board.port) is None
+    assert device_client.get_streamed_values(board.port, [0]) is None
+
+
+def test_failed_subscription_stops_the_reader(fake_board):
+    board = fake_board(lambda line: "ERR")
+    success, message = device_client.subscribe(board.port, PROFILE, [0], 20)
+    assert not success and "UNEXPECTED RESPONSE" in message
+    assert telemetry.get_stream(board.port) is None
@@ -0,0 +1,121 @@
+# tests/test_write_coalescer.py
+
+"""PortWriteCoalescer against SimulatedDevice."""
+
+import time
+import pytest
+from src import write_coalescer
+from src.code_generator import create_communication_map
+from src.device_simulator import SimulatedDevice
+from src.serial_communicator import connection_pool, board_reset_count, release_port
+
+CODE_BLOCK = {"setup_pins": set(), "pin_states": {}, "shared_variable_names": ["speed", "angle"]}
+COMM_MAP = create_communication_map(CODE_BLOCK)
+SPEED, ANGLE = COMM_MAP["speed"]["index"], COMM_MAP["angle"]["index"]
+
+
+def _wait_for(condition, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture(params=["ascii", "binary"])
+def device(request):
+    with SimulatedDevice(COMM_MAP, protocol=request.param) as device:
+        yield device, {"protocol": request.param, "comm_map": COMM_MAP}
+        write_coalescer.stop_coalescer(device.port)
+    connection_pool.close_all()
+
+
+def test_only_the_latest_value_is_sent(device):
+    device, profile = device
+    coalescer = write_coalescer.get_coalescer(device.port, profile, flush_interval_ms=200)
+    for value in range(50):
+        coalescer.queue([(SPEED, value)])
+    _wait_for(lambda: device.values[SPEED] == 49)
+    assert device.commands_handled < 10
+
+
+def test_acknowledged_values_are_not_sent_again(device):
+    device, profile = device
+    coalescer = write_coalescer.get_coalescer(device.port, profile, flush_interval_ms=1)
+    assert not coalescer.queue([(SPEED, 5), (ANGLE, 7)])
+    _wait_for(lambda: device.values[SPEED] == 5 and device.values[ANGLE] == 7 and not coalescer._in_flight)
+    handled = device.commands_handled
+    assert coalescer.queue([(SPEED, 5), (ANGLE, 7)])
+    time.sleep(0.05)
+    assert device.commands_handled == handled
+
+
+def test_direct_writes_supersede_pending_ones(device):
+    device, profile = device
+    coalescer = write_coalescer.get_coalescer(device.port, profile, flush_interval_ms=1)
+    write_coalescer.record_sent(device.port, [(SPEED, 3)])
+    assert coalescer.queue([(SPEED, 3)])
+
+
+def test_board_restart_forgets_acknowledged_values(device):
+    device, profile = device
+    coalescer = write_coalescer.get_coalescer(device.port, profile, flush_interval_ms=1)
+    coalescer.queue([(SPEED, 9)])
+    _wait_for(lambda: device.values[SPEED] == 9 and not coalescer._in_flight)
+
+    resets = board_reset_count(device.port)
+    device.reboot()
+    _wait_for(lambda: board_reset_count(device.port) != resets)
+    assert not coalescer.queue([(SPEED, 9)])
+    _wait_for(lambda: device.values[SPEED] == 9)
+
+
+def test_new_profile_or_release_stops_the_coalescer(device):
+    device, profile = device
+    coalescer = write_coalescer.get_coalescer(device.port, profile)
+    assert write_coalescer.get_coalescer(device.port, profile) is coalescer
+    replacement = write_coalescer.get_coalescer(device.port, dict(profile))
+    assert coalescer.is_stopped and replacement is not coalescer
+    release_port(device.port)
+    assert replacement.is_stopped
+
+
+def test_failed_flush_is_retried(monkeypatch):
+    calls = []
+
+    def set_values(port, profile, items):
+        calls.append(items)
+        return (len(calls) > 1, "❌ ERROR: No reply.")
+
+    monkeypatch.setattr(write_coalescer, "set_values", set_values)
+    monkeypatch.setattr(write_coalescer, "RETRY_DELAY", 0.01)
+    coalescer = write_coalescer.PortWriteCoalescer("sim://retry", {"protocol": "ascii", "comm_map": COMM_MAP}, flush_interval_ms=1)
+    try:
+        coalescer.queue([(SPEED, 1)])
+        _wait_for(lambda: len(calls) == 2)
+        assert calls[1] == [(SPEED, 1)]
+        _wait_for(lambda: coalescer.last_error is None)
+    finally:
+        coalescer.stop()
+
+
+def test_sequence_driven_variables_are_always_sent(device):
+    device, profile = device
+    coalescer = write_coalescer.get_coalescer(device.port, profile, flush_interval_ms=1)
+    coalescer.queue([(SPEED, 4), (ANGLE, 4)])
+    _wait_for(lambda: device.values[SPEED] == 4 and device.values[ANGLE] == 4 and not coalescer._in_flight)
+
+    write_coalescer.mark_sequence_driven(device.port, [SPEED])
+    device.values[SPEED] = 99  # What a sequence playing on the board would do.
+    assert not coalescer.queue([(SPEED, 4)])
+    assert coalescer.queue([(ANGLE, 4)])
+    _wait_for(lambda: device.values[SPEED] == 4)
+    assert not coalescer.queue([(SPEED, 4)])  # Still not trusted after the flush.
+
+
+def test_autoplay_sequences_count_from_boot(device):
+    device, profile = device
+    profile = dict(profile, sequence_map={"fade": {"id": 0, "autoplay": True, "indices": [SPEED]}})
+    coalescer = write_coalescer.get_coalescer(device.port, profile, flush_interval_ms=1)
+    write_coalescer.record_sent(device.port, [(SPEED, 1), (ANGLE, 1)])
+    assert not coalescer.queue([(SPEED, 1)])
+    assert coalescer.queue([(ANGLE, 1)])